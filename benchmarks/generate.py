@@ -0,0 +1,698 @@
+"""
+A deterministic generator of synthetic data archives for benchmarks: a Facebook data export and a Google Takeout
+archive, laid out exactly the way `FacebookIndex` and `GoogleIndex` read them, at any scale from a thousand to tens of
+millions of events.
+
+    python -m benchmarks.generate --events 100000 --output /tmp/archives
+
+writes /tmp/archives/facebook/ (friends_and_followers/, messages/inbox/*/message_N.json, location/,
+security_and_login_information/, and the other directories a download has) and /tmp/archives/google/Takeout/ (Mail/,
+Calendar/ and Contacts/). The same seed and scale always produce byte-identical archives.
+
+The events are spread over the sources roughly the way they are in real archives (see `SHARES`): mostly messages and
+email, with text drawn from a Zipf-distributed vocabulary, people who are named with Zipf-distributed frequency, and
+locations clustered around a few cities, so the indexes see realistic term, posting-list and spatial distributions.
+Files are written a row (or message) at a time, so memory use doesn't grow with the scale.
+"""
+
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from itertools import accumulate
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+
+import click
+
+# The owner of the archives, as their name appears in their Facebook data (the search engine's `full_name`).
+FULL_NAME = 'Jordan Avery'
+EMAIL_ADDRESS = 'jordan.avery@example.com'
+
+# Events are spread over [START, END) in epoch seconds (2012 to 2022).
+START = 1325376000
+END = 1672531200
+
+# The share of the events that each kind of record makes up.
+SHARES = {
+    'messages': 0.35,
+    'email': 0.25,
+    'location': 0.10,
+    'off_facebook_activity': 0.08,
+    'notifications': 0.06,
+    'calendar': 0.04,
+    'ads': 0.03,
+    'security': 0.02,
+    'comments': 0.015,
+    'reactions': 0.015,
+    'groups': 0.01,
+    'search': 0.01,
+    'polls': 0.005,
+    'events': 0.005,
+    'apps': 0.005,
+}
+
+# Messenger exports split threads into parts of at most this many messages, newest first.
+MESSAGES_PER_PART = 10000
+
+# The most frequent words of the synthetic vocabulary, in rank order. The rest of the vocabulary is made-up words,
+# which give term frequencies a long tail.
+WORDS = [
+    'the', 'to', 'and', 'you', 'for', 'is', 'on', 'we', 'it', 'this', 'that', 'with', 'can', 'be', 'have', 'are', 'at',
+    'will', 'from', 'your', 'meeting', 'thanks', 'know', 'time', 'get', 'just', 'week', 'update', 'team', 'tomorrow',
+    'today', 'please', 'project', 'call', 'dinner', 'weekend', 'plan', 'review', 'budget', 'launch', 'schedule',
+    'photos', 'trip', 'office', 'lunch', 'coffee', 'game', 'movie', 'birthday', 'party', 'flight', 'hotel', 'invoice',
+    'receipt', 'order', 'shipping', 'delivery', 'account', 'password', 'security', 'report', 'draft', 'notes',
+    'agenda', 'deadline', 'proposal', 'contract', 'design', 'feedback', 'interview', 'offer', 'apartment', 'lease',
+    'rent', 'groceries', 'recipe', 'concert', 'tickets', 'soccer', 'practice', 'class', 'homework', 'exam', 'library',
+    'museum', 'hike', 'beach', 'camping', 'vacation', 'conference', 'slides', 'demo', 'release', 'bug', 'server',
+    'database', 'deploy', 'backup', 'newsletter', 'subscription', 'discount', 'sale', 'coupon', 'podcast', 'playlist',
+    'marathon', 'gym', 'yoga', 'doctor', 'dentist', 'appointment', 'insurance', 'taxes', 'mortgage', 'wedding',
+    'anniversary', 'graduation', 'pizza', 'sushi', 'tacos', 'brunch', 'bakery', 'garden', 'puppy', 'kitten',
+]
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'pa', 'qu', 'el', 'an', 'or', 'is', 'ub']
+VOCABULARY_SIZE = 50000
+
+FIRST_NAMES = [
+    'Alice', 'Bob', 'Carol', 'Dan', 'Erin', 'Frank', 'Grace', 'Heidi', 'Ivan', 'Judy', 'Ken', 'Laura', 'Mallory',
+    'Nina', 'Oscar', 'Peggy', 'Quinn', 'Rupert', 'Sybil', 'Trent', 'Uma', 'Victor', 'Wendy', 'Xavier', 'Yara', 'Zoe',
+    'Aiden', 'Beatriz', 'Chen', 'Dmitri', 'Elif', 'Farah', 'Goran', 'Hana', 'Ines', 'Jamal', 'Keiko', 'Luis', 'Maya',
+    'Nikhil', 'Olga', 'Priya', 'Rafael', 'Sofia', 'Tomas', 'Wei', 'Yusuf', 'Zainab',
+]
+LAST_NAMES = [
+    'Smith', 'Jones', 'King', 'Brown', 'Garcia', 'Miller', 'Davis', 'Lopez', 'Wilson', 'Anderson', 'Thomas', 'Moore',
+    'Martin', 'Lee', 'Walker', 'Hall', 'Young', 'Allen', 'Wright', 'Scott', 'Nguyen', 'Hill', 'Green', 'Adams',
+    'Baker', 'Nelson', 'Carter', 'Mitchell', 'Perez', 'Roberts', 'Turner', 'Phillips', 'Campbell', 'Parker', 'Evans',
+    'Edwards', 'Collins', 'Stewart', 'Morris', 'Rogers', 'Reed', 'Cook', 'Morgan', 'Bell', 'Murphy', 'Bailey',
+]
+DOMAINS = ['example.com', 'example.org', 'mail.example.net', 'corp.example.com']
+
+# (name, latitude, longitude, UTC offset in hours, IANA time zone), most visited first.
+CITIES = [
+    ('Berkeley', 37.8716, -122.2727, -8, 'America/Los_Angeles'),
+    ('San Francisco', 37.7749, -122.4194, -8, 'America/Los_Angeles'),
+    ('New York', 40.7128, -74.0060, -5, 'America/New_York'),
+    ('Seattle', 47.6062, -122.3321, -8, 'America/Los_Angeles'),
+    ('Chicago', 41.8781, -87.6298, -6, 'America/Chicago'),
+    ('London', 51.5074, -0.1278, 0, 'Europe/London'),
+    ('Berlin', 52.5200, 13.4050, 1, 'Europe/Berlin'),
+    ('Tokyo', 35.6762, 139.6503, 9, 'Asia/Tokyo'),
+    ('Sydney', -33.8688, 151.2093, 10, 'Australia/Sydney'),
+    ('Mexico City', 19.4326, -99.1332, -6, 'America/Mexico_City'),
+]
+
+ADVERTISERS = ['Acme Outdoors', 'Blue Bottle', 'Cloudline', 'Dunmore Books', 'Evergreen Bank', 'Fieldhouse',
+               'Glimmer Games', 'Harbor Travel', 'Ironwood Tools', 'Juniper Foods']
+APPS = ['Spotify', 'Instagram', 'Tinder', 'Goodreads', 'Strava', 'Pinterest', 'Airbnb', 'Duolingo', 'Venmo', 'Yelp']
+ACTIVITY_TYPES = ['PAGE_VIEW', 'VIEW_CONTENT', 'ADD_TO_CART', 'PURCHASE', 'SEARCH', 'ACTIVATE_APP']
+GROUPS = ['Berkeley Free & For Sale', 'Bay Area Hikers', 'Python Developers', 'Class of 2016', 'Sourdough Bakers',
+          'Board Game Night', 'Urban Gardening', 'Indie Film Club']
+REACTIONS = ['LIKE', 'LOVE', 'HAHA', 'WOW', 'SAD', 'ANGRY']
+USER_AGENTS = ['Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Safari/605.1',
+               'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0 Safari',
+               'Mozilla/5.0 (iPhone; CPU iPhone OS 15_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko)',
+               'Mozilla/5.0 (Linux; Android 12; Pixel 6) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0 Mobile']
+
+
+def zipf_weights(count: int) -> List[float]:
+    """
+    Returns the cumulative weights of `count` items whose frequencies follow Zipf's law (the k-th is 1/k as likely as
+    the first), for `random.choices`.
+    """
+    return list(accumulate(1 / rank for rank in range(1, count + 1)))
+
+
+def zipf_split(total: int, count: int) -> List[int]:
+    """
+    Splits `total` into `count` Zipf-distributed sizes, largest first.
+    """
+    weights = [1 / rank for rank in range(1, count + 1)]
+    scale = total / sum(weights)
+    sizes = [int(weight * scale) for weight in weights]
+    for i in range(total - sum(sizes)):
+        sizes[i % count] += 1
+    return sizes
+
+
+def fold(line: str) -> str:
+    """
+    Folds an iCalendar/vCard content line into lines of at most 75 characters (RFC 5545), each continuation line
+    starting with a space.
+    """
+    chunks = [line[:75]] + [line[i:i + 74] for i in range(75, len(line), 74)]
+    return '\r\n '.join(chunks) + '\r\n'
+
+
+class Generator:
+    """
+    Generates the records of a pair of archives. Every random choice is drawn from a single seeded `random.Random`, in
+    a fixed order, so the output only depends on the seed and scale.
+    """
+
+    def __init__(self, events: int, seed: int = 0) -> None:
+        """
+        Args:
+            events (int): The approximate number of events the archives produce when indexed.
+            seed (int): The seed of every random choice.
+        """
+        self.events = events
+        self.random = random.Random(seed)
+
+        words = set(WORDS)
+        self.words = list(WORDS)
+        while len(self.words) < VOCABULARY_SIZE:
+            word = ''.join(self.random.choices(SYLLABLES, k=self.random.randint(2, 4)))
+            if word not in words:
+                words.add(word)
+                self.words.append(word)
+        self.word_weights = zipf_weights(len(self.words))
+
+        # Larger archives name more people: about 2 sqrt(events), up to every combination of the names above.
+        names = [first + ' ' + last for last in LAST_NAMES for first in FIRST_NAMES]
+        self.random.shuffle(names)
+        self.people = names[:max(20, min(len(names), int(2 * events ** 0.5)))]
+        self.people_weights = zipf_weights(len(self.people))
+        self.emails = {person: self.address(person) for person in self.people}
+        self.friends = self.people[:len(self.people) * 3 // 5]
+        self.city_weights = zipf_weights(len(CITIES))
+
+    def count(self, kind: str) -> int:
+        return max(1, round(self.events * SHARES[kind]))
+
+    def address(self, person: str) -> str:
+        first, last = person.lower().split(' ')
+        return f'{first}.{last}@{self.random.choice(DOMAINS)}'
+
+    def text(self, low: int, high: int) -> str:
+        count = self.random.randint(low, high)
+        return ' '.join(self.random.choices(self.words, cum_weights=self.word_weights, k=count))
+
+    def person(self) -> str:
+        return self.random.choices(self.people, cum_weights=self.people_weights)[0]
+
+    def friend(self) -> str:
+        return self.random.choice(self.friends)
+
+    def city(self) -> Tuple[str, float, float, int, str]:
+        return self.random.choices(CITIES, cum_weights=self.city_weights)[0]
+
+    def timestamp(self) -> int:
+        return self.random.randrange(START, END)
+
+    def ip_address(self) -> str:
+        return '.'.join(str(self.random.randint(1, 254)) for _ in range(4))
+
+    def sentence(self) -> str:
+        """
+        Returns some text, which now and then names a friend (by their full or first name).
+        """
+        text = self.text(4, 24)
+        if self.random.random() < 0.2:
+            friend = self.friend()
+            text += ' ' + (friend if self.random.random() < 0.5 else friend.split(' ')[0])
+        return text
+
+    # Facebook
+
+    def friend_rows(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Returns the rows of each friends_and_followers file.
+        """
+        others = self.people[len(self.friends):]
+        return {
+            'friends.json': [{'name': friend, 'timestamp': self.timestamp()} for friend in self.friends],
+            'friend_requests_sent.json': [{'name': person, 'timestamp': self.timestamp()} for person in others[::3]],
+            'rejected_friend_requests.json': [
+                {'name': person, 'timestamp': self.timestamp()} for person in others[1::3]
+            ],
+            'removed_friends.json': [{'name': person, 'timestamp': self.timestamp()} for person in others[2::6]],
+        }
+
+    def threads(self) -> Iterator[Tuple[str, Dict[str, Any], int]]:
+        """
+        Yields the directory name, details (everything but the messages) and message count of each Messenger thread.
+        Threads have Zipf-distributed sizes, and are mostly DMs, with some group chats and the odd note to self.
+        """
+        total = self.count('messages')
+        sizes = zipf_split(total, max(1, total // 400))
+        for number, size in enumerate(sizes):
+            kind = self.random.random()
+            if kind < 0.7:
+                participants = [self.person(), FULL_NAME]
+                title = participants[0]
+            elif kind < 0.97:
+                participants = sorted(set(self.person() for _ in range(self.random.randint(2, 8)))) + [FULL_NAME]
+                title = self.text(1, 3).title()
+            else:
+                participants = [FULL_NAME]
+                title = FULL_NAME
+            name = ''.join(character for character in title.lower() if character.isalnum())[:20] or 'thread'
+            directory = f'{name}_{number:08x}'
+            yield directory, {
+                'participants': [{'name': participant} for participant in participants],
+                'title': title,
+                'is_still_participant': True,
+                'thread_type': 'Regular' if len(participants) <= 2 else 'RegularGroup',
+                'thread_path': 'inbox/' + directory,
+            }, size
+
+    def messages(self, details: Dict[str, Any], count: int) -> Iterator[Dict[str, Any]]:
+        """
+        Yields a thread's messages, newest first, as Messenger exports them. Some are photos (without any content), and
+        some have reactions.
+        """
+        participants = [row['name'] for row in details['participants']]
+        stop = self.random.randrange(START + (END - START) // 4, END)
+        start = self.random.randrange(START, stop)
+        gap = (stop - start) / max(count, 1)
+        timestamp = float(stop)
+        for _ in range(count):
+            timestamp = max(START, timestamp - self.random.expovariate(1 / gap))
+            message: Dict[str, Any] = {'sender_name': self.random.choice(participants),
+                                       'timestamp_ms': int(timestamp * 1000)}
+            if self.random.random() < 0.05:
+                message['photos'] = [{'uri': f'messages/inbox/{details["thread_path"][6:]}/photos/'
+                                             f'{self.random.getrandbits(48):012x}.jpg',
+                                      'creation_timestamp': int(timestamp)}]
+            else:
+                message['content'] = self.sentence()
+            if self.random.random() < 0.1:
+                message['reactions'] = [{'reaction': self.random.choice(REACTIONS),
+                                         'actor': self.random.choice(participants)}]
+            message['type'] = 'Generic'
+            message['is_unsent'] = False
+            yield message
+
+    def locations(self) -> Iterator[Dict[str, Any]]:
+        for _ in range(self.count('location')):
+            name, latitude, longitude, _, _ = self.city()
+            yield {
+                'name': name,
+                'creation_timestamp': self.timestamp(),
+                'coordinate': {'latitude': round(self.random.gauss(latitude, 0.05), 6),
+                               'longitude': round(self.random.gauss(longitude, 0.05), 6)},
+            }
+
+    def off_facebook_activity(self) -> Iterator[Dict[str, Any]]:
+        total = self.count('off_facebook_activity')
+        for number, size in enumerate(zipf_split(total, max(1, total // 50))):
+            yield {
+                'name': f'{self.random.choice(ADVERTISERS)} {number}',
+                'events': [{'id': self.random.getrandbits(40), 'type': self.random.choice(ACTIVITY_TYPES),
+                            'timestamp': self.timestamp()} for _ in range(size)],
+            }
+
+    def notifications(self) -> Iterator[Dict[str, Any]]:
+        templates = ['{} commented on your post.', '{} tagged you in a photo.', '{} shared a memory with you.',
+                     '{} invited you to like a page.', 'You have a new friend suggestion: {}.']
+        for _ in range(self.count('notifications')):
+            text = self.random.choice(templates).format(self.person())
+            yield {'timestamp': self.timestamp(), 'unread': self.random.random() < 0.1, 'text': text,
+                   'href': f'https://www.facebook.com/notifications/{self.random.getrandbits(48)}'}
+
+    def ads(self) -> Iterator[Dict[str, Any]]:
+        for _ in range(self.count('ads')):
+            yield {'title': self.random.choice(ADVERTISERS), 'action': 'Clicked ad', 'timestamp': self.timestamp()}
+
+    def apps(self) -> Iterator[Dict[str, Any]]:
+        for _ in range(self.count('apps')):
+            yield {'name': self.random.choice(APPS), 'added_timestamp': self.timestamp(),
+                   'user_app_scoped_id': self.random.getrandbits(48), 'category': 'active'}
+
+    def comments(self) -> Iterator[Dict[str, Any]]:
+        for _ in range(self.count('comments')):
+            timestamp = self.timestamp()
+            yield {'timestamp': timestamp,
+                   'data': [{'comment': {'timestamp': timestamp, 'comment': self.sentence(), 'author': FULL_NAME}}],
+                   'title': f"{FULL_NAME} commented on {self.person()}'s post."}
+
+    def reactions(self) -> Iterator[Dict[str, Any]]:
+        for _ in range(self.count('reactions')):
+            reaction = self.random.choice(REACTIONS)
+            yield {'timestamp': self.timestamp(),
+                   'data': [{'reaction': {'reaction': reaction, 'actor': FULL_NAME}}],
+                   'title': f"{FULL_NAME} reacted {reaction.lower()} to {self.person()}'s post."}
+
+    def events_joined(self) -> Iterator[Dict[str, Any]]:
+        for _ in range(self.count('events')):
+            start = self.timestamp()
+            yield {'name': self.text(2, 5).title(), 'start_timestamp': start, 'end_timestamp': start + 3 * 3600,
+                   'place': {'name': self.city()[0]}}
+
+    def group_activity(self) -> Dict[str, Iterator[Dict[str, Any]]]:
+        """
+        Returns the rows of each groups file (comments, memberships and posts, which make up 2/5, 1/5 and 2/5 of the
+        group activity).
+        """
+        total = self.count('groups')
+
+        def comments() -> Iterator[Dict[str, Any]]:
+            for _ in range(max(1, total * 2 // 5)):
+                timestamp, group = self.timestamp(), self.random.choice(GROUPS)
+                yield {'timestamp': timestamp,
+                       'data': [{'comment': {'timestamp': timestamp, 'comment': self.sentence(), 'author': FULL_NAME,
+                                             'group': group}}],
+                       'title': f"{FULL_NAME} commented on {self.person()}'s post in {group}."}
+
+        def memberships() -> Iterator[Dict[str, Any]]:
+            for _ in range(max(1, total // 5)):
+                yield {'timestamp': self.timestamp(), 'title': f'{FULL_NAME} became a member of '
+                                                               f'{self.random.choice(GROUPS)}.'}
+
+        def posts() -> Iterator[Dict[str, Any]]:
+            for _ in range(max(1, total * 2 // 5)):
+                yield {'timestamp': self.timestamp(), 'data': [{'post': self.sentence()}],
+                       'title': f'{FULL_NAME} posted in {self.random.choice(GROUPS)}.'}
+
+        return {'your_comments_in_groups.json': comments(), 'your_group_membership_activity.json': memberships(),
+                'your_posts_in_groups.json': posts()}
+
+    def polls(self) -> Iterator[Dict[str, Any]]:
+        for _ in range(self.count('polls')):
+            yield {'timestamp': self.timestamp(), 'title': f"{FULL_NAME} voted on {self.person()}'s poll.",
+                   'attachments': [{'data': [{'text': self.text(1, 4)}]}]}
+
+    def searches(self) -> Iterator[Dict[str, Any]]:
+        for _ in range(self.count('search')):
+            text = self.person() if self.random.random() < 0.3 else self.text(1, 3)
+            yield {'timestamp': self.timestamp(), 'attachments': [{'data': [{'text': text}]}],
+                   'data': [{'text': text}], 'title': 'You searched Facebook'}
+
+    def security(self) -> Dict[str, Tuple[str, Iterator[Dict[str, Any]]]]:
+        """
+        Returns the node and rows of each security_and_login_information file, which share the security events evenly.
+        """
+        count = max(1, self.count('security') // 5)
+
+        def account_activity() -> Iterator[Dict[str, Any]]:
+            for _ in range(count):
+                city = self.city()
+                yield {'action': self.random.choice(['Login', 'Session updated', 'Password changed']),
+                       'timestamp': self.timestamp(), 'ip_address': self.ip_address(),
+                       'user_agent': self.random.choice(USER_AGENTS), 'city': city[0], 'region': '',
+                       'country': '', 'site_name': 'www.facebook.com'}
+
+        def authorized_logins() -> Iterator[Dict[str, Any]]:
+            for _ in range(count):
+                created = self.timestamp()
+                yield {'name': self.random.choice(['iPhone', 'Pixel 6', 'MacBook Pro', 'Chrome on Windows']),
+                       'created_timestamp': created, 'updated_timestamp': created + self.random.randint(0, 10 ** 7),
+                       'ip_address': self.ip_address(), 'user_agent': self.random.choice(USER_AGENTS)}
+
+        def ip_address_activity() -> Iterator[Dict[str, Any]]:
+            for _ in range(count):
+                yield {'ip': self.ip_address(), 'action': self.random.choice(['Login', 'Logout', 'Checkpoint']),
+                       'timestamp': self.timestamp()}
+
+        def logins_and_logouts() -> Iterator[Dict[str, Any]]:
+            for _ in range(count):
+                yield {'action': self.random.choice(['Log In', 'Log Out']), 'timestamp': self.timestamp(),
+                       'site': 'www.facebook.com', 'ip_address': self.ip_address()}
+
+        def sessions() -> Iterator[Dict[str, Any]]:
+            for _ in range(count):
+                created = self.timestamp()
+                yield {'created_timestamp': created, 'updated_timestamp': created + self.random.randint(0, 10 ** 6),
+                       'ip_address': self.ip_address(), 'user_agent': self.random.choice(USER_AGENTS),
+                       'location': self.city()[0], 'app': 'Facebook', 'session_type': 'web'}
+
+        return {
+            'account_activity.json': ('account_activity_v2', account_activity()),
+            'authorized_logins.json': ('recognized_devices_v2', authorized_logins()),
+            'ip_address_activity.json': ('used_ip_address_v2', ip_address_activity()),
+            'logins_and_logouts.json': ('account_accesses_v2', logins_and_logouts()),
+            "where_you're_logged_in.json": ('active_sessions_v2', sessions()),
+        }
+
+    # Google
+
+    def vcards(self) -> Iterator[str]:
+        """
+        Yields a vCard for every person with an email address, some with nicknames and a second address.
+        """
+        for person in self.people:
+            first, last = person.split(' ')
+            lines = ['BEGIN:VCARD', 'VERSION:3.0', f'FN:{person}', f'N:{last};{first};;;']
+            if self.random.random() < 0.1:
+                lines.append(f'NICKNAME:{first[:3]}')
+            lines.append(f'EMAIL;TYPE=INTERNET;TYPE=HOME:{self.emails[person]}')
+            if self.random.random() < 0.2:
+                lines.append(f'EMAIL;TYPE=INTERNET;TYPE=WORK:{first.lower()}@work.example.com')
+            lines.append(f'TEL;TYPE=CELL:+1 510 555 {self.random.randint(0, 9999):04d}')
+            lines.append('END:VCARD')
+            yield ''.join(fold(line) for line in lines)
+
+    def vevents(self) -> Iterator[Tuple[str, int]]:
+        """
+        Yields each calendar VEVENT, with the number of events it expands into. About a tenth of them recur weekly a
+        fixed number of times; the rest are single (timed or all-day) events.
+        """
+        remaining = self.count('calendar')
+        number = 0
+        while remaining > 0:
+            number += 1
+            begin = datetime.fromtimestamp(self.timestamp() // 900 * 900, timezone.utc)
+            city = self.city()
+            lines = ['BEGIN:VEVENT']
+            if self.random.random() < 0.15:
+                lines += [f'DTSTART;VALUE=DATE:{begin:%Y%m%d}', f'DTEND;VALUE=DATE:{begin + timedelta(days=1):%Y%m%d}']
+            elif self.random.random() < 0.5:
+                local = begin.astimezone(timezone(timedelta(hours=city[3])))
+                end = local + timedelta(minutes=self.random.choice([30, 60, 90]))
+                lines += [f'DTSTART;TZID={city[4]}:{local:%Y%m%dT%H%M%S}', f'DTEND;TZID={city[4]}:{end:%Y%m%dT%H%M%S}']
+            else:
+                end = begin + timedelta(minutes=self.random.choice([30, 60, 90]))
+                lines += [f'DTSTART:{begin:%Y%m%dT%H%M%SZ}', f'DTEND:{end:%Y%m%dT%H%M%SZ}']
+            occurrences = 1
+            if remaining > 1 and self.random.random() < 0.1:
+                occurrences = min(remaining, self.random.randint(4, 12))
+                lines.append(f'RRULE:FREQ=WEEKLY;COUNT={occurrences}')
+            lines += [f'DTSTAMP:{begin:%Y%m%dT%H%M%SZ}', f'UID:{self.random.getrandbits(64):016x}{number}@google.com',
+                      f'SUMMARY:{self.text(1, 5).capitalize()}', f'DESCRIPTION:{self.text(0, 40)}',
+                      f'LOCATION:{city[0]}', 'STATUS:CONFIRMED', 'SEQUENCE:0']
+            for person in sorted(set(self.person() for _ in range(self.random.randint(0, 5)))):
+                lines.append(f'ATTENDEE;CUTYPE=INDIVIDUAL;ROLE=REQ-PARTICIPANT;PARTSTAT=ACCEPTED;CN={person};'
+                             f'X-NUM-GUESTS=0:mailto:{self.emails[person]}')
+            if self.random.random() < 0.3:
+                lines += ['BEGIN:VALARM', 'ACTION:DISPLAY', 'DESCRIPTION:Reminder', 'TRIGGER:-P0DT0H10M0S',
+                          'END:VALARM']
+            lines.append('END:VEVENT')
+            remaining -= occurrences
+            yield ''.join(fold(line) for line in lines), occurrences
+
+    def emails_messages(self) -> Iterator[str]:
+        """
+        Yields each email as an mbox entry (its "From " line, headers and body). A quarter are sent by the owner, and
+        bodies are plain text, HTML, or both (multipart/alternative).
+        """
+        for number in range(self.count('email')):
+            timestamp = self.timestamp()
+            city = self.city()
+            person = self.person()
+            sent = self.random.random() < 0.25
+            sender = f'{FULL_NAME} <{EMAIL_ADDRESS}>' if sent else f'"{person}" <{self.emails[person]}>'
+            recipients = f'"{person}" <{self.emails[person]}>' if sent else EMAIL_ADDRESS
+            labels = 'Sent' if sent else self.random.choice(
+                ['Inbox,Important,Opened', 'Inbox,Opened', 'Archived,Opened', 'Category Promotions,Unread'])
+            date = datetime.fromtimestamp(timestamp, timezone(timedelta(hours=city[3])))
+            headers = [
+                f'From {self.random.getrandbits(63)}@xxx {date.astimezone(timezone.utc):%a %b %d %H:%M:%S +0000 %Y}',
+                f'X-GM-THRID: {self.random.getrandbits(63)}',
+                f'X-Gmail-Labels: {labels}',
+                'MIME-Version: 1.0',
+                f'Date: {format_datetime(date)}',
+                f'Message-ID: <{number:x}.{self.random.getrandbits(32):08x}@mail.example.com>',
+                f'Subject: {self.text(2, 8).capitalize()}',
+                f'From: {sender}',
+                f'To: {recipients}',
+            ]
+            if self.random.random() < 0.1:
+                other = self.person()
+                headers.append(f'Cc: "{other}" <{self.emails[other]}>')
+            paragraphs = [self.sentence() for _ in range(self.random.randint(1, 6))]
+            plain = '\n\n'.join(paragraphs)
+            html = '<html><body>' + ''.join(f'<p>{paragraph}</p>' for paragraph in paragraphs) + '</body></html>'
+            kind = self.random.random()
+            if kind < 0.6:
+                headers.append('Content-Type: text/plain; charset="UTF-8"')
+                body = plain
+            elif kind < 0.85:
+                boundary = f'{self.random.getrandbits(64):016x}'
+                headers.append(f'Content-Type: multipart/alternative; boundary="{boundary}"')
+                body = (f'--{boundary}\nContent-Type: text/plain; charset="UTF-8"\n\n{plain}\n\n'
+                        f'--{boundary}\nContent-Type: text/html; charset="UTF-8"\n\n{html}\n\n--{boundary}--')
+            else:
+                headers.append('Content-Type: text/html; charset="UTF-8"')
+                body = html
+            yield '\n'.join(headers) + '\n\n' + body + '\n\n'
+
+
+def write_json(path: str, node: Union[str, Sequence[str]], rows: Iterable[Any], before: Dict[str, Any] = {},
+               after: Dict[str, Any] = {}) -> int:
+    """
+    Writes a JSON object whose `node` (a key, or a path of nested keys) is a list of rows, one row at a time, between
+    the fields `before` and `after` it. Returns the number of rows.
+    """
+    nodes = [node] if isinstance(node, str) else list(node)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    count = 0
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('{\n')
+        for name, value in before.items():
+            file.write(f'  {json.dumps(name)}: {json.dumps(value)},\n')
+        file.write('  ' + ''.join(json.dumps(name) + ': {' for name in nodes[:-1]) + json.dumps(nodes[-1]) + ': [')
+        for row in rows:
+            file.write((',\n    ' if count else '\n    ') + json.dumps(row))
+            count += 1
+        file.write('\n  ]' + '}' * (len(nodes) - 1))
+        for name, value in after.items():
+            file.write(f',\n  {json.dumps(name)}: {json.dumps(value)}')
+        file.write('\n}\n')
+    return count
+
+
+def write_text(path: str, chunks: Iterable[str], header: str = '', footer: str = '') -> int:
+    """
+    Writes a text file made of `chunks` (e.g. mbox messages or vCards) between a header and footer, one chunk at a
+    time, with its line endings as they are. Returns the number of chunks.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        file.write(header)
+        for chunk in chunks:
+            file.write(chunk)
+            count += 1
+        file.write(footer)
+    return count
+
+
+def generate_facebook(generator: Generator, root: str) -> Dict[str, int]:
+    """
+    Writes a Facebook data export to `root`, and returns the number of events each source should produce.
+    """
+    def path(*parts: str) -> str:
+        return os.path.join(root, *parts)
+
+    counts = {'Friends': 0}
+    nodes = {'friends.json': 'friends_v2', 'friend_requests_sent.json': 'sent_requests_v2',
+             'rejected_friend_requests.json': 'rejected_requests_v2', 'removed_friends.json': 'deleted_friends_v2'}
+    for name, rows in generator.friend_rows().items():
+        counts['Friends'] += write_json(path('friends_and_followers', name), nodes[name], rows)
+
+    counts['Messenger'] = 0
+    for directory, details, size in generator.threads():
+        messages = generator.messages(details, size)
+        # Every part repeats the thread's details around its share of the messages, as in real exports.
+        before = {'participants': details['participants']}
+        after = {name: value for name, value in details.items() if name != 'participants'}
+        for part in range(1, max(1, -(-size // MESSAGES_PER_PART)) + 1):
+            rows = (message for _, message in zip(range(MESSAGES_PER_PART), messages))
+            counts['Messenger'] += write_json(path('messages', 'inbox', directory, f'message_{part}.json'),
+                                              'messages', rows, before, after)
+
+    counts['Location'] = write_json(path('location', 'location_history.json'), 'location_history_v2',
+                                    generator.locations())
+
+    counts['Apps and Websites Off of Facebook'] = 0
+
+    def count_activity(categories: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for category in categories:
+            counts['Apps and Websites Off of Facebook'] += len(category['events'])
+            yield category
+
+    write_json(path('apps_and_websites_off_of_facebook', 'your_off-facebook_activity.json'),
+               'off_facebook_activity_v2', count_activity(generator.off_facebook_activity()))
+    counts['Apps and Websites'] = write_json(path('apps_and_websites_off_of_facebook', 'apps_and_websites.json'),
+                                             'installed_apps_v2', generator.apps())
+    counts['Notifications'] = write_json(path('notifications', 'notifications.json'), 'notifications_v2',
+                                         generator.notifications())
+    counts['Ads'] = write_json(path('ads_information', "advertisers_you've_interacted_with.json"), 'history_v2',
+                               generator.ads())
+    counts['Comments and Reactions'] = (
+        write_json(path('comments_and_reactions', 'comments.json'), 'comments_v2', generator.comments()) +
+        write_json(path('comments_and_reactions', 'posts_and_comments.json'), 'reactions_v2', generator.reactions())
+    )
+    counts['Events'] = write_json(path('events', 'your_event_responses.json'),
+                                  ['event_responses_v2', 'events_joined'], generator.events_joined())
+
+    counts['Groups'] = 0
+    nodes = {'your_comments_in_groups.json': 'group_comments_v2',
+             'your_group_membership_activity.json': 'groups_joined_v2', 'your_posts_in_groups.json': 'group_posts_v2'}
+    for name, rows in generator.group_activity().items():
+        counts['Groups'] += write_json(path('groups', name), nodes[name], rows)
+
+    counts['Polls'] = write_json(path('polls', 'polls_you_voted_on.json'), 'poll_votes_v2', generator.polls())
+    counts['Search'] = write_json(path('search', 'your_search_history.json'), 'searches_v2', generator.searches())
+    counts['Security and Login'] = 0
+    for name, (node, rows) in generator.security().items():
+        counts['Security and Login'] += write_json(path('security_and_login_information', name), node, rows)
+    return counts
+
+
+def generate_google(generator: Generator, root: str) -> Dict[str, int]:
+    """
+    Writes a Google Takeout archive (contacts, a calendar and a mailbox) to `root`, and returns the number of events
+    each source should produce.
+    """
+    takeout = os.path.join(root, 'Takeout')
+    write_text(os.path.join(takeout, 'Contacts', 'All Contacts', 'All Contacts.vcf'), generator.vcards())
+
+    counts = {'Calendar': 0}
+
+    def count_occurrences(vevents: Iterator[Tuple[str, int]]) -> Iterator[str]:
+        for vevent, occurrences in vevents:
+            counts['Calendar'] += occurrences
+            yield vevent
+
+    header = ''.join(fold(line) for line in [
+        'BEGIN:VCALENDAR', 'PRODID:-//Google Inc//Google Calendar 70.9054//EN', 'VERSION:2.0', 'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH', f'X-WR-CALNAME:{EMAIL_ADDRESS}', 'X-WR-TIMEZONE:America/Los_Angeles',
+    ])
+    write_text(os.path.join(takeout, 'Calendar', EMAIL_ADDRESS + '.ics'), count_occurrences(generator.vevents()),
+               header, fold('END:VCALENDAR'))
+
+    counts['Email'] = write_text(os.path.join(takeout, 'Mail', 'All mail Including Spam and Trash.mbox'),
+                                 generator.emails_messages())
+    return counts
+
+
+def generate(root: str, events: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    Writes a Facebook export to `root`/facebook and a Google Takeout archive to `root`/google.
+
+    Args:
+        root (str): The directory to write the archives to.
+        events (int): The approximate number of events the archives produce when indexed.
+        seed (int): The seed of every random choice.
+
+    Returns:
+        The archives' full name (see `FULL_NAME`), the number of events each source should produce, and the size of
+        each archive in bytes.
+    """
+    generator = Generator(events, seed)
+    counts = {'Facebook': generate_facebook(generator, os.path.join(root, 'facebook')),
+              'Google': generate_google(generator, os.path.join(root, 'google'))}
+    sizes = {}
+    for company in ('facebook', 'google'):
+        sizes[company] = sum(os.path.getsize(os.path.join(directory, name))
+                             for directory, _, names in os.walk(os.path.join(root, company)) for name in names)
+    return {'full_name': FULL_NAME, 'events': counts, 'bytes': sizes}
+
+
+@click.command()
+@click.option('--output', required=True, type=click.Path(file_okay=False), help='The directory to write to.')
+@click.option('--events', default=100000, show_default=True,
+              help='The approximate number of events (e.g. from 1000 to 10000000).')
+@click.option('--seed', default=0, show_default=True, help='The seed of every random choice.')
+def main(output: str, events: int, seed: int) -> None:
+    """
+    Writes synthetic Facebook and Google archives, and prints a JSON summary of what they contain.
+    """
+    if events < 1:
+        raise click.BadParameter('There must be at least one event.', param_hint='--events')
+    click.echo(json.dumps(generate(output, events, seed), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+An end-to-end benchmark of the search engine over synthetic archives (see `benchmarks.generate`). It measures:
+
+- each parser's throughput (events and bytes per second) and peak memory, running it alone in a fresh process;
+- a full preprocess (every parser, the secondary indexes, and saving the snapshot), and its peak memory;
+- loading the snapshot, and the latency percentiles of a suite of queries over it (see `QUERIES`).
+
+    python -m benchmarks.run --events 100000 --output benchmarks.jsonl
+
+The results are printed as a JSON document, and appended as a single line to the `--output` file (if given), so a
+history of runs can be compared across commits. Every run records the commit, interpreter, platform and parameters it
+was run with.
+
+Each measurement runs in its own spawned process, so peak RSS figures aren't inflated by the harness or by earlier
+measurements; they do include the interpreter and its imports (reported separately as the baseline).
+"""
+
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import click
+import numpy as np
+
+from benchmarks.generate import CITIES, FULL_NAME, WORDS, generate
+from examples.search.index.facebook import FacebookIndex
+from examples.search.index.google import GoogleIndex
+from examples.search.main import SearchEngine
+from lens.sources.FacebookSource import FacebookSource
+from lens.sources.GoogleSource import GoogleSource
+
+# The latency percentiles reported for each query.
+PERCENTILES = (50, 90, 99)
+
+# The query suite, by name. "{person}" is replaced with the person named by the most events.
+QUERIES: Dict[str, Dict[str, Any]] = {
+    'latest': {'limit': 10},
+    'source': {'source': 'Email', 'limit': 10},
+    'time_range': {'since': '2017-03-01', 'until': '2017-04-01', 'limit': 100},
+    'time_range_all': {'since': '2017-03-01', 'until': '2017-04-01'},
+    'text_common': {'q': WORDS[20], 'limit': 10},
+    'text_two_terms': {'q': f'{WORDS[38]} {WORDS[39]}', 'limit': 10},
+    'text_rare': {'q': WORDS[-1], 'limit': 10},
+    'text_filtered': {'q': WORDS[30], 'source': 'Messenger', 'since': '2015-01-01', 'limit': 10},
+    'near': {'near': [CITIES[0][1], CITIES[0][2], 10], 'limit': 10},
+    'bbox': {'bbox': [CITIES[5][1] - 1, CITIES[5][2] - 1, CITIES[5][1] + 1, CITIES[5][2] + 1], 'limit': 100},
+    'person': {'person': '{person}', 'limit': 10},
+    'group_by_source_month': {'group_by': ['source', 'month']},
+    'group_by_name': {'group_by': 'name', 'source': 'Email', 'limit': 20},
+    'top_people': {'top_people': 10},
+    'top_people_text': {'top_people': 10, 'q': WORDS[40]},
+}
+
+
+def peak_rss() -> int:
+    """
+    Returns the peak resident set size of this process and its finished children, in bytes.
+    """
+    peak = max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+    # It's reported in KiB on Linux, and in bytes on macOS.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    """
+    Summarizes latencies (in seconds) as milliseconds.
+    """
+    milliseconds = np.array(latencies) * 1000
+    summary = {f'p{percentile}_ms': float(np.percentile(milliseconds, percentile)) for percentile in PERCENTILES}
+    summary.update(mean_ms=float(milliseconds.mean()), max_ms=float(milliseconds.max()))
+    return summary
+
+
+def isolated(function: Callable, *args: Any) -> Any:
+    """
+    Runs a function in a freshly spawned process (with its output silenced), and returns its result.
+    """
+    with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as pool:
+        return pool.submit(quietly, function, *args).result()
+
+
+def quietly(function: Callable, *args: Any) -> Any:
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        return function(*args)
+
+
+def sources(root: str) -> Tuple[FacebookSource, GoogleSource]:
+    # Sources expect their root to end with a separator.
+    return FacebookSource(os.path.join(root, 'facebook', '')), GoogleSource(os.path.join(root, 'google', ''))
+
+
+def make_index(company: str, root: str, config: Dict[str, Any]) -> Any:
+    facebook, google = sources(root)
+    if company == FacebookIndex.COMPANY:
+        return FacebookIndex(source=facebook, full_name=config['full_name'])
+    return GoogleIndex(source=google, workers=config.get('workers'))
+
+
+def measure_parser(company: str, name: str, root: str, config: Dict[str, Any],
+                   states: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Runs a single parser (after restoring the shared state of the parsers it depends on), and returns its throughput,
+    peak memory and shared state.
+    """
+    baseline = peak_rss()
+    index = make_index(company, root, config)
+    for state in states:
+        index.restore_state(state)
+    start = time.perf_counter()
+    store, state = index.run_parser(name)
+    seconds = time.perf_counter() - start
+    # The bytes parsed are those of the files the events were attributed to.
+    size = sum(index.source.stat(index.source.root + origin.split('/', 1)[1])[0] for origin in store.replaced_origins())
+    return {
+        'parser': f'{type(index).__name__}.{name}',
+        'events': len(store),
+        'bytes': size,
+        'seconds': seconds,
+        'events_per_second': len(store) / seconds if seconds else None,
+        'megabytes_per_second': size / seconds / 2 ** 20 if seconds else None,
+        'baseline_rss_bytes': baseline,
+        'peak_rss_bytes': peak_rss(),
+        'state': state,
+    }
+
+
+def measure_preprocess(root: str, config: Dict[str, Any], snapshot: str) -> Dict[str, Any]:
+    """
+    Preprocesses the archives from scratch and saves the snapshot, and returns how long each took.
+    """
+    baseline = peak_rss()
+    start = time.perf_counter()
+    engine = SearchEngine(config=config)
+    engine.preprocess(*sources(root))
+    seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    engine.save(snapshot)
+    return {
+        'events': len(engine.events),
+        'seconds': seconds,
+        'events_per_second': len(engine.events) / seconds,
+        'save_seconds': time.perf_counter() - start,
+        'snapshot_bytes': os.path.getsize(snapshot),
+        'baseline_rss_bytes': baseline,
+        'peak_rss_bytes': peak_rss(),
+    }
+
+
+def measure_queries(snapshot: str, config: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    """
+    Loads a snapshot, then runs each query in the suite `repeat` times (after a warm-up run) and returns its latency
+    percentiles. Each run reads every row and serializes it, as the server would.
+    """
+    baseline = peak_rss()
+    start = time.perf_counter()
+    engine = SearchEngine.load(snapshot, config=config)
+    load_seconds = time.perf_counter() - start
+    load_rss = peak_rss()
+
+    top = engine.query({'top_people': 1})
+    person = top[0]['name'] if top else FULL_NAME
+    queries = {}
+    for name, args in QUERIES.items():
+        args = {key: value.format(person=person) if isinstance(value, str) else value for key, value in args.items()}
+        rows = sum(1 for _ in engine.results(args))
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in engine.results(args).lines():
+                pass
+            latencies.append(time.perf_counter() - start)
+        queries[name] = {'args': args, 'rows': rows, **percentiles(latencies)}
+    return {
+        'load_seconds': load_seconds,
+        'baseline_rss_bytes': baseline,
+        'load_rss_bytes': load_rss,
+        'peak_rss_bytes': peak_rss(),
+        'queries': queries,
+    }
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def benchmark(root: str, config: Dict[str, Any], repeat: int, parsers: bool = True) -> Dict[str, Any]:
+    """
+    Benchmarks the search engine over the archives in `root` (see the module docstring).
+
+    Args:
+        root (str): The directory holding the facebook/ and google/ archives.
+        config (Dict[str, Any]): The search engine's configuration.
+        repeat (int): How many times each query is timed.
+        parsers (bool): Whether to benchmark each parser on its own, as well as the whole preprocess.
+    """
+    results: Dict[str, Any] = {}
+    if parsers:
+        results['parsers'] = []
+        for index in (FacebookIndex, GoogleIndex):
+            # Dependent parsers get the shared state their dependencies produced, as in `SearchEngine.preprocess`.
+            states: Dict[str, Dict[str, Any]] = {}
+            for name in index.PARSERS:
+                dependencies = [states[dependency] for dependency in index.DEPENDENCIES.get(name, [])]
+                result = isolated(measure_parser, index.COMPANY, name, root, config, dependencies)
+                states[name] = result.pop('state')
+                results['parsers'].append(result)
+
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot = os.path.join(directory, 'index.lens')
+        results['preprocess'] = isolated(measure_preprocess, root, config, snapshot)
+        results['serve'] = isolated(measure_queries, snapshot, config, repeat)
+    return results
+
+
+@click.command()
+@click.option('--events', default=100000, show_default=True,
+              help='The approximate number of events to generate (e.g. from 1000 to 10000000).')
+@click.option('--seed', default=0, show_default=True, help='The seed of the generated archives.')
+@click.option('--data', type=click.Path(file_okay=False),
+              help='A directory to keep the generated archives in, which are reused if it already holds them. '
+                   'Defaults to a temporary directory.')
+@click.option('--workers', default=1, show_default=True,
+              help='The number of processes that parsers (and mbox files) are run with.')
+@click.option('--repeat', default=20, show_default=True, help='How many times each query is timed.')
+@click.option('--skip-parsers', is_flag=True, help="Don't benchmark each parser on its own.")
+@click.option('--output', type=click.Path(dir_okay=False), help='A file to append the results to, as a JSON line.')
+def main(events: int, seed: int, data: Optional[str], workers: int, repeat: int, skip_parsers: bool,
+         output: Optional[str]) -> None:
+    """
+    Benchmarks parsing, preprocessing and querying over synthetic archives, and prints the results as JSON.
+    """
+    root = data or tempfile.mkdtemp(prefix='lens-benchmark-')
+    try:
+        summary = None
+        if not (os.path.isdir(os.path.join(root, 'facebook')) and os.path.isdir(os.path.join(root, 'google'))):
+            start = time.perf_counter()
+            summary = generate(root, events, seed)
+            summary['seconds'] = time.perf_counter() - start
+        config = {'full_name': FULL_NAME, 'workers': workers}
+        results = {
+            'environment': environment(),
+            'parameters': {'events': events, 'seed': seed, 'workers': workers, 'repeat': repeat,
+                           'generated': summary is not None},
+            'archives': summary,
+            **benchmark(root, config, repeat, parsers=not skip_parsers),
+        }
+    finally:
+        if data is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    click.echo(json.dumps(results, indent=2, default=str))
+    if output is not None:
+        with open(output, 'a') as file:
+            file.write(json.dumps(results, default=str) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,149 @@
 """
-TODO: Make a user-facing CLI here.
+The command-line interface to the search engine: preprocess data archives into a snapshot, query a snapshot, or serve
+its /query endpoint over HTTP.
+
+    python -m cli.cli preprocess --facebook test_data/facebook/ --google test_data/google/ --snapshot index.lens
+    python -m cli.cli query --snapshot index.lens source=Email limit=10
+    python -m cli.cli serve --snapshot index.lens --port 8000
 
 The CLI depends on this package and the common package.
 """
-import click
\ No newline at end of file
+
+import json
+import os.path
+import sys
+from functools import partial
+from typing import Any, Dict, Optional, Tuple
+
+import click
+
+from examples.search.main import SearchEngine
+from lens.server import MAX_LIMIT, QueryServer, run
+from lens.sources.FacebookSource import FacebookSource
+from lens.sources.GoogleSource import GoogleSource
+
+
+def load_config(path: Optional[str], full_name: Optional[str]) -> Dict[str, Any]:
+    config = {}
+    if path is not None:
+        with open(path) as file:
+            config = json.load(file)
+    if full_name is not None:
+        config['full_name'] = full_name
+    return config
+
+
+def parse_arguments(pairs: Tuple[str, ...]) -> Dict[str, Any]:
+    """
+    Parses KEY=VALUE query arguments. A key that's repeated becomes a list.
+    """
+    args: Dict[str, Any] = {}
+    for pair in pairs:
+        name, separator, value = pair.partition('=')
+        if not separator:
+            raise click.BadParameter(f'Expected KEY=VALUE, got {pair!r}.', param_hint='ARGS')
+        if name in args:
+            args[name] = (args[name] if isinstance(args[name], list) else [args[name]]) + [value]
+        else:
+            args[name] = value
+    return args
+
+
+def parse_json_arguments(text: str) -> Dict[str, Any]:
+    """
+    Parses query arguments given as a JSON object.
+    """
+    try:
+        args = json.loads(text)
+    except ValueError as error:
+        raise click.BadParameter(f'Invalid JSON: {error}.', param_hint='--json')
+    if not isinstance(args, dict):
+        raise click.BadParameter('Expected a JSON object.', param_hint='--json')
+    return args
+
+
+@click.group()
+@click.option('--config', 'config_path', type=click.Path(exists=True, dir_okay=False),
+              help='A JSON file of search engine configuration (e.g. full_name, workers, metadata_budget).')
+@click.option('--full-name', help="The user's full name, as it appears in their Facebook data.")
+@click.pass_context
+def cli(context: click.Context, config_path: Optional[str], full_name: Optional[str]) -> None:
+    context.obj = load_config(config_path, full_name)
+
+
+@cli.command()
+@click.option('--facebook', required=True, type=click.Path(exists=True, file_okay=False),
+              help='The directory of the Facebook data export.')
+@click.option('--google', required=True, type=click.Path(exists=True, file_okay=False),
+              help='The directory of the Google Takeout export.')
+@click.option('--snapshot', required=True, type=click.Path(dir_okay=False), help='The snapshot to write.')
+@click.option('--rebuild', is_flag=True, help='Index everything from scratch, even if the snapshot exists.')
+@click.pass_obj
+def preprocess(config: Dict[str, Any], facebook: str, google: str, snapshot: str, rebuild: bool) -> None:
+    """
+    Indexes data archives into a snapshot. If the snapshot exists, only files that changed since it was written are
+    re-indexed.
+    """
+    if os.path.exists(snapshot) and not rebuild:
+        engine = SearchEngine.load(snapshot, config=config)
+    else:
+        engine = SearchEngine(config=config)
+    engine.preprocess(FacebookSource(facebook), GoogleSource(google))
+    engine.save(snapshot)
+    click.echo(f'Indexed {len(engine.events) - engine.events.retracted} events into {snapshot}.', err=True)
+
+
+@cli.command()
+@click.option('--snapshot', required=True, type=click.Path(exists=True, dir_okay=False), help='The snapshot to query.')
+@click.option('--json', 'json_args', help='The query arguments as a JSON object, instead of KEY=VALUE pairs.')
+@click.argument('pairs', metavar='[KEY=VALUE]...', nargs=-1)
+@click.pass_obj
+def query(config: Dict[str, Any], snapshot: str, json_args: Optional[str], pairs: Tuple[str, ...]) -> None:
+    """
+    Queries a snapshot, and writes the results to stdout as newline-delimited JSON (followed by a cursor line if
+    there's another page). See `examples.search.query` for the arguments.
+    """
+    args = parse_json_arguments(json_args) if json_args is not None else parse_arguments(pairs)
+    engine = SearchEngine.load(snapshot, config=config)
+    try:
+        engine.results(args).write_ndjson(sys.stdout)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+
+
+@cli.command()
+@click.option('--snapshot', required=True, type=click.Path(exists=True, dir_okay=False), help='The snapshot to serve.')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8000, show_default=True)
+@click.option('--workers', type=int, help='The number of workers that run queries. Defaults to the number of CPUs.')
+@click.option('--threads', is_flag=True, help='Run queries in worker threads rather than processes.')
+@click.option('--heavy-workers', type=int,
+              help='The most aggregates (and unlimited queries) that run at once. Defaults to half the workers.')
+@click.option('--backlog', default=64, show_default=True,
+              help='The most requests (of each kind) that wait for a worker before new ones are turned away.')
+@click.option('--timeout', default=30.0, show_default=True, help='The seconds after which a request times out.')
+@click.option('--max-limit', default=MAX_LIMIT, show_default=True,
+              help='The most rows a response holds. Larger results are paged with cursors.')
+@click.pass_obj
+def serve(config: Dict[str, Any], snapshot: str, host: str, port: int, workers: Optional[int], threads: bool,
+          heavy_workers: Optional[int], backlog: int, timeout: float, max_limit: int) -> None:
+    """
+    Serves a snapshot's /query endpoint over HTTP.
+    """
+    server = QueryServer(
+        load=partial(SearchEngine.load, snapshot, config),
+        endpoints={'/query': 'results'},
+        workers=workers,
+        processes=not threads,
+        heavy=SearchEngine.heavy,
+        heavy_concurrency=heavy_workers,
+        backlog=backlog,
+        timeout=timeout,
+        max_limit=max_limit
+    )
+    run(server, host, port, ready=lambda addresses: click.echo(
+        'Serving on ' + ', '.join(f'http://{address}:{port}' for address, port in addresses), err=True))
+
+
+if __name__ == '__main__':
+    cli()
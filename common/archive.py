@@ -0,0 +1,402 @@
+"""
+A seekable, encrypted container for data downloads.
+
+Member files are concatenated into a single stream, which is cut into fixed-size chunks. Each chunk is compressed (when
+that makes it smaller) and sealed with AES-256-GCM on its own, and an encrypted index at the end of the container maps
+every member to its range of the stream and every chunk to its location in the container. Reading a member therefore
+only decrypts the chunks that overlap it, and a reader needs nothing but the header, the trailer, the index and those
+chunks. Nothing has to be decrypted or extracted ahead of time.
+
+Every member's entry is also sealed into the container as soon as the member's data has been written, right among the
+chunks, and every sealed record is framed by its kind and length. A prefix of the container (e.g. one that's still
+being downloaded) can therefore be read without the index: its records are scanned in order, and every member whose
+entry and chunks have arrived can be read.
+
+    +--------+---------+---------+---------+-----+---------+---------+-----------------+---------+
+    | header | chunk 0 | chunk 1 | entry 0 | ... | chunk n | entry m | encrypted index | trailer |
+    +--------+---------+---------+---------+-----+---------+---------+-----------------+---------+
+
+Chunk keys are derived from the user's (Fernet) key as in `common.encryption`, under a random per-container salt.
+"""
+
+import hashlib
+import io
+import json
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict, deque
+from typing import Any, BinaryIO, Deque, Dict, Iterable, List, Optional, Union
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from common.encryption import derive_key
+
+MAGIC = b'LENSARC1'
+VERSION = 2
+
+# magic, format version, chunk size, HKDF salt, nonce prefix
+HEADER = struct.Struct('<8sII16s4s')
+# record kind, sealed length
+RECORD = struct.Struct('<BI')
+# index offset, index length, magic
+TRAILER = struct.Struct('<QQ8s')
+
+# The kinds of records. A chunk's kind says whether it's compressed.
+RAW_CHUNK = 0
+COMPRESSED_CHUNK = 1
+ENTRY = 2
+INDEX = 3
+
+CHUNK_SIZE = 1024 * 1024
+COMPRESSION_LEVEL = 6
+
+# The nonce counter values of entries (which count up from here) and of the index. Chunks count up from zero.
+ENTRY_COUNTER = 2 ** 63
+INDEX_COUNTER = 2 ** 64 - 1
+
+# The number of decrypted chunks a reader keeps for repeated access.
+CACHED_CHUNKS = 16
+
+
+def nonce(prefix: bytes, counter: int) -> bytes:
+    return prefix + struct.pack('>Q', counter)
+
+
+class ArchiveEntry:
+    """
+    A member of an archive: its range [offset, offset + size) of the archive's stream, along with the modification time
+    and SHA-256 hash of the file it was read from.
+    """
+
+    __slots__ = ('name', 'offset', 'size', 'mtime_ns', 'sha256')
+
+    def __init__(self, name: str, offset: int, size: int, mtime_ns: int, sha256: str) -> None:
+        self.name = name
+        self.offset = offset
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.sha256 = sha256
+
+
+class ArchiveWriter:
+    """
+    Writes an archive to a file object, which only needs to support sequential writes (e.g. a `BlockUploader`).
+    """
+
+    def __init__(self, file: BinaryIO, key: bytes, chunk_size: int = CHUNK_SIZE,
+                 compression_level: int = COMPRESSION_LEVEL) -> None:
+        salt = os.urandom(16)
+        self.prefix = os.urandom(4)
+        self.header = HEADER.pack(MAGIC, VERSION, chunk_size, salt, self.prefix)
+        self.cipher = AESGCM(derive_key(key, salt))
+        self.file = file
+        self.chunk_size = chunk_size
+        self.compression_level = compression_level
+
+        self.entries: List[ArchiveEntry] = []
+        # (offset, length, compressed) of every sealed chunk.
+        self.chunks: List[List[int]] = []
+        self.buffer = bytearray()
+        self.stream_size = 0
+        self.position = 0
+        self._write(self.header)
+
+    def __enter__(self) -> 'ArchiveWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.close()
+
+    def _write(self, data: bytes) -> None:
+        self.file.write(data)
+        self.position += len(data)
+
+    def _write_record(self, kind: int, counter: int, data: bytes) -> int:
+        """
+        Seals a record and writes it (after its kind and length), and returns the offset of the sealed data. The kind
+        is authenticated, so e.g. a raw chunk can't be passed off as a compressed one.
+        """
+        sealed = self.cipher.encrypt(nonce(self.prefix, counter), data, self.header + bytes([kind]))
+        self._write(RECORD.pack(kind, len(sealed)))
+        offset = self.position
+        self._write(sealed)
+        return offset
+
+    def _seal(self, chunk: bytes) -> None:
+        compressed = zlib.compress(chunk, self.compression_level)
+        kind = COMPRESSED_CHUNK if len(compressed) < len(chunk) else RAW_CHUNK
+        data = compressed if kind == COMPRESSED_CHUNK else chunk
+        offset = self._write_record(kind, len(self.chunks), data)
+        self.chunks.append([offset, self.position - offset, kind])
+
+    def add(self, name: str, data: Union[bytes, BinaryIO, Iterable[bytes]], mtime_ns: int = 0) -> ArchiveEntry:
+        """
+        Appends a member, given its contents, a file object to stream them from, or an iterable of blocks.
+        """
+        if isinstance(data, (bytes, bytearray)):
+            data = io.BytesIO(data)
+        blocks = iter(lambda: data.read(self.chunk_size), b'') if hasattr(data, 'read') else data
+        digest = hashlib.sha256()
+        offset = self.stream_size
+        for block in blocks:
+            digest.update(block)
+            self.buffer += block
+            self.stream_size += len(block)
+            while len(self.buffer) >= self.chunk_size:
+                self._seal(bytes(self.buffer[:self.chunk_size]))
+                del self.buffer[:self.chunk_size]
+
+        entry = ArchiveEntry(name, offset, self.stream_size - offset, mtime_ns, digest.hexdigest())
+        row = [entry.name, entry.offset, entry.size, entry.mtime_ns, entry.sha256]
+        self._write_record(ENTRY, ENTRY_COUNTER + len(self.entries), json.dumps(row).encode('utf-8'))
+        self.entries.append(entry)
+        return entry
+
+    def add_directory(self, root: str, prefix: str = '', extensions: Optional[List[str]] = None) -> int:
+        """
+        Adds every file under `root` (with one of the given extensions, if any), named by its path relative to the root
+        with a prefix. Returns the number of files added.
+        """
+        count = 0
+        for directory, _, names in sorted(os.walk(root)):
+            for name in sorted(names):
+                if extensions is not None and not any(name.endswith(extension) for extension in extensions):
+                    continue
+                path = os.path.join(directory, name)
+                relative_path = os.path.relpath(path, root).replace(os.sep, '/')
+                with open(path, 'rb') as file:
+                    self.add(prefix + relative_path, file, mtime_ns=os.stat(path).st_mtime_ns)
+                count += 1
+        return count
+
+    def close(self) -> None:
+        if self.buffer:
+            self._seal(bytes(self.buffer))
+            self.buffer = bytearray()
+        index = json.dumps({
+            'stream_size': self.stream_size,
+            'chunks': self.chunks,
+            'members': [[e.name, e.offset, e.size, e.mtime_ns, e.sha256] for e in self.entries],
+        }).encode('utf-8')
+        index_offset = self._write_record(INDEX, INDEX_COUNTER, zlib.compress(index))
+        self._write(TRAILER.pack(index_offset, self.position - index_offset, MAGIC))
+        self.file.flush()
+
+
+class ArchiveReader:
+    """
+    Reads members of an archive from a seekable file (or a path). Members can be opened as file objects, and chunks are
+    decrypted on demand and cached, so reading is random-access and costs no more than the data that's touched.
+
+    The file may also be a prefix of an archive, e.g. one that's still being downloaded. Then only the members that
+    have arrived in full are listed (`complete` is False), and `refresh` picks up the ones that arrived since.
+    """
+
+    def __init__(self, file: Union[str, BinaryIO], key: bytes, cached_chunks: int = CACHED_CHUNKS) -> None:
+        self.path = file if isinstance(file, str) else None
+        self.key = key
+        self.cached_chunks = cached_chunks
+        self.file = open(file, 'rb') if isinstance(file, str) else file
+        self.lock = threading.Lock()
+        self.cache: Dict[int, bytes] = OrderedDict()
+
+        self.header = self._read_at(0, HEADER.size)
+        if len(self.header) < HEADER.size:
+            raise ValueError('The archive is truncated.')
+        magic, version, self.chunk_size, salt, self.prefix = HEADER.unpack(self.header)
+        if magic != MAGIC:
+            raise ValueError('Not a Lens archive.')
+        if version != VERSION:
+            raise ValueError(f'Unsupported archive version {version} (expected {VERSION}).')
+        self.cipher = AESGCM(derive_key(key, salt))
+
+        self.stream_size = 0
+        self.chunks: List[List[int]] = []
+        self.entries: Dict[str, ArchiveEntry] = {}
+        self.complete = False
+        # The offset of the next record to scan, the entries read but whose data hasn't all arrived yet, and the
+        # number of entries read.
+        self.scanned = HEADER.size
+        self.pending: Deque[ArchiveEntry] = deque()
+        self.scanned_entries = 0
+
+        end = self._size()
+        if end >= HEADER.size + TRAILER.size:
+            index_offset, index_length, magic = TRAILER.unpack(self._read_at(end - TRAILER.size, TRAILER.size))
+            if magic == MAGIC:
+                self._read_index(index_offset, index_length)
+        self.refresh()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Readers are passed to worker processes by path, and reopened there.
+        if self.path is None:
+            raise TypeError('Only archive readers opened from a path can be pickled.')
+        return {'path': self.path, 'key': self.key, 'cached_chunks': self.cached_chunks}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state['path'], state['key'], state['cached_chunks'])
+
+    def _read_at(self, offset: int, length: int) -> bytes:
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(length)
+
+    def _size(self) -> int:
+        with self.lock:
+            return self.file.seek(0, os.SEEK_END)
+
+    def _unseal(self, kind: int, counter: int, offset: int, length: int) -> bytes:
+        return self.cipher.decrypt(nonce(self.prefix, counter), self._read_at(offset, length),
+                                   self.header + bytes([kind]))
+
+    def _read_index(self, offset: int, length: int) -> None:
+        index = json.loads(zlib.decompress(self._unseal(INDEX, INDEX_COUNTER, offset, length)))
+        self.stream_size = index['stream_size']
+        self.chunks = index['chunks']
+        self.entries = {row[0]: ArchiveEntry(*row) for row in index['members']}
+        self.pending.clear()
+        self.complete = True
+
+    def refresh(self) -> int:
+        """
+        Scans the records of a partial archive that have arrived since it was opened (or last refreshed), and returns
+        the number of members that became readable. Does nothing once the archive is complete.
+        """
+        if self.complete:
+            return 0
+        count = len(self.entries)
+        end = self._size()
+        while not self.complete and self.scanned + RECORD.size <= end:
+            kind, length = RECORD.unpack(self._read_at(self.scanned, RECORD.size))
+            offset = self.scanned + RECORD.size
+            if offset + length > end:
+                break
+            if kind in (RAW_CHUNK, COMPRESSED_CHUNK):
+                self.chunks.append([offset, length, kind])
+            elif kind == ENTRY:
+                # Entries are sealed with their position in the sequence, so they can't be dropped or reordered.
+                row = json.loads(self._unseal(ENTRY, ENTRY_COUNTER + self.scanned_entries, offset, length))
+                self.pending.append(ArchiveEntry(*row))
+                self.scanned_entries += 1
+            elif kind == INDEX:
+                self._read_index(offset, length)
+            else:
+                raise ValueError(f'The archive has a record of unknown kind {kind}.')
+            self.scanned = offset + length
+
+        if not self.complete:
+            # Every chunk but the last one is full, and the last one holds the end of every member written before it.
+            self.stream_size = len(self.chunks) * self.chunk_size
+            while self.pending and self.pending[0].offset + self.pending[0].size <= self.stream_size:
+                entry = self.pending.popleft()
+                self.entries[entry.name] = entry
+        return len(self.entries) - count
+
+    def names(self) -> List[str]:
+        return list(self.entries)
+
+    def chunk(self, number: int) -> bytes:
+        """
+        Returns the decrypted contents of a chunk of the stream.
+        """
+        with self.lock:
+            data = self.cache.get(number)
+            if data is not None:
+                self.cache.move_to_end(number)
+                return data
+
+        offset, length, kind = self.chunks[number]
+        data = self._unseal(kind, number, offset, length)
+        if kind == COMPRESSED_CHUNK:
+            data = zlib.decompress(data)
+
+        with self.lock:
+            self.cache[number] = data
+            while len(self.cache) > self.cached_chunks:
+                self.cache.popitem(last=False)
+        return data
+
+    def read_range(self, start: int, stop: int) -> bytes:
+        """
+        Returns the bytes in [start, stop) of the archive's stream.
+        """
+        if stop <= start:
+            return b''
+        first, last = start // self.chunk_size, (stop - 1) // self.chunk_size
+        data = b''.join(self.chunk(number) for number in range(first, last + 1))
+        offset = start - first * self.chunk_size
+        return data[offset:offset + stop - start]
+
+    def open(self, name: str) -> 'ArchiveMember':
+        entry = self.entries.get(name)
+        if entry is None:
+            raise FileNotFoundError(f'The archive has no member named "{name}".')
+        return ArchiveMember(self, entry)
+
+    def read(self, name: str) -> bytes:
+        with self.open(name) as member:
+            return member.read()
+
+
+class ArchiveMember(io.RawIOBase):
+    """
+    A read-only, seekable file over a single archive member. Like an `mmap`, it also supports slicing and `find`, so
+    code written against memory-mapped files (e.g. the mbox reader) works on archive members unchanged.
+    """
+
+    def __init__(self, reader: ArchiveReader, entry: ArchiveEntry) -> None:
+        super().__init__()
+        self.reader = reader
+        self.entry = entry
+        self.position = 0
+
+    def __len__(self) -> int:
+        return self.entry.size
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self.position, os.SEEK_END: self.entry.size}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def readinto(self, buffer: Any) -> int:
+        data = self[self.position:self.position + len(buffer)]
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def __getitem__(self, key: Union[int, slice]) -> Any:
+        if isinstance(key, int):
+            if key < 0:
+                key += self.entry.size
+            return self[key:key + 1][0]
+        start, stop, step = key.indices(self.entry.size)
+        if step != 1:
+            raise ValueError('Archive members only support contiguous slices.')
+        return self.reader.read_range(self.entry.offset + start, self.entry.offset + max(start, stop))
+
+    def find(self, sub: bytes, start: int = 0, end: Optional[int] = None) -> int:
+        """
+        Returns the lowest offset in [start, end) at which `sub` is found, or -1.
+        """
+        end = self.entry.size if end is None else min(end, self.entry.size)
+        window = self.reader.chunk_size
+        position = start
+        while position < end:
+            stop = min(end, position + window + len(sub) - 1)
+            found = self[position:stop].find(sub)
+            if found != -1:
+                return position + found
+            position += window
+        return -1
@@ -0,0 +1,174 @@
+import os
+import shutil
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional, Tuple
+
+from azure.core import MatchConditions
+from azure.storage.blob import BlobBlock, BlobClient, BlobServiceClient
+
+# The size of the pieces that downloads are streamed in.
+READ_SIZE = 4 * 1024 * 1024
+
+
+class BlobStore(ABC):
+    """
+    The storage operations that dataset uploads and downloads need. Blobs are uploaded as a list of blocks that are
+    staged independently (and so can be staged concurrently), then committed in order to form the blob.
+    """
+
+    @abstractmethod
+    def stage_block(self, name: str, block_id: str, data: bytes) -> None:
+        pass
+
+    @abstractmethod
+    def commit_blocks(self, name: str, block_ids: List[str]) -> None:
+        pass
+
+    @abstractmethod
+    def download(self, name: str) -> Iterator[bytes]:
+        """
+        Streams a blob's contents as a sequence of byte strings.
+        """
+
+    @abstractmethod
+    def properties(self, name: str) -> Tuple[int, str]:
+        """
+        Returns a blob's size and ETag. The ETag changes whenever the blob is rewritten.
+        """
+
+    @abstractmethod
+    def download_range(self, name: str, offset: int, length: int, etag: Optional[str] = None) -> bytes:
+        """
+        Returns `length` bytes of a blob from `offset` (or fewer, at the end of the blob). Given an ETag, fails if the
+        blob has changed since.
+        """
+
+    @abstractmethod
+    def exists(self, name: str) -> bool:
+        pass
+
+    @abstractmethod
+    def list_blobs(self, prefix: str = '') -> Iterator[str]:
+        """
+        Yields the names of the (committed) blobs whose names start with `prefix`.
+        """
+
+    @abstractmethod
+    def delete(self, name: str) -> None:
+        pass
+
+    def upload(self, name: str, data: bytes) -> None:
+        """
+        Uploads a (small) blob in a single block.
+        """
+        self.stage_block(name, 'block-00000000', data)
+        self.commit_blocks(name, ['block-00000000'])
+
+
+class AzureBlobStore(BlobStore):
+    """
+    Stores blobs as block blobs in an Azure Blob Storage container (or an Azurite emulator, given its connection
+    string).
+    """
+
+    def __init__(self, connect_str: str, container_name: str) -> None:
+        self.container_name = container_name
+        self.blob_service_client = BlobServiceClient.from_connection_string(connect_str)
+
+    def get_blob_client(self, name: str) -> BlobClient:
+        return self.blob_service_client.get_blob_client(container=self.container_name, blob=name)
+
+    def stage_block(self, name: str, block_id: str, data: bytes) -> None:
+        self.get_blob_client(name).stage_block(block_id=block_id, data=data)
+
+    def commit_blocks(self, name: str, block_ids: List[str]) -> None:
+        self.get_blob_client(name).commit_block_list([BlobBlock(block_id=block_id) for block_id in block_ids])
+
+    def download(self, name: str) -> Iterator[bytes]:
+        yield from self.get_blob_client(name).download_blob().chunks()
+
+    def properties(self, name: str) -> Tuple[int, str]:
+        properties = self.get_blob_client(name).get_blob_properties()
+        return properties.size, properties.etag
+
+    def download_range(self, name: str, offset: int, length: int, etag: Optional[str] = None) -> bytes:
+        if etag is None:
+            return self.get_blob_client(name).download_blob(offset=offset, length=length).readall()
+        return self.get_blob_client(name).download_blob(
+            offset=offset, length=length, etag=etag, match_condition=MatchConditions.IfNotModified
+        ).readall()
+
+    def exists(self, name: str) -> bool:
+        return self.get_blob_client(name).exists()
+
+    def list_blobs(self, prefix: str = '') -> Iterator[str]:
+        container = self.blob_service_client.get_container_client(self.container_name)
+        for blob in container.list_blobs(name_starts_with=prefix):
+            yield blob.name
+
+    def delete(self, name: str) -> None:
+        self.get_blob_client(name).delete_blob()
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Stores blobs as files in a local directory, e.g. for tests or for running without an Azure account. Staged blocks
+    are written to a directory next to the blob, and concatenated into the blob when they're committed.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def stage_block(self, name: str, block_id: str, data: bytes) -> None:
+        directory = self.path(name) + '.blocks'
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, block_id), 'wb') as file:
+            file.write(data)
+
+    def commit_blocks(self, name: str, block_ids: List[str]) -> None:
+        directory = self.path(name) + '.blocks'
+        with open(self.path(name) + '.tmp', 'wb') as blob:
+            for block_id in block_ids:
+                with open(os.path.join(directory, block_id), 'rb') as block:
+                    shutil.copyfileobj(block, blob)
+        os.replace(self.path(name) + '.tmp', self.path(name))
+        shutil.rmtree(directory)
+
+    def download(self, name: str) -> Iterator[bytes]:
+        with open(self.path(name), 'rb') as file:
+            yield from iter(lambda: file.read(READ_SIZE), b'')
+
+    @staticmethod
+    def etag(stat: os.stat_result) -> str:
+        # Blobs are only ever replaced as a whole, so the size and modification time identify a version.
+        return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+    def properties(self, name: str) -> Tuple[int, str]:
+        stat = os.stat(self.path(name))
+        return stat.st_size, self.etag(stat)
+
+    def download_range(self, name: str, offset: int, length: int, etag: Optional[str] = None) -> bytes:
+        with open(self.path(name), 'rb') as file:
+            if etag is not None and self.etag(os.fstat(file.fileno())) != etag:
+                raise RuntimeError(f'The blob "{name}" has changed since {etag}.')
+            file.seek(offset)
+            return file.read(length)
+
+    def exists(self, name: str) -> bool:
+        return os.path.isfile(self.path(name))
+
+    def list_blobs(self, prefix: str = '') -> Iterator[str]:
+        for directory, directories, names in os.walk(self.root):
+            # Skip blocks that are staged but not yet committed.
+            directories[:] = [name for name in directories if not name.endswith('.blocks')]
+            for name in names:
+                blob = os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, '/')
+                if blob.startswith(prefix) and not blob.endswith('.tmp'):
+                    yield blob
+
+    def delete(self, name: str) -> None:
+        os.remove(self.path(name))
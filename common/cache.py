@@ -0,0 +1,84 @@
+import hashlib
+import os
+from typing import List, Optional, Tuple
+
+# The default size budget of a download cache.
+CACHE_SIZE = 10 * 1024 * 1024 * 1024
+
+
+class DownloadCache:
+    """
+    An on-disk cache of downloaded blobs, keyed by blob name and ETag, so a blob that hasn't changed since it was last
+    downloaded is never downloaded again. Blobs are cached exactly as they're stored (i.e. still encrypted), so the
+    cache doesn't leave any user data on disk in the clear.
+
+    The cache holds at most `max_size` bytes. Entries are touched whenever they're used, and the least recently used
+    ones are evicted first once the cache is over budget. Partial downloads are kept in the cache directory too (with a
+    `.part` suffix), so an interrupted download can resume, but they don't count towards the budget.
+    """
+
+    def __init__(self, root: str, max_size: int = CACHE_SIZE) -> None:
+        """
+        Args:
+            root (str): The directory to keep cached blobs in.
+            max_size (int): The total size of the cached blobs, in bytes, beyond which the least recently used ones
+                are evicted. Defaults to 10 GB.
+        """
+        self.root = root
+        self.max_size = max_size
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name: str, etag: str) -> str:
+        key = hashlib.sha256(f'{name}\n{etag}'.encode()).hexdigest()
+        return os.path.join(self.root, key)
+
+    def get(self, name: str, etag: str) -> Optional[str]:
+        """
+        Returns the path to a cached blob, or None if this version of the blob isn't cached.
+        """
+        path = self.path(name, etag)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, name: str, etag: str, path: str) -> str:
+        """
+        Moves a downloaded blob (on the same file system) into the cache, evicts entries to stay within the budget,
+        and returns the blob's new path.
+        """
+        destination = self.path(name, etag)
+        os.replace(path, destination)
+        os.utime(destination)
+        self.evict(keep=destination)
+        return destination
+
+    def entries(self) -> List[Tuple[float, int, str]]:
+        """
+        Returns the (last use, size, path) of every cached blob, least recently used first.
+        """
+        entries = []
+        with os.scandir(self.root) as scan:
+            for entry in scan:
+                if entry.is_file() and '.' not in entry.name:
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """
+        Removes the least recently used blobs (other than `keep`) until the cache is within its budget. Returns the
+        number of bytes freed.
+        """
+        entries = self.entries()
+        excess = sum(size for _, size, _ in entries) - self.max_size
+        freed = 0
+        for _, size, path in entries:
+            if freed >= excess:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            freed += size
+        return freed
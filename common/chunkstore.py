@@ -0,0 +1,292 @@
+"""
+Deduplicated dataset uploads.
+
+Every file of a dataset is split into content-defined chunks: chunk boundaries are placed wherever a rolling hash of
+the last few bytes matches a bit pattern, so they depend only on the bytes around them. Inserting or appending data
+(e.g. new emails in an mbox file) therefore only changes the chunks around the edit, and every other chunk keeps its
+boundaries and its contents.
+
+Chunks are stored as individual blobs named by a keyed hash (HMAC) of their contents, under the user's prefix, and are
+compressed and encrypted independently. An upload only sends the chunks the store doesn't have yet, followed by an
+encrypted manifest that lists every file's chunks. Since chunk names are keyed with the user's key, they don't reveal
+whether two users (or the server) hold the same data.
+
+    <prefix>manifest           the encrypted manifest of the latest upload
+    <prefix>chunks/<hmac>      an encrypted chunk
+"""
+
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Deque, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+import numpy as np
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from common.archive import ArchiveWriter
+from common.blobstore import BlobStore
+from common.cache import DownloadCache
+from common.encryption import derive_key
+
+# The bounds on chunk sizes. The average is the expected distance between hash matches past the minimum, and must be
+# a power of two.
+MIN_CHUNK_SIZE = 256 * 1024
+AVERAGE_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+
+# The number of bytes the rolling hash covers.
+WINDOW = 48
+
+# The size of the reads that files are chunked in.
+READ_SIZE = 8 * 1024 * 1024
+
+COMPRESSION_LEVEL = 6
+
+# A random (but fixed) 32-bit value for every byte value. The rolling hash of a window is the sum of its bytes' values.
+GEAR = np.frombuffer(hashlib.shake_256(b'lens content-defined chunking').digest(256 * 4), dtype='<u4')
+
+# Flags stored in front of every sealed blob.
+RAW = 0
+COMPRESSED = 1
+
+
+def cut_candidates(data: bytes, average_size: int = AVERAGE_CHUNK_SIZE) -> np.ndarray:
+    """
+    Returns the (sorted) offsets in `data` at which a chunk may end, i.e. where the rolling hash of the preceding
+    `WINDOW` bytes matches. The hash is computed for the whole buffer at once: a windowed sum is the difference of two
+    prefix sums, which wrap around consistently in 32 bits.
+    """
+    sums = np.cumsum(GEAR[np.frombuffer(data, dtype=np.uint8)], dtype=np.uint32)
+    hashes = sums.copy()
+    hashes[WINDOW:] -= sums[:-WINDOW]
+    return np.flatnonzero((hashes & np.uint32(average_size - 1)) == 0) + 1
+
+
+def content_chunks(stream: BinaryIO, min_size: int = MIN_CHUNK_SIZE, average_size: int = AVERAGE_CHUNK_SIZE,
+                   max_size: int = MAX_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Splits a stream into content-defined chunks of between `min_size` and `max_size` bytes (except a shorter final
+    one). The boundaries only depend on the stream's contents, not on how it's read.
+    """
+    buffer = b''
+    end_of_stream = False
+    while not end_of_stream:
+        block = stream.read(READ_SIZE)
+        end_of_stream = not block
+        # The buffer always starts at a chunk boundary, and since candidates are only taken `min_size` (> `WINDOW`)
+        # bytes past a boundary, the partial windows at the start of the buffer never matter.
+        buffer += block
+        cuts = cut_candidates(buffer, average_size)
+        start = 0
+        while start < len(buffer):
+            index = np.searchsorted(cuts, start + min_size)
+            if index < len(cuts) and cuts[index] <= start + max_size:
+                end = int(cuts[index])
+            elif len(buffer) - start >= max_size:
+                end = start + max_size
+            elif end_of_stream:
+                end = len(buffer)
+            else:
+                break
+            yield buffer[start:end]
+            start = end
+        buffer = buffer[start:]
+
+
+class ChunkStore:
+    """
+    A user's deduplicated dataset in a blob store: a set of encrypted chunks, plus a manifest of the files they make up.
+    """
+
+    def __init__(self, store: BlobStore, prefix: str, key: bytes, workers: int = 4,
+                 cache: Optional[DownloadCache] = None) -> None:
+        """
+        Args:
+            store (BlobStore): The store to keep the chunks in.
+            prefix (str): The user's prefix in the store, e.g. "datasets/<uuid>/".
+            key (bytes): The user's (Fernet) key, which the encryption and chunk naming keys are derived from.
+            workers (int): The number of chunks compressed, encrypted and uploaded (or downloaded) concurrently.
+            cache (Optional[DownloadCache]): A cache for downloaded chunks. Chunks never change, so cached chunks are
+                used without checking the store.
+        """
+        self.store = store
+        self.prefix = prefix
+        self.workers = workers
+        self.cache = cache
+        self.key = key
+        self.cipher = AESGCM(derive_key(key, b'lens chunk store: encryption'))
+        self.naming_key = derive_key(key, b'lens chunk store: naming')
+
+    @property
+    def manifest_name(self) -> str:
+        return self.prefix + 'manifest'
+
+    def chunk_name(self, chunk_id: str) -> str:
+        return f'{self.prefix}chunks/{chunk_id}'
+
+    def chunk_id(self, chunk: bytes) -> str:
+        return hmac.new(self.naming_key, chunk, hashlib.sha256).hexdigest()
+
+    def seal(self, data: bytes, associated_data: bytes) -> bytes:
+        """
+        Compresses (if that makes it smaller) and encrypts a blob. The flag and the blob's name are authenticated, so
+        a chunk can't be served in place of another.
+        """
+        compressed = zlib.compress(data, COMPRESSION_LEVEL)
+        flag = COMPRESSED if len(compressed) < len(data) else RAW
+        nonce = os.urandom(12)
+        header = bytes([flag]) + nonce
+        return header + self.cipher.encrypt(nonce, compressed if flag == COMPRESSED else data,
+                                            associated_data + bytes([flag]))
+
+    def unseal(self, blob: bytes, associated_data: bytes) -> bytes:
+        flag, nonce = blob[0], blob[1:13]
+        data = self.cipher.decrypt(nonce, blob[13:], associated_data + bytes([flag]))
+        return zlib.decompress(data) if flag == COMPRESSED else data
+
+    def read_manifest(self) -> Optional[Dict[str, Any]]:
+        """
+        Returns the manifest of the latest upload, or None if nothing has been uploaded yet.
+        """
+        if not self.store.exists(self.manifest_name):
+            return None
+        blob = b''.join(self.store.download(self.manifest_name))
+        return json.loads(self.unseal(blob, self.manifest_name.encode()))
+
+    def upload(self, input_path: str, extensions: List[str]) -> Dict[str, int]:
+        """
+        Uploads the files under `input_path` with one of the given extensions, named by their path relative to the
+        parent of `input_path` (as in `AzureStorage.create_zip`). Files whose size and modification time match the
+        previous manifest are assumed unchanged and aren't read. Returns statistics about the upload.
+        """
+        previous = self.read_manifest() or {'files': []}
+        previous_files = {entry['name']: entry for entry in previous['files']}
+        existing = {name.rsplit('/', 1)[-1] for name in self.store.list_blobs(self.prefix + 'chunks/')}
+        stats = {'files': 0, 'chunks': 0, 'uploaded_chunks': 0, 'bytes': 0, 'uploaded_bytes': 0}
+
+        files = []
+        pending: Deque[Future] = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for path, name in self._walk(input_path, extensions):
+                stat = os.stat(path)
+                entry = {'name': name, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+                old = previous_files.get(name)
+                if old and old['size'] == entry['size'] and old['mtime_ns'] == entry['mtime_ns'] and \
+                        all(chunk_id in existing for chunk_id, _ in old['chunks']):
+                    entry['chunks'] = old['chunks']
+                else:
+                    entry['chunks'] = []
+                    with open(path, 'rb') as file:
+                        for chunk in content_chunks(file):
+                            chunk_id = self.chunk_id(chunk)
+                            entry['chunks'].append([chunk_id, len(chunk)])
+                            if chunk_id in existing:
+                                continue
+                            existing.add(chunk_id)
+                            stats['uploaded_chunks'] += 1
+                            stats['uploaded_bytes'] += len(chunk)
+                            pending.append(pool.submit(self._upload_chunk, chunk_id, chunk))
+                            # Wait for uploads to catch up, so at most a few chunks per worker are held in memory.
+                            while len(pending) > 2 * self.workers:
+                                pending.popleft().result()
+                files.append(entry)
+                stats['files'] += 1
+                stats['chunks'] += len(entry['chunks'])
+                stats['bytes'] += entry['size']
+            while pending:
+                pending.popleft().result()
+
+        # The manifest is only replaced once every chunk it refers to is stored, so a failed upload leaves the previous
+        # dataset intact.
+        manifest = json.dumps({'version': 1, 'files': files}).encode('utf-8')
+        self.store.upload(self.manifest_name, self.seal(manifest, self.manifest_name.encode()))
+        return stats
+
+    def _walk(self, input_path: str, extensions: List[str]) -> Iterator[Tuple[str, str]]:
+        parent = os.path.join(input_path, '..')
+        for root, directories, names in os.walk(input_path):
+            directories.sort()
+            for name in sorted(names):
+                if any(name.endswith(extension) for extension in extensions):
+                    path = os.path.join(root, name)
+                    yield path, os.path.relpath(path, parent).replace(os.sep, '/')
+
+    def _upload_chunk(self, chunk_id: str, chunk: bytes) -> None:
+        # Compression and encryption run in the pool too (zlib and AES-GCM release the GIL), so they're parallel.
+        name = self.chunk_name(chunk_id)
+        self.store.upload(name, self.seal(chunk, name.encode()))
+
+    def read_chunk(self, chunk_id: str) -> bytes:
+        name = self.chunk_name(chunk_id)
+        cached = self.cache.get(name, chunk_id) if self.cache else None
+        if cached is not None:
+            with open(cached, 'rb') as file:
+                blob = file.read()
+        else:
+            blob = b''.join(self.store.download(name))
+            if self.cache:
+                descriptor, partial_path = tempfile.mkstemp(suffix='.part', dir=self.cache.root)
+                with os.fdopen(descriptor, 'wb') as file:
+                    file.write(blob)
+                self.cache.put(name, chunk_id, partial_path)
+        chunk = self.unseal(blob, name.encode())
+        if self.chunk_id(chunk) != chunk_id:
+            raise ValueError(f'Chunk {chunk_id} is corrupt.')
+        return chunk
+
+    def read_chunks(self, chunk_ids: List[str]) -> Iterator[bytes]:
+        """
+        Yields the contents of the given chunks in order, downloading a bounded number of them concurrently.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            remaining = iter(chunk_ids)
+            pending: Deque[Future] = deque()
+            for chunk_id in remaining:
+                pending.append(pool.submit(self.read_chunk, chunk_id))
+                if len(pending) == 2 * self.workers:
+                    break
+            while pending:
+                chunk = pending.popleft().result()
+                for chunk_id in remaining:
+                    pending.append(pool.submit(self.read_chunk, chunk_id))
+                    break
+                yield chunk
+
+    def download_archive(self, output: Union[str, BinaryIO]) -> int:
+        """
+        Rebuilds the latest upload as an encrypted archive (see `common.archive`) under the same key, with every file
+        named as in the manifest (e.g. "facebook/..."), so it can be read with an `ArchiveSource`. Files are written in
+        order as their chunks arrive, and each one can be read from the partial archive once it's complete. Returns
+        the number of files.
+        """
+        manifest = self.read_manifest()
+        if manifest is None:
+            raise FileNotFoundError(f'No dataset has been uploaded to {self.prefix}.')
+        chunks = self.read_chunks([chunk_id for entry in manifest['files'] for chunk_id, _ in entry['chunks']])
+        with open(output, 'wb') if isinstance(output, str) else contextlib.nullcontext(output) as file:
+            with ArchiveWriter(file, self.key) as archive:
+                for entry in manifest['files']:
+                    archive.add(entry['name'], (next(chunks) for _ in entry['chunks']), mtime_ns=entry['mtime_ns'])
+        return len(manifest['files'])
+
+    def prune(self) -> int:
+        """
+        Deletes the chunks that the latest manifest doesn't refer to (e.g. the parts of files that were replaced).
+        Returns the number of chunks deleted. Downloads of an earlier manifest that are still running will fail.
+        """
+        manifest = self.read_manifest()
+        referenced: Set[str] = {
+            chunk_id for entry in (manifest or {'files': []})['files'] for chunk_id, _ in entry['chunks']
+        }
+        deleted = 0
+        for name in list(self.store.list_blobs(self.prefix + 'chunks/')):
+            if name.rsplit('/', 1)[-1] not in referenced:
+                self.store.delete(name)
+                deleted += 1
+        return deleted
@@ -0,0 +1,131 @@
+"""
+Chunked authenticated encryption for data downloads.
+
+A dataset is encrypted as a sequence of fixed-size chunks, each sealed with AES-256-GCM, so that it can be encrypted,
+uploaded, downloaded and decrypted as a stream, holding only a few chunks in memory at a time. The format follows the
+STREAM construction: every chunk's nonce combines a random per-dataset prefix with the chunk's index and a flag marking
+the final chunk, so chunks can't be reordered, dropped, or truncated from the end without decryption failing.
+
+    +--------+---------+---------+-----+----------------+
+    | header | chunk 0 | chunk 1 | ... | chunk n (last) |
+    +--------+---------+---------+-----+----------------+
+
+Each chunk is `chunk_size` bytes of ciphertext plus a 16-byte tag, except the last, which may be shorter (or empty). The
+chunk key is derived with HKDF from the user's (Fernet) key and a random salt stored in the header, so every dataset
+is encrypted under its own key.
+"""
+
+import base64
+import os
+import struct
+from typing import Iterable, Iterator
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+MAGIC = b'LENSENC1'
+
+# magic, chunk size, HKDF salt, nonce prefix
+HEADER = struct.Struct('<8sI16s7s')
+
+TAG_SIZE = 16
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def derive_key(key: bytes, salt: bytes) -> bytes:
+    """
+    Derives a 256-bit AES key from a Fernet key (as stored in the user's key file) and a salt.
+    """
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        info=b'lens chunked encryption v1',
+    ).derive(base64.urlsafe_b64decode(key))
+
+
+def chunk_nonce(prefix: bytes, index: int, last: bool) -> bytes:
+    return prefix + struct.pack('>I?', index, last)
+
+
+def is_chunked(data: bytes) -> bool:
+    """
+    Returns whether a blob (given at least its first few bytes) was written by `ChunkEncryptor`.
+    """
+    return data[:len(MAGIC)] == MAGIC
+
+
+class ChunkEncryptor:
+    """
+    Encrypts a stream chunk by chunk. Callers write `header` first, followed by the output of `encrypt` for every chunk
+    in order; every chunk except the last must be exactly `chunk_size` bytes long.
+    """
+
+    def __init__(self, key: bytes, chunk_size: int = CHUNK_SIZE) -> None:
+        salt = os.urandom(16)
+        self.prefix = os.urandom(7)
+        self.chunk_size = chunk_size
+        self.header = HEADER.pack(MAGIC, chunk_size, salt, self.prefix)
+        self.cipher = AESGCM(derive_key(key, salt))
+
+    def encrypt(self, index: int, chunk: bytes, last: bool) -> bytes:
+        if not last and len(chunk) != self.chunk_size:
+            raise ValueError(f'Chunk {index} has {len(chunk)} bytes (expected {self.chunk_size}).')
+        # The header is authenticated along with every chunk, so it can't be swapped for another dataset's.
+        return self.cipher.encrypt(chunk_nonce(self.prefix, index, last), chunk, self.header)
+
+
+class ChunkDecryptor:
+    """
+    Decrypts a stream written by `ChunkEncryptor`, given its header.
+    """
+
+    def __init__(self, key: bytes, header: bytes) -> None:
+        if len(header) != HEADER.size:
+            raise ValueError('Not a chunked Lens dataset.')
+        magic, self.chunk_size, salt, self.prefix = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError('Not a chunked Lens dataset.')
+        self.header = header
+        self.cipher = AESGCM(derive_key(key, salt))
+
+    def decrypt(self, index: int, chunk: bytes, last: bool) -> bytes:
+        return self.cipher.decrypt(chunk_nonce(self.prefix, index, last), chunk, self.header)
+
+
+def read_exactly(stream: Iterator[bytes], buffer: bytearray, size: int) -> bytes:
+    """
+    Takes `size` bytes (or fewer, at the end of the stream) from the front of `buffer`, refilling it from `stream`.
+    """
+    while len(buffer) < size:
+        data = next(stream, None)
+        if data is None:
+            break
+        buffer += data
+    result = bytes(buffer[:size])
+    del buffer[:size]
+    return result
+
+
+def decrypt_chunks(key: bytes, data: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Decrypts a chunked stream, given as an iterable of byte strings of any size, and yields its plaintext chunk by
+    chunk. Raises `cryptography.exceptions.InvalidTag` if the stream was modified or truncated.
+    """
+    stream = iter(data)
+    buffer = bytearray()
+    decryptor = ChunkDecryptor(key, read_exactly(stream, buffer, HEADER.size))
+    size = decryptor.chunk_size + TAG_SIZE
+
+    index = 0
+    chunk = read_exactly(stream, buffer, size)
+    while True:
+        # A chunk is the last one if nothing follows it; read ahead by one byte to tell.
+        following = read_exactly(stream, buffer, 1)
+        last = not following
+        yield decryptor.decrypt(index, chunk, last)
+        if last:
+            return
+        chunk = following + read_exactly(stream, buffer, size - 1)
+        index += 1
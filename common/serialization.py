@@ -0,0 +1,23 @@
+from datetime import date, datetime
+from typing import Any
+
+import numpy as np
+
+
+def json_default(value: Any) -> Any:
+    """
+    Converts the values that `json.dumps` can't serialize (e.g. in event metadata) to JSON: sets to (sorted) lists,
+    dates to ISO-8601 strings, bytes to text and numpy scalars to Python numbers. Anything else becomes its `str`.
+    """
+    if isinstance(value, (set, frozenset)):
+        try:
+            return sorted(value)
+        except TypeError:
+            return list(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
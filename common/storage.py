@@ -1,39 +1,273 @@
+import io
+import json
 import os
-from typing import Optional
-import uuid
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import BinaryIO, Deque, List, Optional, Set, Union
 import zipfile
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient, __version__
 
 from cryptography.fernet import Fernet
 
 import hashlib
 
-from zipfile import ZipFile
-import os
-from os.path import basename
+from common.blobstore import READ_SIZE, AzureBlobStore, BlobStore
+from common.cache import CACHE_SIZE, DownloadCache
+from common.chunkstore import ChunkStore
+from common.encryption import (CHUNK_SIZE, HEADER, MAGIC, TAG_SIZE, ChunkDecryptor, ChunkEncryptor, decrypt_chunks,
+                               is_chunked)
 
 INCLUDED_EXTENSIONS = ['.json', '.csv', '.ics', '.vcf', '.mbox']
 
+# The delay before retrying a failed ranged read, doubled after every further failure.
+RETRY_DELAY = 1.0
+
+
+class BlockUploader(io.RawIOBase):
+    """
+    A write-only file that encrypts everything written to it in fixed-size chunks, and uploads each encrypted chunk as
+    a block of a blob from a thread pool. At most `max_pending` chunks are buffered (waiting for or being uploaded) at
+    a time, and writes wait for uploads to catch up beyond that, so memory use doesn't depend on how much is written.
+    The blob is committed when the file is closed, and isn't created at all if the upload fails.
+    """
+
+    def __init__(self, store: BlobStore, name: str, key: bytes, chunk_size: int = CHUNK_SIZE, workers: int = 4,
+                 max_pending: Optional[int] = None) -> None:
+        """
+        Args:
+            store (BlobStore): The store to upload to.
+            name (str): The blob's name.
+            key (bytes): The user's (Fernet) key, which the encryption key is derived from.
+            chunk_size (int): The size of each encrypted chunk (and uploaded block).
+            workers (int): The number of concurrent block uploads.
+            max_pending (Optional[int]): The number of chunks that may be buffered. Defaults to twice `workers`.
+        """
+        super().__init__()
+        self.store = store
+        self.name = name
+        self.encryptor = ChunkEncryptor(key, chunk_size=chunk_size)
+        self.max_pending = max_pending or 2 * workers
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending: Deque[Future] = deque()
+        self.block_ids: List[str] = []
+        self.buffer = bytearray()
+        self.chunks = 0
+        self.size = 0
+        self._submit(self.encryptor.header)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        self.size += len(data)
+        # A full chunk is only sealed once more data follows it, since the last chunk is encrypted differently.
+        chunk_size = self.encryptor.chunk_size
+        while len(self.buffer) > chunk_size:
+            chunk = bytes(self.buffer[:chunk_size])
+            del self.buffer[:chunk_size]
+            self._submit(chunk, encrypt=True, last=False)
+        return len(data)
+
+    def _submit(self, data: bytes, encrypt: bool = False, last: bool = False) -> None:
+        block_id = f'block-{len(self.block_ids):08d}'
+        self.block_ids.append(block_id)
+        index = self.chunks
+        if encrypt:
+            self.chunks += 1
+        self.pending.append(self.pool.submit(self._upload, block_id, data, index if encrypt else None, last))
+        while len(self.pending) > self.max_pending:
+            self.pending.popleft().result()
+
+    def _upload(self, block_id: str, data: bytes, index: Optional[int], last: bool) -> None:
+        # Chunks are encrypted in the upload threads too, so encryption of one chunk overlaps the upload of another.
+        if index is not None:
+            data = self.encryptor.encrypt(index, data, last)
+        self.store.stage_block(self.name, block_id, data)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            self._submit(bytes(self.buffer), encrypt=True, last=True)
+            self.buffer = bytearray()
+            while self.pending:
+                self.pending.popleft().result()
+            self.store.commit_blocks(self.name, self.block_ids)
+        finally:
+            self.pool.shutdown()
+            super().close()
+
+    def abort(self) -> None:
+        """
+        Stops uploading without committing the blob.
+        """
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.pool.shutdown()
+        super().close()
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class RangeDownloader:
+    """
+    Downloads a blob written by `BlockUploader` with concurrent ranged reads, one per encrypted chunk. Each chunk is
+    decrypted as soon as it arrives and written straight to its place in the output file, so chunks can complete in
+    any order and only the chunks in flight are held in memory.
+
+    Completed chunks are recorded in a journal next to the partial output (`<output>.progress`), so a download that's
+    interrupted, or that fails after retrying, picks up where it stopped the next time it's run, as long as the blob
+    hasn't changed in the meantime.
+    """
+
+    def __init__(self, store: BlobStore, name: str, key: bytes, workers: int = 4, retries: int = 3) -> None:
+        """
+        Args:
+            store (BlobStore): The store to download from.
+            name (str): The blob's name.
+            key (bytes): The user's (Fernet) key, which the encryption key is derived from.
+            workers (int): The number of concurrent ranged reads.
+            retries (int): The number of times a failed read is retried before the download fails.
+        """
+        self.store = store
+        self.name = name
+        self.key = key
+        self.workers = workers
+        self.retries = retries
+        self.resumed = 0
+
+    def download(self, output_path: str, size: int, etag: str, ciphertext_path: Optional[str] = None) -> int:
+        """
+        Downloads and decrypts the blob into `output_path`, and returns the size of the plaintext.
+
+        Args:
+            output_path (str): The path to write the plaintext to. It only appears once the download is complete.
+            size (int): The blob's size, as returned by `BlobStore.properties`.
+            etag (str): The blob's ETag, as returned by `BlobStore.properties`. Reads fail if the blob changes.
+            ciphertext_path (Optional[str]): A path to also write the blob itself to (e.g. to cache it).
+        """
+        decryptor = ChunkDecryptor(self.key, self._read(0, HEADER.size, etag))
+        stride = decryptor.chunk_size + TAG_SIZE
+        count = max(1, -(-(size - HEADER.size) // stride))
+
+        part_path = output_path + '.part'
+        journal_path = output_path + '.progress'
+        paths = [part_path] + ([ciphertext_path] if ciphertext_path else [])
+        done = self._resume(journal_path, paths, size, etag)
+        self.resumed = len(done)
+
+        flags = os.O_RDWR | os.O_CREAT | (0 if done else os.O_TRUNC)
+        descriptors = [os.open(path, flags, 0o600) for path in paths]
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            with open(journal_path, 'a' if done else 'w') as journal:
+                if not done:
+                    journal.write(json.dumps({'etag': etag, 'size': size}) + '\n')
+                if ciphertext_path:
+                    os.pwrite(descriptors[1], decryptor.header, 0)
+
+                futures = [
+                    pool.submit(self._download_chunk, decryptor, descriptors, index, index == count - 1, size, etag)
+                    for index in range(count) if index not in done
+                ]
+                try:
+                    # The journal is only written from this thread, once a chunk's data is in place.
+                    for future in as_completed(futures):
+                        journal.write(f'{future.result()}\n')
+                        journal.flush()
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            pool.shutdown()
+            for descriptor in descriptors:
+                os.close(descriptor)
+
+        plaintext_size = size - HEADER.size - count * TAG_SIZE
+        os.truncate(part_path, plaintext_size)
+        os.replace(part_path, output_path)
+        os.remove(journal_path)
+        return plaintext_size
+
+    def _resume(self, journal_path: str, paths: List[str], size: int, etag: str) -> Set[int]:
+        """
+        Returns the chunks that a previous, interrupted download of the same version of the blob completed.
+        """
+        if not os.path.exists(journal_path) or not all(os.path.exists(path) for path in paths):
+            return set()
+        with open(journal_path) as journal:
+            lines = journal.read().split('\n')
+        try:
+            if json.loads(lines[0]) != {'etag': etag, 'size': size}:
+                return set()
+        except ValueError:
+            return set()
+        # The last line may have been cut short if the previous download was killed while writing it.
+        return {int(line) for line in lines[1:] if line.isdigit()}
+
+    def _read(self, offset: int, length: int, etag: str) -> bytes:
+        for attempt in range(self.retries + 1):
+            try:
+                return self.store.download_range(self.name, offset, length, etag=etag)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                time.sleep(RETRY_DELAY * 2 ** attempt)
+
+    def _download_chunk(self, decryptor: ChunkDecryptor, descriptors: List[int], index: int, last: bool, size: int,
+                        etag: str) -> int:
+        stride = decryptor.chunk_size + TAG_SIZE
+        offset = HEADER.size + index * stride
+        ciphertext = self._read(offset, min(stride, size - offset), etag)
+        os.pwrite(descriptors[0], decryptor.decrypt(index, ciphertext, last), index * decryptor.chunk_size)
+        if len(descriptors) > 1:
+            os.pwrite(descriptors[1], ciphertext, offset)
+        return index
+
 
 class AzureStorage():
 
-    def __init__(self, key_path: str, azure_connect_str: str, azure_container_name: str) -> None:
+    def __init__(self, key_path: str, azure_connect_str: Optional[str] = None,
+                 azure_container_name: Optional[str] = None, store: Optional[BlobStore] = None,
+                 workers: int = 4, cache_dir: Optional[str] = None, cache_size: int = CACHE_SIZE) -> None:
+        """
+        Args:
+            key_path (str): The path to the user's key file.
+            azure_connect_str (Optional[str]): The connection string of the Azure storage account.
+            azure_container_name (Optional[str]): The name of the container that datasets are stored in.
+            store (Optional[BlobStore]): A blob store to use instead of Azure (e.g. a `LocalBlobStore` for tests).
+            workers (int): The number of blocks uploaded (or ranges downloaded) concurrently. Defaults to 4.
+            cache_dir (Optional[str]): A directory to cache downloaded (still encrypted) datasets in, so datasets that
+                haven't changed aren't downloaded again. Defaults to no cache.
+            cache_size (int): The cache's size budget, in bytes. Defaults to 10 GB.
+        """
         self.azure_container_name = azure_container_name
+        self.workers = workers
+        self.cache = DownloadCache(cache_dir, max_size=cache_size) if cache_dir is not None else None
 
         self.initialize_encryptor(key_path=key_path)
-        self.initialize_storage(azure_connect_str=azure_connect_str)
+        if store is not None:
+            self.store = store
+        else:
+            self.initialize_storage(azure_connect_str=azure_connect_str)
 
         print('Azure storage initialized for container: ' +
-              self.azure_container_name)
+              str(self.azure_container_name))
 
     def initialize_encryptor(self, key_path: str):
         with open(key_path, 'rb') as file:
-            key = file.read()
-            self.encryptor = Fernet(key)
+            self.key = file.read().strip()
+            self.encryptor = Fernet(self.key)
 
     def initialize_storage(self, azure_connect_str: str):
-        self.blob_service_client = BlobServiceClient.from_connection_string(
-            azure_connect_str)
+        self.store = AzureBlobStore(azure_connect_str, self.azure_container_name)
 
     def get_uuid(self, company: str, user_id: str) -> str:
         m = hashlib.sha256()
@@ -41,15 +275,13 @@ class AzureStorage():
         m.update(f'company/{company}'.encode())
         return m.hexdigest()[:16]
 
-    def get_blob_client(self, remote_file_name: str) -> BlobServiceClient:
-        return self.blob_service_client.get_blob_client(
-            container=self.azure_container_name,
-            blob=remote_file_name
-        )
-
-    def create_zip(self, input_path: str, output_path: str):
+    def create_zip(self, input_path: str, output: Union[str, BinaryIO]):
+        """
+        Compresses the dataset files under `input_path` into a zip archive, written to a path or a (possibly
+        non-seekable) file object.
+        """
         n = 0
-        zipf = zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED)
+        zipf = zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED)
         for root, dirs, files in os.walk(input_path):
             for file in files:
                 if any([file.endswith(ext) for ext in INCLUDED_EXTENSIONS]):
@@ -57,37 +289,96 @@ class AzureStorage():
                     zipf.write(os.path.join(root, file),
                                os.path.relpath(os.path.join(root, file),
                                                os.path.join(input_path, '..')))
-        print(f'Compressed {n} files into archive: ' + output_path)
+        print(f'Compressed {n} files into archive.')
         zipf.close()
 
+    def get_chunk_store(self, company: str, user_id: str) -> ChunkStore:
+        prefix = f'datasets/{self.get_uuid(company=company, user_id=user_id)}/'
+        return ChunkStore(self.store, prefix, self.key, workers=self.workers, cache=self.cache)
+
     def upload_dataset(self, company: str, user_id: str, input_path: str):
         """
         Encrypts a data download archive from a specific company (e.g. Google, Apple, etc.) and uploads the data to
-        Azure blob storage. Writes upload status (e.g. blob storage URL) to output_dir/company.json. The user owns
-        the storage key.
+        Azure blob storage. The user owns the storage key.
+
+        Files are split into content-defined chunks, and only the chunks that aren't stored yet are compressed,
+        encrypted and uploaded (in parallel), so re-uploading a refreshed download only sends what changed. See
+        `common.chunkstore`.
+        """
+        print('Chunking, encrypting and uploading dataset...')
+        stats = self.get_chunk_store(company, user_id).upload(input_path, INCLUDED_EXTENSIONS)
+        print(f'Uploaded {stats["uploaded_chunks"]} new chunks ({stats["uploaded_bytes"]} bytes) of '
+              f'{stats["chunks"]} chunks in {stats["files"]} files ({stats["bytes"]} bytes).')
+
+    def upload_archive(self, company: str, user_id: str, input_path: str):
+        """
+        Uploads a data download as a single zip archive, encrypted chunk by chunk as it's compressed. This is how
+        datasets were uploaded before deduplicated uploads, and `download_dataset` still reads them.
         """
         remote_file_name = self.get_uuid(company=company, user_id=user_id)
-        zip_path = 'zips/' + remote_file_name + '.zip'
-        print('Compressing dataset...')
-        self.create_zip(input_path, zip_path)
-        blob_client = self.get_blob_client(remote_file_name=remote_file_name)
-        with open(zip_path, 'rb') as data:
-            print('Encrypting file contents...')
-            encrypted_file_contents = self.encryptor.encrypt(data.read())
-            print('Uploading to Azure...')
-            blob_client.upload_blob(encrypted_file_contents)
+        print('Compressing, encrypting and uploading dataset...')
+        with BlockUploader(self.store, remote_file_name, self.key, workers=self.workers) as uploader:
+            self.create_zip(input_path, uploader)
+        print(f'Uploaded {uploader.size} bytes in {len(uploader.block_ids)} blocks.')
 
     def download_dataset(self, company: str, user_id: str, download_file_path: str):
         """
         Download and decrypt a data download from Azure blob storage and make it available for preprocessing. Data is
         downloaded into the VM's on-disk storage at output_path.
+
+        Deduplicated datasets are rebuilt from their chunks as an encrypted archive (see `common.archive`), which an
+        `ArchiveSource` reads in place with the same key, without extracting anything. Its files can be read as soon
+        as they're written, before the whole dataset has arrived.
+
+        Datasets uploaded as a single blob (see `upload_archive`) are downloaded as a zip archive instead, with
+        concurrent ranged reads decrypted chunk by chunk straight to disk, and an interrupted download resumes where it
+        stopped. With a cache, a dataset whose blob hasn't changed since it was last downloaded is decrypted from the
+        cache without any network I/O.
         """
+        chunk_store = self.get_chunk_store(company, user_id)
+        if self.store.exists(chunk_store.manifest_name):
+            count = chunk_store.download_archive(download_file_path)
+            print(f'Downloaded {count} files.')
+            return
+
         remote_file_name = self.get_uuid(company=company, user_id=user_id)
-        blob_client = self.get_blob_client(remote_file_name=remote_file_name)
-        with open(download_file_path, "wb") as download_file:
-            encrypted_file_contents = blob_client.download_blob().readall()
-            download_file.write(
-                self.encryptor.decrypt(encrypted_file_contents))
+        size, etag = self.store.properties(remote_file_name)
+
+        cached = self.cache.get(remote_file_name, etag) if self.cache else None
+        if cached is not None:
+            print('Decrypting cached dataset...')
+            self.decrypt_file(cached, download_file_path)
+            return
+
+        ciphertext_path = self.cache.path(remote_file_name, etag) + '.part' if self.cache else None
+        if is_chunked(self.store.download_range(remote_file_name, 0, len(MAGIC), etag=etag)):
+            downloader = RangeDownloader(self.store, remote_file_name, self.key, workers=self.workers)
+            plaintext_size = downloader.download(download_file_path, size, etag, ciphertext_path=ciphertext_path)
+            print(f'Downloaded {plaintext_size} bytes ({downloader.resumed} chunks resumed).')
+        else:
+            # Datasets uploaded before chunked encryption are a single Fernet token, which can only be decrypted whole.
+            data = b''.join(self.store.download(remote_file_name))
+            with open(download_file_path, 'wb') as download_file:
+                download_file.write(self.encryptor.decrypt(data))
+            if ciphertext_path:
+                with open(ciphertext_path, 'wb') as file:
+                    file.write(data)
+
+        if ciphertext_path:
+            self.cache.put(remote_file_name, etag, ciphertext_path)
+
+    def decrypt_file(self, path: str, output_path: str):
+        """
+        Decrypts a dataset blob that's already on disk (e.g. in the download cache) into `output_path`.
+        """
+        with open(path, 'rb') as file, open(output_path, 'wb') as output:
+            first = file.read(len(MAGIC))
+            file.seek(0)
+            if is_chunked(first):
+                for chunk in decrypt_chunks(self.key, iter(lambda: file.read(READ_SIZE), b'')):
+                    output.write(chunk)
+            else:
+                output.write(self.encryptor.decrypt(file.read()))
 
     @staticmethod
     def generate_key(key_path: str):
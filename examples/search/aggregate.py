@@ -0,0 +1,155 @@
+"""
+Vectorized group-by aggregation over the event store's columns.
+
+Events are grouped by any combination of dimensions: their company, source or key, the names of the people they
+mention, and time buckets (hour, day, week or month, in UTC). Each group reports its count and/or the min and max (i.e.
+first and last) timestamp of its events. Grouping packs each event's dimension values into one integer, then sorts by
+it and reduces each run of equal integers, so apart from exploding the (set-valued) names, no per-event Python code
+runs.
+
+Weeks start on Mondays. Time buckets are labelled with the ISO-8601 date (or time, or month) they start at.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from examples.search.models.store import EventStore
+from examples.search.query import FILTERS
+
+SECONDS_PER_HOUR = 60 * 60
+SECONDS_PER_DAY = 24 * SECONDS_PER_HOUR
+# 1970-01-01 was a Thursday, so weeks (starting on Mondays) are offset by 3 days from the epoch.
+WEEK_OFFSET_DAYS = 3
+
+
+def buckets(timestamps: np.ndarray, unit: str) -> np.ndarray:
+    """
+    Returns the number of each timestamp's time bucket (counted from the one containing the epoch).
+    """
+    if unit == 'hour':
+        return np.floor(timestamps / SECONDS_PER_HOUR).astype(np.int64)
+    days = np.floor(timestamps / SECONDS_PER_DAY).astype(np.int64)
+    if unit == 'day':
+        return days
+    if unit == 'week':
+        return (days + WEEK_OFFSET_DAYS) // 7
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def bucket_labels(numbers: np.ndarray, unit: str) -> List[str]:
+    """
+    Returns the ISO-8601 label of the start of each time bucket.
+    """
+    if unit == 'hour':
+        return [str(value)[:16] for value in numbers.astype('datetime64[h]').astype('datetime64[m]')]
+    if unit == 'day':
+        return [str(value) for value in numbers.astype('datetime64[D]')]
+    if unit == 'week':
+        return [str(value) for value in (numbers * 7 - WEEK_OFFSET_DAYS).astype('datetime64[D]')]
+    return [str(value) for value in numbers.astype('datetime64[M]')]
+
+
+def reduce_groups(keys: List[np.ndarray], counts: np.ndarray, minimums: np.ndarray,
+                  maximums: np.ndarray) -> Tuple[List[np.ndarray], np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Groups rows by their values in the key columns, and sums their counts and reduces their min/max timestamps per
+    group. Returns each group's key values (one array per key column), count, min and max.
+    """
+    if not len(counts):
+        empty = np.zeros(0, dtype=np.float64)
+        return [key[:0] for key in keys], np.zeros(0, dtype=np.int64), empty, empty
+    # Each key column is dictionary-encoded, and the codes are packed into a single integer per row (in mixed radix),
+    # which is much faster to group by than the rows of a 2D array. The packed integers are re-encoded whenever they
+    # could overflow.
+    packed, radix = np.zeros(len(counts), dtype=np.int64), 1
+    for key in keys:
+        distinct, codes = np.unique(key, return_inverse=True)
+        if radix * len(distinct) >= 2 ** 62:
+            _, packed = np.unique(packed, return_inverse=True)
+            packed, radix = packed.reshape(-1).astype(np.int64), int(packed.max()) + 1
+        packed = packed * len(distinct) + codes.reshape(-1)
+        radix *= len(distinct)
+    _, inverse = np.unique(packed, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    order = np.argsort(inverse, kind='stable')
+    starts = np.searchsorted(inverse[order], np.arange(inverse.max() + 1))
+    # Every row in a group has the same key values, so they're read from the group's first row.
+    first = order[starts]
+    return ([key[first] for key in keys],
+            np.add.reduceat(counts[order], starts).astype(np.int64),
+            np.minimum.reduceat(minimums[order], starts),
+            np.maximum.reduceat(maximums[order], starts))
+
+
+def format_groups(store: EventStore, dimensions: List[str], aggregates: List[str], keys: List[np.ndarray],
+                  counts: np.ndarray, minimums: np.ndarray, maximums: np.ndarray, names: Optional[List[str]] = None,
+                  descending: bool = False, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Decodes grouped key values into labels, and returns a dict per group with its labels and aggregates, sorted by
+    its labels.
+
+    Args:
+        names (Optional[List[str]]): The names that the "name" dimension's codes refer to, if it's grouped by.
+    """
+    columns = []
+    for dimension, values in zip(dimensions, keys):
+        if dimension in FILTERS:
+            table = getattr(store, FILTERS[dimension][0])
+            columns.append([table.decode(int(code)) for code in values])
+        elif dimension == 'name':
+            columns.append([names[int(code)] for code in values])
+        else:
+            columns.append(bucket_labels(values, dimension))
+
+    groups = []
+    for index, labels in enumerate(zip(*columns) if columns else [()] * len(counts)):
+        group: Dict[str, Any] = dict(zip(dimensions, labels))
+        if 'count' in aggregates:
+            group['count'] = int(counts[index])
+        if 'min' in aggregates:
+            group['min'] = float(minimums[index])
+        if 'max' in aggregates:
+            group['max'] = float(maximums[index])
+        groups.append(group)
+    groups.sort(key=lambda group: tuple(group[dimension] for dimension in dimensions), reverse=descending)
+    return groups if limit is None else groups[:limit]
+
+
+def aggregate_events(store: EventStore, ids: np.ndarray, dimensions: List[str], aggregates: List[str],
+                     descending: bool = False, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Groups the given rows by the given dimensions, and returns each group's aggregates (see `format_groups`).
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    timestamps = store.timestamps.values[ids]
+    # Rows without a valid timestamp can't be bucketed or contribute to the min/max.
+    valid = ~np.isnan(timestamps)
+    ids, timestamps = ids[valid], timestamps[valid]
+
+    names = None
+    if 'name' in dimensions:
+        # A row that mentions several people belongs to each of their groups, so rows are repeated once per name.
+        codes: Dict[str, int] = {}
+        repeated, name_codes = [], []
+        for position, index in enumerate(ids):
+            for name in store.names[int(index)] or ():
+                repeated.append(position)
+                name_codes.append(codes.setdefault(name, len(codes)))
+        repeated = np.array(repeated, dtype=np.int64)
+        ids, timestamps = ids[repeated], timestamps[repeated]
+        names = list(codes)
+
+    keys = []
+    for dimension in dimensions:
+        if dimension in FILTERS:
+            keys.append(getattr(store, FILTERS[dimension][1]).values[ids].astype(np.int64))
+        elif dimension == 'name':
+            keys.append(np.array(name_codes, dtype=np.int64))
+        else:
+            keys.append(buckets(timestamps, dimension))
+
+    keys, counts, minimums, maximums = reduce_groups(keys, np.ones(len(ids), dtype=np.int64), timestamps, timestamps)
+    return format_groups(store, dimensions, aggregates, keys, counts, minimums, maximums, names=names,
+                         descending=descending, limit=limit)
@@ -0,0 +1,113 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from examples.search.models.store import EventStore
+from examples.search.models.timestamps import TimestampParser
+
+
+class BaseIndex:
+    """
+    An index over a single company's data archive. Subclasses list their parse_* methods in PARSERS, and declare in
+    DEPENDENCIES which parsers need the shared state (e.g. the friend list) built by another parser first. This lets
+    `SearchEngine.preprocess` run independent parsers concurrently with `run_parser`.
+
+    Parsers call `select` with each source file's path before appending its events. This attributes the events to the
+    file, and lets an incremental re-index (see `SearchEngine.preprocess`) skip the files that haven't changed. Each
+    file's timestamps are parsed with a `TimestampParser` of its own (`timestamps`), which learns the file's format.
+    """
+
+    COMPANY: str = ''
+    PARSERS: List[str] = []
+    DEPENDENCIES: Dict[str, List[str]] = {}
+
+    events: EventStore
+    source: Any
+
+    # The paths (relative to the source root) to re-parse, or None to parse everything. Files in `appended` only had
+    # data appended to them since the last run, and map to the byte offset at which the new data starts (parsers that
+    # can start from there say so to `select`).
+    selected: Optional[Set[str]] = None
+    appended: Dict[str, int] = {}
+
+    # The shared state that dependent parsers used on the last run. If it has changed (e.g. a new friend was added),
+    # they re-parse every file, since their output depends on it.
+    previous_state: Optional[Dict[str, Any]] = None
+
+    # The parser for the timestamps of the file that was last selected.
+    timestamps: TimestampParser
+
+    def get_events(self) -> EventStore:
+        for name in self.PARSERS:
+            getattr(self, name)()
+        return self.events
+
+    def shared_state(self) -> Dict[str, Any]:
+        """
+        Returns the state built by this index's parsers that other parsers depend on.
+        """
+        return {}
+
+    def restore_state(self, state: Dict[str, Any]) -> None:
+        pass
+
+    def relative(self, path: str) -> str:
+        return self.source.relative(path)
+
+    def select(self, path: str, resumable: bool = False) -> bool:
+        """
+        Returns whether the file at `path` (relative to the source root) should be parsed, and if so, attributes the
+        events appended after this call to it.
+
+        Args:
+            path (str): The file's path, relative to the source root.
+            resumable (bool): Whether the parser only parses the file from its `resume_offset`. Only then are the
+                events from the file's previous parse kept; otherwise the whole file is re-parsed, and they're replaced.
+        """
+        if self.selected is not None and path not in self.selected:
+            return False
+        self.events.set_origin(self.COMPANY + '/' + path, resumed=resumable and self.resume_offset(path) > 0)
+        self.timestamps = TimestampParser()
+        return True
+
+    def select_group(self, paths: List[str]) -> bool:
+        """
+        Returns whether a group of files that are parsed together (e.g. the parts of a Messenger thread) should be
+        parsed. If any of them changed, all of them are selected.
+        """
+        if self.selected is None:
+            return True
+        if self.selected.isdisjoint(paths):
+            return False
+        self.selected.update(paths)
+        return True
+
+    def timestamped(self, rows: Iterable[Dict[str, Any]], field: str) -> Iterator[Tuple[Dict[str, Any], float]]:
+        """
+        Pairs each of a selected file's rows with its `field` timestamp in epoch seconds, converting the whole column
+        at once with the file's parser.
+        """
+        rows = list(rows)
+        if not rows:
+            # e.g. the rows of a file that wasn't selected
+            return iter([])
+        return zip(rows, self.timestamps.parse_many([row[field] for row in rows]).tolist())
+
+    def resume_offset(self, path: str) -> int:
+        """
+        Returns the offset from which to parse a selected file: past its previously parsed data, if it was appended to.
+        """
+        return self.appended.get(path, 0) if self.selected is not None else 0
+
+    def run_parser(self, name: str,
+                   *dependencies: Tuple[EventStore, Dict[str, Any]]) -> Tuple[EventStore, Dict[str, Any]]:
+        """
+        Runs a single parser into a fresh store, after restoring the shared state produced by the parsers it depends on.
+        Returns the store along with this index's shared state, so that dependent parsers can in turn be restored.
+        """
+        for _, state in dependencies:
+            self.restore_state(state)
+        if dependencies and self.selected is not None and self.shared_state() != self.previous_state:
+            self.selected = None
+            self.appended = {}
+        self.events = EventStore()
+        getattr(self, name)()
+        return self.events, self.shared_state()
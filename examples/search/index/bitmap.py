@@ -0,0 +1,208 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# A container holds the ids that share their high 16 bits. Containers with up to this many ids are sorted arrays of
+# their low 16 bits (2 bytes per id); denser ones are bitsets of 2^16 bits (8 KiB), as in Roaring bitmaps.
+ARRAY_LIMIT = 4096
+BITSET_WORDS = (1 << 16) // 64
+
+
+def bitset_cardinality(bitset: np.ndarray) -> int:
+    return int(np.unpackbits(bitset.view(np.uint8)).sum())
+
+
+def array_to_bitset(values: np.ndarray) -> np.ndarray:
+    bits = np.zeros(1 << 16, dtype=np.uint8)
+    bits[values] = 1
+    return np.packbits(bits, bitorder='little').view(np.uint64)
+
+
+def bitset_to_array(bitset: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.unpackbits(bitset.view(np.uint8), bitorder='little')).astype(np.uint16)
+
+
+def bitset_contains(bitset: np.ndarray, values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.uint64)
+    return ((bitset[values >> np.uint64(6)] >> (values & np.uint64(63))) & np.uint64(1)).astype(bool)
+
+
+def container(values: Optional[np.ndarray], bitset: Optional[np.ndarray] = None) -> Tuple[np.ndarray, int]:
+    """
+    Returns the smaller representation of a container (given as a sorted array of low bits, or as a bitset) and its
+    cardinality.
+    """
+    if bitset is not None:
+        cardinality = bitset_cardinality(bitset)
+        return (bitset_to_array(bitset) if cardinality <= ARRAY_LIMIT else bitset), cardinality
+    if len(values) > ARRAY_LIMIT:
+        return array_to_bitset(values), len(values)
+    return values, len(values)
+
+
+class Bitmap:
+    """
+    An immutable, compressed set of non-negative row ids (below 2^48), split into containers by their high bits. Each
+    container is a sorted array or a bitset depending on its density, so sparse sets take 2 bytes per id and dense ones
+    at most 1 bit per possible id, and set operations work container by container with vectorized array operations.
+    """
+
+    __slots__ = ('keys', 'containers', 'cardinalities')
+
+    def __init__(self, keys: np.ndarray, containers: List[np.ndarray], cardinalities: np.ndarray) -> None:
+        self.keys = keys
+        self.containers = containers
+        self.cardinalities = cardinalities
+
+    def __len__(self) -> int:
+        return int(self.cardinalities.sum())
+
+    @classmethod
+    def empty(cls) -> 'Bitmap':
+        return cls(np.zeros(0, dtype=np.int64), [], np.zeros(0, dtype=np.int64))
+
+    @classmethod
+    def from_ids(cls, ids: np.ndarray) -> 'Bitmap':
+        """
+        Builds a bitmap from row ids (in any order, with or without duplicates).
+        """
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        if not len(ids):
+            # Splitting no ids would leave a single empty container, without a key.
+            return cls.empty()
+        keys, starts = np.unique(ids >> 16, return_index=True)
+        containers, cardinalities = [], []
+        for values in np.split((ids & 0xFFFF).astype(np.uint16), starts[1:]):
+            values, cardinality = container(values)
+            containers.append(values)
+            cardinalities.append(cardinality)
+        return cls(keys, containers, np.array(cardinalities, dtype=np.int64))
+
+    def to_ids(self) -> np.ndarray:
+        """
+        Returns the row ids in the set, in ascending order.
+        """
+        if not len(self.keys):
+            return np.zeros(0, dtype=np.int64)
+        chunks = []
+        for key, values in zip(self.keys, self.containers):
+            if values.dtype == np.uint64:
+                values = bitset_to_array(values)
+            chunks.append((int(key) << 16) | values.astype(np.int64))
+        return np.concatenate(chunks)
+
+    def _is_bitset(self, index: int) -> bool:
+        return self.containers[index].dtype == np.uint64
+
+    def _pairs(self, other: 'Bitmap') -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return np.intersect1d(self.keys, other.keys, assume_unique=True, return_indices=True)
+
+    def __and__(self, other: 'Bitmap') -> 'Bitmap':
+        keys, containers, cardinalities = [], [], []
+        for key, i, j in zip(*self._pairs(other)):
+            a, b = self.containers[i], other.containers[j]
+            if self._is_bitset(i) and other._is_bitset(j):
+                values, cardinality = container(None, a & b)
+            elif self._is_bitset(i):
+                values, cardinality = container(b[bitset_contains(a, b)])
+            elif other._is_bitset(j):
+                values, cardinality = container(a[bitset_contains(b, a)])
+            else:
+                values, cardinality = container(np.intersect1d(a, b, assume_unique=True))
+            if cardinality:
+                keys.append(key)
+                containers.append(values)
+                cardinalities.append(cardinality)
+        return Bitmap(np.array(keys, dtype=np.int64), containers, np.array(cardinalities, dtype=np.int64))
+
+    def __or__(self, other: 'Bitmap') -> 'Bitmap':
+        keys = np.union1d(self.keys, other.keys)
+        containers, cardinalities = [], []
+        mine = dict(zip(self.keys.tolist(), range(len(self.keys))))
+        theirs = dict(zip(other.keys.tolist(), range(len(other.keys))))
+        for key in keys.tolist():
+            i, j = mine.get(key), theirs.get(key)
+            if i is None or j is None:
+                bitmap, index = (other, j) if i is None else (self, i)
+                containers.append(bitmap.containers[index])
+                cardinalities.append(bitmap.cardinalities[index])
+                continue
+            a, b = self.containers[i], other.containers[j]
+            if self._is_bitset(i) or other._is_bitset(j):
+                a = a if self._is_bitset(i) else array_to_bitset(a)
+                b = b if other._is_bitset(j) else array_to_bitset(b)
+                values, cardinality = container(None, a | b)
+            else:
+                values, cardinality = container(np.union1d(a, b))
+            containers.append(values)
+            cardinalities.append(cardinality)
+        return Bitmap(keys.astype(np.int64), containers, np.array(cardinalities, dtype=np.int64))
+
+    def __sub__(self, other: 'Bitmap') -> 'Bitmap':
+        theirs = dict(zip(other.keys.tolist(), range(len(other.keys))))
+        keys, containers, cardinalities = [], [], []
+        for i, key in enumerate(self.keys.tolist()):
+            j = theirs.get(key)
+            a = self.containers[i]
+            if j is None:
+                values, cardinality = a, self.cardinalities[i]
+            elif other._is_bitset(j):
+                b = other.containers[j]
+                if self._is_bitset(i):
+                    values, cardinality = container(None, a & ~b)
+                else:
+                    values, cardinality = container(a[~bitset_contains(b, a)])
+            else:
+                b = other.containers[j]
+                if self._is_bitset(i):
+                    values, cardinality = container(None, a & ~array_to_bitset(b))
+                else:
+                    values, cardinality = container(np.setdiff1d(a, b, assume_unique=True))
+            if cardinality:
+                keys.append(key)
+                containers.append(values)
+                cardinalities.append(cardinality)
+        return Bitmap(np.array(keys, dtype=np.int64), containers, np.array(cardinalities, dtype=np.int64))
+
+    def intersection_count(self, other: 'Bitmap') -> int:
+        """
+        Returns the size of the intersection of two bitmaps, without building it.
+        """
+        count = 0
+        for _, i, j in zip(*self._pairs(other)):
+            a, b = self.containers[i], other.containers[j]
+            if self._is_bitset(i) and other._is_bitset(j):
+                count += bitset_cardinality(a & b)
+            elif self._is_bitset(i):
+                count += int(bitset_contains(a, b).sum())
+            elif other._is_bitset(j):
+                count += int(bitset_contains(b, a).sum())
+            else:
+                count += len(np.intersect1d(a, b, assume_unique=True))
+        return count
+
+    def to_bytes(self) -> bytes:
+        """
+        Serializes the bitmap as its container count, keys, cardinalities, then each container's raw data.
+        """
+        header = np.array([len(self.keys)], dtype=np.int64).tobytes()
+        return b''.join([header, self.keys.astype(np.int64).tobytes(), self.cardinalities.astype(np.int64).tobytes(),
+                         *(values.tobytes() for values in self.containers)])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Bitmap':
+        """
+        Deserializes a bitmap written by `to_bytes`. Its containers are views of the data rather than copies.
+        """
+        count = int(np.frombuffer(data, dtype=np.int64, count=1)[0])
+        keys = np.frombuffer(data, dtype=np.int64, count=count, offset=8)
+        cardinalities = np.frombuffer(data, dtype=np.int64, count=count, offset=8 + 8 * count)
+        containers, offset = [], 8 + 16 * count
+        for cardinality in cardinalities.tolist():
+            if cardinality > ARRAY_LIMIT:
+                containers.append(np.frombuffer(data, dtype=np.uint64, count=BITSET_WORDS, offset=offset))
+                offset += 8 * BITSET_WORDS
+            else:
+                containers.append(np.frombuffer(data, dtype=np.uint16, count=cardinality, offset=offset))
+                offset += 2 * cardinality
+        return cls(keys, containers, cardinalities)
@@ -1,40 +1,58 @@
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Dict, Iterable, List, Optional, Set
 
+from examples.search.index.base import BaseIndex
+from examples.search.index.helpers.mentions import MentionMatcher
 from examples.search.models.event import Event
+from examples.search.models.store import EventStore
 from lens.sources.FacebookSource import FacebookSource
 
 COMPANY = 'Facebook'
 
 
-class FacebookIndex:
-
-    def __init__(self, source: FacebookSource, full_name: str) -> None:
+class FacebookIndex(BaseIndex):
+
+    COMPANY = COMPANY
+    PARSERS = [
+        'parse_friends',
+        'parse_ads_information',
+        'parse_apps_and_websites_off_of_facebook',
+        'parse_comments_and_reactions',
+        'parse_events',
+        'parse_groups',
+        'parse_location',
+        'parse_messages',
+        'parse_notifications',
+        'parse_polls',
+        'parse_search',
+        'parse_security_and_login_information',
+    ]
+
+    # These parsers extract friend mentions, so they need the friend list.
+    DEPENDENCIES = {
+        name: ['parse_friends'] for name in ('parse_groups', 'parse_notifications', 'parse_polls', 'parse_search')
+    }
+
+    def __init__(self, source: FacebookSource, full_name: str, store: Optional[EventStore] = None) -> None:
         self.source = source
         self.full_name = full_name
-        self.events: List[Event] = []
+        self.events = store if store is not None else EventStore()
         self.friends: Set[str] = set()
+        self.mentions: Optional[MentionMatcher] = None
+
+    def shared_state(self) -> Dict[str, Any]:
+        return {'friends': self.friends}
 
-    def get_events(self) -> List[Event]:
-        self.parse_friends()
-        self.parse_ads_information()
-        self.parse_apps_and_websites_off_of_facebook()
-        self.parse_comments_and_reactions()
-        self.parse_events()
-        self.parse_groups()
-        self.parse_location()
-        self.parse_messages()
-        self.parse_notifications()
-        self.parse_polls()
-        self.parse_search()
-        self.parse_security_and_login_information()
-        return self.events
+    def restore_state(self, state: Dict[str, Any]) -> None:
+        self.friends = set(state['friends'])
+        self.mentions = None
 
     def extract_names(self, content: str) -> Set[str]:
-        mentioned: Set[str] = set()
-        for friend in self.friends:
-            if friend.lower() in content.lower() or friend.split(' ')[0] in content.lower():
-                mentioned.add(friend)
-        return mentioned
+        # A friend is mentioned if their full name (case-insensitively) or their first name appears in the content.
+        if self.mentions is None:
+            self.mentions = MentionMatcher(
+                (pattern, friend) for friend in self.friends for pattern in (friend.lower(), friend.split(' ')[0])
+            )
+        return self.mentions.find(content.lower())
 
     def parse_friends(self):
         categories = [{
@@ -60,96 +78,101 @@ class FacebookIndex:
         }]
 
         for category in categories:
-            rows = self.safe_load_data(
-                path='friends_and_followers/' + category['path'],
-                node=category['node']
-            )
+            # The friend list is always rebuilt in full, since other parsers depend on it, but events are only emitted
+            # for selected files.
+            path = 'friends_and_followers/' + category['path']
+            rows = self.source.read_node(path=path, node=category['node'])
             self.friends.update(set([row['name'] for row in rows]))
-            self.events.extend([
+            self.mentions = None
+            if not self.select(path):
+                continue
+            self.events.extend(
                 Event(
                     company=COMPANY,
                     source='Friends',
                     key='friend_added',
-                    timestamp=row['timestamp'],
+                    timestamp=timestamp,
                     title=category['title_prefix'] + row["name"],
                     names={row['name']}
-                ) for row in rows
-            ])
+                ) for row, timestamp in self.timestamped(rows, 'timestamp')
+            )
 
     def parse_ads_information(self):
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Ads',
                 key='ad_interaction',
-                timestamp=row['timestamp'],
+                timestamp=timestamp,
                 title=f'You interacted with an advertiser on Facebook: {row["title"]}'
-            ) for row in self.safe_load_data(
+            ) for row, timestamp in self.timestamped(self.safe_load_data(
                 path='ads_information/advertisers_you\'ve_interacted_with.json',
                 node='history_v2'
-            )
-        ])
+            ), 'timestamp')
+        )
 
     def parse_apps_and_websites_off_of_facebook(self):
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Apps and Websites',
                 key='installed_app',
-                timestamp=row['added_timestamp'],
+                timestamp=timestamp,
                 title=f'You connected an app to Facebook: {row["name"]}',
                 metadata=row
-            ) for row in self.safe_load_data(
+            ) for row, timestamp in self.timestamped(self.safe_load_data(
                 path='apps_and_websites_off_of_facebook/apps_and_websites.json',
                 node='installed_apps_v2'
-            )
-        ])
+            ), 'added_timestamp')
+        )
 
+        # Off-Facebook activity and location history can be hundreds of MB, so their rows are decoded one at a time.
         categories = self.safe_load_data(
             path='apps_and_websites_off_of_facebook/your_off-facebook_activity.json',
-            node='off_facebook_activity_v2'
+            node='off_facebook_activity_v2',
+            stream=True
         )
         for category in categories:
             advertiser_name = category['name']
-            self.events.extend([
+            self.events.extend(
                 Event(
                     company=COMPANY,
                     source='Apps and Websites Off of Facebook',
                     key='off_facebook_activity_record',
-                    timestamp=event['timestamp'],
+                    timestamp=timestamp,
                     title=f'Facebook logged off-Facebook activity on: {advertiser_name} (type: {event["type"]})',
                     metadata=event
-                ) for event in category.get('events', [])
-            ])
+                ) for event, timestamp in self.timestamped(category.get('events', []), 'timestamp')
+            )
 
     def parse_comments_and_reactions(self):
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Comments and Reactions',
                 key='comment_added',
-                timestamp=row['timestamp'],
+                timestamp=timestamp,
                 title=row["title"],
                 metadata=row["data"]
-            ) for row in self.safe_load_data(
+            ) for row, timestamp in self.timestamped(self.safe_load_data(
                 path='comments_and_reactions/comments.json',
                 node='comments_v2'
-            )
-        ])
+            ), 'timestamp')
+        )
 
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Comments and Reactions',
                 key='reaction_added',
-                timestamp=row['timestamp'],
+                timestamp=timestamp,
                 title=row["title"],
                 metadata=row["data"]
-            ) for row in self.safe_load_data(
+            ) for row, timestamp in self.timestamped(self.safe_load_data(
                 path='comments_and_reactions/posts_and_comments.json',
                 node='reactions_v2'
-            )
-        ])
+            ), 'timestamp')
+        )
 
     def parse_events(self):
         rows = self.safe_load_data(
@@ -158,260 +181,261 @@ class FacebookIndex:
         )
         if rows:
             rows = rows.get('events_joined', [])
-            self.events.extend([
+            self.events.extend(
                 Event(
                     company=COMPANY,
                     source='Events',
                     key='event_started',
-                    timestamp=row['start_timestamp'],
+                    timestamp=timestamp,
                     title="You RSVP'd to an event: " + row["name"],
                     metadata=row
-                ) for row in rows
-            ])
+                ) for row, timestamp in self.timestamped(rows, 'start_timestamp')
+            )
 
     def parse_groups(self):
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Groups',
                 key='group_comment',
-                timestamp=row['timestamp'],
+                timestamp=timestamp,
                 title=row["title"],
                 metadata=row.get("data"),
                 names=self.extract_names(str(row))
-            ) for row in self.safe_load_data(
+            ) for row, timestamp in self.timestamped(self.safe_load_data(
                 path='groups/your_comments_in_groups.json',
                 node='group_comments_v2'
-            )
-        ])
+            ), 'timestamp')
+        )
 
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Groups',
                 key='group_joined',
-                timestamp=row['timestamp'],
+                timestamp=timestamp,
                 title=row["title"],
-            ) for row in self.safe_load_data(
+            ) for row, timestamp in self.timestamped(self.safe_load_data(
                 path='groups/your_group_membership_activity.json',
                 node='groups_joined_v2'
-            )
-        ])
+            ), 'timestamp')
+        )
 
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Groups',
                 key='group_post',
-                timestamp=row['timestamp'],
+                timestamp=timestamp,
                 title=row["title"],
                 metadata=row["data"],
                 names=self.extract_names(str(row))
-            ) for row in self.safe_load_data(
+            ) for row, timestamp in self.timestamped(self.safe_load_data(
                 path='groups/your_posts_in_groups.json',
                 node='group_posts_v2'
-            )
-        ])
+            ), 'timestamp')
+        )
 
     def parse_location(self):
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Location',
                 key='location_logged',
-                timestamp=row['creation_timestamp'],
+                timestamp=self.timestamps.parse(row['creation_timestamp']),
                 title=f'Facebook recorded your location in {row["name"]}.',
                 location=row['coordinate']
             ) for row in self.safe_load_data(
                 path='location/location_history.json',
-                node='location_history_v2'
+                node='location_history_v2',
+                stream=True
             )
-        ])
+        )
 
     def parse_messages(self):
-        for thread in self.source.glob('*.json'):
-            if not thread.endswith('message_1.json'):
+        for parts in self.source.messenger_threads():
+            if not self.select_group(parts):
                 continue
-            thread = self.source.read_json(thread)
-            for message in thread.get('messages'):
-                thread_metadata = {k: v for k,
-                                   v in thread.items() if k != 'messages'}
-                message_metadata = {
-                    'thread_details': thread_metadata,
-                    'message_details': message
-                }
-
-                participants = [row['name'] for row in thread['participants']]
-                is_sender = message.get('sender_name') == self.full_name
-                num_participants = len(participants)
-                group_name = thread.get('title')
-                content = message.get('content', '[empty body]')
-
-                if num_participants == 1:
-                    title = 'You sent a message to yourself: ' + content
-                if num_participants == 2:
-                    dm_target = [
-                        p for p in participants if p != self.full_name
-                    ][0]
-                    if is_sender:
-                        title = f'You sent a DM to {dm_target}: {content}'
-                    else:
-                        title = f'You received a DM from {dm_target}: {content}'
 
-                elif num_participants >= 2:
-                    if is_sender:
-                        title = f'You sent a message to in the group "{group_name}": {content}'
+            # Thread details (title, participants, ...) are read from the first part, without decoding its messages,
+            # and stored once for the whole thread.
+            thread = self.source.read_fields(parts[0], exclude={'messages'})
+            participants = [row['name'] for row in thread.get('participants', [])]
+            num_participants = len(participants)
+            group_name = thread.get('title')
+            dm_target = next((p for p in participants if p != self.full_name), None)
+            thread_id = None
+
+            for part in parts:
+                self.select(part)
+                for message in self.source.read_node(path=part, node='messages', stream=True):
+                    is_sender = message.get('sender_name') == self.full_name
+                    content = message.get('content', '[empty body]')
+
+                    if num_participants == 1:
+                        title = 'You sent a message to yourself: ' + content
+                    elif num_participants == 2:
+                        if is_sender:
+                            title = f'You sent a DM to {dm_target}: {content}'
+                        else:
+                            title = f'You received a DM from {dm_target}: {content}'
+                    elif num_participants > 2:
+                        if is_sender:
+                            title = f'You sent a message to in the group "{group_name}": {content}'
+                        else:
+                            title = f'You received a message in the group "{group_name}": {content}'
                     else:
-                        title = f'You received a message in the group "{group_name}": {content}'
+                        continue
 
-                else:
-                    continue
-
-                self.events.append(Event(
-                    company=COMPANY,
-                    source='Messenger',
-                    key='messenger_event',
-                    timestamp=message['timestamp_ms'] / 1000,
-                    content=message.get('content', None),
-                    metadata=message_metadata,
-                    title=title
-                ))
+                    if thread_id is None:
+                        thread_id = self.events.add_thread(thread)
+                    self.events.append(Event(
+                        company=COMPANY,
+                        source='Messenger',
+                        key='messenger_event',
+                        timestamp=message['timestamp_ms'] / 1000,
+                        content=message.get('content', None),
+                        metadata={'message_details': message},
+                        title=title
+                    ), thread_id=thread_id)
 
     def parse_notifications(self):
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Notifications',
                 key='notification_sent',
-                timestamp=row['timestamp'],
+                timestamp=timestamp,
                 title=f'Facebook sent you a notification: {row["text"]}',
                 names=self.extract_names(str(row)),
                 content=row['href'],
-            ) for row in self.safe_load_data(
+            ) for row, timestamp in self.timestamped(self.safe_load_data(
                 path='notifications/notifications.json',
                 node='notifications_v2'
-            )
-        ])
+            ), 'timestamp')
+        )
 
     def parse_polls(self):
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Polls',
                 key='poll_vote',
-                timestamp=row['timestamp'],
+                timestamp=timestamp,
                 title=row["title"],
                 names=self.extract_names(str(row)),
                 metadata=row.get('attachments')
-            ) for row in self.safe_load_data(
+            ) for row, timestamp in self.timestamped(self.safe_load_data(
                 path='polls/polls_you_voted_on.json',
                 node='poll_votes_v2'
-            )
-        ])
+            ), 'timestamp')
+        )
 
     def parse_search(self):
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Search',
                 key='search',
-                timestamp=row['timestamp'],
+                timestamp=timestamp,
                 title="You searched Facebook for: " +
                     row.get('data', [{}])[0].get('text'),
                 names=self.extract_names(str(row)),
                 metadata=row.get('attachments')
-            ) for row in self.safe_load_data(
+            ) for row, timestamp in self.timestamped(self.safe_load_data(
                 path='search/your_search_history.json',
                 node='searches_v2'
-            )
-        ])
+            ), 'timestamp')
+        )
 
     def parse_security_and_login_information(self):
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Security and Login',
                 key='account_event',
-                timestamp=row['timestamp'],
+                timestamp=timestamp,
                 title='Facebook Account Event: ' +
                     row['action'] + ' near ' + row['city'],
                 metadata=row
-            ) for row in self.safe_load_data(
+            ) for row, timestamp in self.timestamped(self.safe_load_data(
                 path='security_and_login_information/account_activity.json',
                 node='account_activity_v2'
-            )
-        ])
+            ), 'timestamp')
+        )
 
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Security and Login',
                 key='account_event',
-                timestamp=row['created_timestamp'],
+                timestamp=timestamp,
                 title='Signed into Facebook from a new device: ' + row['name'],
                 metadata=row
-            ) for row in self.safe_load_data(
+            ) for row, timestamp in self.timestamped(self.safe_load_data(
                 path='security_and_login_information/authorized_logins.json',
                 node='recognized_devices_v2'
-            )
-        ])
+            ), 'created_timestamp')
+        )
 
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Security and Login',
                 key='account_event',
-                timestamp=row['timestamp'],
+                timestamp=timestamp,
                 title='IP Address Activity Record: ' + row['action'],
                 metadata=row
-            ) for row in self.safe_load_data(
+            ) for row, timestamp in self.timestamped(self.safe_load_data(
                 path='security_and_login_information/ip_address_activity.json',
                 node='used_ip_address_v2'
-            )
-        ])
+            ), 'timestamp')
+        )
 
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Security and Login',
                 key='account_event',
-                timestamp=row['timestamp'],
+                timestamp=timestamp,
                 title='Login/Logout Event: ' + row['action'],
                 metadata=row
-            ) for row in self.safe_load_data(
+            ) for row, timestamp in self.timestamped(self.safe_load_data(
                 path='security_and_login_information/logins_and_logouts.json',
                 node='account_accesses_v2'
-            )
-        ])
+            ), 'timestamp')
+        )
 
-        self.events.extend([
+        self.events.extend(
             Event(
                 company=COMPANY,
                 source='Security and Login',
                 key='account_event',
-                timestamp=row['created_timestamp'],
+                timestamp=timestamp,
                 title='Active Session near: ' + row['location'],
                 metadata=row
-            ) for row in self.safe_load_data(
+            ) for row, timestamp in self.timestamped(self.safe_load_data(
                 path='security_and_login_information/where_you\'re_logged_in.json',
                 node='active_sessions_v2'
-            )
-        ])
+            ), 'created_timestamp')
+        )
 
     def parse_things(self, rows: List[Any], key: str, name: str, title_prefix: str):
         for row in rows:
             if row['name'] == name:
-                self.events.extend([
+                self.events.extend(
                     Event(
                         company=COMPANY,
                         source='About You',
                         key=key,
-                        timestamp=entry['timestamp'],
+                        timestamp=timestamp,
                         title=title_prefix + entry['data']['name'],
                         names=self.extract_names(entry['data']['name']),
                         metadata=entry['data']
-                    ) for entry in row['entries']
-                ])
+                    ) for entry, timestamp in self.timestamped(row['entries'], 'timestamp')
+                )
 
-    def safe_load_data(self, path: str, node: str) -> Optional[List[Dict[str, Any]]]:
-        return self.source.read_node(path=path, node=node)
+    def safe_load_data(self, path: str, node: str, stream: bool = False) -> Iterable[Any]:
+        if not self.select(path):
+            return []
+        return self.source.read_node(path=path, node=node, stream=stream)
@@ -1,96 +1,135 @@
 import os
-from typing import Any, Dict, List, Set
-import vobject
-import re
-from ics import Calendar
-import mailbox
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
 import tempfile
 from tqdm import tqdm
 
 from typing import Any, Dict, List, Set
-from examples.search.index.helpers.gmail import GmailMboxMessage
+from examples.search.index.base import BaseIndex
+from examples.search.index.helpers.contacts import ContactDirectory
+from examples.search.index.helpers.ical import read_calendar
+from examples.search.index.helpers.mbox import read_mbox
+from examples.search.index.helpers.mentions import MentionMatcher
 
 from examples.search.models.event import Event
+from examples.search.models.store import EventStore
 from lens.sources.GoogleSource import GoogleSource
 
 COMPANY = 'Google'
 
+# By default, recurring calendar events are expanded up to this many seconds after indexing.
+RECURRENCE_HORIZON = 365 * 24 * 60 * 60
+
+
+def calendar_metadata(event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns the metadata kept for a `read_calendar` record (an event, or one instance of a recurring event).
+    """
+    return {
+        'uid': event['uid'],
+        'name': event['name'],
+        'begin': event['begin'],
+        'end': event['end'],
+        'all_day': event['all_day'],
+        'location': event['location'],
+        'attendees': event['attendees'],
+        'rrule': event['rrule'],
+    }
+
 
-def clean_names(name):
-    return re.sub(' +', ' ', name).strip()
+class GoogleIndex(BaseIndex):
 
+    COMPANY = COMPANY
+    PARSERS = ['parse_contacts', 'parse_calendar', 'parse_email']
 
-class GoogleIndex:
+    # Calendar attendees and email mentions are resolved against the contact list.
+    DEPENDENCIES = {
+        'parse_calendar': ['parse_contacts'],
+        'parse_email': ['parse_contacts'],
+    }
 
-    def __init__(self, source: GoogleSource) -> None:
+    def __init__(self, source: GoogleSource, store: Optional[EventStore] = None, workers: Optional[int] = None,
+                 recurrence_window: Optional[Tuple[float, float]] = None) -> None:
+        """
+        Args:
+            source (GoogleSource): The source of the user's Google data.
+            store (Optional[EventStore]): The store to append events to. Defaults to a new one.
+            workers (Optional[int]): The number of processes that mbox files are parsed with. Defaults to one per CPU.
+            recurrence_window (Optional[Tuple[float, float]]): The [since, until) window (in epoch seconds) that
+                recurring calendar events are expanded within. Defaults to every instance until a year from now.
+        """
         self.source = source
-        self.events: List[Event] = []
-        self.contacts: List[Dict] = []
-        self.email_map: Dict[str, str] = {}
-
-    def get_events(self) -> List[Event]:
-        self.parse_contacts()
-        self.parse_calendar()
-        self.parse_email()
-        return self.events
-
-    def extract_names(self, content: str) -> Set[str]:
-        mentioned: Set[str] = set()
-        for contact in self.contacts:
-            name, email = contact['name'], contact['email']
-            if name in content or email in content:
-                mentioned.add(name)
-        return mentioned
+        self.workers = workers
+        self.recurrence_window = recurrence_window or (float('-inf'), time.time() + RECURRENCE_HORIZON)
+        self.events = store if store is not None else EventStore()
+        self.directory = ContactDirectory()
+        self.mentions: Optional[MentionMatcher] = None
+
+    def shared_state(self) -> Dict[str, Any]:
+        return {'directory': self.directory}
+
+    def restore_state(self, state: Dict[str, Any]) -> None:
+        self.directory = state['directory']
+        self.mentions = None
+
+    def mention_matcher(self) -> MentionMatcher:
+        # A contact is mentioned if their name or one of their email addresses appears in the content.
+        if self.mentions is None:
+            self.mentions = MentionMatcher(self.directory.patterns())
+        return self.mentions
 
     def parse_contacts(self):
+        # Contacts don't produce events, and calendar and email parsing depend on the full directory, so every contact
+        # file is always read.
         paths = self.source.get_contact_paths()
         for path in paths:
             print(path)
-            for contact in vobject.readComponents(open(path).read()):
-                names = contact.contents.get('n')
-                if names and len(names) > 0:
-                    name = clean_names(str(names[0].value))
-                    email = contact.email.value
-                    self.contacts.append({
-                        'name': name,
-                        'email': email
-                    })
-                    self.email_map[email] = name
+            self.directory.read(self.source.read_lines(path))
+        self.mentions = None
 
     def parse_calendar(self):
         for path in self.source.get_calendar_paths():
+            if not self.select(self.relative(path)):
+                continue
             print(path)
-            c = Calendar(open(path).read())
-            for event in c.events:
-                names = set()
-                for attendee in event.attendees:
-                    if attendee.email in self.email_map:
-                        names.add(self.email_map[attendee.email])
+            since, until = self.recurrence_window
+            for event in read_calendar(self.source.read_lines(path), since=since, until=until):
+                names = {name for name in map(self.directory.resolve, event['attendees']) if name is not None}
                 self.events.append(Event(
                     company=COMPANY,
                     source='Calendar',
                     key='event',
-                    timestamp=event.begin.float_timestamp,
-                    title='Calendar Event: ' + event.name,
-                    metadata=event.__dict__,
+                    timestamp=event['begin'],
+                    title='Calendar Event: ' + (event['name'] or ''),
+                    metadata=calendar_metadata(event),
                     names=names,
                 ))
 
     def parse_email(self):
         for path in self.source.get_mailbox_paths():
+            if not self.select(self.relative(path), resumable=True):
+                continue
             print(path)
-            m = mailbox.mbox(path)
-            for email_data in tqdm(m):
-                email = GmailMboxMessage(email_data).parse_email()
+            start = self.resume_offset(self.relative(path))
+            # Contacts are found in the whole (raw) message by the mbox reader's workers, and among its participants
+            # by their addresses. The body itself stays in the mbox file, and is only parsed again when it's read (see
+            # `EmailBody`), so only the headers are kept in the event. Its text is extracted by the workers too, and
+            # handed to the text index without being stored.
+            emails = read_mbox(path, workers=self.workers, start=start, source=self.source,
+                               mentions=self.mention_matcher(), text=True)
+            for email in tqdm(emails):
                 if email['subject'].startswith('?'):
                     continue
+                body = email.pop('body')
+                text = email.pop('text')
+                names = email.pop('names') | self.directory.resolve_all(email['from'], email['to'])
                 self.events.append(Event(
                     company=COMPANY,
                     source='Email',
                     key='email',
                     timestamp=email['timestamp'],
                     title='Email: ' + email['subject'],
-                    content=email['text'],
+                    content=body,
                     metadata=email,
-                    names=self.extract_names(str(email))
-                ))
+                    names=names
+                ), text=text)
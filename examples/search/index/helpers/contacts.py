@@ -0,0 +1,165 @@
+"""
+A streaming vCard reader, and a directory that resolves email addresses (and names) to contacts.
+
+vCard files use the same content-line syntax as iCalendar files, so they're read the same way: line by line, with
+folded lines unfolded and only the properties the index uses (N, FN, NICKNAME and EMAIL) decoded.
+"""
+
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from examples.search.index.helpers.ical import split_line, unescape, unfold
+
+# A list value's separator: a comma that isn't escaped.
+LIST_SEPARATOR = re.compile(r'(?<!\\),')
+# An email address in a header such as `"Smith, Alice" <alice@example.com>, bob@example.com`.
+ADDRESS = re.compile(r'[^\s<>,;:"()\[\]]+@[^\s<>,;:"()\[\]]+')
+
+
+def clean_names(name: str) -> str:
+    return re.sub(' +', ' ', name).strip()
+
+
+def structured_name(value: str) -> str:
+    """
+    Formats an N value ("Family;Given;Additional;Prefix;Suffix") as "Prefix Given Additional Family Suffix".
+    """
+    parts = [unescape(part).replace(',', ' ') for part in re.split(r'(?<!\\);', value)] + [''] * 5
+    family, given, additional, prefix, suffix = parts[:5]
+    return clean_names(' '.join([prefix, given, additional, family, suffix]))
+
+
+def read_vcards(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Yields every contact in a vCard stream as its "name" (from N, or FN if there's no N), its "emails" (in order) and
+    its "aliases" (its FN and nicknames, other than its name).
+    """
+    card: Optional[Dict[str, Any]] = None
+    for line in unfold(lines):
+        name, _, value = split_line(line)
+        if name == 'BEGIN' and value.strip().upper() == 'VCARD':
+            card = {'n': None, 'fn': None, 'emails': [], 'nicknames': []}
+        elif card is None:
+            continue
+        elif name == 'END' and value.strip().upper() == 'VCARD':
+            contact_name = (card['n'] or card['fn'] or '').strip()
+            if contact_name or card['emails']:
+                aliases = [alias for alias in [card['fn'], *card['nicknames']] if alias and alias != contact_name]
+                yield {'name': contact_name, 'emails': card['emails'], 'aliases': aliases}
+            card = None
+        elif name == 'N':
+            card['n'] = structured_name(value)
+        elif name == 'FN':
+            card['fn'] = clean_names(unescape(value))
+        elif name == 'NICKNAME':
+            card['nicknames'].extend(clean_names(unescape(nickname)) for nickname in LIST_SEPARATOR.split(value))
+        elif name == 'EMAIL':
+            address = value.strip()
+            if address[:7].lower() == 'mailto:':
+                address = address[7:]
+            if address:
+                card['emails'].append(address)
+
+
+def normalize(key: str) -> str:
+    """
+    Normalizes an email address or a name for lookups: Unicode-normalized (NFKC), case-folded, and with any "mailto:"
+    prefix, angle brackets and surrounding whitespace removed.
+    """
+    key = unicodedata.normalize('NFKC', key).strip().strip('<>').strip()
+    if key[:7].lower() == 'mailto:':
+        key = key[7:]
+    return key.casefold()
+
+
+class ContactDirectory:
+    """
+    Every contact's name, email addresses and aliases, with a hash table from each (normalized) address and alias to
+    the contact, so that resolving an address costs O(1) no matter how many contacts there are.
+
+    An address or alias that belongs to several contacts resolves to the one added last.
+    """
+
+    def __init__(self) -> None:
+        self.contacts: List[Dict[str, Any]] = []
+        self._emails: Dict[str, int] = {}
+        self._aliases: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.contacts)
+
+    def __eq__(self, other: Any) -> bool:
+        # Directories with the same contacts (in the same order) resolve every key the same way. This is what lets an
+        # incremental re-index tell that the parsers that depend on the directory don't need to re-parse everything.
+        if not isinstance(other, ContactDirectory):
+            return NotImplemented
+        return self.contacts == other.contacts
+
+    __hash__ = None  # type: ignore
+
+    def add(self, name: str, emails: Iterable[str] = (), aliases: Iterable[str] = ()) -> int:
+        """
+        Adds a contact and returns its id.
+        """
+        contact_id = len(self.contacts)
+        contact = {'name': name, 'emails': list(emails), 'aliases': list(aliases)}
+        self.contacts.append(contact)
+        for email in contact['emails']:
+            self._emails[normalize(email)] = contact_id
+        for alias in [name, *contact['aliases']]:
+            if alias:
+                self._aliases[normalize(alias)] = contact_id
+        return contact_id
+
+    def read(self, lines: Iterable[str]) -> None:
+        """
+        Adds every contact in a vCard stream.
+        """
+        for contact in read_vcards(lines):
+            self.add(contact['name'], contact['emails'], contact['aliases'])
+
+    def find(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the contact with an email address (with or without a display name, as in "Alice <alice@example.com>"),
+        or failing that an alias, or None.
+        """
+        normalized = normalize(key)
+        contact_id = self._emails.get(normalized)
+        if contact_id is None and '@' in key:
+            for address in ADDRESS.findall(key):
+                contact_id = self._emails.get(normalize(address))
+                if contact_id is not None:
+                    break
+        if contact_id is None:
+            contact_id = self._aliases.get(normalized)
+        return self.contacts[contact_id] if contact_id is not None else None
+
+    def resolve(self, key: str) -> Optional[str]:
+        """
+        Returns the name of the contact with an email address or alias, or None.
+        """
+        contact = self.find(key)
+        return contact['name'] if contact is not None else None
+
+    def resolve_all(self, *headers: Optional[str]) -> Set[str]:
+        """
+        Returns the names of the contacts among the addresses in email headers (e.g. "From", "To" and "Cc").
+        """
+        names = set()
+        for header in headers:
+            for address in ADDRESS.findall(str(header)) if header else []:
+                contact_id = self._emails.get(normalize(address))
+                if contact_id is not None:
+                    names.add(self.contacts[contact_id]['name'])
+        return names
+
+    def patterns(self) -> Iterator[Tuple[str, str]]:
+        """
+        Yields the (pattern, name) pairs that mention each contact: their name and email addresses. Aliases are left
+        out, since short ones (e.g. nicknames) would match as parts of other words.
+        """
+        for contact in self.contacts:
+            if contact['name']:
+                for pattern in [contact['name'], *contact['emails']]:
+                    yield pattern, contact['name']
@@ -1,40 +1,86 @@
 #! /usr/bin/env python3
 # ~*~ utf-8 ~*~
 
+import html
 import mailbox
-import bs4
-from dateutil.parser import parse
+import mmap
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
 
+from examples.search.models.timestamps import TimestampParser
 
-def get_html_text(html):
-    try:
-        return bs4.BeautifulSoup(html, 'lxml').body.get_text(' ', strip=True)
-    except AttributeError:  # message contents empty
+# Elements whose contents aren't text, and comments. (`head` covers `title`, `meta`, etc.)
+HIDDEN = re.compile(r'<(script|style|template|head)\b[^>]*>.*?</\1\s*>|<!--.*?(?:-->|$)|<!\[CDATA\[.*?\]\]>',
+                    re.IGNORECASE | re.DOTALL)
+BODY_START = re.compile(r'<body\b[^>]*>', re.IGNORECASE)
+BODY_END = re.compile(r'</body\s*>', re.IGNORECASE)
+# A tag (or declaration) starts with a letter, "/", "!" or "?" right after the "<"; any other "<" is text. A ">" inside
+# a quoted attribute value doesn't end the tag.
+TAG = re.compile(r'<[a-zA-Z/!?](?:[^>"\']|"[^"]*"|\'[^\']*\')*>')
+
+# The number of parsed email bodies kept in memory.
+BODY_CACHE_SIZE = 256
+# The number of mbox files kept mapped for reading email bodies.
+MAP_CACHE_SIZE = 8
+
+# The formats of `Date` headers, which are almost always RFC 2822 dates.
+DATE_FORMATS = ['rfc2822', 'iso8601']
+
+
+def get_html_text(html_text):
+    """
+    Extracts the text of an HTML document's body, with every run of text stripped and separated by a single space.
+    Rather than building a tree, it only strips tags (and elements that don't hold text) with regular expressions,
+    which is much faster than an HTML parser, but doesn't repair malformed markup the way one would (e.g. an unclosed
+    quote in a tag leaves the tag as text). Returns None for empty documents.
+    """
+    if not html_text or not html_text.strip():
         return None
+    html_text = HIDDEN.sub(' ', html_text)
+    start = BODY_START.search(html_text)
+    if start:
+        end = BODY_END.search(html_text, start.end())
+        html_text = html_text[start.end():end.start() if end else len(html_text)]
+    strings = (html.unescape(string).strip() if '&' in string else string.strip() for string in TAG.split(html_text))
+    return ' '.join(string for string in strings if string)
+
+
+def parts_text(parts: List[Tuple[str, str, Optional[str]]]) -> str:
+    """
+    Joins the text of an email's (content type, transfer encoding, text) parts, as `read_email_payload` returns them.
+    """
+    return ' '.join(text for _, _, text in parts if isinstance(text, str))
 
 
 class GmailMboxMessage():
-    def __init__(self, email_data):
+    def __init__(self, email_data, dates: Optional[TimestampParser] = None):
+        """
+        Args:
+            email_data (mailbox.mboxMessage): The message.
+            dates (Optional[TimestampParser]): The parser for the `Date` header, shared by the messages of an mbox file.
+                Defaults to a new one.
+        """
         if not isinstance(email_data, mailbox.mboxMessage):
             raise TypeError('Variable must be type mailbox.mboxMessage')
         self.email_data = email_data
+        self.dates = dates or TimestampParser(formats=DATE_FORMATS)
 
-    def parse_email(self):
-        email_labels = self.email_data['X-Gmail-Labels']
-        email_date = self.email_data['Date']
-        email_from = self.email_data['From']
-        email_to = self.email_data['To']
-        email_subject = self.email_data['Subject']
-        email_text = self.read_email_payload()
+    def parse_headers(self):
         return {
-            'labels': email_labels,
-            'timestamp': parse(email_date),
-            'from': email_from,
-            'to': email_to,
-            'subject': email_subject,
-            'text': email_text
+            'labels': self.email_data['X-Gmail-Labels'],
+            'timestamp': self.dates.parse_datetime(self.email_data['Date']),
+            'from': self.email_data['From'],
+            'to': self.email_data['To'],
+            'subject': self.email_data['Subject'],
         }
 
+    def parse_email(self):
+        return {**self.parse_headers(), 'text': self.read_email_payload()}
+
     def read_email_payload(self):
         email_payload = self.email_data.get_payload()
         if self.email_data.is_multipart():
@@ -67,3 +113,89 @@ class GmailMboxMessage():
         else:
             msg_text = None
         return (content_type, encoding, msg_text)
+
+
+class EmailBody:
+    """
+    Stands in for the body of an email: the location (path, byte offset and length) of the raw message in its mbox file.
+    The body is only parsed when it's read, and recently read bodies are cached.
+
+    Paths are the ones the mbox was read with, so bodies are read through the same source (or from disk, by default).
+    """
+
+    __slots__ = ('path', 'offset', 'length')
+
+    def __init__(self, path: str, offset: int, length: int) -> None:
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+    def __getstate__(self) -> Tuple[str, int, int]:
+        return self.path, self.offset, self.length
+
+    def __setstate__(self, state: Tuple[str, int, int]) -> None:
+        self.path, self.offset, self.length = state
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, EmailBody) and self.__getstate__() == other.__getstate__()
+
+    def __hash__(self) -> int:
+        return hash(self.__getstate__())
+
+    def __repr__(self) -> str:
+        return f'EmailBody({self.path!r}, {self.offset}, {self.length})'
+
+    def read(self, source: Any = None) -> bytes:
+        """
+        Returns the raw message, starting with its "From " line.
+        """
+        # The file's size is part of the key of the cached mapping, so a file that grew is mapped again.
+        size = source.stat(self.path)[0] if source is not None else os.path.getsize(self.path)
+        with _MAPS_LOCK:
+            return _map(source, self.path, size)[self.offset:self.offset + self.length]
+
+    def parts(self, source: Any = None) -> List[Tuple[str, str, Optional[str]]]:
+        """
+        Returns the message's (content type, transfer encoding, text) parts, as `read_email_payload` does.
+        """
+        return _parts(source, self)
+
+    def text(self, source: Any = None) -> str:
+        return parts_text(self.parts(source))
+
+
+# The mapped mbox files, by (source, path, size), least recently used first. Maps are closed when they're evicted, so
+# they're only read while `_MAPS_LOCK` is held.
+_MAPS: 'OrderedDict[Tuple[Any, str, int], Any]' = OrderedDict()
+_MAPS_LOCK = threading.Lock()
+
+
+def _map(source: Any, path: str, size: int) -> Any:
+    key = (source, path, size)
+    data = _MAPS.pop(key, None)
+    if data is None:
+        if source is not None:
+            data = source.map(path)
+        else:
+            with open(path, 'rb') as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        while len(_MAPS) >= MAP_CACHE_SIZE:
+            _MAPS.popitem(last=False)[1].close()
+    _MAPS[key] = data
+    return data
+
+
+def close_maps() -> None:
+    """
+    Closes the mbox files that email bodies were read from. They're mapped again if another body is read.
+    """
+    with _MAPS_LOCK:
+        while _MAPS:
+            _MAPS.popitem()[1].close()
+
+
+@lru_cache(maxsize=BODY_CACHE_SIZE)
+def _parts(source: Any, body: EmailBody) -> List[Tuple[str, str, Optional[str]]]:
+    # Imported here, since the mbox reader imports this module.
+    from examples.search.index.helpers.mbox import parse_message
+    return GmailMboxMessage(parse_message(body.read(source))).read_email_payload()
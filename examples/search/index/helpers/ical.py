@@ -0,0 +1,258 @@
+"""
+A streaming reader for (potentially very large) iCalendar files, such as the ones in a Google Takeout archive.
+
+Rather than building a full object model of the calendar, the reader scans it line by line, unfolds continuation
+lines, and only decodes the properties of each VEVENT that the index uses (UID, SUMMARY, DTSTART, DTEND, LOCATION,
+ATTENDEE, and RRULE, EXDATE and RECURRENCE-ID for recurrences). Nested components (e.g. alarms) and every other
+property are skipped without being parsed.
+
+Recurring events are expanded lazily into one occurrence per instance within a time window. Since an instance may be
+overridden by a VEVENT (with a RECURRENCE-ID) anywhere in the file, recurring events are expanded once the whole file
+has been read; every other event is yielded as soon as it's read.
+"""
+
+import logging
+import re
+from collections import deque
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from dateutil.rrule import rruleset, rrulestr
+
+from examples.search.models.timestamps import datetime_to_epoch
+
+# The properties of a VEVENT that are decoded. Everything else is skipped.
+FIELDS = {'UID', 'SUMMARY', 'DTSTART', 'DTEND', 'LOCATION', 'ATTENDEE', 'RRULE', 'EXDATE', 'RECURRENCE-ID'}
+
+# The most occurrences that a single recurring event is expanded into, which guards against rules that recur every
+# minute (or second) for years. A series with more instances in the window keeps its most recent ones.
+MAX_OCCURRENCES = 5000
+# The most instances of a single rule that are enumerated (from its first instance) while looking for the ones in the
+# window, which bounds the time spent on such rules.
+MAX_SCANNED = 100 * MAX_OCCURRENCES
+
+logger = logging.getLogger(__name__)
+
+TEXT_ESCAPE = re.compile(r'\\([\\;,nN])')
+DATE_TIME = re.compile(r'(\d{4})(\d{2})(\d{2})(?:T(\d{2})(\d{2})(\d{2})(Z?))?')
+
+
+def unfold(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Joins folded lines (which continue on the next line, after a leading space or tab) into content lines.
+    """
+    previous = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and previous is not None:
+            previous += line[1:]
+            continue
+        if previous is not None:
+            yield previous
+        previous = line
+    if previous is not None:
+        yield previous
+
+
+def split_line(line: str) -> Tuple[str, str, str]:
+    """
+    Splits a content line into its upper-cased name, its raw parameters (after the first ";", if any), and its value.
+    The name's group prefix, if any, is dropped (e.g. "item1.EMAIL", as Google Contacts exports extra addresses, is
+    "EMAIL").
+    """
+    colon = line.find(':')
+    if colon == -1:
+        return line.upper(), '', ''
+    if '"' in line[:colon]:
+        # A quoted parameter value may contain a colon.
+        quoted = False
+        for colon, char in enumerate(line):
+            if char == '"':
+                quoted = not quoted
+            elif char == ':' and not quoted:
+                break
+    head, value = line[:colon], line[colon + 1:]
+    name, _, params = head.partition(';')
+    return name.rpartition('.')[2].upper(), params, value
+
+
+def parameter(params: str, name: str) -> Optional[str]:
+    """
+    Returns the value of a parameter (e.g. "TZID") from a content line's raw parameters.
+    """
+    for param in params.split(';'):
+        key, _, value = param.partition('=')
+        if key.upper() == name:
+            return value.strip('"')
+    return None
+
+
+def unescape(value: str) -> str:
+    if '\\' not in value:
+        return value
+    return TEXT_ESCAPE.sub(lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+@lru_cache(maxsize=None)
+def time_zone(name: str) -> Optional[ZoneInfo]:
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def parse_date(value: str, params: str) -> Tuple[Optional[datetime], bool]:
+    """
+    Parses a DATE or DATE-TIME value into a datetime and whether it's a (whole-day) date. Times in UTC or with a known
+    TZID are aware; floating times and dates are naive (i.e. taken to be in UTC).
+    """
+    match = DATE_TIME.match(value.strip())
+    if match is None:
+        return None, False
+    year, month, day, hour, minute, second, utc = match.groups()
+    try:
+        if hour is None:
+            return datetime(int(year), int(month), int(day)), True
+        parsed = datetime(int(year), int(month), int(day), int(hour), int(minute), min(int(second), 59))
+    except ValueError:
+        return None, False
+    if utc:
+        return parsed.replace(tzinfo=timezone.utc), False
+    tzid = parameter(params, 'TZID') if params else None
+    zone = time_zone(tzid) if tzid else None
+    return (parsed.replace(tzinfo=zone) if zone is not None else parsed), False
+
+
+def read_vevents(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Yields the decoded fields of every VEVENT in an iCalendar stream: its "uid", "name", "begin" and "end" (datetimes),
+    "all_day", "location", "attendees" (email addresses), and its "rrule", "exdates" and "recurrence_id", if any.
+    """
+    event: Optional[Dict[str, Any]] = None
+    # The components nested inside the current event (e.g. VALARM), whose properties aren't the event's.
+    depth = 0
+    for line in unfold(lines):
+        name, params, value = split_line(line)
+        if name == 'BEGIN':
+            if event is not None:
+                depth += 1
+            elif value.strip().upper() == 'VEVENT':
+                event = {'uid': None, 'name': None, 'begin': None, 'end': None, 'all_day': False, 'location': None,
+                         'attendees': [], 'rrule': None, 'exdates': [], 'recurrence_id': None}
+            continue
+        if event is None:
+            continue
+        if name == 'END':
+            if depth:
+                depth -= 1
+            elif value.strip().upper() == 'VEVENT':
+                if event['begin'] is not None:
+                    yield event
+                event = None
+            continue
+        if depth or name not in FIELDS:
+            continue
+
+        if name == 'DTSTART':
+            event['begin'], event['all_day'] = parse_date(value, params)
+        elif name == 'DTEND':
+            event['end'], _ = parse_date(value, params)
+        elif name == 'SUMMARY':
+            event['name'] = unescape(value)
+        elif name == 'LOCATION':
+            event['location'] = unescape(value)
+        elif name == 'UID':
+            event['uid'] = value
+        elif name == 'ATTENDEE':
+            address = value[7:] if value[:7].lower() == 'mailto:' else value
+            event['attendees'].append(address)
+        elif name == 'RRULE':
+            event['rrule'] = value
+        elif name == 'EXDATE':
+            for date in value.split(','):
+                exdate, _ = parse_date(date, params)
+                if exdate is not None:
+                    event['exdates'].append(exdate)
+        elif name == 'RECURRENCE-ID':
+            event['recurrence_id'], _ = parse_date(value, params)
+
+
+def match_awareness(value: datetime, reference: datetime) -> datetime:
+    """
+    Makes a naive datetime aware (in the reference's zone) or an aware one naive (in UTC) to match a reference, so that
+    the two can be compared.
+    """
+    if value.tzinfo is None and reference.tzinfo is not None:
+        return value.replace(tzinfo=reference.tzinfo)
+    if value.tzinfo is not None and reference.tzinfo is None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def occurrences(event: Dict[str, Any], since: float, until: float,
+                overridden: Set[float]) -> Iterator[Dict[str, Any]]:
+    """
+    Expands a recurring event into a copy per instance that begins within [since, until), other than the instances
+    that are overridden (given as epoch seconds). Falls back to the event itself if its rule can't be parsed. If more
+    than `MAX_OCCURRENCES` instances fall in the window, only the most recent ones are kept, and a warning is logged.
+    """
+    begin = event['begin']
+    try:
+        duration = event['end'] - begin if event['end'] is not None else None
+        rules = rruleset()
+        rules.rrule(rrulestr(event['rrule'], dtstart=begin))
+        for exdate in event['exdates']:
+            rules.exdate(match_awareness(exdate, begin))
+        instances = iter(rules)
+    except (ValueError, TypeError, OverflowError):
+        if since <= datetime_to_epoch(begin) < until:
+            yield event
+        return
+
+    kept: deque = deque(maxlen=MAX_OCCURRENCES)
+    matched = scanned = 0
+    try:
+        for instance in instances:
+            seconds = datetime_to_epoch(instance)
+            scanned += 1
+            if seconds >= until or scanned > MAX_SCANNED:
+                break
+            if seconds < since or seconds in overridden:
+                continue
+            matched += 1
+            kept.append(instance)
+    except (ValueError, TypeError, OverflowError):
+        # e.g. an instance beyond the year 9999, or mixed naive and aware exception dates.
+        pass
+    if matched > len(kept) or scanned > MAX_SCANNED:
+        logger.warning('Recurring event %r has too many instances to expand; only %d, up to %s, are kept.',
+                       event['uid'], len(kept), kept[-1].isoformat() if kept else 'none')
+    for instance in kept:
+        yield {**event, 'begin': instance, 'end': instance + duration if duration is not None else None}
+
+
+def read_calendar(lines: Iterable[str], since: float = float('-inf'),
+                  until: float = float('inf')) -> Iterator[Dict[str, Any]]:
+    """
+    Yields a `read_vevents` record for every event in an iCalendar stream, with every recurring event expanded into a
+    record per instance (each with its own "begin" and "end") that begins in [since, until).
+
+    Args:
+        lines (Iterable[str]): The lines of the iCalendar file, e.g. a text file object.
+        since (float): The start of the window that recurring events are expanded within, in epoch seconds.
+        until (float): The end of the window, in epoch seconds. Open-ended rules are expanded up to this time, so it
+            should be finite.
+    """
+    recurring: List[Dict[str, Any]] = []
+    overridden: Dict[Any, Set[float]] = {}
+    for event in read_vevents(lines):
+        if event['recurrence_id'] is not None:
+            overridden.setdefault(event['uid'], set()).add(datetime_to_epoch(event['recurrence_id']))
+        if event['rrule'] is not None and event['recurrence_id'] is None:
+            recurring.append(event)
+        else:
+            yield event
+    for event in recurring:
+        yield from occurrences(event, since, until, overridden.get(event['uid'], set()))
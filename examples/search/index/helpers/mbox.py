@@ -0,0 +1,156 @@
+"""
+A parallel reader for (potentially very large) mbox files, such as the ones in a Gmail Takeout archive.
+
+`mailbox.mbox` scans the whole file to build a table of contents before it yields the first message, then re-reads and
+parses every message on a single core. Instead, this reader memory-maps the file, splits it into byte ranges that start
+on "From " separator lines, and parses the ranges in a process pool. Results are yielded range by range in file order,
+so the output is identical (and identically ordered) to a sequential read no matter how many workers are used.
+
+Only each message's headers are parsed up front; its body is recorded as the message's byte range (an `EmailBody`), and
+only parsed if it's read. When the body's text is needed (e.g. to index it), it's extracted in the workers too.
+
+Given a source (e.g. an `ArchiveSource`), the file is read through the source's `map` instead, which works the same way.
+"""
+
+import mailbox
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from examples.search.index.helpers.gmail import DATE_FORMATS, EmailBody, GmailMboxMessage, parts_text
+from examples.search.models.timestamps import TimestampParser
+
+# The target size of the byte range handed to each worker task. Ranges are extended to the next message boundary.
+RANGE_SIZE = 8 * 1024 * 1024
+
+SEPARATOR = b'\nFrom '
+
+
+@contextmanager
+def map_file(path: str, source: Any = None) -> Iterator[Any]:
+    """
+    Maps a file into memory, or opens a memory-like view of it through a source.
+    """
+    if source is not None:
+        data = source.map(path)
+    else:
+        with open(path, 'rb') as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    with data:
+        yield data
+
+
+def split_mbox(data: Any, range_size: int = RANGE_SIZE, start: int = 0) -> List[Tuple[int, int]]:
+    """
+    Splits an mbox file (from the message at `start` onwards) into [start, stop) byte ranges of roughly `range_size`
+    bytes, each starting at a message.
+    """
+    boundaries = [start]
+    while boundaries[-1] + range_size < len(data):
+        separator = data.find(SEPARATOR, boundaries[-1] + range_size)
+        if separator == -1:
+            break
+        boundaries.append(separator + 1)
+    boundaries.append(len(data))
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def parse_message(raw: bytes) -> mailbox.mboxMessage:
+    """
+    Parses a single message (starting with its "From " line) the same way `mailbox.mbox.get_message` does.
+    """
+    from_line, _, body = raw.partition(b'\n')
+    from_line = from_line.rstrip(b'\r').decode('ascii', errors='replace')
+    if body.endswith(b'\r\n'):
+        body = body[:-2]
+    elif body.endswith(b'\n'):
+        body = body[:-1]
+    message = mailbox.mboxMessage(body.replace(b'\r\n', b'\n'))
+    message.set_unixfrom(from_line)
+    message.set_from(from_line[5:])
+    return message
+
+
+def header_end(data: Any, start: int, stop: int) -> int:
+    """
+    Returns the offset of the blank line that ends the headers of the message at `start` (or `stop` if there's none),
+    so that only the headers need to be parsed.
+    """
+    ends = [data.find(separator, start, stop) for separator in (b'\n\n', b'\n\r\n')]
+    return min([end + 1 for end in ends if end != -1], default=stop)
+
+
+def parse_range(path: str, start: int, stop: int, source: Any = None, mentions: Any = None,
+                text: bool = False) -> List[Dict[str, Any]]:
+    """
+    Parses the headers of every message in a byte range of an mbox file into a `GmailMboxMessage.parse_headers` record,
+    along with an `EmailBody` (under "body") that locates the raw message for reading its body later. Given a
+    `MentionMatcher`, the labels it finds in each raw message are added under "names", and with `text`, the text of its
+    body (see `EmailBody.text`) is added under "text".
+    """
+    records = []
+    dates = TimestampParser(formats=DATE_FORMATS)
+    with map_file(path, source) as data:
+        position = start
+        while position < stop:
+            separator = data.find(SEPARATOR, position, stop)
+            end = stop if separator == -1 else separator + 1
+            if data[position:position + 5] == b'From ':
+                # Without the body's text, only the headers need to be parsed.
+                parsed_end = end if text else header_end(data, position, end)
+                message = GmailMboxMessage(parse_message(data[position:parsed_end]), dates)
+                record = {**message.parse_headers(), 'body': EmailBody(path, position, end - position)}
+                if text:
+                    record['text'] = parts_text(message.read_email_payload())
+                if mentions is not None:
+                    record['names'] = mentions.find(data[position:end].decode('utf-8', errors='replace'))
+                records.append(record)
+            position = end
+    return records
+
+
+def read_mbox(path: str, workers: Optional[int] = None, range_size: int = RANGE_SIZE,
+              start: int = 0, source: Any = None, mentions: Any = None, text: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Yields a `parse_range` record (headers and an `EmailBody`) for every message in an mbox file, in file order.
+
+    Args:
+        path (str): The path to the mbox file.
+        workers (Optional[int]): The number of worker processes. Defaults to the number of CPUs; 1 parses in-process.
+        range_size (int): The approximate number of bytes parsed per worker task.
+        start (int): The offset of the first message to read, e.g. the previous size of a file that was appended to.
+        source (Any): The source to read the file through (e.g. an `ArchiveSource`). Defaults to reading it from disk.
+            It's passed to the worker processes, so it must be picklable.
+        mentions (Any): A `MentionMatcher` to scan every message with in the worker processes. Defaults to none.
+        text (bool): Whether to also extract the text of every message's body in the worker processes.
+    """
+    size = source.stat(path)[0] if source is not None else os.path.getsize(path)
+    if size <= start:
+        return
+    with map_file(path, source) as data:
+        ranges = split_mbox(data, range_size=range_size, start=start)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(ranges) == 1:
+        for start, stop in ranges:
+            yield from parse_range(path, start, stop, source, mentions, text)
+        return
+
+    # Keep a bounded number of ranges in flight so that memory stays proportional to the number of workers rather than
+    # the size of the file, and yield each range's records in order as soon as it completes.
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        remaining = iter(ranges)
+        pending = deque()
+        for start, stop in remaining:
+            pending.append(pool.submit(parse_range, path, start, stop, source, mentions, text))
+            if len(pending) == 2 * workers:
+                break
+        while pending:
+            records = pending.popleft().result()
+            for start, stop in remaining:
+                pending.append(pool.submit(parse_range, path, start, stop, source, mentions, text))
+                break
+            yield from records
@@ -0,0 +1,100 @@
+import re
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
+
+# The number of distinct pattern prefixes up to which scans jump between them with a regular expression.
+MAX_STARTS = 64
+
+
+class MentionMatcher:
+    """
+    An Aho-Corasick automaton that finds which of a fixed vocabulary of patterns (e.g. friend names and contact email
+    addresses) occur as substrings of a document, in a single linear pass over the document regardless of how many
+    patterns there are. Each pattern maps to a label (e.g. the canonical name of the person it refers to).
+
+    Transitions that fall back along failure links are memoized as they're discovered, so scanning a character costs
+    one dictionary lookup in the common case. From the root, the scan jumps with a regular expression to the next place
+    where a pattern's first two characters occur, so long documents that rarely mention anyone (e.g. raw emails) are
+    scanned mostly at C speed.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, str]]) -> None:
+        """
+        Args:
+            patterns (Iterable[Tuple[str, str]]): (pattern, label) pairs. Several patterns may share a label.
+        """
+        self._transitions: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        outputs: List[Set[str]] = [set()]
+
+        for pattern, label in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self._transitions[state].get(char)
+                if next_state is None:
+                    next_state = len(self._transitions)
+                    self._transitions[state][char] = next_state
+                    self._transitions.append({})
+                    self._fail.append(0)
+                    outputs.append(set())
+                state = next_state
+            outputs[state].add(label)
+
+        # Failure links are computed breadth-first, so that a state's failure target (which is always shallower) is
+        # complete before it's used.
+        self._children = [dict(transitions) for transitions in self._transitions]
+        queue = deque([0])
+        while queue:
+            state = queue.popleft()
+            for char, child in self._children[state].items():
+                self._fail[child] = self._resolve(self._fail[state], char) if state else 0
+                outputs[child] |= outputs[self._fail[child]]
+                queue.append(child)
+
+        self._outputs: List[FrozenSet[str]] = [frozenset(labels) for labels in outputs]
+        # Every path of length two from the root, and every single-character pattern.
+        starts = sorted({char + second for char, child in self._children[0].items()
+                         for second in list(self._children[child]) + ([''] if self._outputs[child] else [])},
+                        key=len, reverse=True)
+        # With many patterns, almost every position could start one, and the jumps would cost more than they save.
+        self._start = re.compile('|'.join(map(re.escape, starts))) if len(starts) <= MAX_STARTS else None
+
+    def __len__(self) -> int:
+        return len(self._transitions)
+
+    def _resolve(self, state: int, char: str) -> int:
+        fail = state
+        while fail and char not in self._children[fail]:
+            fail = self._fail[fail]
+        next_state = self._children[fail].get(char, 0)
+        self._transitions[state][char] = next_state
+        return next_state
+
+    def find(self, text: str) -> Set[str]:
+        """
+        Returns the labels of every pattern that occurs in `text`.
+        """
+        transitions, outputs = self._transitions, self._outputs
+        found = set(outputs[0])
+        if len(transitions) == 1:
+            return found
+        state = 0
+        position = 0
+        length = len(text)
+        start = self._start
+        while position < length:
+            if start is not None and not state:
+                # From the root, jump straight to the next place a pattern could start.
+                match = start.search(text, position)
+                if match is None:
+                    break
+                position = match.start()
+            char = text[position]
+            next_state = transitions[state].get(char)
+            if next_state is None:
+                next_state = self._resolve(state, char)
+            state = next_state
+            if outputs[state]:
+                found |= outputs[state]
+            position += 1
+        return found
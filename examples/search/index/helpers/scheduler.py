@@ -0,0 +1,81 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+
+class StageScheduler:
+    """
+    Runs a graph of tasks in a process pool. A task is submitted as soon as all of its dependencies have finished, and
+    receives their results as extra positional arguments, so independent tasks run concurrently while dependent ones
+    wait only for what they actually need.
+
+    Results are returned keyed by task name; callers that merge them should iterate in `order` (the order tasks were
+    added) so that the merged output doesn't depend on which worker finished first.
+    """
+
+    def __init__(self, workers: Optional[int] = None) -> None:
+        """
+        Args:
+            workers (Optional[int]): The size of the process pool. Defaults to the number of CPUs; with 1 worker, tasks
+                run in-process one after another.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.order: List[str] = []
+        self.tasks: Dict[str, Tuple[Callable, Tuple, Tuple[str, ...]]] = {}
+
+    def add(self, name: str, function: Callable, *args: Any, dependencies: Sequence[str] = ()) -> None:
+        if name in self.tasks:
+            raise ValueError(f'A task named "{name}" has already been scheduled.')
+        self.order.append(name)
+        self.tasks[name] = (function, args, tuple(dependencies))
+
+    def _check(self) -> None:
+        visiting: Set[str] = set()
+        done: Set[str] = set()
+
+        def visit(name: str) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f'The task graph has a cycle through "{name}".')
+            if name not in self.tasks:
+                raise ValueError(f'Unknown task dependency: "{name}".')
+            visiting.add(name)
+            for dependency in self.tasks[name][2]:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.order:
+            visit(name)
+
+    def _ready(self, results: Dict[str, Any], started: Set[str]) -> List[str]:
+        return [
+            name for name in self.order
+            if name not in started and all(d in results for d in self.tasks[name][2])
+        ]
+
+    def run(self) -> Dict[str, Any]:
+        self._check()
+        results: Dict[str, Any] = {}
+        started: Set[str] = set()
+
+        if self.workers == 1:
+            while len(results) < len(self.tasks):
+                for name in self._ready(results, started):
+                    function, args, dependencies = self.tasks[name]
+                    started.add(name)
+                    results[name] = function(*args, *[results[d] for d in dependencies])
+            return results
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            running: Dict[Future, str] = {}
+            while len(results) < len(self.tasks):
+                for name in self._ready(results, started):
+                    function, args, dependencies = self.tasks[name]
+                    started.add(name)
+                    running[pool.submit(function, *args, *[results[d] for d in dependencies])] = name
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    results[running.pop(future)] = future.result()
+        return results
@@ -0,0 +1,145 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from examples.search.index.bitmap import Bitmap
+from examples.search.index.helpers.contacts import normalize
+from examples.search.models.store import EventStore, PackedBytes
+from lens.snapshot import SnapshotReader, SnapshotWriter
+
+
+class PeopleIndex:
+    """
+    Maps each person named by events (in `Event.names`) to a bitmap of the ids of the live events that name them, and
+    to how many of those events come from each source. Names are matched after normalization (see
+    `examples.search.index.helpers.contacts.normalize`), and each person keeps the spelling first seen.
+
+    Like the other secondary indexes, it's extended with the rows appended since it was built; rows retracted since then
+    are removed from every bitmap, so bitmaps (and counts) only ever hold live rows.
+    """
+
+    def __init__(self) -> None:
+        self.names: List[str] = []
+        self.person_ids: Dict[str, int] = {}
+        self.bitmaps: List[Optional[Bitmap]] = []
+        # The number of each person's events from each source (by source code).
+        self.source_counts = np.zeros((0, 0), dtype=np.int64)
+        self.size = 0
+        self.retracted = 0
+        # The bitmaps of an index loaded from a snapshot are only deserialized when they're first used.
+        self._packed: Optional[PackedBytes] = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def person(self, name: str) -> Optional[int]:
+        return self.person_ids.get(normalize(name))
+
+    def bitmap(self, person: int) -> Bitmap:
+        bitmap = self.bitmaps[person]
+        if bitmap is None:
+            bitmap = self.bitmaps[person] = Bitmap.from_bytes(self._packed.get_bytes(person))
+        return bitmap
+
+    def extend(self, store: EventStore) -> None:
+        """
+        Adds the rows appended to the store since the index was built, and removes the rows retracted since then.
+        """
+        postings: Dict[int, List[int]] = {}
+        for index in range(self.size, len(store)):
+            if store.live.values[index]:
+                for name in store.names[index] or ():
+                    key = normalize(name)
+                    person = self.person_ids.get(key)
+                    if person is None:
+                        person = self.person_ids[key] = len(self.names)
+                        self.names.append(name)
+                        self.bitmaps.append(Bitmap.empty())
+                    postings.setdefault(person, []).append(index)
+        self.size = len(store)
+
+        counts = np.zeros((len(self.names), len(store.sources)), dtype=np.int64)
+        counts[:self.source_counts.shape[0], :self.source_counts.shape[1]] = self.source_counts
+        self.source_counts = counts
+        source_codes = store.source_codes.values
+        for person, ids in postings.items():
+            ids = np.array(ids, dtype=np.int64)
+            self.bitmaps[person] = self.bitmap(person) | Bitmap.from_ids(ids)
+            np.add.at(self.source_counts[person], source_codes[ids], 1)
+
+        if store.retracted > self.retracted:
+            retracted = Bitmap.from_ids(np.flatnonzero(~store.live.values))
+            for person in range(len(self.names)):
+                removed = self.bitmap(person) & retracted
+                if len(removed):
+                    self.bitmaps[person] = self.bitmap(person) - removed
+                    np.subtract.at(self.source_counts[person], source_codes[removed.to_ids()], 1)
+            self.retracted = store.retracted
+
+    def save(self, writer: SnapshotWriter, name: str = 'people') -> None:
+        packed = PackedBytes()
+        for person in range(len(self.names)):
+            packed.append_bytes(self.bitmap(person).to_bytes())
+        packed.save(writer, name + '.bitmaps')
+        writer.add_object(name + '.names', self.names)
+        writer.add_array(name + '.source_counts', self.source_counts)
+        writer.add_array(name + '.parameters', np.array([self.size, self.retracted], dtype=np.int64))
+
+    @classmethod
+    def load(cls, reader: SnapshotReader, name: str = 'people') -> 'PeopleIndex':
+        index = cls()
+        index.names = reader.object(name + '.names')
+        index.person_ids = {normalize(person): i for i, person in enumerate(index.names)}
+        index.bitmaps = [None] * len(index.names)
+        index._packed = PackedBytes.load(reader, name + '.bitmaps')
+        index.source_counts = np.array(reader.array(name + '.source_counts'))
+        index.size, index.retracted = (int(value) for value in reader.array(name + '.parameters'))
+        return index
+
+    def search(self, all_of: Optional[List[str]] = None, any_of: Optional[List[str]] = None) -> Bitmap:
+        """
+        Returns the events that name all of the people in `all_of` and at least one of the people in `any_of`.
+        Unknown names match no events.
+        """
+        result = None
+        if any_of is not None:
+            result = Bitmap.empty()
+            for name in any_of:
+                person = self.person(name)
+                if person is not None:
+                    result = result | self.bitmap(person)
+        # Intersecting the smallest bitmaps first keeps the intermediate results small.
+        people = [self.person(name) for name in all_of or []]
+        if None in people:
+            return Bitmap.empty()
+        for person in sorted(people, key=lambda person: len(self.bitmap(person))):
+            result = self.bitmap(person) if result is None else result & self.bitmap(person)
+        return result if result is not None else Bitmap.empty()
+
+    def top(self, events: Optional[Bitmap] = None, source_codes: Optional[List[int]] = None,
+            limit: Optional[int] = None, exclude: List[str] = ()) -> List[Dict[str, Any]]:
+        """
+        Returns the people who are named by the most events (other than the excluded people), with how many events name
+        them, most first.
+
+        Args:
+            events (Optional[Bitmap]): The events to count. Defaults to every event (from the given sources), in which
+                case the counts are read from the per-source counts rather than by intersecting bitmaps.
+            source_codes (Optional[List[int]]): The sources to count events from, if `events` isn't given. Defaults to
+                all of them.
+            limit (Optional[int]): The maximum number of people to return.
+            exclude (List[str]): The people to leave out (e.g. the ones whose events are being counted).
+        """
+        if events is None:
+            counts = self.source_counts if source_codes is None else self.source_counts[:, source_codes]
+            counts = counts.sum(axis=1)
+        else:
+            counts = np.array([self.bitmap(person).intersection_count(events) for person in range(len(self.names))],
+                              dtype=np.int64)
+        for name in exclude:
+            person = self.person(name)
+            if person is not None:
+                counts[person] = 0
+        people = [int(person) for person in np.flatnonzero(counts)]
+        people.sort(key=lambda person: (-counts[person], self.names[person]))
+        return [{'name': self.names[person], 'count': int(counts[person])} for person in people[:limit]]
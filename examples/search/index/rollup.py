@@ -0,0 +1,87 @@
+from typing import Any, Dict, List
+
+import numpy as np
+
+from examples.search.aggregate import SECONDS_PER_DAY, buckets, format_groups, reduce_groups
+from examples.search.models.store import EventStore
+from examples.search.query import FILTERS, Query
+from lens.snapshot import SnapshotReader, SnapshotWriter
+
+# The dimensions that a rollup can group by: its own (coded) dimensions, and time buckets of at least a day.
+ROLLUP_DIMENSIONS = tuple(FILTERS) + ('day', 'week', 'month')
+
+
+class Rollup:
+    """
+    A cube of the live events' count and min/max timestamp per (company, source, key, day), materialized at the end
+    of each preprocess. A grouped query that only filters and groups by those dimensions (or coarser time buckets) is
+    answered by reducing the cube's cells, which number far fewer than the events they summarize.
+    """
+
+    def __init__(self, store: EventStore) -> None:
+        ids = np.arange(len(store))
+        timestamps = store.timestamps.values
+        mask = ~np.isnan(timestamps)
+        if store.retracted:
+            mask &= store.live.values
+        ids, timestamps = ids[mask], timestamps[mask]
+        keys = [getattr(store, column).values[ids].astype(np.int64) for _, column in FILTERS.values()]
+        keys.append(buckets(timestamps, 'day'))
+        keys, self.counts, self.minimums, self.maximums = reduce_groups(
+            keys, np.ones(len(ids), dtype=np.int64), timestamps, timestamps)
+        *coded, self.days = keys
+        self.codes = dict(zip(FILTERS, coded))
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def save(self, writer: SnapshotWriter, name: str = 'rollup') -> None:
+        for dimension, codes in self.codes.items():
+            writer.add_array(f'{name}.{dimension}', codes)
+        writer.add_array(name + '.days', self.days)
+        writer.add_array(name + '.counts', self.counts)
+        writer.add_array(name + '.minimums', self.minimums)
+        writer.add_array(name + '.maximums', self.maximums)
+
+    @classmethod
+    def load(cls, reader: SnapshotReader, name: str = 'rollup') -> 'Rollup':
+        rollup = cls.__new__(cls)
+        rollup.codes = {dimension: reader.array(f'{name}.{dimension}') for dimension in FILTERS}
+        rollup.days = reader.array(name + '.days')
+        rollup.counts = reader.array(name + '.counts')
+        rollup.minimums = reader.array(name + '.minimums')
+        rollup.maximums = reader.array(name + '.maximums')
+        return rollup
+
+    def covers(self, query: Query) -> bool:
+        """
+        Whether a grouped query can be answered from the rollup: it mustn't search text, an area or people, group by
+        hours or names, or have a time range that doesn't fall on day boundaries (in UTC).
+        """
+        return (query.group_by is not None and query.text is None and not query.located and not query.people
+                and all(dimension in ROLLUP_DIMENSIONS for dimension in query.group_by)
+                and all(time is None or time % SECONDS_PER_DAY == 0 for time in (query.since, query.until)))
+
+    def aggregate(self, store: EventStore, query: Query) -> List[Dict[str, Any]]:
+        """
+        Answers a grouped query that the rollup `covers` (see `examples.search.aggregate.format_groups`).
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for name, values in query.filters.items():
+            table = getattr(store, FILTERS[name][0])
+            mask &= np.isin(self.codes[name], [table.codes[v] for v in values if v in table.codes])
+        if query.since is not None:
+            mask &= self.days >= query.since // SECONDS_PER_DAY
+        if query.until is not None:
+            mask &= self.days < query.until // SECONDS_PER_DAY
+
+        keys = []
+        for dimension in query.group_by:
+            if dimension in self.codes:
+                keys.append(self.codes[dimension][mask])
+            else:
+                keys.append(buckets(self.days[mask] * float(SECONDS_PER_DAY), dimension))
+        keys, counts, minimums, maximums = reduce_groups(
+            keys, self.counts[mask], self.minimums[mask], self.maximums[mask])
+        return format_groups(store, query.group_by, query.aggregates, keys, counts, minimums, maximums,
+                             descending=query.order == 'desc', limit=query.limit)
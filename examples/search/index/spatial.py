@@ -0,0 +1,171 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+from lens.snapshot import SnapshotReader, SnapshotWriter
+
+# The size of a grid cell, in degrees (about 5.5 km of latitude).
+CELL_SIZE = 0.05
+
+# The mean radius of the Earth, in kilometers.
+EARTH_RADIUS_KM = 6371.0088
+
+# (south, west, north, east), in degrees. A box with west > east crosses the antimeridian.
+BoundingBox = Tuple[float, float, float, float]
+# (latitude, longitude, radius in kilometers).
+Circle = Tuple[float, float, float]
+
+
+def circle_bbox(circle: Circle) -> BoundingBox:
+    """
+    Returns a bounding box that contains a circle on the Earth's surface.
+    """
+    latitude, longitude, radius = circle
+    delta = np.degrees(radius / EARTH_RADIUS_KM)
+    south, north = max(latitude - delta, -90.0), min(latitude + delta, 90.0)
+    if south == -90.0 or north == 90.0:
+        return south, -180.0, north, 180.0
+    # The widest part of the circle (in degrees of longitude) is at the latitude closest to a pole.
+    width = delta / np.cos(np.radians(max(abs(south), abs(north))))
+    if width >= 180:
+        return south, -180.0, north, 180.0
+    return south, wrap_longitude(longitude - width), north, wrap_longitude(longitude + width)
+
+
+def wrap_longitude(longitude: float) -> float:
+    return (longitude + 540) % 360 - 180 if not -180 <= longitude <= 180 else longitude
+
+
+def distance_km(latitudes: np.ndarray, longitudes: np.ndarray, latitude: float, longitude: float) -> np.ndarray:
+    """
+    Returns the great-circle (haversine) distances between arrays of coordinates and a point.
+    """
+    lat1, lat2 = np.radians(latitudes), np.radians(latitude)
+    dlat = lat1 - lat2
+    dlon = np.radians(longitudes - longitude)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def within(latitudes: np.ndarray, longitudes: np.ndarray, bbox: Optional[BoundingBox] = None,
+           near: Optional[Circle] = None) -> np.ndarray:
+    """
+    Returns a mask of the coordinates that are inside a bounding box and/or a circle. Missing (NaN) coordinates never
+    are.
+    """
+    mask = ~(np.isnan(latitudes) | np.isnan(longitudes))
+    if bbox is not None:
+        south, west, north, east = bbox
+        mask &= (latitudes >= south) & (latitudes <= north)
+        if west <= east:
+            mask &= (longitudes >= west) & (longitudes <= east)
+        else:
+            mask &= (longitudes >= west) | (longitudes <= east)
+    if near is not None:
+        latitude, longitude, radius = near
+        mask &= distance_km(latitudes, longitudes, latitude, longitude) <= radius
+    return mask
+
+
+class SpatialIndex:
+    """
+    A grid over the coordinates of every event that has a location. Row ids are sorted by grid cell (row-major, in
+    rows of latitude), so the rows within a bounding box are found by one binary search per row of cells that the box
+    spans, and only the rows in those cells are checked against the exact box (or circle).
+
+    The index keeps its own copy of the coordinates in cell order, so checking candidates reads contiguous memory.
+    """
+
+    def __init__(self, latitudes: np.ndarray, longitudes: np.ndarray, cell_size: float = CELL_SIZE) -> None:
+        self.cell_size = cell_size
+        self.size = 0
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.cells = np.zeros(0, dtype=np.int64)
+        self.latitudes = np.zeros(0, dtype=np.float64)
+        self.longitudes = np.zeros(0, dtype=np.float64)
+        self.extend(latitudes, longitudes)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def columns(self) -> int:
+        return int(np.ceil(360 / self.cell_size)) + 1
+
+    def cell_rows(self, latitudes: np.ndarray) -> np.ndarray:
+        return np.floor((np.asarray(latitudes) + 90) / self.cell_size).astype(np.int64)
+
+    def cell_columns(self, longitudes: np.ndarray) -> np.ndarray:
+        return np.floor((np.asarray(longitudes) + 180) / self.cell_size).astype(np.int64)
+
+    def extend(self, latitudes: np.ndarray, longitudes: np.ndarray) -> None:
+        """
+        Adds the rows appended to the store since the index was built, given its full coordinate columns. Only the new
+        rows are sorted; they're then spliced into the existing order.
+        """
+        new_ids = np.arange(self.size, len(latitudes))
+        self.size = len(latitudes)
+        new_ids = new_ids[~(np.isnan(latitudes[new_ids]) | np.isnan(longitudes[new_ids]))]
+        new_latitudes, new_longitudes = latitudes[new_ids], longitudes[new_ids]
+        cells = self.cell_rows(new_latitudes) * self.columns + self.cell_columns(new_longitudes)
+        order = np.argsort(cells, kind='stable')
+        new_ids, cells = new_ids[order], cells[order]
+        # Inserting to the right of equal cells keeps each cell's rows in row id order.
+        positions = np.searchsorted(self.cells, cells, side='right')
+        self.ids = np.insert(self.ids, positions, new_ids)
+        self.cells = np.insert(self.cells, positions, cells)
+        self.latitudes = np.insert(self.latitudes, positions, new_latitudes[order])
+        self.longitudes = np.insert(self.longitudes, positions, new_longitudes[order])
+
+    def save(self, writer: SnapshotWriter, name: str = 'spatial') -> None:
+        writer.add_array(name + '.ids', self.ids)
+        writer.add_array(name + '.cells', self.cells)
+        writer.add_array(name + '.latitudes', self.latitudes)
+        writer.add_array(name + '.longitudes', self.longitudes)
+        writer.add_array(name + '.parameters', np.array([self.cell_size, self.size], dtype=np.float64))
+
+    @classmethod
+    def load(cls, reader: SnapshotReader, name: str = 'spatial') -> 'SpatialIndex':
+        index = cls.__new__(cls)
+        index.ids = reader.array(name + '.ids')
+        index.cells = reader.array(name + '.cells')
+        index.latitudes = reader.array(name + '.latitudes')
+        index.longitudes = reader.array(name + '.longitudes')
+        cell_size, size = reader.array(name + '.parameters')
+        index.cell_size, index.size = float(cell_size), int(size)
+        return index
+
+    def candidates(self, bbox: BoundingBox) -> np.ndarray:
+        """
+        Returns the positions (in cell order) of the rows in every cell that overlaps a bounding box.
+        """
+        south, west, north, east = bbox
+        rows = np.arange(self.cell_rows(max(south, -90.0)), self.cell_rows(min(north, 90.0)) + 1)
+        spans = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+        starts, stops = [], []
+        for span_west, span_east in spans:
+            first, last = self.cell_columns(max(span_west, -180.0)), self.cell_columns(min(span_east, 180.0))
+            starts.append(np.searchsorted(self.cells, rows * self.columns + first, side='left'))
+            stops.append(np.searchsorted(self.cells, rows * self.columns + last, side='right'))
+        starts, stops = np.concatenate(starts), np.concatenate(stops)
+        lengths = stops - starts
+        if not lengths.sum():
+            return np.zeros(0, dtype=np.int64)
+        # Concatenates the [start, stop) ranges without a Python loop over them.
+        offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        return np.arange(lengths.sum()) + offsets
+
+    def search(self, bbox: Optional[BoundingBox] = None, near: Optional[Circle] = None) -> np.ndarray:
+        """
+        Returns the ids of the rows located inside a bounding box and/or a circle (in row id order).
+
+        Args:
+            bbox (Optional[BoundingBox]): (south, west, north, east), in degrees.
+            near (Optional[Circle]): (latitude, longitude, radius in kilometers).
+        """
+        region = bbox if near is None else circle_bbox(near)
+        if region is None:
+            return np.sort(self.ids)
+        positions = self.candidates(region)
+        mask = within(self.latitudes[positions], self.longitudes[positions], bbox=bbox, near=near)
+        return np.sort(self.ids[positions[mask]])
@@ -0,0 +1,533 @@
+import math
+import re
+from array import array
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from examples.search.models.store import PackedStrings
+from lens.snapshot import SnapshotReader, SnapshotWriter
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Postings are grouped into fixed-size blocks. Each block records its doc id range and the highest term-frequency
+# score inside it, so that blocks that cannot change the top-k are never decoded.
+BLOCK_SIZE = 128
+
+# The number of segments a SegmentedTextIndex may grow to before its newest segments are merged.
+MAX_SEGMENTS = 8
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def varint_lengths(values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        lengths += (values >> np.uint64(shift)) > 0
+    return lengths
+
+
+def encode_varints(values: np.ndarray) -> np.ndarray:
+    """
+    Encodes non-negative integers as LEB128 varints (7 bits per byte, high bit set on all but the last byte).
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = varint_lengths(values)
+    starts = np.cumsum(lengths) - lengths
+    positions = np.arange(lengths.sum()) - np.repeat(starts, lengths)
+    chunks = (np.repeat(values, lengths) >> (7 * positions).astype(np.uint64)) & np.uint64(0x7F)
+    continued = positions < np.repeat(lengths - 1, lengths)
+    return (chunks | (continued.astype(np.uint64) << np.uint64(7))).astype(np.uint8)
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    ends = np.flatnonzero(data < 0x80)
+    if len(ends) == 0:
+        return np.zeros(0, dtype=np.int64)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    positions = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    chunks = (data & 0x7F).astype(np.int64) << (7 * positions)
+    return np.add.reduceat(chunks, starts)
+
+
+class FrozenVocabulary:
+    """
+    A read-only term -> term id mapping over a sorted, packed term list. Lookups are binary searches, so a vocabulary
+    loaded from a snapshot is usable immediately instead of being rebuilt as a dictionary.
+    """
+
+    def __init__(self, terms: PackedStrings, term_ids: np.ndarray) -> None:
+        self.terms = terms
+        self.term_ids = term_ids
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def get(self, term: str, default: Optional[int] = None) -> Optional[int]:
+        lo, hi = 0, len(self.terms)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.terms[mid] < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.terms) and self.terms[lo] == term:
+            return int(self.term_ids[lo])
+        return default
+
+
+class TextIndex:
+    """
+    An inverted index over event text with BM25 ranking.
+
+    Each term's posting list is a sequence of blocks of up to BLOCK_SIZE documents. A block is stored as varint-encoded
+    doc id deltas followed by varint-encoded term frequencies. Queries are evaluated term-at-a-time in decreasing order
+    of each term's maximum possible score (MaxScore): once the k-th best score exceeds what an unseen document could
+    still reach, the remaining terms only decode blocks that overlap live candidates.
+
+    Retracted documents keep their postings (callers filter them out of results), but their lengths and document
+    frequencies are subtracted from the statistics that scores are computed with, so they don't skew the ranking.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Union[Dict[str, int], FrozenVocabulary] = {}
+        self.doc_lengths = np.zeros(0, dtype=np.uint32)
+        self.average_length = 0.0
+
+        self.term_df = np.zeros(0, dtype=np.int64)
+        self.term_blocks = np.zeros(1, dtype=np.int64)
+        self.block_first = np.zeros(0, dtype=np.int64)
+        self.block_last = np.zeros(0, dtype=np.int64)
+        self.block_count = np.zeros(0, dtype=np.int64)
+        self.block_max = np.zeros(0, dtype=np.float32)
+        self.block_offsets = np.zeros(1, dtype=np.int64)
+        self.postings = np.zeros(0, dtype=np.uint8)
+
+        # Which documents are retracted, and their total length and number per term.
+        self.retracted = np.zeros(0, dtype=bool)
+        self.retracted_df = np.zeros(0, dtype=np.int64)
+        self.retracted_count = 0
+        self.retracted_length = 0
+
+    @classmethod
+    def build(cls, documents: Iterable[str], k1: float = 1.2, b: float = 0.75) -> 'TextIndex':
+        """
+        Builds an index over a sequence of documents, whose positions become their doc ids.
+        """
+        index = cls(k1=k1, b=b)
+        doc_ids: List[array] = []
+        term_freqs: List[array] = []
+        lengths = array('I')
+
+        for doc_id, text in enumerate(documents):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_id = index.vocabulary.get(term)
+                if term_id is None:
+                    term_id = index.vocabulary[term] = len(doc_ids)
+                    doc_ids.append(array('I'))
+                    term_freqs.append(array('I'))
+                doc_ids[term_id].append(doc_id)
+                term_freqs[term_id].append(tf)
+
+        index.doc_lengths = np.frombuffer(lengths, dtype=np.uint32).copy()
+        index.average_length = float(index.doc_lengths.mean()) if len(lengths) else 0.0
+        index._compress(doc_ids, term_freqs)
+        index.retracted = np.zeros(len(index.doc_lengths), dtype=bool)
+        index.retracted_df = np.zeros(len(index.term_df), dtype=np.int64)
+        return index
+
+    @classmethod
+    def merge(cls, segments: List['TextIndex'], k1: float = 1.2, b: float = 0.75) -> 'TextIndex':
+        """
+        Merges indexes over consecutive ranges of doc ids into one, straight from their postings, so documents aren't
+        read or tokenized again. Retracted documents' postings are dropped; they stay in the merged index as empty,
+        retracted documents, so that doc ids don't change.
+        """
+        index = cls(k1=k1, b=b)
+        names: List[str] = []
+        terms, docs, tfs, lengths, retracted = [], [], [], [], []
+        base = 0
+        for segment in segments:
+            segment_docs, segment_tfs = segment._decode_blocks(np.arange(len(segment.block_count)))
+            block_terms = np.repeat(np.arange(len(segment.term_df)), np.diff(segment.term_blocks))
+            keep = ~segment.retracted[segment_docs]
+            terms.append(np.repeat(block_terms, segment.block_count)[keep] + len(names))
+            docs.append(segment_docs[keep] + base)
+            tfs.append(segment_tfs[keep])
+            lengths.append(np.where(segment.retracted, 0, segment.doc_lengths))
+            retracted.append(segment.retracted)
+            names.extend(segment.terms())
+            base += len(segment)
+
+        # Terms are renumbered in sorted order (dropping the ones that only retracted documents had), and postings are
+        # laid out term by term.
+        names_array = np.array(names, dtype=object)
+        used, terms = np.unique(names_array[np.concatenate(terms)].astype(str), return_inverse=True)
+        index.vocabulary = {term: term_id for term_id, term in enumerate(used.tolist())}
+        docs, tfs = np.concatenate(docs), np.concatenate(tfs)
+        order = np.lexsort((docs, terms))
+        index.doc_lengths = np.concatenate(lengths).astype(np.uint32)
+        index.average_length = float(index.doc_lengths.mean()) if len(index.doc_lengths) else 0.0
+        index._encode(np.bincount(terms, minlength=len(used)).astype(np.int64), docs[order], tfs[order])
+        index.retracted = np.zeros(len(index.doc_lengths), dtype=bool)
+        index.retracted_df = np.zeros(len(index.term_df), dtype=np.int64)
+        index.retract(np.flatnonzero(np.concatenate(retracted)))
+        return index
+
+    def terms(self) -> List[str]:
+        """
+        Returns every term, in term id order.
+        """
+        if isinstance(self.vocabulary, FrozenVocabulary):
+            order = np.argsort(self.vocabulary.term_ids)
+            return [self.vocabulary.terms[int(position)] for position in order]
+        return sorted(self.vocabulary, key=self.vocabulary.__getitem__)
+
+    def _compress(self, doc_ids: List[array], term_freqs: List[array]) -> None:
+        term_df = np.array([len(docs) for docs in doc_ids], dtype=np.int64)
+        docs = np.frombuffer(b''.join(d.tobytes() for d in doc_ids), dtype=np.uint32).astype(np.int64)
+        tfs = np.frombuffer(b''.join(t.tobytes() for t in term_freqs), dtype=np.uint32).astype(np.int64)
+        self._encode(term_df, docs, tfs)
+
+    def _encode(self, term_df: np.ndarray, docs: np.ndarray, tfs: np.ndarray) -> None:
+        """
+        Encodes postings, laid out term by term (and by doc id within a term), into blocks.
+        """
+        self.term_df = term_df
+
+        # Postings are laid out term by term, so each posting's rank within its term determines its block.
+        term_starts = np.cumsum(self.term_df) - self.term_df
+        ranks = np.arange(len(docs)) - np.repeat(term_starts, self.term_df)
+        self.term_blocks = np.concatenate([[0], np.cumsum((self.term_df + BLOCK_SIZE - 1) // BLOCK_SIZE)])
+        block_of = np.repeat(self.term_blocks[:-1], self.term_df) + ranks // BLOCK_SIZE
+        self.block_count = np.bincount(block_of, minlength=self.term_blocks[-1]).astype(np.int64)
+        block_starts = np.cumsum(self.block_count) - self.block_count
+        self.block_first = docs[block_starts]
+        self.block_last = docs[block_starts + self.block_count - 1]
+        self.block_max = np.maximum.reduceat(self._tf_scores(docs, tfs), block_starts).astype(np.float32) \
+            if len(docs) else np.zeros(0, dtype=np.float32)
+
+        # Each block is encoded as its doc id deltas followed by its term frequencies.
+        deltas = docs - np.concatenate([[0], docs[:-1]])
+        deltas[block_starts] = 0
+        offsets = ranks % BLOCK_SIZE
+        delta_positions = 2 * np.repeat(block_starts, self.block_count) + offsets
+        values = np.empty(2 * len(docs), dtype=np.int64)
+        values[delta_positions] = deltas
+        values[delta_positions + np.repeat(self.block_count, self.block_count)] = tfs
+        self.postings = encode_varints(values)
+        block_bytes = np.add.reduceat(varint_lengths(values), 2 * block_starts) if len(docs) else []
+        self.block_offsets = np.concatenate([[0], np.cumsum(block_bytes)]).astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @property
+    def live_count(self) -> int:
+        return len(self) - self.retracted_count
+
+    @property
+    def live_length(self) -> float:
+        """
+        The total length of the documents that aren't retracted.
+        """
+        return self.average_length * len(self) - self.retracted_length
+
+    def retract(self, doc_ids: np.ndarray) -> int:
+        """
+        Removes documents from the index's statistics (but not from its postings), and returns how many of them weren't
+        already retracted. Only the blocks that may hold the documents are decoded to find their terms.
+        """
+        doc_ids = np.unique(np.asarray(doc_ids, dtype=np.int64))
+        doc_ids = doc_ids[~self.retracted[doc_ids]]
+        if len(doc_ids) == 0:
+            return 0
+        # The arrays may be read-only views of a snapshot.
+        self.retracted = np.array(self.retracted)
+        self.retracted_df = np.array(self.retracted_df)
+        self.retracted[doc_ids] = True
+        self.retracted_count += len(doc_ids)
+        self.retracted_length += int(self.doc_lengths[doc_ids].sum())
+
+        blocks = np.flatnonzero(np.searchsorted(doc_ids, self.block_last, side='right') >
+                                np.searchsorted(doc_ids, self.block_first, side='left'))
+        if len(blocks):
+            docs, _ = self._decode_blocks(blocks)
+            terms = np.repeat(np.searchsorted(self.term_blocks, blocks, side='right') - 1, self.block_count[blocks])
+            self.retracted_df += np.bincount(terms[np.isin(docs, doc_ids)], minlength=len(self.retracted_df))
+        return len(doc_ids)
+
+    # The NumPy arrays that make up the index, which are saved to (and memory-mapped from) snapshots as-is.
+    ARRAYS = ['doc_lengths', 'term_df', 'term_blocks', 'block_first', 'block_last', 'block_count', 'block_max',
+              'block_offsets', 'postings', 'retracted', 'retracted_df']
+
+    def save(self, writer: SnapshotWriter, name: str = 'text') -> None:
+        writer.add_object(name + '.parameters', {'k1': self.k1, 'b': self.b, 'average_length': self.average_length,
+                                                 'retracted_count': self.retracted_count,
+                                                 'retracted_length': self.retracted_length})
+        for array_name in self.ARRAYS:
+            writer.add_array(f'{name}.{array_name}', getattr(self, array_name))
+
+        if isinstance(self.vocabulary, FrozenVocabulary):
+            self.vocabulary.terms.save(writer, name + '.terms')
+            writer.add_array(name + '.term_ids', self.vocabulary.term_ids)
+        else:
+            terms = sorted(self.vocabulary)
+            packed = PackedStrings()
+            for term in terms:
+                packed.append(term)
+            packed.save(writer, name + '.terms')
+            writer.add_array(name + '.term_ids', np.array([self.vocabulary[term] for term in terms], dtype=np.int64))
+
+    @classmethod
+    def load(cls, reader: SnapshotReader, name: str = 'text') -> 'TextIndex':
+        parameters = reader.object(name + '.parameters')
+        index = cls(k1=parameters['k1'], b=parameters['b'])
+        index.average_length = parameters['average_length']
+        index.retracted_count = parameters['retracted_count']
+        index.retracted_length = parameters['retracted_length']
+        for array_name in cls.ARRAYS:
+            setattr(index, array_name, reader.array(f'{name}.{array_name}'))
+        index.vocabulary = FrozenVocabulary(
+            PackedStrings.load(reader, name + '.terms'),
+            reader.array(name + '.term_ids')
+        )
+        return index
+
+    def _tf_scores(self, docs: np.ndarray, tfs: np.ndarray, average_length: Optional[float] = None) -> np.ndarray:
+        """
+        The BM25 term-frequency component, which is multiplied by the term's IDF to get its score contribution.
+        """
+        average_length = self.average_length if average_length is None else average_length
+        norms = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / max(average_length, 1e-9))
+        return tfs * (self.k1 + 1) / (tfs + norms)
+
+    def _idf(self, term_id: int) -> float:
+        df = self.term_df[term_id] - self.retracted_df[term_id]
+        return math.log(1 + (self.live_count - df + 0.5) / (df + 0.5))
+
+    def _decode_blocks(self, blocks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Decodes a set of blocks with a single vectorized varint pass and returns their (doc ids, term frequencies).
+        """
+        starts, stops = self.block_offsets[blocks], self.block_offsets[blocks + 1]
+        sizes = stops - starts
+        gather = np.repeat(starts - (np.cumsum(sizes) - sizes), sizes) + np.arange(sizes.sum())
+        values = decode_varints(self.postings[gather])
+
+        counts = self.block_count[blocks]
+        value_starts = 2 * (np.cumsum(counts) - counts)
+        positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        delta_positions = np.repeat(value_starts, counts) + positions
+        tfs = values[delta_positions + np.repeat(counts, counts)]
+
+        # Deltas restart at zero in every block, so a running sum minus its value at each block start gives offsets.
+        sums = np.cumsum(values[delta_positions])
+        block_sums = sums[np.cumsum(counts) - counts]
+        docs = np.repeat(self.block_first[blocks], counts) + sums - np.repeat(block_sums, counts)
+        return docs, tfs
+
+    def search(self, text: str, limit: Optional[int] = None,
+               predicate: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+               collection: Optional['SegmentedTextIndex'] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ranks documents containing any of the query's terms by BM25 and returns (doc ids, scores) in descending score
+        order.
+
+        Args:
+            text (str): The query text.
+            limit (Optional[int]): The number of results to return. Without a limit, every match is scored.
+            predicate (Optional[Callable]): A vectorized filter that maps an array of doc ids to a boolean mask.
+            collection (Optional[SegmentedTextIndex]): The index this one is a segment of, whose document frequencies
+                and average length are used for scoring instead of the segment's own.
+        """
+        term_ids = []
+        for term in set(tokenize(text)):
+            term_id = self.vocabulary.get(term)
+            if term_id is not None:
+                term_ids.append((term_id, term))
+        term_ids.sort()
+        if collection is not None:
+            average_length = collection.average_length
+        else:
+            average_length = self.live_length / self.live_count if self.live_count else self.average_length
+        # Block maxima were computed with this index's average length. A larger average length (from the collection)
+        # can raise a document's score by at most this factor, which keeps the bounds below safe.
+        scale = max(1.0, average_length / max(self.average_length, 1e-9))
+        terms = []
+        for term_id, term in term_ids:
+            idf = self._idf(term_id) if collection is None else collection.idf(term)
+            blocks = range(self.term_blocks[term_id], self.term_blocks[term_id + 1])
+            terms.append((idf * scale * float(self.block_max[blocks.start:blocks.stop].max()), idf, blocks))
+        terms.sort(key=lambda term: -term[0])
+
+        candidates = np.zeros(0, dtype=np.int64)
+        scores = np.zeros(0, dtype=np.float64)
+        remaining = sum(term[0] for term in terms)
+        for upper_bound, idf, blocks in terms:
+            remaining -= upper_bound
+            threshold = -math.inf
+            if limit is not None and len(scores) >= max(limit, 1):
+                threshold = np.partition(scores, -max(limit, 1))[-max(limit, 1)]
+                # Candidates that can't reach the threshold even with every remaining term are dropped for good.
+                alive = scores + upper_bound + remaining >= threshold
+                candidates, scores = candidates[alive], scores[alive]
+
+            blocks = np.arange(blocks.start, blocks.stop)
+            if idf * scale * float(self.block_max[blocks].min()) + remaining < threshold:
+                # Documents first seen in a block whose bound is too low can't make the top-k, so such blocks are
+                # only decoded when they overlap a live candidate.
+                overlaps = (np.searchsorted(candidates, self.block_last[blocks], side='right') >
+                            np.searchsorted(candidates, self.block_first[blocks], side='left'))
+                blocks = blocks[(idf * scale * self.block_max[blocks] + remaining >= threshold) | overlaps]
+            if len(blocks) == 0:
+                continue
+
+            docs, tfs = self._decode_blocks(blocks)
+            if predicate is not None:
+                mask = predicate(docs)
+                docs, tfs = docs[mask], tfs[mask]
+            contributions = idf * self._tf_scores(docs, tfs, average_length)
+            if upper_bound + remaining < threshold:
+                positions = np.minimum(np.searchsorted(candidates, docs), max(len(candidates) - 1, 0))
+                hits = (candidates[positions] == docs) if len(candidates) else np.zeros(len(docs), dtype=bool)
+                np.add.at(scores, positions[hits], contributions[hits])
+            else:
+                merged, inverse = np.unique(np.concatenate([candidates, docs]), return_inverse=True)
+                scores = np.bincount(inverse, weights=np.concatenate([scores, contributions]), minlength=len(merged))
+                candidates = merged
+
+        ranking = np.lexsort((candidates, -scores))
+        if limit is not None:
+            ranking = ranking[:limit]
+        return candidates[ranking], scores[ranking]
+
+
+class SegmentedTextIndex:
+    """
+    A text index made of TextIndex segments over consecutive ranges of doc ids, so that documents appended to the store
+    are indexed without rebuilding the postings of existing ones. Segments are scored with collection-wide document
+    frequencies and average length, which leave out retracted documents (see `retract`), so rankings match a single
+    index built over the live documents.
+
+    A retracted document's postings stay in its segment until the segment is merged by `compact` (and its row stays in
+    the event store until the index is rebuilt from scratch).
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.segments: List[TextIndex] = []
+        self.bases: List[int] = []
+        self.average_length = 0.0
+        self.live_count = 0
+
+    @classmethod
+    def build(cls, documents: Iterable[str], k1: float = 1.2, b: float = 0.75) -> 'SegmentedTextIndex':
+        index = cls(k1=k1, b=b)
+        index.add(documents)
+        return index
+
+    def __len__(self) -> int:
+        return self.bases[-1] + len(self.segments[-1]) if self.segments else 0
+
+    def add(self, documents: Iterable[str]) -> None:
+        """
+        Indexes documents whose doc ids follow on from the documents already in the index.
+        """
+        segment = TextIndex.build(documents, k1=self.k1, b=self.b)
+        if len(segment):
+            self.bases.append(len(self))
+            self.segments.append(segment)
+            self._update_statistics()
+
+    def retract(self, doc_ids: np.ndarray) -> int:
+        """
+        Removes documents (e.g. every retracted row, including ones retracted before) from the collection statistics,
+        and returns how many of them weren't already retracted.
+        """
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        retracted = 0
+        for number, (base, segment) in enumerate(zip(self.bases, self.segments)):
+            stop = self.bases[number + 1] if number + 1 < len(self.bases) else len(self)
+            local = doc_ids[(doc_ids >= base) & (doc_ids < stop)] - base
+            if len(local):
+                retracted += segment.retract(local)
+        if retracted:
+            self._update_statistics()
+        return retracted
+
+    def compact(self) -> None:
+        """
+        Merges the newest segments while there are more than MAX_SEGMENTS of them (see `TextIndex.merge`, which drops
+        the postings of retracted documents). A merge extends to older segments that are smaller than the merged
+        result, so segment sizes stay geometric and each posting is re-encoded a logarithmic number of times.
+        """
+        if len(self.segments) <= MAX_SEGMENTS:
+            return
+        first = MAX_SEGMENTS - 1
+        size = sum(len(segment) for segment in self.segments[first:])
+        while first > 0 and len(self.segments[first - 1]) <= size:
+            first -= 1
+            size += len(self.segments[first])
+
+        merged = TextIndex.merge(self.segments[first:], k1=self.k1, b=self.b)
+        del self.segments[first:], self.bases[first + 1:]
+        self.segments.append(merged)
+        self._update_statistics()
+
+    def _update_statistics(self) -> None:
+        self.live_count = sum(segment.live_count for segment in self.segments)
+        total_length = sum(segment.live_length for segment in self.segments)
+        self.average_length = total_length / self.live_count if self.live_count else 0.0
+
+    def idf(self, term: str) -> float:
+        df = 0
+        for segment in self.segments:
+            term_id = segment.vocabulary.get(term)
+            if term_id is not None:
+                df += int(segment.term_df[term_id] - segment.retracted_df[term_id])
+        return math.log(1 + (self.live_count - df + 0.5) / (df + 0.5))
+
+    def search(self, text: str, limit: Optional[int] = None,
+               predicate: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Searches every segment (see `TextIndex.search`) and merges their results.
+        """
+        ids = [np.zeros(0, dtype=np.int64)]
+        scores = [np.zeros(0, dtype=np.float64)]
+        for base, segment in zip(self.bases, self.segments):
+            local_predicate = None if predicate is None else (lambda docs, base=base: predicate(docs + base))
+            segment_ids, segment_scores = segment.search(text, limit=limit, predicate=local_predicate, collection=self)
+            ids.append(segment_ids + base)
+            scores.append(segment_scores)
+
+        ids, scores = np.concatenate(ids), np.concatenate(scores)
+        ranking = np.lexsort((ids, -scores))
+        if limit is not None:
+            ranking = ranking[:limit]
+        return ids[ranking], scores[ranking]
+
+    def save(self, writer: SnapshotWriter, name: str = 'text') -> None:
+        writer.add_object(name + '.segments', {'k1': self.k1, 'b': self.b, 'bases': self.bases})
+        for number, segment in enumerate(self.segments):
+            segment.save(writer, f'{name}.{number}')
+
+    @classmethod
+    def load(cls, reader: SnapshotReader, name: str = 'text') -> 'SegmentedTextIndex':
+        parameters = reader.object(name + '.segments')
+        index = cls(k1=parameters['k1'], b=parameters['b'])
+        index.bases = list(parameters['bases'])
+        index.segments = [TextIndex.load(reader, f'{name}.{number}') for number in range(len(index.bases))]
+        index._update_statistics()
+        return index
@@ -0,0 +1,121 @@
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+from lens.snapshot import SnapshotReader, SnapshotWriter
+
+# The smallest block of the sorted permutation examined per step of a filtered scan.
+MIN_SCAN_BLOCK = 1024
+
+
+class TimestampIndex:
+    """
+    A timestamp-sorted permutation of event row ids. Time ranges are located with a binary search, and the rows within
+    a range are already in chronological order, so a sort-filter-limit query only touches the rows it returns (plus
+    any rows rejected by a filter along the way).
+    """
+
+    def __init__(self, timestamps: np.ndarray) -> None:
+        self.order = np.argsort(timestamps, kind='stable')
+        self.sorted_timestamps = timestamps[self.order]
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def extend(self, timestamps: np.ndarray) -> None:
+        """
+        Adds the rows appended to the store since the index was built, given its full timestamp column. Only the new
+        rows are sorted; they're then spliced into the existing permutation.
+        """
+        new_ids = np.arange(len(self.order), len(timestamps))
+        new_ids = new_ids[np.argsort(timestamps[new_ids], kind='stable')]
+        new_timestamps = timestamps[new_ids]
+        # Inserting to the right of equal timestamps keeps ties in row id order, as a full stable sort would.
+        positions = np.searchsorted(self.sorted_timestamps, new_timestamps, side='right')
+        self.order = np.insert(self.order, positions, new_ids)
+        self.sorted_timestamps = np.insert(self.sorted_timestamps, positions, new_timestamps)
+
+    def save(self, writer: SnapshotWriter, name: str = 'timeline') -> None:
+        writer.add_array(name + '.order', self.order)
+        writer.add_array(name + '.sorted_timestamps', self.sorted_timestamps)
+
+    @classmethod
+    def load(cls, reader: SnapshotReader, name: str = 'timeline') -> 'TimestampIndex':
+        index = cls.__new__(cls)
+        index.order = reader.array(name + '.order')
+        index.sorted_timestamps = reader.array(name + '.sorted_timestamps')
+        return index
+
+    def range(self, since: Optional[float] = None, until: Optional[float] = None) -> Tuple[int, int]:
+        """
+        Returns the [start, stop) positions in the sorted permutation covering timestamps in [since, until).
+        """
+        start = 0 if since is None else int(np.searchsorted(self.sorted_timestamps, since, side='left'))
+        stop = len(self.order) if until is None else int(np.searchsorted(self.sorted_timestamps, until, side='left'))
+        return start, max(start, stop)
+
+    def position(self, timestamp: float, row: int, side: str = 'left') -> int:
+        """
+        Returns the position of a row in the sorted permutation, given its timestamp (which needn't be in the index any
+        more). Rows with equal timestamps are in row id order, so the row is found with two binary searches.
+
+        Args:
+            side (str): 'left' for the position of the row itself, or 'right' for the position after it.
+        """
+        lo = int(np.searchsorted(self.sorted_timestamps, timestamp, side='left'))
+        hi = int(np.searchsorted(self.sorted_timestamps, timestamp, side='right'))
+        return lo + int(np.searchsorted(self.order[lo:hi], row, side=side))
+
+    def scan(self, since: Optional[float] = None, until: Optional[float] = None, descending: bool = False,
+             limit: Optional[int] = None, predicate: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+             after: Optional[Tuple[float, int]] = None) -> np.ndarray:
+        """
+        Returns up to `limit` row ids with timestamps in [since, until), in chronological (or reverse chronological)
+        order.
+
+        Args:
+            since (Optional[float]): Inclusive lower bound, in epoch seconds.
+            until (Optional[float]): Exclusive upper bound, in epoch seconds.
+            descending (bool): Whether to return the most recent events first.
+            limit (Optional[int]): The maximum number of row ids to return.
+            predicate (Optional[Callable]): A vectorized filter that maps an array of row ids to a boolean mask.
+            after (Optional[Tuple[float, int]]): The (timestamp, row id) of the last row of a previous page, to only
+                return the rows that come after it (in the scan's order).
+        """
+        start, stop = self.range(since, until)
+        if after is not None:
+            if descending:
+                stop = max(start, min(stop, self.position(*after, side='left')))
+            else:
+                start = min(stop, max(start, self.position(*after, side='right')))
+        if limit is not None:
+            limit = max(limit, 0)
+
+        if predicate is None:
+            if limit is not None:
+                if descending:
+                    start = max(start, stop - limit)
+                else:
+                    stop = min(stop, start + limit)
+            ids = self.order[start:stop]
+            return ids[::-1] if descending else ids
+
+        # Filtered scans walk the range in geometrically growing blocks, starting from the requested end, so that
+        # selective filters still terminate as soon as enough rows have been found.
+        matches = []
+        found = 0
+        block = max(MIN_SCAN_BLOCK, 2 * (limit or 0))
+        while start < stop and (limit is None or found < limit):
+            if descending:
+                ids = self.order[max(start, stop - block):stop][::-1]
+                stop -= len(ids)
+            else:
+                ids = self.order[start:min(stop, start + block)]
+                start += len(ids)
+            ids = ids[predicate(ids)]
+            matches.append(ids)
+            found += len(ids)
+            block *= 2
+
+        ids = np.concatenate(matches) if matches else self.order[:0]
+        return ids if limit is None else ids[:limit]
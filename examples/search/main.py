@@ -9,17 +9,33 @@ in a confidential computing node on Microsoft Azure, where the confidentiality a
 application code are protected during processing-time due to the secure hardware provided by Intel SGX enclaves.
 """
 
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from examples.search.aggregate import aggregate_events
 from examples.search.index.google import GoogleIndex
 from lens.sources.FacebookSource import FacebookSource
+from examples.search.index.bitmap import Bitmap
 from examples.search.index.facebook import FacebookIndex
-from examples.search.models.event import Event
+from examples.search.index.helpers.gmail import EmailBody, close_maps
+from examples.search.index.helpers.scheduler import StageScheduler
+from examples.search.index.people import PeopleIndex
+from examples.search.index.rollup import Rollup
+from examples.search.index.spatial import SpatialIndex
+from examples.search.index.text import SegmentedTextIndex
+from examples.search.index.timeline import TimestampIndex
+from examples.search.models.store import EventStore
+from examples.search.query import Query
+from examples.search.results import Cursor, Results
+from lens.snapshot import SnapshotReader, SnapshotWriter
+from lens.sources import BaseSource
 from lens.sources.GoogleSource import GoogleSource
+from lens.sources.SourceManifest import SourceManifest
 from tqdm import tqdm
 
 import os
 import os.path
 
+import numpy as np
+
 
 class SearchEngine:
 
@@ -31,7 +47,22 @@ class SearchEngine:
             config (Dict[str, Any]): A dictionary of configuration parameters. Defaults to {}.
         """
         self.config = config
-        self.events: List[Event] = []
+        # Event metadata beyond this many bytes (if set) is spilled to disk, since it's rarely read.
+        self.events = EventStore(metadata_budget=config.get('metadata_budget'))
+        self.timeline = TimestampIndex(self.events.timestamps.values)
+        self.spatial = SpatialIndex(self.events.latitudes.values, self.events.longitudes.values)
+        self.text_index = SegmentedTextIndex()
+        self.rollup = Rollup(self.events)
+        self.people = PeopleIndex()
+
+        # The manifest of each company's source files as of the last preprocess, and the shared state (e.g. the friend
+        # list) its parsers produced, which together let the next preprocess re-parse only what changed.
+        self.manifests: Dict[str, SourceManifest] = {}
+        self.states: Dict[str, Dict[str, Any]] = {}
+
+        # The source each company's data was read from, for reading the parts of events that are only parsed on demand
+        # (e.g. email bodies).
+        self.sources: Dict[str, BaseSource] = {}
 
     def query(self, args: Dict[str, Any] = {}) -> List[Dict[str, Any]]:
         """
@@ -39,18 +70,195 @@ class SearchEngine:
         logic to define argument types and validate arguments within application logic.
 
         Args:
-            args (Dict[str, Any], optional): Endpoint arguments. Defaults to {}.
+            args (Dict[str, Any], optional): Endpoint arguments. Defaults to {}. See `examples.search.query` for the
+                supported arguments.
+        """
+        return list(self.results(args))
+
+    @staticmethod
+    def heavy(args: Dict[str, Any]) -> bool:
+        """
+        Whether a query's arguments make it expensive enough for a server to admit it separately from the others:
+        aggregates, and queries without a limit (which return every matching event).
+        """
+        return args.get('group_by') is not None or args.get('top_people') is not None or args.get('limit') is None
+
+    def results(self, args: Dict[str, Any] = {}) -> Results:
+        """
+        Runs a query like `query`, but returns its rows as a `Results` iterator, which reads and projects each event
+        only as it's consumed (and can write them out as NDJSON). Once it's consumed, its `cursor` is the one to pass
+        for the next page.
+        """
+        query = Query(args)
+        if query.group_by is not None:
+            if self.rollup.covers(query):
+                groups = self.rollup.aggregate(self.events, query)
+            else:
+                groups = aggregate_events(self.events, self.matching_ids(query, limit=None)[0], query.group_by,
+                                          query.aggregates, descending=query.order == 'desc', limit=query.limit)
+            return Results((group, None) for group in groups)
+        if query.top_people is not None:
+            return Results((person, None) for person in self.top_people(query))
+
+        ids, scores = self.matching_ids(query, limit=query.limit)
+        keys = scores if scores is not None else self.events.timestamps.values[ids]
+        fingerprint = query.fingerprint
+        previous = query.cursor.count if query.cursor is not None else 0
+        return Results(
+            ((self.result(int(index), query.fields), (float(key), int(index))) for index, key in zip(ids, keys)),
+            limit=query.limit,
+            cursor=lambda key, row, count: Cursor(fingerprint, key, row, previous + count)
+        )
+
+    def matching_ids(self, query: Query, limit: Optional[int]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Returns the ids of the rows that match a query (after its cursor, if any), in the order they're returned in:
+        by relevance for text searches (in which case their scores are returned too), and otherwise by time.
+        """
+        # The events that name the queried people are found by intersecting (or uniting) their bitmaps.
+        people = self.people.search(query.people_all, query.people_any).to_ids() if query.people else None
+        after = query.cursor
+
+        if query.text is not None:
+            predicate = query.predicate(self.events, time_range=True)
+            if people is not None:
+                predicate = self.people_predicate(people, predicate)
+            # Results are ranked by (descending) score, then row id. The rows on previous pages are ranked again to
+            # find where the next page starts, and if rows have been added since, more are ranked until it's full.
+            fetch = limit if after is None or limit is None else after.count + limit
+            while True:
+                ids, scores = self.text_index.search(query.text, limit=fetch, predicate=predicate)
+                if after is None:
+                    return np.asarray(ids, dtype=np.int64), scores
+                mask = (scores < after.key) | ((scores == after.key) & (ids > after.row))
+                if fetch is None or mask.sum() >= limit or len(ids) < fetch:
+                    return np.asarray(ids[mask][:limit], dtype=np.int64), scores[mask][:limit]
+                fetch *= 2
+
+        if query.located or people is not None:
+            # Only the events in the area (and/or that name the people) are candidates, so they're found through the
+            # spatial (and/or people) index, then filtered and sorted by time.
+            if query.located:
+                ids = self.spatial.search(bbox=query.bbox, near=query.near)
+                if people is not None:
+                    ids = np.intersect1d(ids, people, assume_unique=True)
+            else:
+                ids = people
+            predicate = query.predicate(self.events, time_range=True, location=False)
+            if predicate is not None:
+                ids = ids[predicate(ids)]
+            ids = ids[np.argsort(self.events.timestamps.values[ids], kind='stable')]
+            if query.order == 'desc':
+                ids = ids[::-1]
+            if after is not None:
+                # Events without a timestamp sort last, as if they were infinitely late.
+                timestamps = np.nan_to_num(self.events.timestamps.values[ids], nan=np.inf)
+                key = np.inf if np.isnan(after.key) else after.key
+                if query.order == 'desc':
+                    ids = ids[(timestamps < key) | ((timestamps == key) & (ids < after.row))]
+                else:
+                    ids = ids[(timestamps > key) | ((timestamps == key) & (ids > after.row))]
+            return ids[:limit], None
+
+        ids = self.timeline.scan(
+            since=query.since,
+            until=query.until,
+            descending=query.order == 'desc',
+            limit=limit,
+            predicate=query.predicate(self.events),
+            after=(after.key, after.row) if after is not None else None
+        )
+        return ids, None
+
+    @staticmethod
+    def people_predicate(people: np.ndarray,
+                         predicate: Optional[Callable[[np.ndarray], np.ndarray]]) -> Callable[[np.ndarray], np.ndarray]:
+        """
+        Extends a row-id predicate to only accept the given (sorted) rows.
         """
-        events = self.events
-        return [e.to_json() for e in events]
+        def accept(ids: np.ndarray) -> np.ndarray:
+            mask = np.isin(ids, people)
+            return mask & predicate(ids) if predicate is not None else mask
+
+        return accept
+
+    def top_people(self, query: Query) -> List[Dict[str, Any]]:
+        """
+        Returns the people named by the most events that match a query (see the "top_people" argument).
+        """
+        if (query.text is None and not query.located and not query.people and query.since is None
+                and query.until is None and set(query.filters) <= {'source'}):
+            # Only filtered by source (if at all), so the counts are read from each person's per-source counts.
+            codes = None
+            if 'source' in query.filters:
+                table = self.events.sources
+                codes = [table.codes[v] for v in query.filters['source'] if v in table.codes]
+            return self.people.top(source_codes=codes, limit=query.top_people)
+        events = Bitmap.from_ids(self.matching_ids(query, limit=None)[0])
+        return self.people.top(events, limit=query.top_people, exclude=query.people)
+
+    def result(self, index: int, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        event = self.events[index]
+        if isinstance(event.content, EmailBody) and (fields is None or 'content' in fields):
+            event.content = event.content.parts(self.sources.get(event.company))
+        return event.to_json(fields)
+
+    def document(self, index: int) -> str:
+        """
+        Returns the text that the text index holds for a row, including email bodies (which aren't stored). Their text
+        is taken from the store's `unstored_text` (where the mbox reader's workers put it), which is freed as it's read.
+        """
+        text = self.events.text(index)
+        unstored = self.events.unstored_text.pop(index, None)
+        if unstored is not None:
+            return text + ' ' + unstored
+        content = self.events.content_objects.get(index)
+        if isinstance(content, EmailBody):
+            company = self.events.companies.decode(self.events.company_codes[index])
+            text += ' ' + content.text(self.sources.get(company))
+        return text
+
+    def save(self, path: str) -> None:
+        """
+        Writes the preprocessed index (event columns, string tables and secondary indexes) to a snapshot file.
+        """
+        with SnapshotWriter(path) as writer:
+            self.events.save(writer)
+            self.timeline.save(writer)
+            self.spatial.save(writer)
+            self.text_index.save(writer)
+            self.rollup.save(writer)
+            self.people.save(writer)
+            writer.add_object('manifests', self.manifests)
+            writer.add_object('states', self.states)
+
+    @classmethod
+    def load(cls, path: str, config: Dict[str, Any] = {},
+             sources: Optional[Dict[str, BaseSource]] = None) -> 'SearchEngine':
+        """
+        Loads a snapshot written by `save`. The snapshot is memory-mapped rather than read, so loading takes roughly
+        constant time and rows are paged in from disk as queries touch them.
+
+        Email bodies are read from the mbox files they were indexed from, through the given sources (by company).
+        Without a source, they're read from disk.
+        """
+        engine = cls(config=config)
+        engine.sources = dict(sources or {})
+        reader = SnapshotReader(path)
+        engine.events = EventStore.load(reader, metadata_budget=config.get('metadata_budget'))
+        engine.timeline = TimestampIndex.load(reader)
+        engine.spatial = SpatialIndex.load(reader)
+        engine.text_index = SegmentedTextIndex.load(reader)
+        engine.rollup = Rollup.load(reader)
+        engine.people = PeopleIndex.load(reader)
+        engine.manifests = reader.object('manifests')
+        engine.states = reader.object('states')
+        return engine
 
     def help(self) -> None:
         print(f'This index contains {len(self.events)} events.')
-        event_types = set()
-        for event in self.events:
-            event_types.add(event.key)
         print('The possible event types are:')
-        print('\n- '.join(sorted(event_types)))
+        print('\n- '.join(self.events.distinct_keys()))
 
     def preprocess(self, facebook_source: FacebookSource, google_source: GoogleSource):
         """
@@ -59,11 +267,69 @@ class SearchEngine:
         the in-memory state efficiently, and it's re-built when a user makes a query.
         """
 
-        self.events.extend(FacebookIndex(
-            source=facebook_source,
-            full_name=self.config.get('full_name')
-        ).get_events())
+        indexes = [
+            FacebookIndex(
+                source=facebook_source,
+                full_name=self.config.get('full_name')
+            ),
+            GoogleIndex(
+                source=google_source,
+                workers=self.config.get('workers'),
+                recurrence_window=self.config.get('recurrence_window')
+            ),
+        ]
+
+        # If the sources were indexed before, only files that were added or changed since then are re-parsed, and
+        # events from files that changed or were removed are retracted.
+        replaced = set()
+        for index in indexes:
+            self.sources[index.COMPANY] = index.source
+            previous = self.manifests.get(index.COMPANY)
+            self.manifests[index.COMPANY] = index.source.manifest(previous)
+            if previous is None:
+                continue
+            diff = self.manifests[index.COMPANY].diff(previous)
+            print(f'{index.COMPANY}: {len(diff.added)} files added, {len(diff.changed)} changed, '
+                  f'{len(diff.removed)} removed.')
+            index.selected = diff.modified
+            index.appended = diff.appended
+            index.previous_state = self.states.get(index.COMPANY)
+            replaced.update(index.COMPANY + '/' + path for path in diff.removed)
+
+        # Every parser is a separate task, so independent parsers (across both indexes) run concurrently. Stores are
+        # merged in task order, which makes the result identical to running the parsers one after another.
+        scheduler = StageScheduler(workers=self.config.get('workers'))
+        for index in indexes:
+            prefix = type(index).__name__ + '.'
+            for name in index.PARSERS:
+                scheduler.add(
+                    prefix + name, index.run_parser, name,
+                    dependencies=[prefix + dependency for dependency in index.DEPENDENCIES.get(name, [])]
+                )
+        results = scheduler.run()
+
+        for name in scheduler.order:
+            store, _ = results[name]
+            replaced.update(store.replaced_origins())
+        self.events.retract(replaced)
+
+        start = len(self.events)
+        for name in scheduler.order:
+            store, _ = results[name]
+            self.events.merge(store)
+        for index in indexes:
+            prefix = type(index).__name__ + '.'
+            for name in sorted({d for dependencies in index.DEPENDENCIES.values() for d in dependencies}):
+                _, self.states[index.COMPANY] = results[prefix + name]
 
-        self.events.extend(GoogleIndex(
-            source=google_source
-        ).get_events())
+        # The secondary indexes are extended with the new rows only; retracted rows are filtered out at query time.
+        self.timeline.extend(self.events.timestamps.values)
+        self.spatial.extend(self.events.latitudes.values, self.events.longitudes.values)
+        self.text_index.add(self.document(i) for i in range(start, len(self.events)))
+        close_maps()
+        self.text_index.retract(np.flatnonzero(~self.events.live.values))
+        self.text_index.compact()
+        self.people.extend(self.events)
+        # Unlike the indexes, the rollup is rebuilt from scratch (without retracted rows), which is a single pass over
+        # a few columns.
+        self.rollup = Rollup(self.events)
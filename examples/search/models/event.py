@@ -1,16 +1,32 @@
-from datetime import datetime
-from typing import Any, Dict, Optional, Set, cast
+from typing import Any, Callable, Dict, Iterable, Optional, Set
 
-import pytz
+from examples.search.models.timestamps import normalize_timestamp
+
+
+class LazyValue:
+    """
+    Stands in for a value that's only computed (e.g. decoded) when it's first read.
+    """
+
+    __slots__ = ('load',)
+
+    def __init__(self, load: Callable[[], Any]) -> None:
+        self.load = load
 
 
 class Event:
     """
     An Event is a piece of information from a third-party data source that occurred at a particular timestamp.
+
+    Events are stored column-wise in an `EventStore`; instances of this class are short-lived views over a single row,
+    so they use `__slots__` rather than a per-instance `__dict__`. Their metadata may be a `LazyValue`, which is only
+    decoded when it's read (e.g. by `to_json`).
     """
 
+    __slots__ = ('company', 'source', 'key', 'timestamp', 'title', 'content', '_metadata', 'names', 'location')
+
     def __init__(self, company: str, source: str, key: str, timestamp: Any,
-                 title: str, content: Optional[Any] = None, metadata: Optional[Dict] = None,
+                 title: str, content: Optional[Any] = None, metadata: Optional[Any] = None,
                  names: Optional[Set[str]] = None, location: Optional[Dict[str, float]] = None) -> None:
         """
         Args:
@@ -20,7 +36,8 @@ class Event:
             timestamp (Any): The timestamp at which this event occurred. May be passed in as any timestamp format.
             title (Any): A title to represent this event (e.g. "Shomil sent you a message.").
             content (Optional[Any]): A blob-like field to represent this event's primary content (e.g. email body, etc.)
-            metadata (Optional[Dict]): A variable-format dictionary containing metadata attributes.
+            metadata (Optional[Any]): A variable-format dictionary containing metadata attributes, or a `LazyValue`
+                that loads one.
         """
         self.company = company
         self.source = source
@@ -28,27 +45,37 @@ class Event:
         self.timestamp = Event.parse_timestamp(timestamp)
         self.title = title
         self.content = content
-        self.metadata = metadata
+        self._metadata = metadata
 
-        # Two things that we can build an index off of
+        # Indexed by `PeopleIndex` and `SpatialIndex` respectively
         self.names = names
         self.location = location
 
+    @property
+    def metadata(self) -> Optional[Dict]:
+        if isinstance(self._metadata, LazyValue):
+            self._metadata = self._metadata.load()
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, metadata: Optional[Any]) -> None:
+        self._metadata = metadata
+
     @staticmethod
-    def parse_timestamp(timestamp):
+    def parse_timestamp(timestamp: Any) -> float:
         """
-        TODO: Build a general-purpose timestamp parser here. All timestamps should be represented in GMT and as
-        epoch time (seconds since 1970). The input may be a string, an integer, or a double.
+        Normalizes a timestamp (epoch seconds or milliseconds, an ISO-8601 or RFC 2822 string, or a datetime) to epoch
+        seconds in UTC. See `examples.search.models.timestamps`.
         """
-        if isinstance(timestamp, datetime):
-            timestamp = cast(datetime, timestamp)
-            seconds = timestamp.replace(tzinfo=pytz.UTC).timestamp()
-        else:
-            seconds = timestamp
+        return normalize_timestamp(timestamp)
 
-        return seconds
-
-    def to_json(self):
+    def to_json(self, fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Returns the event as a dict, or only the given fields of it. Fields that aren't returned (e.g. lazily decoded
+        metadata) aren't read.
+        """
+        if fields is not None:
+            return {field: getattr(self, 'location' if field == 'locations' else field) for field in fields}
         return {
             'company': self.company,
             'source': self.source,
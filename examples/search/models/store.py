@@ -0,0 +1,745 @@
+import os
+import pickle
+import tempfile
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from functools import partial
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import msgpack
+import numpy as np
+
+from examples.search.models.event import Event, LazyValue
+from lens.snapshot import SnapshotReader, SnapshotWriter
+
+
+def flatten_strings(value: Any) -> Iterator[str]:
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from flatten_strings(item)
+
+
+class GrowableArray:
+    """
+    A NumPy-backed column that supports amortized O(1) appends. The backing buffer doubles in size whenever it fills
+    up, and `values` returns a view over the populated prefix.
+    """
+
+    def __init__(self, dtype: Any, capacity: int = 1024) -> None:
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index: int) -> Any:
+        return self._data[:self._size][index]
+
+    @classmethod
+    def from_array(cls, values: np.ndarray) -> 'GrowableArray':
+        """
+        Wraps an existing (possibly read-only, memory-mapped) array, which is only copied if the column is appended to.
+        """
+        column = cls(values.dtype, capacity=0)
+        column._data = values
+        column._size = len(values)
+        return column
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Only pickle the populated prefix so that stores shipped between processes don't carry spare capacity.
+        return {'values': self.values}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self._data = state['values']
+        self._size = len(self._data)
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._data[:self._size]
+
+    def append(self, value: Any) -> None:
+        if self._size == len(self._data) or not self._data.flags.writeable:
+            self._reserve(self._size + 1)
+        self._data[self._size] = value
+        self._size += 1
+
+    def extend(self, values: Any) -> None:
+        values = np.asarray(values, dtype=self._data.dtype)
+        self._reserve(self._size + len(values))
+        self._data[self._size:self._size + len(values)] = values
+        self._size += len(values)
+
+    def writable_values(self) -> np.ndarray:
+        """
+        Returns a mutable view over the populated prefix, copying the buffer first if it's read-only (memory-mapped).
+        """
+        self._reserve(self._size)
+        return self.values
+
+    def _reserve(self, capacity: int) -> None:
+        if capacity <= len(self._data) and self._data.flags.writeable:
+            return
+        data = np.empty(max(capacity, 2 * len(self._data), 1024), dtype=self._data.dtype)
+        data[:self._size] = self._data[:self._size]
+        self._data = data
+
+
+class PackedBytes:
+    """
+    A list of optional byte strings packed into a single buffer plus an offsets array, which avoids the per-object
+    overhead of millions of small Python objects. A column loaded from a snapshot reads straight from the memory-mapped
+    file, and is only copied into memory if it's appended to.
+    """
+
+    def __init__(self) -> None:
+        self._data: Any = bytearray()
+        self._offsets: Any = array('q', [0])
+        self._nulls: Any = bytearray()
+
+    def __len__(self) -> int:
+        return len(self._nulls)
+
+    def get_bytes(self, index: int) -> Optional[bytes]:
+        if self._nulls[index]:
+            return None
+        return bytes(self._data[self._offsets[index]:self._offsets[index + 1]])
+
+    def _thaw(self) -> None:
+        if not isinstance(self._data, bytearray):
+            self._data = bytearray(self._data)
+            self._offsets = array('q', self._offsets.tobytes())
+            self._nulls = bytearray(self._nulls)
+
+    def append_bytes(self, value: Optional[bytes]) -> None:
+        self._thaw()
+        if value is not None:
+            self._data += value
+        self._offsets.append(len(self._data))
+        self._nulls.append(value is None)
+
+    def extend(self, other: 'PackedBytes') -> None:
+        self._thaw()
+        base = len(self._data)
+        self._data += other._data
+        self._offsets.extend(int(offset) + base for offset in other._offsets[1:])
+        self._nulls += bytes(other._nulls)
+
+    def save(self, writer: SnapshotWriter, name: str) -> None:
+        writer.add_bytes(name + '.data', self._data)
+        writer.add_array(name + '.offsets', np.asarray(self._offsets, dtype=np.int64))
+        writer.add_array(name + '.nulls', np.frombuffer(bytes(self._nulls), dtype=np.uint8))
+
+    @classmethod
+    def load(cls, reader: SnapshotReader, name: str) -> 'PackedBytes':
+        column = cls()
+        column._data = reader.bytes(name + '.data')
+        column._offsets = reader.array(name + '.offsets')
+        column._nulls = reader.array(name + '.nulls')
+        return column
+
+
+class PackedStrings(PackedBytes):
+    """
+    A `PackedBytes` column of optional strings, stored as UTF-8.
+    """
+
+    def __getitem__(self, index: int) -> Optional[str]:
+        value = self.get_bytes(index)
+        return None if value is None else value.decode('utf-8', errors='surrogatepass')
+
+    def append(self, value: Optional[str]) -> None:
+        self.append_bytes(None if value is None else value.encode('utf-8', errors='surrogatepass'))
+
+
+class ObjectColumn:
+    """
+    A column of arbitrary Python objects (e.g. sets of names). Rows loaded from a snapshot stay pickled in the
+    memory-mapped file and are only unpickled when read, while rows appended afterwards are held as live objects.
+    """
+
+    def __init__(self) -> None:
+        self._frozen = PackedBytes()
+        self._live: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self._frozen) + len(self._live)
+
+    def __getitem__(self, index: int) -> Any:
+        if index < len(self._frozen):
+            return pickle.loads(self._frozen.get_bytes(index))
+        return self._live[index - len(self._frozen)]
+
+    def __iter__(self) -> Iterator[Any]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def append(self, value: Any) -> None:
+        self._live.append(value)
+
+    def extend(self, values: Iterable[Any]) -> None:
+        self._live.extend(values)
+
+    def save(self, writer: SnapshotWriter, name: str) -> None:
+        packed = PackedBytes()
+        packed.extend(self._frozen)
+        for value in self._live:
+            packed.append_bytes(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        packed.save(writer, name)
+
+    @classmethod
+    def load(cls, reader: SnapshotReader, name: str) -> 'ObjectColumn':
+        column = cls()
+        column._frozen = PackedBytes.load(reader, name)
+        return column
+
+
+class SparseObjects:
+    """
+    A sparse mapping from row id to object, for the rare rows whose content isn't a plain string. Like `ObjectColumn`,
+    entries loaded from a snapshot stay pickled until they're read.
+    """
+
+    def __init__(self) -> None:
+        self._frozen_ids = np.zeros(0, dtype=np.int64)
+        self._frozen = ObjectColumn()
+        self._live: Dict[int, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._frozen_ids) + len(self._live)
+
+    def __setitem__(self, index: int, value: Any) -> None:
+        self._live[index] = value
+
+    def get(self, index: int) -> Any:
+        if index in self._live:
+            return self._live[index]
+        position = int(np.searchsorted(self._frozen_ids, index))
+        if position < len(self._frozen_ids) and self._frozen_ids[position] == index:
+            return self._frozen[position]
+        return None
+
+    def items(self) -> Iterator[Tuple[int, Any]]:
+        for position, index in enumerate(self._frozen_ids):
+            yield int(index), self._frozen[position]
+        yield from sorted(self._live.items())
+
+    def save(self, writer: SnapshotWriter, name: str) -> None:
+        # Rows are only ever appended, so live ids always sort after the frozen ones.
+        live = sorted(self._live.items())
+        ids = np.array([index for index, _ in live], dtype=np.int64)
+        writer.add_array(name + '.ids', np.concatenate([self._frozen_ids, ids]))
+        values = ObjectColumn()
+        values._frozen = self._frozen._frozen
+        values.extend(value for _, value in live)
+        values.save(writer, name + '.values')
+
+    @classmethod
+    def load(cls, reader: SnapshotReader, name: str) -> 'SparseObjects':
+        objects = cls()
+        objects._frozen_ids = reader.array(name + '.ids')
+        objects._frozen = ObjectColumn.load(reader, name + '.values')
+        return objects
+
+
+class KeyTable:
+    """
+    Encodes values as MessagePack, with the key set (shape) of every string-keyed dict stored once in the table rather
+    than in each value: such a dict is encoded as its shape's id followed by its values. Metadata rows from the same
+    parser share a handful of shapes, so this typically halves their size.
+
+    Tuples, sets and datetimes are encoded as extension types so that they're decoded as they were. Anything else that
+    MessagePack can't represent (e.g. a third-party object) is pickled.
+    """
+
+    # Extension type codes.
+    RECORD, TUPLE, SET, FROZENSET, DATETIME, PICKLE = range(1, 7)
+
+    def __init__(self, shapes: Iterable[Tuple[str, ...]] = ()) -> None:
+        self.shapes: List[Tuple[str, ...]] = [tuple(shape) for shape in shapes]
+        self.ids: Dict[Tuple[str, ...], int] = {shape: shape_id for shape_id, shape in enumerate(self.shapes)}
+
+    def encode(self, value: Any) -> bytes:
+        try:
+            return msgpack.packb(self._pack(value), use_bin_type=True)
+        except (OverflowError, TypeError, ValueError):
+            # e.g. integers wider than 64 bits, or nesting deeper than MessagePack allows.
+            return msgpack.packb(self._pickle(value), use_bin_type=True)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, ext_hook=self._unpack_ext, raw=False, strict_map_key=False)
+
+    def _pickle(self, value: Any) -> msgpack.ExtType:
+        return msgpack.ExtType(self.PICKLE, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def _ext(self, code: int, values: List[Any]) -> msgpack.ExtType:
+        return msgpack.ExtType(code, msgpack.packb(values, use_bin_type=True))
+
+    def _pack(self, value: Any) -> Any:
+        kind = type(value)
+        if value is None or kind in (str, int, float, bool, bytes):
+            return value
+        if kind is dict:
+            shape = tuple(value)
+            if all(type(key) is str for key in shape):
+                shape_id = self.ids.get(shape)
+                if shape_id is None:
+                    shape_id = self.ids[shape] = len(self.shapes)
+                    self.shapes.append(shape)
+                return self._ext(self.RECORD, [shape_id, *map(self._pack, value.values())])
+            return {self._pack(key): self._pack(item) for key, item in value.items()}
+        if kind is list:
+            return [self._pack(item) for item in value]
+        if kind is tuple:
+            return self._ext(self.TUPLE, [self._pack(item) for item in value])
+        if kind is set or kind is frozenset:
+            return self._ext(self.SET if kind is set else self.FROZENSET, [self._pack(item) for item in value])
+        if kind is datetime:
+            return msgpack.ExtType(self.DATETIME, value.isoformat().encode('ascii'))
+        return self._pickle(value)
+
+    def _unpack_ext(self, code: int, data: bytes) -> Any:
+        if code == self.DATETIME:
+            return datetime.fromisoformat(data.decode('ascii'))
+        if code == self.PICKLE:
+            return pickle.loads(data)
+        values = self.decode(data)
+        if code == self.RECORD:
+            return dict(zip(self.shapes[values[0]], values[1:]))
+        if code == self.TUPLE:
+            return tuple(values)
+        if code == self.SET:
+            return set(values)
+        if code == self.FROZENSET:
+            return frozenset(values)
+        raise ValueError(f'Unknown extension type {code}.')
+
+
+class MetadataArena:
+    """
+    A column of metadata values (dicts of arbitrary, mostly JSON-like data), stored as compact `KeyTable`-encoded bytes
+    in a single arena rather than as live Python objects. Values are only decoded when a row is read, which is rare:
+    only the handful of events that a query returns are.
+
+    Rows loaded from a snapshot are read straight from the memory-mapped file. Rows appended afterwards are held in
+    memory, unless the arena has a memory budget: once they outgrow it, they're moved (oldest first, as they're the
+    least likely to be read) to a temporary spill file, and read back from it on demand.
+
+    Each run of rows is encoded against its own key table, so the rows of another arena (e.g. one built in a worker
+    process) can be appended as-is, without re-encoding them.
+    """
+
+    def __init__(self, memory_budget: Optional[int] = None, spill_dir: Optional[str] = None) -> None:
+        """
+        Args:
+            memory_budget (Optional[int]): The number of bytes of appended rows to hold in memory before spilling them
+                to disk. Defaults to no limit.
+            spill_dir (Optional[str]): The directory to create the spill file in. Defaults to the system's temporary
+                directory.
+        """
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self._frozen = PackedBytes()
+        # Appended rows, as [offset, offset + length) ranges of a byte stream whose first `_spilled` bytes are in the
+        # spill file, and the rest in `_buffer`.
+        self._buffer = bytearray()
+        self._offsets = array('q', [0])
+        self._nulls = bytearray()
+        self._spilled = 0
+        self._spill_file: Optional[IO[bytes]] = None
+        # The key table of each run of rows, and the row each run starts at.
+        self._tables: List[KeyTable] = []
+        self._starts: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._frozen) + len(self._nulls)
+
+    def __getitem__(self, index: int) -> Any:
+        data = self.get_bytes(index)
+        if data is None:
+            return None
+        return self._tables[bisect_right(self._starts, index) - 1].decode(data)
+
+    def __iter__(self) -> Iterator[Any]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # The spill file belongs to this process, so a pickled arena (e.g. one returned by a worker) carries its rows.
+        rows = [self.get_bytes(index) for index in range(len(self))]
+        return {'memory_budget': self.memory_budget, 'spill_dir': self.spill_dir, 'rows': rows,
+                'tables': [table.shapes for table in self._tables], 'starts': self._starts}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state['memory_budget'], state['spill_dir'])
+        self._tables = [KeyTable(shapes) for shapes in state['tables']]
+        self._starts = list(state['starts'])
+        for data in state['rows']:
+            self._append_bytes(data)
+
+    def get_bytes(self, index: int) -> Optional[bytes]:
+        if index < len(self._frozen):
+            return self._frozen.get_bytes(index)
+        index -= len(self._frozen)
+        if self._nulls[index]:
+            return None
+        start, stop = self._offsets[index], self._offsets[index + 1]
+        if start >= self._spilled:
+            return bytes(self._buffer[start - self._spilled:stop - self._spilled])
+        return os.pread(self._spill_file.fileno(), stop - start, start)
+
+    def append(self, value: Any) -> None:
+        if value is None:
+            self._append_bytes(None)
+            return
+        if not self._tables:
+            self._tables.append(KeyTable())
+            self._starts.append(len(self))
+        self._append_bytes(self._tables[-1].encode(value))
+
+    def extend(self, values: Iterable[Any]) -> None:
+        if isinstance(values, MetadataArena):
+            self._extend_arena(values)
+            return
+        for value in values:
+            self.append(value)
+
+    def _extend_arena(self, other: 'MetadataArena') -> None:
+        base = len(self)
+        for table, start in zip(other._tables, other._starts):
+            self._tables.append(KeyTable(table.shapes))
+            self._starts.append(base + start)
+        for index in range(len(other)):
+            self._append_bytes(other.get_bytes(index))
+
+    def _append_bytes(self, data: Optional[bytes]) -> None:
+        if data is not None:
+            self._buffer += data
+        self._offsets.append(self._offsets[-1] + (len(data) if data is not None else 0))
+        self._nulls.append(data is None)
+        if self.memory_budget is not None and len(self._buffer) > self.memory_budget:
+            self._spill()
+
+    def _spill(self) -> None:
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(dir=self.spill_dir)
+        self._spill_file.seek(self._spilled)
+        self._spill_file.write(self._buffer)
+        self._spill_file.flush()
+        self._spilled += len(self._buffer)
+        self._buffer = bytearray()
+
+    def _chunks(self, chunk_size: int = 16 * 1024 * 1024) -> Iterator[Any]:
+        yield self._frozen._data
+        for offset in range(0, self._spilled, chunk_size):
+            yield os.pread(self._spill_file.fileno(), min(chunk_size, self._spilled - offset), offset)
+        yield self._buffer
+
+    def save(self, writer: SnapshotWriter, name: str) -> None:
+        # The arena is written in the same layout as a `PackedBytes` column, streaming spilled rows from disk.
+        base = len(self._frozen._data)
+        offsets = np.concatenate([np.asarray(self._frozen._offsets, dtype=np.int64),
+                                  np.asarray(self._offsets[1:], dtype=np.int64) + base])
+        writer.add_chunks(name + '.data', self._chunks())
+        writer.add_array(name + '.offsets', offsets)
+        writer.add_array(name + '.nulls', np.frombuffer(bytes(self._frozen._nulls) + bytes(self._nulls), np.uint8))
+        writer.add_object(name + '.tables', ([table.shapes for table in self._tables], self._starts))
+
+    @classmethod
+    def load(cls, reader: SnapshotReader, name: str, memory_budget: Optional[int] = None,
+             spill_dir: Optional[str] = None) -> 'MetadataArena':
+        arena = cls(memory_budget, spill_dir)
+        arena._frozen = PackedBytes.load(reader, name)
+        shapes, arena._starts = reader.object(name + '.tables')
+        arena._tables = [KeyTable(table) for table in shapes]
+        return arena
+
+
+class StringTable:
+    """
+    Dictionary-encodes a low-cardinality string column (e.g. company, source, key) as small integer codes.
+    """
+
+    def __init__(self) -> None:
+        self.strings: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.strings)
+            self.strings.append(value)
+            self.codes[value] = code
+        return code
+
+    def decode(self, code: int) -> str:
+        return self.strings[code]
+
+    @classmethod
+    def from_strings(cls, strings: List[str]) -> 'StringTable':
+        table = cls()
+        for value in strings:
+            table.encode(value)
+        return table
+
+
+class EventStore:
+    """
+    A columnar store of events. Rather than holding one Python object per event, each attribute is kept in its own
+    column: timestamps and coordinates in NumPy arrays, company/source/key as dictionary codes, titles and string
+    content in packed buffers. `Event` objects are only materialized (as lightweight views) for rows that are read.
+    """
+
+    def __init__(self, metadata_budget: Optional[int] = None) -> None:
+        """
+        Args:
+            metadata_budget (Optional[int]): The number of bytes of (encoded) metadata to hold in memory, beyond which
+                it's spilled to disk. Defaults to no limit.
+        """
+        self.companies = StringTable()
+        self.sources = StringTable()
+        self.keys = StringTable()
+
+        self.timestamps = GrowableArray(np.float64)
+        self.company_codes = GrowableArray(np.uint16)
+        self.source_codes = GrowableArray(np.uint16)
+        self.key_codes = GrowableArray(np.uint16)
+        self.latitudes = GrowableArray(np.float64)
+        self.longitudes = GrowableArray(np.float64)
+
+        # The source file each event was parsed from (relative to its company's root, e.g. "Google/Mail/All mail.mbox"),
+        # and whether the event is still live. Re-indexing a changed file retracts its old events rather than deleting
+        # them, so that row ids (which every secondary index refers to) stay stable.
+        self.origins = StringTable()
+        self.origin_codes = GrowableArray(np.uint32)
+        self.live = GrowableArray(np.bool_)
+        self.retracted = 0
+        self.resumed: Set[str] = set()
+        self._origin_code = self.origins.encode('')
+
+        self.titles = PackedStrings()
+        self.contents = PackedStrings()
+
+        # Metadata shared by many events (e.g. a Messenger thread's title and participants) is stored once, in
+        # `threads`, and rows refer to it by id (or -1). It's merged into the row's metadata when the row is read.
+        self.threads = MetadataArena(metadata_budget)
+        self.thread_ids = GrowableArray(np.int32)
+
+        # Content that isn't a plain string (e.g. parsed email parts) is rare, so it's kept in a sparse side table.
+        self.content_objects = SparseObjects()
+        # Searchable text that isn't stored with its row (e.g. the text of an email body, which is read from its mbox
+        # when it's shown), by row id. It's only held until the text index has read it, and isn't saved.
+        self.unstored_text: Dict[int, str] = {}
+        self.metadata = MetadataArena(metadata_budget)
+        self.names = ObjectColumn()
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, index: int) -> Event:
+        return self.get(index)
+
+    def __iter__(self) -> Iterator[Event]:
+        for index in range(len(self)):
+            yield self.get(index)
+
+    def append(self, event: Event, thread_id: int = -1, text: Optional[str] = None) -> int:
+        """
+        Decomposes an event into the store's columns and returns its row id.
+
+        Args:
+            event (Event): The event to append.
+            thread_id (int): The id (from `add_thread`) of shared metadata that the event's metadata is merged with.
+            text (Optional[str]): Searchable text of the event that isn't stored (see `unstored_text`).
+        """
+        index = len(self)
+        self.timestamps.append(event.timestamp)
+        self.company_codes.append(self.companies.encode(event.company))
+        self.source_codes.append(self.sources.encode(event.source))
+        self.key_codes.append(self.keys.encode(event.key))
+        self.origin_codes.append(self._origin_code)
+        self.live.append(True)
+        self.thread_ids.append(thread_id)
+
+        location = event.location or {}
+        self.latitudes.append(location.get('latitude', np.nan))
+        self.longitudes.append(location.get('longitude', np.nan))
+
+        self.titles.append(event.title)
+        if event.content is None or isinstance(event.content, str):
+            self.contents.append(event.content)
+        else:
+            self.contents.append(None)
+            self.content_objects[index] = event.content
+        if text is not None:
+            self.unstored_text[index] = text
+
+        self.metadata.append(event.metadata)
+        self.names.append(event.names)
+        return index
+
+    def extend(self, events: Iterable[Event]) -> None:
+        for event in events:
+            self.append(event)
+
+    def add_thread(self, details: Dict[str, Any]) -> int:
+        """
+        Stores metadata shared by a group of events (under the key "thread_details") and returns its id.
+        """
+        self.threads.append(details)
+        return len(self.threads) - 1
+
+    def set_origin(self, origin: str, resumed: bool = False) -> None:
+        """
+        Sets the source file that subsequently appended events are attributed to.
+
+        Args:
+            origin (str): The file's path, prefixed with its company.
+            resumed (bool): Whether the file is being parsed from where a previous parse left off (because data was
+                only appended to it), so that the events from that parse remain valid.
+        """
+        self._origin_code = self.origins.encode(origin)
+        if resumed:
+            self.resumed.add(origin)
+
+    def replaced_origins(self) -> List[str]:
+        """
+        Returns every origin that was (fully) parsed into this store, including files that produced no events. Events
+        from earlier parses of these files are superseded.
+        """
+        return [origin for origin in self.origins.strings if origin and origin not in self.resumed]
+
+    def retract(self, origins: Iterable[str]) -> int:
+        """
+        Marks every live event parsed from one of the given origins as retracted, and returns how many there were.
+        """
+        codes = [self.origins.codes[origin] for origin in origins if origin in self.origins.codes]
+        if not codes or not len(self):
+            return 0
+        live = self.live.writable_values()
+        mask = live & np.isin(self.origin_codes.values, codes)
+        live[mask] = False
+        self.retracted += int(mask.sum())
+        return int(mask.sum())
+
+    def merge(self, other: 'EventStore') -> None:
+        """
+        Appends every row of another store (e.g. one built in a worker process), re-mapping its dictionary codes.
+        """
+        base = len(self)
+        for table, codes, other_table, other_codes in [
+            (self.companies, self.company_codes, other.companies, other.company_codes),
+            (self.sources, self.source_codes, other.sources, other.source_codes),
+            (self.keys, self.key_codes, other.keys, other.key_codes),
+            (self.origins, self.origin_codes, other.origins, other.origin_codes),
+        ]:
+            mapping = np.array([table.encode(value) for value in other_table.strings], dtype=codes.values.dtype)
+            codes.extend(mapping[other_codes.values] if len(mapping) else [])
+
+        self.timestamps.extend(other.timestamps.values)
+        self.latitudes.extend(other.latitudes.values)
+        self.longitudes.extend(other.longitudes.values)
+        self.live.extend(other.live.values)
+        thread_ids = other.thread_ids.values
+        self.thread_ids.extend(np.where(thread_ids >= 0, thread_ids + len(self.threads), -1))
+        self.threads.extend(other.threads)
+        self.retracted += other.retracted
+        self.titles.extend(other.titles)
+        self.contents.extend(other.contents)
+        for index, content in other.content_objects.items():
+            self.content_objects[base + index] = content
+        self.unstored_text.update((base + index, text) for index, text in other.unstored_text.items())
+        self.metadata.extend(other.metadata)
+        self.names.extend(other.names)
+
+    def get(self, index: int) -> Event:
+        """
+        Materializes a lightweight `Event` view over a single row.
+        """
+        if index < 0:
+            index += len(self)
+        content = self.content_objects.get(index)
+        if content is None:
+            content = self.contents[index]
+
+        location = None
+        latitude, longitude = self.latitudes[index], self.longitudes[index]
+        if not (np.isnan(latitude) and np.isnan(longitude)):
+            location = {'latitude': float(latitude), 'longitude': float(longitude)}
+
+        return Event(
+            company=self.companies.decode(self.company_codes[index]),
+            source=self.sources.decode(self.source_codes[index]),
+            key=self.keys.decode(self.key_codes[index]),
+            timestamp=float(self.timestamps[index]),
+            title=self.titles[index],
+            content=content,
+            metadata=LazyValue(partial(self._metadata, index)),
+            names=self.names[index],
+            location=location
+        )
+
+    def _metadata(self, index: int) -> Any:
+        metadata = self.metadata[index]
+        thread_id = int(self.thread_ids[index])
+        if thread_id < 0:
+            return metadata
+        return {'thread_details': self.threads[thread_id], **(metadata or {})}
+
+    def text(self, index: int) -> str:
+        """
+        Returns the searchable text of a row: its title followed by every string found in its content.
+        """
+        content = self.content_objects.get(index)
+        if content is None:
+            content = self.contents[index]
+        return ' '.join(flatten_strings([self.titles[index], content]))
+
+    # The NumPy columns that make up the store, which are saved to (and memory-mapped from) snapshots as-is.
+    ARRAYS = ['timestamps', 'company_codes', 'source_codes', 'key_codes', 'latitudes', 'longitudes', 'origin_codes',
+              'live', 'thread_ids']
+
+    def save(self, writer: SnapshotWriter, name: str = 'events') -> None:
+        writer.add_object(name + '.tables', {
+            'companies': self.companies.strings,
+            'sources': self.sources.strings,
+            'keys': self.keys.strings,
+            'origins': self.origins.strings,
+        })
+        for column in self.ARRAYS:
+            writer.add_array(f'{name}.{column}', getattr(self, column).values)
+        self.titles.save(writer, name + '.titles')
+        self.contents.save(writer, name + '.contents')
+        self.content_objects.save(writer, name + '.content_objects')
+        self.metadata.save(writer, name + '.metadata')
+        self.threads.save(writer, name + '.threads')
+        self.names.save(writer, name + '.names')
+
+    @classmethod
+    def load(cls, reader: SnapshotReader, name: str = 'events', metadata_budget: Optional[int] = None) -> 'EventStore':
+        store = cls(metadata_budget)
+        tables = reader.object(name + '.tables')
+        store.companies = StringTable.from_strings(tables['companies'])
+        store.sources = StringTable.from_strings(tables['sources'])
+        store.keys = StringTable.from_strings(tables['keys'])
+        store.origins = StringTable.from_strings(tables['origins'])
+        store._origin_code = store.origins.encode('')
+        for column in cls.ARRAYS:
+            setattr(store, column, GrowableArray.from_array(reader.array(f'{name}.{column}')))
+        store.retracted = int(len(store) - np.count_nonzero(store.live.values))
+        store.titles = PackedStrings.load(reader, name + '.titles')
+        store.contents = PackedStrings.load(reader, name + '.contents')
+        store.content_objects = SparseObjects.load(reader, name + '.content_objects')
+        store.metadata = MetadataArena.load(reader, name + '.metadata', metadata_budget)
+        store.threads = MetadataArena.load(reader, name + '.threads', metadata_budget)
+        store.names = ObjectColumn.load(reader, name + '.names')
+        return store
+
+    def distinct_keys(self) -> List[str]:
+        codes = self.key_codes.values[self.live.values] if self.retracted else self.key_codes.values
+        return sorted(self.keys.decode(code) for code in np.unique(codes))
@@ -0,0 +1,197 @@
+"""
+Normalizes the timestamps that data sources use to epoch seconds in UTC.
+
+Sources represent time as epoch seconds or milliseconds (numbers or numeric strings), ISO-8601 strings, RFC 2822
+strings (e.g. email `Date` headers) or `datetime`s. Each format has a fast-path parser, and `dateutil` is only used for
+strings that none of them understand. A `TimestampParser` remembers which format last succeeded, so that a source whose
+timestamps all share a format tries the right parser first, and its `parse_many` converts a whole column at once. Each
+source has a parser of its own (see `BaseIndex.timestamps`), so that sources with different formats don't keep
+unlearning each other's.
+
+Naive datetimes (and strings without a UTC offset) are taken to be in UTC.
+"""
+
+import re
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_tz
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from dateutil.parser import parse as parse_fuzzy
+
+# Numbers beyond this are epoch milliseconds rather than seconds (1e11 seconds is in the year 5138, while 1e11
+# milliseconds is in 1973).
+EPOCH_MS_THRESHOLD = 1e11
+
+# Date and time (and optionally a zone) as in "Mon, 4 Mar 2019 10:00:00 -0700 (MST)". Anything after the zone, such as
+# a comment, is ignored.
+RFC_2822 = re.compile(r'\s*(?:[A-Za-z]{3},?\s*)?(\d{1,2})\s+([A-Za-z]{3})[a-z]*\.?\s+(\d{2,4})\s+(\d{1,2}):(\d{2})'
+                      r'(?::(\d{2}))?\s*([+-]\d{4}|[A-Za-z]+)?')
+MONTHS = {month: number for number, month in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], start=1)}
+# The UTC offsets (in minutes) of the zone names that RFC 2822 allows.
+ZONES = {'ut': 0, 'utc': 0, 'gmt': 0, 'z': 0, 'est': -300, 'edt': -240, 'cst': -360, 'cdt': -300, 'mst': -420,
+         'mdt': -360, 'pst': -480, 'pdt': -420}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+@lru_cache(maxsize=None)
+def zone(minutes: int) -> timezone:
+    """
+    Returns the (shared) fixed-offset time zone `minutes` ahead of UTC.
+    """
+    return timezone.utc if not minutes else timezone(timedelta(minutes=minutes))
+
+
+def datetime_to_epoch(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH).total_seconds()
+
+
+def parse_epoch(value: Any) -> Optional[float]:
+    """
+    Parses epoch seconds or milliseconds, given as a number or a numeric string.
+    """
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    elif isinstance(value, bool) or not isinstance(value, (int, float, np.number)):
+        return None
+    value = float(value)
+    return value / 1000 if abs(value) >= EPOCH_MS_THRESHOLD else value
+
+
+def parse_rfc2822(value: str) -> Optional[datetime]:
+    """
+    Parses an RFC 2822 date (as found in email headers), with a regular expression in the common case and with
+    `email.utils` for the rest (e.g. obsolete forms).
+    """
+    match = RFC_2822.match(value)
+    if match is not None:
+        day, month, year, hour, minute, second, offset = match.groups()
+        month = MONTHS.get(month.lower())
+        if offset is None:
+            minutes = None
+        elif offset[0] in '+-':
+            minutes = (int(offset[1:3]) * 60 + int(offset[3:5])) * (-1 if offset[0] == '-' else 1)
+        else:
+            minutes = ZONES.get(offset.lower())
+        if month is not None and (offset is None or minutes is not None):
+            year = int(year)
+            if year < 100:
+                year += 2000 if year < 50 else 1900
+            try:
+                return datetime(year, month, int(day), int(hour), int(minute), int(second or 0),
+                                tzinfo=None if minutes is None else zone(minutes))
+            except ValueError:
+                pass
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    try:
+        return datetime(*parsed[:6], tzinfo=None if parsed[9] is None else zone(parsed[9] // 60))
+    except ValueError:
+        return None
+
+
+def parse_iso8601(value: str) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+
+
+class TimestampParser:
+    """
+    Normalizes timestamps to epoch seconds (UTC), trying first the format that last succeeded.
+
+    Parsers are cheap, so each source (e.g. an mbox file, or one of a data export's JSON files) should use its own, so
+    that it learns that source's format.
+    """
+
+    # Each string format's parser returns a datetime, or None if the string isn't in that format.
+    FORMATS: Dict[str, Callable[[str], Optional[datetime]]] = {
+        'rfc2822': parse_rfc2822,
+        'iso8601': parse_iso8601,
+    }
+
+    def __init__(self, formats: Optional[List[str]] = None, fuzzy: bool = True) -> None:
+        """
+        Args:
+            formats (Optional[List[str]]): The string formats to try (from `FORMATS`), in order. Defaults to all of
+                them. Numeric strings are always taken to be epoch seconds or milliseconds.
+            fuzzy (bool): Whether to fall back to `dateutil` for strings in none of the formats, rather than failing.
+        """
+        self.formats = list(formats or self.FORMATS)
+        self.fuzzy = fuzzy
+        self.format: Optional[str] = None
+
+    def parse(self, value: Any) -> float:
+        """
+        Returns a timestamp in epoch seconds (NaN for None). Raises a `ValueError` if it can't be parsed.
+        """
+        if value is None:
+            return float('nan')
+        if isinstance(value, datetime):
+            return datetime_to_epoch(value)
+        seconds = parse_epoch(value)
+        if seconds is not None:
+            return seconds
+        if isinstance(value, str):
+            return datetime_to_epoch(self.parse_datetime(value))
+        raise ValueError(f'Unsupported timestamp: {value!r}')
+
+    def parse_datetime(self, value: str) -> datetime:
+        """
+        Parses a date string into a datetime, which keeps the string's UTC offset (if any). Raises a `ValueError` if
+        it can't be parsed.
+        """
+        if self.format is not None:
+            parsed = self.FORMATS[self.format](value)
+            if parsed is not None:
+                return parsed
+        for name in self.formats:
+            if name != self.format:
+                parsed = self.FORMATS[name](value)
+                if parsed is not None:
+                    self.format = name
+                    return parsed
+        if self.fuzzy:
+            try:
+                return parse_fuzzy(value)
+            except (OverflowError, ValueError) as error:
+                raise ValueError(f'Unsupported timestamp: {value!r}') from error
+        raise ValueError(f'Unsupported timestamp: {value!r}')
+
+    def parse_many(self, values: Iterable[Any]) -> np.ndarray:
+        """
+        Converts a column of timestamps to epoch seconds. Numeric arrays are converted in one vectorized step, and each
+        distinct string is only parsed once.
+        """
+        if isinstance(values, np.ndarray) and values.dtype.kind in 'iuf':
+            seconds = values.astype(np.float64)
+            return np.where(np.abs(seconds) >= EPOCH_MS_THRESHOLD, seconds / 1000, seconds)
+        parsed: Dict[Tuple[type, Any], float] = {}
+        result = []
+        for value in values:
+            key = (type(value), value)
+            seconds = parsed.get(key)
+            if seconds is None:
+                seconds = parsed[key] = self.parse(value)
+            result.append(seconds)
+        return np.array(result, dtype=np.float64)
+
+
+def normalize_timestamp(value: Any) -> float:
+    """
+    Returns a timestamp in any supported format as epoch seconds (UTC). Strings are parsed without any knowledge of
+    their source's format, so sources parse theirs with their own `TimestampParser` instead.
+    """
+    if type(value) is float or type(value) is int:
+        return float(value) if abs(value) < EPOCH_MS_THRESHOLD else value / 1000
+    return TimestampParser().parse(value)
@@ -0,0 +1,266 @@
+"""
+Argument parsing for the search engine's sort-filter-limit-aggregate query language. All arguments are optional:
+
+    since (str | float): Only return events at or after this time (epoch seconds or an ISO-8601 string).
+    until (str | float): Only return events strictly before this time.
+    company, source, key (str | List[str]): Only return events matching one of these values.
+    order (str): 'desc' (most recent first, the default) or 'asc'.
+    limit (int): The maximum number of events to return.
+    q (str): Full-text search over event titles and content. Results are ranked by BM25 relevance instead of time, and
+        passing a limit lets the ranking terminate early.
+    near (str | List[float]): Only return events located within a radius of a point, given as
+        (latitude, longitude, radius in km), either as a list or as a comma-separated string.
+    bbox (str | List[float]): Only return events located inside a bounding box, given as (south, west, north, east) in
+        degrees, either as a list or as a comma-separated string. A box with west > east crosses the antimeridian.
+    group_by (str | List[str]): Return one row per group of matching events instead of the events, grouped by any of
+        'company', 'source', 'key', 'name' (each person an event mentions) and the time buckets 'hour', 'day', 'week'
+        and 'month' (in UTC, weeks starting on Mondays). Groups are sorted by their values in the given order, and
+        the limit applies to groups.
+    aggregate (str | List[str]): The aggregates each group reports, out of 'count' (the default), 'min' and 'max'
+        (its first and last timestamp).
+    person, people_all (str | List[str]): Only return events that name all of these people.
+    people_any (str | List[str]): Only return events that name at least one of these people.
+    top_people (int): Return the (at most) this many people who are named by the most matching events, with their
+        event counts, instead of the events. The people being filtered by are left out.
+    fields (str | List[str]): Only return these fields of each event (see `FIELDS`). Fields that aren't returned (e.g.
+        email bodies) aren't read.
+    cursor (str): Return the page of events after the one that this cursor was returned with. The other arguments
+        (other than the limit and fields) must be the same as that page's.
+"""
+
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from examples.search.index.spatial import within
+from examples.search.models.store import EventStore, StringTable
+from examples.search.models.timestamps import datetime_to_epoch, parse_iso8601
+from examples.search.results import Cursor
+
+ORDERS = ('asc', 'desc')
+
+# Maps each filterable attribute to its (string table, code column) attributes on the EventStore.
+FILTERS = {
+    'company': ('companies', 'company_codes'),
+    'source': ('sources', 'source_codes'),
+    'key': ('keys', 'key_codes'),
+}
+BUCKETS = ('hour', 'day', 'week', 'month')
+DIMENSIONS = tuple(FILTERS) + ('name',) + BUCKETS
+AGGREGATES = ('count', 'min', 'max')
+FIELDS = ('company', 'source', 'key', 'title', 'timestamp', 'content', 'metadata', 'names', 'locations')
+
+
+def parse_time(name: str, value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, datetime):
+        return datetime_to_epoch(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        parsed = parse_iso8601(value)
+        if parsed is not None:
+            return datetime_to_epoch(parsed)
+    raise ValueError(f'Invalid value for argument "{name}": {value!r} (expected epoch seconds or ISO-8601).')
+
+
+def parse_list(name: str, value: Any) -> Optional[List[str]]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, (list, tuple, set)) and all(isinstance(v, str) for v in value):
+        return list(value)
+    raise ValueError(f'Invalid value for argument "{name}": {value!r} (expected a string or list of strings).')
+
+
+def parse_choices(name: str, value: Any, choices: Tuple[str, ...]) -> Optional[List[str]]:
+    values = parse_list(name, value)
+    if values is not None and (not values or any(v not in choices for v in values) or len(set(values)) < len(values)):
+        raise ValueError(f'Invalid value for argument "{name}": {value!r} (expected distinct values out of '
+                         f'{", ".join(choices)}).')
+    return values
+
+
+def parse_numbers(name: str, value: Any, expected: str) -> Optional[List[float]]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    try:
+        numbers = [float(number) for number in value]
+    except (TypeError, ValueError):
+        numbers = []
+    if len(numbers) != len(expected.split(', ')) or not all(np.isfinite(numbers)):
+        raise ValueError(f'Invalid value for argument "{name}": {value!r} (expected {expected}).')
+    return numbers
+
+
+def parse_near(value: Any) -> Optional[Tuple[float, float, float]]:
+    numbers = parse_numbers('near', value, 'latitude, longitude, radius in km')
+    if numbers is None:
+        return None
+    latitude, longitude, radius = numbers
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180 or radius < 0:
+        raise ValueError(f'Invalid value for argument "near": {value!r} (out of range).')
+    return latitude, longitude, radius
+
+
+def parse_bbox(value: Any) -> Optional[Tuple[float, float, float, float]]:
+    numbers = parse_numbers('bbox', value, 'south, west, north, east')
+    if numbers is None:
+        return None
+    south, west, north, east = numbers
+    if not -90 <= south <= north <= 90 or not -180 <= west <= 180 or not -180 <= east <= 180:
+        raise ValueError(f'Invalid value for argument "bbox": {value!r} (out of range).')
+    return south, west, north, east
+
+
+class Query:
+    """
+    A validated set of query arguments.
+    """
+
+    ARGUMENTS = ('since', 'until', 'order', 'limit', 'q', 'near', 'bbox', 'group_by', 'aggregate', 'person',
+                 'people_all', 'people_any', 'top_people', 'fields', 'cursor') + tuple(FILTERS)
+
+    def __init__(self, args: Dict[str, Any]) -> None:
+        if not isinstance(args, dict):
+            raise ValueError(f'Query arguments must be a mapping of names to values, got {type(args).__name__}.')
+        for name in args:
+            if not isinstance(name, str):
+                raise ValueError(f'Query argument names must be strings, got {name!r}.')
+        unknown = set(args) - set(self.ARGUMENTS)
+        if unknown:
+            raise ValueError(f'Unknown query arguments: {", ".join(sorted(unknown))}.')
+
+        self.since = parse_time('since', args.get('since'))
+        self.until = parse_time('until', args.get('until'))
+
+        self.order = args.get('order', 'desc')
+        if self.order not in ORDERS:
+            raise ValueError(f'Invalid value for argument "order": {self.order!r} (expected "asc" or "desc").')
+
+        self.limit = args.get('limit')
+        if self.limit is not None:
+            try:
+                self.limit = int(self.limit)
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid value for argument "limit": {self.limit!r} (expected an integer).')
+            if self.limit < 0:
+                raise ValueError('Argument "limit" must be non-negative.')
+
+        self.text = args.get('q')
+        if self.text is not None and not isinstance(self.text, str):
+            raise ValueError(f'Invalid value for argument "q": {self.text!r} (expected a string).')
+
+        self.filters = {name: parse_list(name, args.get(name)) for name in FILTERS if args.get(name) is not None}
+
+        self.near = parse_near(args.get('near'))
+        self.bbox = parse_bbox(args.get('bbox'))
+
+        self.group_by = parse_choices('group_by', args.get('group_by'), DIMENSIONS)
+        self.aggregates = parse_choices('aggregate', args.get('aggregate', 'count'), AGGREGATES)
+
+        people_all = [parse_list(name, args.get(name)) or [] for name in ('person', 'people_all')]
+        self.people_all = people_all[0] + people_all[1] or None
+        self.people_any = parse_list('people_any', args.get('people_any'))
+
+        self.top_people = args.get('top_people')
+        if self.top_people is not None:
+            try:
+                self.top_people = int(self.top_people)
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid value for argument "top_people": {self.top_people!r} (expected an integer).')
+            if self.top_people < 0:
+                raise ValueError('Argument "top_people" must be non-negative.')
+            if self.group_by is not None:
+                raise ValueError('Arguments "top_people" and "group_by" can\'t be combined.')
+
+        self.fields = parse_choices('fields', args.get('fields'), FIELDS)
+
+        self.cursor = None
+        if args.get('cursor') is not None:
+            if self.group_by is not None or self.top_people is not None:
+                raise ValueError('Argument "cursor" only pages through events.')
+            if not isinstance(args['cursor'], str):
+                raise ValueError(f'Invalid value for argument "cursor": {args["cursor"]!r} (expected a string).')
+            try:
+                self.cursor = Cursor.decode(args['cursor'])
+            except ValueError:
+                raise ValueError(f'Invalid value for argument "cursor": {args["cursor"]!r} (expected a cursor returned '
+                                 f'with a previous page).')
+            if self.cursor.fingerprint != self.fingerprint:
+                raise ValueError('Argument "cursor" was returned by a different query.')
+
+    @property
+    def located(self) -> bool:
+        """
+        Whether the query only matches events inside an area.
+        """
+        return self.near is not None or self.bbox is not None
+
+    @property
+    def fingerprint(self) -> int:
+        """
+        A checksum of the arguments that determine which events match and in what order, which cursors record so that
+        they're only used with the query that returned them.
+        """
+        arguments = (self.since, self.until, self.order, self.text, sorted(self.filters.items()), self.near, self.bbox,
+                     self.people_all, self.people_any)
+        return zlib.crc32(repr(arguments).encode('utf-8'))
+
+    @property
+    def people(self) -> List[str]:
+        """
+        The people that the query filters events by.
+        """
+        return (self.people_all or []) + (self.people_any or [])
+
+    def predicate(self, store: EventStore, time_range: bool = False,
+                  location: bool = True) -> Optional[Callable[[np.ndarray], np.ndarray]]:
+        """
+        Compiles the equality filters and the area (and optionally the time range, for callers that don't scan the
+        timestamp index) into a vectorized row-id predicate over the store's columns.
+
+        Args:
+            store (EventStore): The store whose columns the predicate reads.
+            time_range (bool): Whether to check the time range.
+            location (bool): Whether to check the area, for callers that don't search the spatial index.
+        """
+        since = self.since if time_range else None
+        until = self.until if time_range else None
+        located = location and self.located
+        # Rows retracted by an incremental re-index stay in the store (and its indexes) until they're rebuilt.
+        retracted = store.retracted > 0
+        if not self.filters and since is None and until is None and not located and not retracted:
+            return None
+
+        columns = []
+        for name, values in self.filters.items():
+            table_name, column_name = FILTERS[name]
+            table: StringTable = getattr(store, table_name)
+            codes = np.array([table.codes[v] for v in values if v in table.codes], dtype=np.uint16)
+            columns.append((getattr(store, column_name), codes))
+
+        def predicate(ids: np.ndarray) -> np.ndarray:
+            mask = store.live.values[ids] if retracted else np.ones(len(ids), dtype=bool)
+            for column, codes in columns:
+                mask &= np.isin(column.values[ids], codes)
+            if since is not None:
+                mask &= store.timestamps.values[ids] >= since
+            if until is not None:
+                mask &= store.timestamps.values[ids] < until
+            if located:
+                mask &= within(store.latitudes.values[ids], store.longitudes.values[ids],
+                               bbox=self.bbox, near=self.near)
+            return mask
+
+        return predicate
@@ -0,0 +1,91 @@
+"""
+Streaming query results.
+
+A query's matching row ids are found up front (which takes 8 bytes per row), but rows are only read from the store,
+projected to the requested fields and serialized as they're consumed, so a large result never has to be held in memory
+at once and the first row can be sent before the last one has been read.
+
+Pages of results are linked by cursors: opaque strings that record the sort key (timestamp, or relevance score) and
+row id of the last row of a page. The next page resumes right after that row, so a cursor stays valid while events are
+added to or retracted from the index.
+"""
+
+import base64
+import json
+import struct
+from typing import Any, Callable, Dict, Iterator, NamedTuple, Optional, TextIO, Tuple
+
+from common.serialization import json_default
+
+# query fingerprint, sort key, row id, number of rows on previous pages
+CURSOR = struct.Struct('<Idqq')
+
+
+class Cursor(NamedTuple):
+    fingerprint: int
+    key: float
+    row: int
+    count: int
+
+    def encode(self) -> str:
+        return base64.urlsafe_b64encode(CURSOR.pack(*self)).rstrip(b'=').decode('ascii')
+
+    @classmethod
+    def decode(cls, value: str) -> 'Cursor':
+        """
+        Decodes a cursor returned by `encode`. Raises a `ValueError` if it's malformed.
+        """
+        try:
+            data = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+            return cls(*CURSOR.unpack(data))
+        except (ValueError, struct.error, TypeError) as error:
+            # Invalid base64 (`binascii.Error`) and non-ASCII strings raise `ValueError`s.
+            raise ValueError(f'Invalid cursor: {value!r}') from error
+
+
+class Results:
+    """
+    An iterator over a query's result rows, which are produced one at a time. Once every row has been consumed,
+    `cursor` holds the cursor of the next page, or None if this page wasn't full (i.e. there are no more rows).
+    """
+
+    def __init__(self, rows: Iterator[Tuple[Dict[str, Any], Optional[Tuple[float, int]]]], limit: Optional[int] = None,
+                 cursor: Optional[Callable[[float, int, int], Cursor]] = None) -> None:
+        """
+        Args:
+            rows (Iterator): Yields each row, with its (sort key, row id) position if it can be paged past.
+            limit (Optional[int]): The page size. Without one, every row is returned and there's no next page.
+            cursor (Optional[Callable]): Makes the cursor after a row, given its sort key, row id, and the number of
+                rows returned so far.
+        """
+        self._rows = rows
+        self.limit = limit
+        self._cursor = cursor
+        self.count = 0
+        self.cursor: Optional[str] = None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        position = None
+        for row, position in self._rows:
+            self.count += 1
+            yield row
+        if self.limit is not None and self.count == self.limit and position is not None and self._cursor is not None:
+            self.cursor = self._cursor(position[0], position[1], self.count).encode()
+
+    def lines(self) -> Iterator[str]:
+        """
+        Serializes the rows as newline-delimited JSON, one line per row, followed by a `{"cursor": ...}` line if
+        there's a next page.
+        """
+        for row in self:
+            yield json.dumps(row, default=json_default) + '\n'
+        if self.cursor is not None:
+            yield json.dumps({'cursor': self.cursor}) + '\n'
+
+    def write_ndjson(self, file: TextIO) -> int:
+        """
+        Writes the rows to a text stream as newline-delimited JSON (see `lines`), and returns the number of rows.
+        """
+        for line in self.lines():
+            file.write(line)
+        return self.count
@@ -0,0 +1,282 @@
+"""
+An asyncio HTTP server for a preprocessed Lens application's endpoints (e.g. the search engine's `/query`).
+
+The event loop only parses requests and writes responses. Endpoints run in a pool of workers, each of which loads the
+application once (from a memory-mapped snapshot, so processes share one copy of the index through the page cache) and
+serializes its results as newline-delimited JSON, so the loop never blocks on a query.
+
+Requests go through admission control before they reach the pool. Each request is assigned a lane (e.g. heavy
+aggregates vs. everything else), and each lane runs a bounded number of requests at once with a bounded backlog
+waiting behind them. Requests beyond the backlog are turned away (503) rather than queued. A heavy lane whose
+concurrency is below the pool size therefore always leaves workers free for the other lane. Requests that don't finish
+within the timeout get a 504. Their worker finishes its job (a worker can't be interrupted), but the job holds its
+lane's slot until then, so a backlog of abandoned jobs sheds new load instead of piling up.
+
+    GET /query?source=Email&limit=10        (repeated parameters become lists)
+    POST /query  {"source": "Email", "limit": 10}
+
+A response is built in full by its worker before it's sent, so the "limit" argument of every request is capped (and
+set, if it's missing) to keep responses bounded. Larger results are read page by page, with the cursor that ends each
+page.
+"""
+
+import asyncio
+import json
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from common.serialization import json_default
+
+# The largest request body (e.g. JSON arguments) that's accepted, in bytes.
+MAX_BODY = 1024 * 1024
+# How long a client may take to send its request headers and body, in seconds.
+READ_TIMEOUT = 30
+# The default cap on the "limit" argument, i.e. the most rows in a response.
+MAX_LIMIT = 1000
+
+STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 408: 'Request Timeout',
+          413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+# The application in this (worker) process, loaded by `initialize`.
+_application: Any = None
+
+
+def initialize(load: Callable[[], Any]) -> None:
+    """
+    Loads the application into the current worker (a pool initializer).
+    """
+    global _application
+    _application = load()
+
+
+def call(endpoint: str, args: Dict[str, Any]) -> Tuple[int, bytes]:
+    """
+    Runs an endpoint in a worker, and returns the response status and NDJSON body. Results that serialize themselves
+    (with a `lines` method, e.g. to add a pagination cursor) do so; otherwise there's a line per row.
+
+    A `ValueError` from the endpoint itself (i.e. invalid arguments) is a 400. Errors while its rows are produced are
+    the server's fault, and are raised (to become a 500).
+    """
+    try:
+        rows = getattr(_application, endpoint)(args)
+    except ValueError as error:
+        return 400, error_body(str(error))
+    if hasattr(rows, 'lines'):
+        lines = rows.lines()
+    else:
+        lines = (json.dumps(row, default=json_default) + '\n' for row in rows)
+    return 200, ''.join(lines).encode('utf-8')
+
+
+def error_body(message: str) -> bytes:
+    return json.dumps({'error': message}).encode('utf-8') + b'\n'
+
+
+class RequestError(Exception):
+    """
+    A request that can't be served, with the HTTP status to respond with.
+    """
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class Lane:
+    """
+    Admission control for one class of requests: at most `concurrency` of them run at once, and at most `backlog` wait
+    for a slot.
+    """
+
+    def __init__(self, concurrency: int, backlog: int) -> None:
+        self.slots = asyncio.Semaphore(concurrency)
+        self.backlog = backlog
+        self.waiting = 0
+
+    def full(self) -> bool:
+        return self.slots.locked() and self.waiting >= self.backlog
+
+
+class QueryServer:
+    """
+    Serves an application's endpoints over HTTP (see the module docstring).
+    """
+
+    def __init__(self, load: Callable[[], Any], endpoints: Dict[str, str], workers: Optional[int] = None,
+                 processes: bool = True, heavy: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                 heavy_concurrency: Optional[int] = None, backlog: int = 64, timeout: float = 30.0,
+                 max_limit: int = MAX_LIMIT) -> None:
+        """
+        Args:
+            load (Callable[[], Any]): Loads the application (e.g. from a snapshot). It's called once per worker
+                process, so it must be picklable (e.g. a `functools.partial` of a classmethod) if `processes` is set.
+            endpoints (Dict[str, str]): Maps each URL path (e.g. "/query") to the application method that serves it,
+                which takes a dict of arguments and returns an iterable of JSON-serializable rows. It should raise a
+                `ValueError` for invalid arguments before it returns.
+            workers (Optional[int]): The size of the worker pool. Defaults to the number of CPUs.
+            processes (bool): Whether the workers are processes (which run queries in parallel) rather than threads
+                (which share a single copy of the application, but contend for the GIL).
+            heavy (Optional[Callable]): Returns whether a request (given its endpoint arguments) is heavy, e.g. an
+                aggregate over every event. Defaults to treating every request as light.
+            heavy_concurrency (Optional[int]): The most heavy requests that run at once. Defaults to half the workers.
+            backlog (int): The most requests (per lane) that wait for a worker before new ones are turned away.
+            timeout (float): The seconds a request may take (including waiting for a worker) before it gets a 504.
+            max_limit (int): The cap on every request's "limit" argument, which is also its default. Defaults to 1000.
+        """
+        self.load = load
+        self.endpoints = endpoints
+        self.workers = workers or os.cpu_count() or 1
+        self.processes = processes
+        self.heavy = heavy
+        self.heavy_concurrency = heavy_concurrency or max(1, self.workers // 2)
+        self.backlog = backlog
+        self.timeout = timeout
+        self.max_limit = max_limit
+        self.executor: Optional[Executor] = None
+        self.lanes: Dict[str, Lane] = {}
+
+    def start_executor(self) -> Executor:
+        if self.processes:
+            return ProcessPoolExecutor(self.workers, initializer=initialize, initargs=(self.load,))
+        # Threads share this process's application, so it's only loaded once.
+        initialize(self.load)
+        return ThreadPoolExecutor(self.workers)
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8000,
+                    ready: Optional[Callable[[List[Tuple[str, int]]], None]] = None) -> None:
+        """
+        Serves requests until cancelled.
+
+        Args:
+            ready (Optional[Callable]): Called with the server's bound (host, port) addresses once it's listening.
+        """
+        self.executor = self.start_executor()
+        self.lanes = {'light': Lane(self.workers, self.backlog), 'heavy': Lane(self.heavy_concurrency, self.backlog)}
+        server = await asyncio.start_server(self.handle, host, port)
+        if ready is not None:
+            ready([socket.getsockname()[:2] for socket in server.sockets])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                method, target, body = await asyncio.wait_for(self.read_request(reader), READ_TIMEOUT)
+            except asyncio.TimeoutError:
+                status, response = 408, error_body('Timed out reading the request.')
+            except RequestError as error:
+                status, response = error.status, error_body(str(error))
+            else:
+                status, response = await self.respond(method, target, body)
+            await self.write_response(writer, status, response)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+        """
+        Reads an HTTP/1.x request line, headers and (Content-Length delimited) body.
+        """
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) != 3:
+            raise RequestError(400, 'Malformed request line.')
+        method, target, _ = request_line
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            if line in ('\r\n', '\n', ''):
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise RequestError(400, 'Invalid Content-Length header.')
+        if length > MAX_BODY:
+            raise RequestError(413, f'The request body is too large (the limit is {MAX_BODY} bytes).')
+        body = await reader.readexactly(length) if length > 0 else b''
+        return method.upper(), target, body
+
+    async def respond(self, method: str, target: str, body: bytes) -> Tuple[int, bytes]:
+        url = urlsplit(target)
+        endpoint = self.endpoints.get(url.path)
+        if endpoint is None:
+            return 404, error_body(f'Unknown endpoint: {url.path}')
+        if method == 'GET':
+            args = {name: values[0] if len(values) == 1 else values
+                    for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        elif method == 'POST':
+            try:
+                args = json.loads(body or b'{}')
+            except ValueError:
+                return 400, error_body('The request body must be a JSON object.')
+            if not isinstance(args, dict):
+                return 400, error_body('The request body must be a JSON object.')
+        else:
+            return 405, error_body(f'Unsupported method: {method}')
+        try:
+            limit = int(args.get('limit', self.max_limit))
+        except (TypeError, ValueError):
+            return 400, error_body(f'Invalid value for argument "limit": {args.get("limit")!r} (expected an integer).')
+        args['limit'] = min(limit, self.max_limit)
+        return await self.submit(endpoint, args)
+
+    async def submit(self, endpoint: str, args: Dict[str, Any]) -> Tuple[int, bytes]:
+        """
+        Runs an endpoint in the worker pool, subject to its lane's admission control and the request timeout.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        lane = self.lanes['heavy' if self.heavy is not None and self.heavy(args) else 'light']
+        if lane.full():
+            return 503, error_body('The server is overloaded; try again later.')
+
+        lane.waiting += 1
+        try:
+            await asyncio.wait_for(lane.slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            return 504, error_body('Timed out waiting for a worker.')
+        finally:
+            lane.waiting -= 1
+
+        try:
+            job = self.executor.submit(call, endpoint, args)
+        except BaseException:
+            lane.slots.release()
+            raise
+        # The slot is held until the job finishes, even if the request times out first.
+        job.add_done_callback(lambda _: loop.call_soon_threadsafe(lane.slots.release))
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job)), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            job.cancel()
+            return 504, error_body(f'The request took longer than {self.timeout:g} seconds.')
+        except Exception as error:
+            return 500, error_body(f'{type(error).__name__}: {error}')
+
+    @staticmethod
+    async def write_response(writer: asyncio.StreamWriter, status: int, body: bytes) -> None:
+        head = [f'HTTP/1.1 {status} {STATUS[status]}', 'Content-Type: application/x-ndjson',
+                f'Content-Length: {len(body)}', 'Connection: close']
+        if status == 503:
+            head.append('Retry-After: 1')
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        writer.write(body)
+        await writer.drain()
+
+
+def run(server: QueryServer, host: str = '127.0.0.1', port: int = 8000,
+        ready: Optional[Callable[[List[Tuple[str, int]]], None]] = None) -> None:
+    """
+    Runs a server until it's interrupted (e.g. with Ctrl-C).
+    """
+    try:
+        asyncio.run(server.serve(host, port, ready))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,130 @@
+"""
+A versioned, memory-mappable on-disk format for an application's preprocessed state.
+
+A snapshot is a single file made of named sections: raw NumPy arrays, raw byte buffers, and (small) pickled objects.
+Sections are 64-byte aligned, and a JSON table of contents at the end of the file records each section's location.
+Reading a snapshot memory-maps the file, so arrays and buffers are zero-copy views that the OS pages in on demand and
+that separate processes serving the same snapshot share through the page cache.
+
+    +--------+-----------+-----------+-----+-------------------+
+    | header | section 1 | section 2 | ... | table of contents |
+    +--------+-----------+-----------+-----+-------------------+
+"""
+
+import json
+import mmap
+import os
+import pickle
+import struct
+from typing import Any, Dict, Iterable
+
+import numpy as np
+
+MAGIC = b'LENSSNAP'
+VERSION = 1
+
+# magic, format version, table of contents offset, table of contents length
+HEADER = struct.Struct('<8sIQQ')
+ALIGNMENT = 64
+
+
+class SnapshotWriter:
+    """
+    Writes a snapshot to a temporary file, which atomically replaces `path` when the writer is closed.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path + '.tmp', 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        self.toc: Dict[str, Dict[str, Any]] = {}
+
+    def __enter__(self) -> 'SnapshotWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.path + '.tmp')
+
+    def _write(self, name: str, chunks: Iterable[Any], **entry: Any) -> None:
+        if name in self.toc:
+            raise ValueError(f'The snapshot already has a section named "{name}".')
+        padding = -self.file.tell() % ALIGNMENT
+        self.file.write(b'\0' * padding)
+        offset = self.file.tell()
+        for data in chunks:
+            self.file.write(data)
+        self.toc[name] = dict(entry, offset=offset, length=self.file.tell() - offset)
+
+    def add_array(self, name: str, array: np.ndarray) -> None:
+        array = np.ascontiguousarray(array)
+        self._write(name, [memoryview(array).cast('B')], kind='array', dtype=array.dtype.str, shape=list(array.shape))
+
+    def add_bytes(self, name: str, data: Any) -> None:
+        self._write(name, [data], kind='bytes')
+
+    def add_chunks(self, name: str, chunks: Iterable[Any]) -> None:
+        """
+        Writes a byte section from a sequence of buffers, e.g. to stream one that isn't held in memory in one piece.
+        """
+        self._write(name, chunks, kind='bytes')
+
+    def add_object(self, name: str, value: Any) -> None:
+        self._write(name, [pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)], kind='object')
+
+    def close(self) -> None:
+        toc = json.dumps(self.toc).encode('utf-8')
+        offset = self.file.tell()
+        self.file.write(toc)
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, offset, len(toc)))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.path + '.tmp', self.path)
+
+
+class SnapshotReader:
+    """
+    Memory-maps a snapshot. Arrays and byte buffers returned by the reader are read-only views into the mapping.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.data) < HEADER.size:
+            raise ValueError(f'Not a Lens snapshot: {path}')
+        magic, version, offset, length = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError(f'Not a Lens snapshot: {path}')
+        if version != VERSION:
+            raise ValueError(f'Unsupported snapshot version {version} (expected {VERSION}): {path}')
+        self.toc: Dict[str, Dict[str, Any]] = json.loads(self.data[offset:offset + length])
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.toc
+
+    def _entry(self, name: str, kind: str) -> Dict[str, Any]:
+        entry = self.toc.get(name)
+        if entry is None or entry['kind'] != kind:
+            raise LookupError(f'The snapshot has no {kind} section named "{name}".')
+        return entry
+
+    def array(self, name: str) -> np.ndarray:
+        entry = self._entry(name, 'array')
+        dtype = np.dtype(entry['dtype'])
+        count = entry['length'] // dtype.itemsize
+        return np.frombuffer(self.data, dtype=dtype, count=count, offset=entry['offset']).reshape(entry['shape'])
+
+    def bytes(self, name: str) -> memoryview:
+        entry = self._entry(name, 'bytes')
+        return memoryview(self.data)[entry['offset']:entry['offset'] + entry['length']]
+
+    def object(self, name: str) -> Any:
+        entry = self._entry(name, 'object')
+        return pickle.loads(self.data[entry['offset']:entry['offset'] + entry['length']])
@@ -0,0 +1,71 @@
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
+from common.archive import ArchiveReader
+from lens.sources import BaseSource
+from lens.sources.SourceManifest import SourceManifest, hash_stream
+
+
+class ArchiveSource(BaseSource):
+    """
+    Serves the files of a data download straight from an encrypted archive (see `common.archive`), so nothing is ever
+    decrypted in full or extracted to temporary storage. Files are only decrypted chunk by chunk as parsers read them.
+
+    An archive can hold several downloads under different prefixes (e.g. "facebook/" and "google/"); the source's root
+    selects one of them, and paths are member names that start with it.
+
+    The archive may still be arriving (e.g. from `ChunkStore.download_archive`): then only the files that have arrived
+    in full are listed, and `reader.refresh()` adds the ones that arrived since.
+    """
+
+    def __init__(self, archive: Union[str, ArchiveReader], key: Optional[bytes] = None, root: str = '',
+                 extensions: Optional[List[str]] = None, cache_size: int = 16) -> None:
+        """
+        Args:
+            archive (Union[str, ArchiveReader]): The path to the archive, or a reader that's already open.
+            key (Optional[bytes]): The user's key, if the archive is given by path.
+            root (str): The prefix of the members that belong to this source. Defaults to every member.
+            extensions (Optional[List[str]]): The extensions of the files covered by the manifest. Defaults to every
+                kind of file the indexes read.
+            cache_size (int): The number of decoded JSON nodes kept in memory for repeated reads. Defaults to 16.
+        """
+        super().__init__(root=root, cache_size=cache_size)
+        self.reader = archive if isinstance(archive, ArchiveReader) else ArchiveReader(archive, key)
+        self.EXTENSIONS = extensions if extensions is not None else ['.json', '.mbox', '.ics', '.vcf']
+
+    def list_paths(self, directory: str = '') -> List[str]:
+        prefix = self.root + directory.strip('/') + '/' if directory else self.root
+        return sorted(name for name in self.reader.entries if name.startswith(prefix))
+
+    def exists(self, path: str) -> bool:
+        return path in self.reader.entries
+
+    def stat(self, path: str) -> Tuple[int, int]:
+        entry = self.reader.entries[path]
+        return entry.size, entry.mtime_ns
+
+    def open(self, path: str) -> BinaryIO:
+        return self.reader.open(path)
+
+    def map(self, path: str) -> Any:
+        return self.reader.open(path)
+
+    def relative(self, path: str) -> str:
+        return path[len(self.root):] if path.startswith(self.root) else path
+
+    def manifest(self, previous: Optional[SourceManifest] = None) -> SourceManifest:
+        # The archive's index already records every member's size, modification time and hash, so members only need
+        # to be read to tell whether a file that grew was appended to.
+        files: Dict[str, Dict[str, Any]] = {}
+        for path in self.list_paths():
+            if not any(path.endswith(extension) for extension in self.EXTENSIONS):
+                continue
+            entry = self.reader.entries[path]
+            relative_path = self.relative(path)
+            files[relative_path] = {'size': entry.size, 'mtime_ns': entry.mtime_ns, 'sha256': entry.sha256}
+
+            old = previous.files.get(relative_path) if previous else None
+            if old and old['sha256'] != entry.sha256 and old['size'] < entry.size:
+                with self.open(path) as file:
+                    _, prefix_sha256 = hash_stream(file, old['size'])
+                files[relative_path].update(prefix_size=old['size'], prefix_sha256=prefix_sha256)
+        return SourceManifest(files)
@@ -1,10 +1,7 @@
-from typing import Any, List
-import os
-import json
-import glob
+from lens.sources import BaseSource
 
 
-class FacebookSource:
+class FacebookSource(BaseSource):
     """
     This is an example of a lightweight data source - it simply reads from an on-disk Facebook data archive, and
     returns JSON-formatted data payloads.
@@ -15,25 +12,4 @@ class FacebookSource:
     deleted, so no user data is persisted.
     """
 
-    def __init__(self, root: str) -> None:
-        self.root = root
-
-    def glob(self, extension: str) -> List[str]:
-        return glob.glob(self.root + '**/*' + extension, recursive=True)
-
-    def read_json(self, path: str) -> Any:
-        with open(path, 'r') as file:
-            data = json.load(file)
-            return data
-
-    def read_node(self, path: str, node: str) -> Any:
-        print(self.root + path)
-        if os.path.exists(self.root + path):
-            with open(self.root + path, 'r') as file:
-                data = json.load(file)
-                if node in data:
-                    return data[node]
-
-        raise LookupError(
-            f"This path/node combination doesn't exist in the Facebook dataset (path={path}, node={node})."
-        )
+    EXTENSIONS = ['.json']
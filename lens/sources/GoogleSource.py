@@ -1,10 +1,7 @@
-from typing import Any, List
-import os
-import json
-import glob
+from lens.sources import BaseSource
 
 
-class GoogleSource:
+class GoogleSource(BaseSource):
     """
     This is an example of a lightweight data source - it simply reads from an on-disk Facebook data archive, and
     returns JSON-formatted data payloads.
@@ -15,14 +12,4 @@ class GoogleSource:
     deleted, so no user data is persisted.
     """
 
-    def __init__(self, root: str) -> None:
-        self.root = root
-
-    def get_mailbox_paths(self) -> List[str]:
-        return glob.glob(self.root + '**/*' + '.mbox', recursive=True)
-
-    def get_calendar_paths(self) -> List[str]:
-        return glob.glob(self.root + '**/*' + '.ics', recursive=True)
-
-    def get_contact_paths(self) -> List[str]:
-        return glob.glob(self.root + '**/*' + '.vcf', recursive=True)
\ No newline at end of file
+    EXTENSIONS = ['.mbox', '.ics', '.vcf']
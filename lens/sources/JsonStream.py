@@ -0,0 +1,163 @@
+import json
+import re
+from typing import Any, Dict, Iterator, Set, TextIO
+
+# The number of characters read from the file at a time.
+CHUNK_SIZE = 1024 * 1024
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# A JSON string's remaining characters after its opening quote, up to and including the closing quote.
+STRING_TAIL = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)
+STRUCTURE = re.compile(r'["\[\]{}]')
+# Any character that can follow a number or literal.
+SCALAR_END = re.compile(r'[ \t\n\r,\]}]')
+# The separator after an array element, along with the whitespace around it.
+ELEMENT_END = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+
+DECODER = json.JSONDecoder()
+
+
+class JsonStream:
+    """
+    An incremental reader over a JSON document in a file. It keeps a window of the file in memory, and decodes (or
+    skips) one value at a time with the standard library's decoder, so reading one node of a large document, or the
+    rows of a large array one after another, never materializes more than a single row beyond the window.
+    """
+
+    def __init__(self, file: TextIO, chunk_size: int = CHUNK_SIZE) -> None:
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+
+    def _fill(self) -> bool:
+        # Reads at least as much as is already buffered, so that a value spanning many chunks is retried a logarithmic
+        # (rather than linear) number of times.
+        chunk = self.file.read(max(self.chunk_size, len(self.buffer) - self.position))
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        Skips whitespace and returns the next character, or an empty string at the end of the document.
+        """
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer) or not self._fill():
+                return self.buffer[self.position:self.position + 1]
+
+    def expect(self, character: str) -> None:
+        found = self.peek()
+        if found != character:
+            raise ValueError(f'Expected "{character}" in JSON document, found "{found}".')
+        self.position += 1
+
+    def decode(self) -> Any:
+        """
+        Decodes the next value.
+        """
+        # Array elements usually start right at the current position, which saves a call to peek per row.
+        if self.buffer[self.position:self.position + 1] not in ('{', '[', '"') and self.peek() not in ('{', '[', '"'):
+            # A number at the end of the window may continue in the next chunk (and "1" is valid on its own, just as
+            # "1.5" is), so numbers are only decoded once the character after them has been read.
+            while SCALAR_END.search(self.buffer, self.position) is None and self._fill():
+                pass
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            self.position = end
+            return value
+
+    def skip(self) -> None:
+        """
+        Skips over the next value without decoding it.
+        """
+        if self.peek() not in ('{', '['):
+            self.decode()
+            return
+
+        depth = 0
+        while True:
+            match = STRUCTURE.search(self.buffer, self.position)
+            if match is None:
+                self.position = len(self.buffer)
+                if not self._fill():
+                    raise ValueError('Unexpected end of JSON document.')
+                continue
+            if match.group() == '"':
+                tail = STRING_TAIL.match(self.buffer, match.end())
+                if tail is None:
+                    # The string continues in the next chunk; resume from its opening quote.
+                    self.position = match.start()
+                    if not self._fill():
+                        raise ValueError('Unexpected end of JSON document.')
+                    continue
+                self.position = tail.end()
+                continue
+            self.position = match.end()
+            depth += 1 if match.group() in '[{' else -1
+            if depth == 0:
+                return
+
+    def find_key(self, key: str) -> bool:
+        """
+        Positions the stream at the value of a top-level key of the document (which must be an object), skipping the
+        values of the keys before it. Returns False if the document doesn't have the key.
+        """
+        self.expect('{')
+        while self.peek() not in ('}', ''):
+            name = self.decode()
+            self.expect(':')
+            if name == key:
+                return True
+            self.skip()
+            if self.peek() == ',':
+                self.position += 1
+        return False
+
+    def fields(self, exclude: Set[str]) -> Dict[str, Any]:
+        """
+        Decodes the document (which must be an object) except for the values of the given keys, which are skipped.
+        """
+        fields = {}
+        self.expect('{')
+        while self.peek() not in ('}', ''):
+            name = self.decode()
+            self.expect(':')
+            if name in exclude:
+                self.skip()
+            else:
+                fields[name] = self.decode()
+            if self.peek() == ',':
+                self.position += 1
+        return fields
+
+    def items(self) -> Iterator[Any]:
+        """
+        Decodes the elements of the array at the current position one at a time.
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+        while True:
+            yield self.decode()
+            separator = ELEMENT_END.match(self.buffer, self.position)
+            if separator is None or separator.end() == len(self.buffer):
+                # The separator (or the whitespace after it) may continue in the next chunk.
+                if self.peek() == ']':
+                    self.position += 1
+                    return
+                self.expect(',')
+            elif separator.group(1) == ']':
+                self.position = separator.end()
+                return
+            else:
+                self.position = separator.end()
@@ -0,0 +1,114 @@
+import hashlib
+import os
+from typing import Any, BinaryIO, Dict, List, Optional, Set, Tuple
+
+# Files are hashed in blocks of this size.
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class ManifestDiff:
+    """
+    The difference between two manifests of the same source root.
+
+    Attributes:
+        added (Set[str]): Files that didn't exist before.
+        changed (Set[str]): Files whose content changed.
+        removed (Set[str]): Files that no longer exist.
+        appended (Dict[str, int]): Files that only grew by appending (e.g. an mbox with new messages), mapped to their
+            previous size. They're also included in `changed`.
+    """
+
+    def __init__(self, added: Set[str], changed: Set[str], removed: Set[str], appended: Dict[str, int]) -> None:
+        self.added = added
+        self.changed = changed
+        self.removed = removed
+        self.appended = appended
+
+    @property
+    def modified(self) -> Set[str]:
+        return self.added | self.changed
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+
+class SourceManifest:
+    """
+    Records the size, modification time and SHA-256 content hash of every file under a source root, keyed by path
+    relative to the root. Comparing the manifest of a refreshed download against the previous one tells an index which
+    files it needs to re-parse.
+    """
+
+    def __init__(self, files: Dict[str, Dict[str, Any]]) -> None:
+        self.files = files
+
+    @classmethod
+    def scan(cls, root: str, extensions: List[str], previous: Optional['SourceManifest'] = None) -> 'SourceManifest':
+        """
+        Builds a manifest of the files under `root` with one of the given extensions. Files whose size and
+        modification time match the previous manifest are assumed unchanged and aren't re-hashed.
+        """
+        files: Dict[str, Dict[str, Any]] = {}
+        for directory, _, names in os.walk(root):
+            for name in names:
+                if not any(name.endswith(extension) for extension in extensions):
+                    continue
+                path = os.path.join(directory, name)
+                relative_path = os.path.relpath(path, root).replace(os.sep, '/')
+                stat = os.stat(path)
+                entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+                old = previous.files.get(relative_path) if previous else None
+                if old and old['size'] == entry['size'] and old['mtime_ns'] == entry['mtime_ns']:
+                    entry['sha256'] = old['sha256']
+                else:
+                    prefix_size = old['size'] if old and old['size'] < entry['size'] else None
+                    entry['sha256'], prefix_sha256 = hash_file(path, prefix_size)
+                    if prefix_sha256 is not None:
+                        entry['prefix_size'] = prefix_size
+                        entry['prefix_sha256'] = prefix_sha256
+                files[relative_path] = entry
+        return cls(files)
+
+    def diff(self, previous: Optional['SourceManifest']) -> ManifestDiff:
+        old_files = previous.files if previous else {}
+        added = set(self.files) - set(old_files)
+        removed = set(old_files) - set(self.files)
+        changed: Set[str] = set()
+        appended: Dict[str, int] = {}
+        for path in set(self.files) & set(old_files):
+            new, old = self.files[path], old_files[path]
+            if new['sha256'] == old['sha256']:
+                continue
+            changed.add(path)
+            if new.get('prefix_size') == old['size'] and new.get('prefix_sha256') == old['sha256']:
+                appended[path] = old['size']
+        return ManifestDiff(added=added, changed=changed, removed=removed, appended=appended)
+
+
+def hash_file(path: str, prefix_size: Optional[int] = None) -> Tuple[str, Optional[str]]:
+    """
+    Returns the SHA-256 digest of a file and, computed in the same pass, the digest of its first `prefix_size` bytes.
+    """
+    with open(path, 'rb') as file:
+        return hash_stream(file, prefix_size)
+
+
+def hash_stream(file: BinaryIO, prefix_size: Optional[int] = None) -> Tuple[str, Optional[str]]:
+    """
+    Like `hash_file`, for a file object that's open for reading from the start.
+    """
+    digest = hashlib.sha256()
+    prefix_digest = None
+    if prefix_size is not None:
+        remaining = prefix_size
+        while remaining > 0:
+            block = file.read(min(HASH_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+        prefix_digest = digest.hexdigest()
+    for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+    return digest.hexdigest(), prefix_digest
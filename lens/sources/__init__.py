@@ -1,2 +1,177 @@
+from collections import OrderedDict
+from fnmatch import fnmatch
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+import io
+import json
+import mmap
+import os
+import re
+
+from lens.sources.JsonStream import JsonStream
+from lens.sources.SourceManifest import SourceManifest
+
+MESSAGE_PART = re.compile(r'message_(\d+)\.json')
+
+
 class BaseSource:
-    pass
\ No newline at end of file
+    """
+    A source of files from a user's data download, addressed by paths that start with `root` (e.g. the directory the
+    download was extracted to). Parsers read files through the source, never directly from disk, so the same parsers
+    run over any storage that implements the source's primitives: `list_paths`, `exists`, `stat`, `open` and `map`.
+    This base class implements them over a directory on disk; `ArchiveSource` implements them over an encrypted
+    archive, without extracting it.
+    """
+
+    # The extensions of the files covered by the source's manifest.
+    EXTENSIONS: List[str] = []
+
+    def __init__(self, root: str, cache_size: int = 16) -> None:
+        """
+        Args:
+            root (str): The root directory of the extracted download.
+            cache_size (int): The number of decoded JSON nodes kept in memory for repeated reads. Defaults to 16.
+        """
+        self.root = root
+        self.cache_size = cache_size
+        # (path, node) -> (file size and modification time when decoded, value), in least recently used order.
+        self.cache: Dict[Tuple[str, str], Tuple[Tuple[int, int], Any]] = OrderedDict()
+
+    # Storage primitives. Paths include the root.
+
+    def list_paths(self, directory: str = '') -> List[str]:
+        """
+        Returns the sorted paths of every (non-hidden) file under a directory, given relative to the root.
+        """
+        paths = []
+        for parent, directories, names in os.walk(os.path.join(self.root, directory)):
+            directories[:] = [name for name in directories if not name.startswith('.')]
+            paths.extend(os.path.join(parent, name) for name in names if not name.startswith('.'))
+        return sorted(paths)
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    def stat(self, path: str) -> Tuple[int, int]:
+        """
+        Returns a file's size and modification time (in nanoseconds).
+        """
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def open(self, path: str) -> BinaryIO:
+        return open(path, 'rb')
+
+    def map(self, path: str) -> Any:
+        """
+        Returns a read-only, sliceable view of a (non-empty) file's bytes that supports `find`, like an `mmap`.
+        """
+        with open(path, 'rb') as file:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def manifest(self, previous: Optional[SourceManifest] = None) -> SourceManifest:
+        return SourceManifest.scan(self.root, self.EXTENSIONS, previous=previous)
+
+    # Helpers built on the primitives.
+
+    def relative(self, path: str) -> str:
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def glob(self, extension: str) -> List[str]:
+        return [path for path in self.list_paths() if fnmatch(os.path.basename(path), '*' + extension)]
+
+    def get_mailbox_paths(self) -> List[str]:
+        return self.glob('.mbox')
+
+    def get_calendar_paths(self) -> List[str]:
+        return self.glob('.ics')
+
+    def get_contact_paths(self) -> List[str]:
+        return self.glob('.vcf')
+
+    def read_text(self, path: str) -> str:
+        with io.TextIOWrapper(self.open(path), encoding='utf-8') as file:
+            return file.read()
+
+    def read_lines(self, path: str) -> Iterator[str]:
+        """
+        Yields the lines of a text file one at a time, without reading the whole file into memory.
+        """
+        with io.TextIOWrapper(self.open(path), encoding='utf-8', errors='replace') as file:
+            yield from file
+
+    def read_json(self, path: str) -> Any:
+        with self.open(path) as file:
+            return json.load(file)
+
+    def read_node(self, path: str, node: str, stream: bool = False) -> Any:
+        """
+        Decodes a single top-level node of a JSON file. Only the node itself is decoded, so the rest of the file is
+        never materialized.
+
+        Args:
+            path (str): The file's path, relative to the root.
+            node (str): The top-level key to read.
+            stream (bool): Whether to return an iterator over the node's rows (the node must be a list) that decodes
+                them one at a time, instead of the decoded node. Defaults to False.
+        """
+        full_path = self.root + path
+        if not self.exists(full_path):
+            raise self._missing(path, node)
+        version = self.stat(full_path)
+
+        cached = self.cache.get((path, node))
+        if cached is not None and cached[0] == version and (not stream or isinstance(cached[1], list)):
+            self.cache.move_to_end((path, node))
+            return iter(cached[1]) if stream else cached[1]
+
+        file = io.TextIOWrapper(self.open(full_path), encoding='utf-8')
+        try:
+            reader = JsonStream(file)
+            if not reader.find_key(node):
+                raise self._missing(path, node)
+            if stream:
+                if reader.peek() != '[':
+                    raise ValueError(f'The node "{node}" in {path} is not a list, so its rows can\'t be streamed.')
+                # The returned generator takes ownership of the file, and closes it once it's exhausted.
+                return self._stream(file, reader)
+            value = reader.decode()
+        except BaseException:
+            file.close()
+            raise
+        file.close()
+
+        self.cache[(path, node)] = (version, value)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return value
+
+    def _stream(self, file: Any, reader: JsonStream) -> Iterator[Any]:
+        with file:
+            yield from reader.items()
+
+    def _missing(self, path: str, node: str) -> LookupError:
+        return LookupError(
+            f"This path/node combination doesn't exist in the dataset (path={path}, node={node})."
+        )
+
+    def read_fields(self, path: str, exclude: Set[str]) -> Dict[str, Any]:
+        """
+        Decodes every top-level node of a JSON file (relative to the root) except the excluded ones, which are skipped
+        without being decoded (e.g. a Messenger thread's details, without its messages).
+        """
+        with io.TextIOWrapper(self.open(self.root + path), encoding='utf-8') as file:
+            return JsonStream(file).fields(exclude)
+
+    def messenger_threads(self) -> List[List[str]]:
+        """
+        Lists the Messenger threads in a Facebook download. Each thread is a directory under messages/inbox holding one
+        or more parts (message_1.json, message_2.json, ...), and is returned as the list of its parts' paths (relative
+        to the root) in part order.
+        """
+        threads: Dict[str, List[Tuple[int, str]]] = {}
+        for path in self.list_paths('messages/inbox'):
+            parts = self.relative(path).split('/')
+            match = MESSAGE_PART.fullmatch(parts[-1])
+            if len(parts) == 4 and match:
+                threads.setdefault(parts[2], []).append((int(match.group(1)), '/'.join(parts)))
+        return [[path for _, path in sorted(threads[name])] for name in sorted(threads)]
@@ -0,0 +1,97 @@
+import io
+import os
+
+import pytest
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet
+
+from common.archive import HEADER, RECORD, ArchiveReader, ArchiveWriter
+from common.blobstore import LocalBlobStore
+from common.chunkstore import ChunkStore
+from lens.sources.ArchiveSource import ArchiveSource
+
+KEY = Fernet.generate_key()
+
+MEMBERS = {
+    'facebook/profile.json': b'{"name": "Alice"}',
+    'facebook/messages/inbox.json': os.urandom(300),
+    'google/empty.ics': b'',
+    'google/Mail/all.mbox': b'From alice\n' * 100,
+}
+
+
+def write_archive(chunk_size: int = 64) -> bytes:
+    output = io.BytesIO()
+    with ArchiveWriter(output, KEY, chunk_size=chunk_size) as archive:
+        for name, data in MEMBERS.items():
+            archive.add(name, data, mtime_ns=len(name))
+    return output.getvalue()
+
+
+def test_members_round_trip():
+    reader = ArchiveReader(io.BytesIO(write_archive()), KEY)
+    assert reader.complete
+    assert reader.names() == list(MEMBERS)
+    for name, data in MEMBERS.items():
+        assert reader.read(name) == data
+        assert reader.entries[name].mtime_ns == len(name)
+    with reader.open('google/Mail/all.mbox') as member:
+        assert member[11:22] == b'From alice\n'
+        assert member.find(b'alice', 100) == 104
+
+
+def test_members_are_readable_from_a_prefix():
+    data = write_archive()
+    readable = 0
+    for end in range(0, len(data), 7):
+        try:
+            reader = ArchiveReader(io.BytesIO(data[:end]), KEY)
+        except ValueError:
+            # Not even the header has arrived.
+            continue
+        names = reader.names()
+        # Members become readable in order, and only once all of their data has arrived.
+        assert names == list(MEMBERS)[:len(names)]
+        for name in names:
+            assert reader.read(name) == MEMBERS[name]
+        readable = max(readable, len(names))
+    assert readable == len(MEMBERS)
+
+
+def test_refresh_picks_up_members_that_arrived():
+    data = write_archive()
+    file = io.BytesIO(data[:len(data) // 2])
+    reader = ArchiveReader(file, KEY)
+    before = len(reader.names())
+    assert 0 < before < len(MEMBERS)
+    file.seek(0, os.SEEK_END)
+    file.write(data[len(data) // 2:])
+    assert reader.refresh() == len(MEMBERS) - before
+    assert reader.complete
+    assert all(reader.read(name) == data for name, data in MEMBERS.items())
+
+
+def test_tampered_entries_are_rejected():
+    data = bytearray(write_archive())
+    # The first member is smaller than a chunk, so its entry is the first record.
+    data[HEADER.size + RECORD.size] ^= 1
+    with pytest.raises(InvalidTag):
+        ArchiveReader(io.BytesIO(bytes(data[:-100])), KEY)
+
+
+def test_deduplicated_downloads_are_archives(tmp_path):
+    dataset = tmp_path / 'dataset' / 'facebook'
+    (dataset / 'messages').mkdir(parents=True)
+    for name, data in MEMBERS.items():
+        if name.startswith('facebook/'):
+            (dataset / name[len('facebook/'):]).write_bytes(data)
+
+    chunk_store = ChunkStore(LocalBlobStore(str(tmp_path / 'store')), 'datasets/test/', KEY)
+    chunk_store.upload(str(dataset), ['.json'])
+    output = str(tmp_path / 'download.lens')
+    assert chunk_store.download_archive(output) == 2
+
+    source = ArchiveSource(output, KEY, root='facebook/')
+    assert source.list_paths() == ['facebook/messages/inbox.json', 'facebook/profile.json']
+    with source.open('facebook/messages/inbox.json') as file:
+        assert file.read() == MEMBERS['facebook/messages/inbox.json']
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from examples.search.index.bitmap import ARRAY_LIMIT, Bitmap
+
+
+def ids(seed: int) -> np.ndarray:
+    """
+    Returns row ids spread over several containers: dense ones (bitsets), sparse ones (arrays), ones right at the
+    threshold between the two, and the ids on either side of container boundaries.
+    """
+    random = np.random.default_rng(seed)
+    chunks = [
+        random.choice(1 << 16, size=random.integers(ARRAY_LIMIT + 1, 30000), replace=False),
+        (1 << 16) + random.choice(1 << 16, size=random.integers(1, 200), replace=False),
+        (2 << 16) + random.choice(1 << 16, size=ARRAY_LIMIT + random.integers(-1, 2), replace=False),
+        np.array([(3 << 16) - 1, 3 << 16, (5 << 16) - 1, 5 << 16, (1 << 40) + 7]),
+    ]
+    if seed % 2:
+        chunks.append((7 << 16) + np.arange(0, 1 << 16, 1 + seed % 3))
+    return np.unique(np.concatenate(chunks)).astype(np.int64)
+
+
+def check(bitmap: Bitmap, expected: np.ndarray) -> None:
+    np.testing.assert_array_equal(bitmap.to_ids(), expected)
+    assert len(bitmap) == len(expected)
+    assert np.all(bitmap.cardinalities > 0) and np.all(np.diff(bitmap.keys) > 0)
+    for values, cardinality in zip(bitmap.containers, bitmap.cardinalities):
+        # Containers switch to bitsets exactly when they're too dense to be arrays.
+        assert (values.dtype == np.uint64) == (cardinality > ARRAY_LIMIT)
+
+
+PAIRS = [(0, 1), (1, 2), (2, 3), (3, 3), (4, 0)]
+
+
+@pytest.mark.parametrize('first, second', PAIRS)
+def test_operations_match_numpy(first, second):
+    a, b = ids(first), ids(second)
+    x, y = Bitmap.from_ids(a), Bitmap.from_ids(b)
+    check(x, a)
+    check(x & y, np.intersect1d(a, b))
+    check(x | y, np.union1d(a, b))
+    check(x - y, np.setdiff1d(a, b))
+    check(y - x, np.setdiff1d(b, a))
+    assert x.intersection_count(y) == len(np.intersect1d(a, b))
+
+
+def test_dense_containers_shrink_to_arrays():
+    dense = Bitmap.from_ids(np.arange(20000))
+    sparse = Bitmap.from_ids(np.arange(0, 20000, 10))
+    check(dense, np.arange(20000))
+    # Intersecting or subtracting two bitsets can leave few enough ids for an array.
+    check(dense & Bitmap.from_ids(np.arange(19000, 40000)), np.arange(19000, 20000))
+    check(dense - Bitmap.from_ids(np.arange(100, 20000)), np.arange(100))
+    # Uniting two arrays can leave too many for one.
+    check(sparse | Bitmap.from_ids(np.arange(1, 20000, 10)) | Bitmap.from_ids(np.arange(2, 20000, 10)),
+          np.sort(np.concatenate([np.arange(start, 20000, 10) for start in range(3)])))
+
+
+def test_empty_bitmaps():
+    empty = Bitmap.empty()
+    x = Bitmap.from_ids(ids(1))
+    check(empty, np.zeros(0, dtype=np.int64))
+    check(x & empty, np.zeros(0, dtype=np.int64))
+    check(x | empty, ids(1))
+    check(x - x, np.zeros(0, dtype=np.int64))
+    check(Bitmap.from_ids([]), np.zeros(0, dtype=np.int64))
+
+
+@pytest.mark.parametrize('seed', [0, 1, 4])
+def test_serialization_round_trip(seed):
+    bitmap = Bitmap.from_ids(ids(seed))
+    loaded = Bitmap.from_bytes(bitmap.to_bytes())
+    check(loaded, ids(seed))
+    check(loaded & Bitmap.from_ids(ids(seed + 1)), np.intersect1d(ids(seed), ids(seed + 1)))
@@ -0,0 +1,84 @@
+import io
+import os
+import random
+
+import pytest
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet
+
+from common import chunkstore
+from common.blobstore import LocalBlobStore
+from common.chunkstore import ChunkStore, content_chunks
+
+KEY = Fernet.generate_key()
+# Small chunks, so that a few hundred kilobytes make many of them.
+SIZES = {'min_size': 1024, 'average_size': 4096, 'max_size': 16384}
+
+
+def data(size: int, seed: int = 0) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def chunks(content: bytes) -> list:
+    return list(content_chunks(io.BytesIO(content), **SIZES))
+
+
+def test_chunks_cover_the_stream_within_bounds():
+    content = data(500000)
+    result = chunks(content)
+    assert b''.join(result) == content
+    assert all(SIZES['min_size'] <= len(chunk) <= SIZES['max_size'] for chunk in result[:-1])
+
+
+def test_boundaries_do_not_depend_on_reads(monkeypatch):
+    content = data(500000)
+    expected = chunks(content)
+    monkeypatch.setattr(chunkstore, 'READ_SIZE', 10007)
+    assert chunks(content) == expected
+
+
+@pytest.mark.parametrize('position', [0, 123456, 250000, 499999])
+def test_boundaries_are_stable_under_an_insert(position):
+    content = data(500000)
+    edited = content[:position] + data(100, seed=1) + content[position:]
+    before, after = chunks(content), chunks(edited)
+    # Only the chunks around the insert change (the one it lands in, and at most the next one if a boundary moved).
+    assert len(set(after) - set(before)) <= 2
+    assert len(set(before) - set(after)) <= 2
+
+
+def test_reuploads_only_send_new_chunks(tmp_path):
+    dataset = tmp_path / 'dataset' / 'google'
+    dataset.mkdir(parents=True)
+    content = data(3 * chunkstore.MAX_CHUNK_SIZE)
+    (dataset / 'all.mbox').write_bytes(content)
+    (dataset / 'ignored.bin').write_bytes(b'not a dataset file')
+    store = ChunkStore(LocalBlobStore(str(tmp_path / 'store')), 'datasets/test/', KEY, workers=2)
+
+    stats = store.upload(str(dataset), ['.mbox'])
+    assert stats['files'] == 1 and stats['uploaded_chunks'] == stats['chunks']
+
+    # An unchanged file isn't even read.
+    assert store.upload(str(dataset), ['.mbox'])['uploaded_chunks'] == 0
+
+    middle = len(content) // 2
+    (dataset / 'all.mbox').write_bytes(content[:middle] + b'From someone new\n' + content[middle:])
+    stats = store.upload(str(dataset), ['.mbox'])
+    assert 1 <= stats['uploaded_chunks'] <= 2 < stats['chunks']
+
+    manifest = store.read_manifest()
+    assert [entry['name'] for entry in manifest['files']] == ['google/all.mbox']
+    chunk_ids = [chunk_id for chunk_id, _ in manifest['files'][0]['chunks']]
+    assert b''.join(store.read_chunks(chunk_ids)) == content[:middle] + b'From someone new\n' + content[middle:]
+    # The chunks of the first version are no longer referenced.
+    assert store.prune() >= 1
+
+
+def test_chunks_cannot_be_swapped(tmp_path):
+    store = ChunkStore(LocalBlobStore(str(tmp_path)), 'datasets/test/', KEY)
+    first, second = store.chunk_id(b'first'), store.chunk_id(b'second')
+    store._upload_chunk(first, b'first')
+    store._upload_chunk(second, b'second')
+    os.replace(store.store.path(store.chunk_name(second)), store.store.path(store.chunk_name(first)))
+    with pytest.raises(InvalidTag):
+        store.read_chunk(first)
@@ -0,0 +1,31 @@
+import pytest
+from click.testing import CliRunner
+
+from cli.cli import cli
+from examples.search.query import Query
+
+
+@pytest.mark.parametrize('json_args, message', [
+    ('{"limit": ', 'Invalid JSON'),
+    ('[1, 2]', 'Expected a JSON object'),
+    ('"Email"', 'Expected a JSON object'),
+])
+def test_query_rejects_invalid_json(tmp_path, json_args, message):
+    # The arguments are checked before the snapshot is loaded.
+    snapshot = tmp_path / 'index.lens'
+    snapshot.write_bytes(b'')
+    result = CliRunner().invoke(cli, ['query', '--snapshot', str(snapshot), '--json', json_args])
+    assert result.exit_code == 2
+    assert message in result.output
+    assert 'Traceback' not in result.output
+
+
+@pytest.mark.parametrize('args, message', [
+    ({1: 'Email'}, 'names must be strings'),
+    ({'source': 'Email', None: 1}, 'names must be strings'),
+    ([('source', 'Email')], 'must be a mapping'),
+    ({'sauce': 'Email'}, 'Unknown query arguments: sauce'),
+])
+def test_query_rejects_invalid_argument_names(args, message):
+    with pytest.raises(ValueError, match=message):
+        Query(args)
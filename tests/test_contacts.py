@@ -0,0 +1,39 @@
+from examples.search.index.helpers.contacts import ContactDirectory, read_vcards
+from examples.search.index.helpers.ical import read_vevents
+
+VCARD = [
+    'BEGIN:VCARD\r\n',
+    'VERSION:3.0\r\n',
+    'FN:Alice Smith\r\n',
+    'N:Smith;Alice;;;\r\n',
+    'item1.NICKNAME:Al\r\n',
+    'EMAIL;TYPE=INTERNET:alice@example.com\r\n',
+    'item1.EMAIL;TYPE=INTERNET:alice@work.com\r\n',
+    'item1.X-ABLABEL:Work\r\n',
+    'END:VCARD\r\n',
+]
+
+
+def test_grouped_properties_are_read():
+    contacts = list(read_vcards(VCARD))
+    assert contacts == [{'name': 'Alice Smith', 'emails': ['alice@example.com', 'alice@work.com'], 'aliases': ['Al']}]
+
+
+def test_directory_resolves_grouped_addresses():
+    directory = ContactDirectory()
+    directory.read(VCARD)
+    assert directory.resolve('Alice <alice@work.com>') == 'Alice Smith'
+
+
+def test_grouped_vevent_properties_are_read():
+    lines = ['BEGIN:VEVENT', 'DTSTART:20200101T100000Z', 'x.SUMMARY:Standup', 'END:VEVENT']
+    assert [event['name'] for event in read_vevents(lines)] == ['Standup']
+
+
+def test_directories_compare_by_contacts():
+    first, second = ContactDirectory(), ContactDirectory()
+    first.read(VCARD)
+    second.read(VCARD)
+    assert first == second
+    second.add('Bob Jones', ['bob@example.com'])
+    assert first != second
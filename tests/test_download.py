@@ -0,0 +1,126 @@
+import os
+import threading
+
+import pytest
+from cryptography.fernet import Fernet
+
+from common.blobstore import BlobStore, LocalBlobStore
+from common.storage import AzureStorage, BlockUploader, RangeDownloader
+
+KEY = Fernet.generate_key()
+CHUNK_SIZE = 64
+# The number of chunks of the test blob.
+CHUNKS = 20
+
+
+class FlakyBlobStore(LocalBlobStore):
+    """
+    A local store that counts ranged reads, and fails every read after the first `fail_after`.
+    """
+
+    def __init__(self, root: str, fail_after: int = -1) -> None:
+        super().__init__(root)
+        self.fail_after = fail_after
+        self.reads = 0
+        self.lock = threading.Lock()
+
+    def download_range(self, name, offset, length, etag=None):
+        with self.lock:
+            self.reads += 1
+            if 0 <= self.fail_after < self.reads:
+                raise ConnectionError('The connection was reset.')
+        return super().download_range(name, offset, length, etag=etag)
+
+
+@pytest.fixture
+def blob(tmp_path):
+    data = os.urandom(CHUNKS * CHUNK_SIZE - 10)
+    with BlockUploader(LocalBlobStore(str(tmp_path / 'store')), 'dataset', KEY, chunk_size=CHUNK_SIZE) as uploader:
+        uploader.write(data)
+    return str(tmp_path / 'store'), data
+
+
+def test_download_round_trip(blob, tmp_path):
+    root, data = blob
+    store = FlakyBlobStore(root)
+    output = str(tmp_path / 'dataset.zip')
+    size, etag = store.properties('dataset')
+    assert RangeDownloader(store, 'dataset', KEY, workers=3).download(output, size, etag) == len(data)
+    with open(output, 'rb') as file:
+        assert file.read() == data
+    assert not os.path.exists(output + '.progress') and not os.path.exists(output + '.part')
+
+
+def test_interrupted_download_resumes(blob, tmp_path):
+    root, data = blob
+    output = str(tmp_path / 'dataset.zip')
+    # The header and 8 chunks are read before the connection drops.
+    store = FlakyBlobStore(root, fail_after=9)
+    size, etag = store.properties('dataset')
+    with pytest.raises(ConnectionError):
+        RangeDownloader(store, 'dataset', KEY, workers=1, retries=0).download(output, size, etag)
+    assert not os.path.exists(output)
+    assert os.path.exists(output + '.progress')
+
+    store = FlakyBlobStore(root)
+    downloader = RangeDownloader(store, 'dataset', KEY, workers=3)
+    assert downloader.download(output, size, etag) == len(data)
+    # Chunks that completed alongside the failed one may not have been journaled before the download stopped.
+    assert 0 < downloader.resumed <= 8
+    # Only the header and the chunks that weren't done are read again.
+    assert store.reads == 1 + CHUNKS - downloader.resumed
+    with open(output, 'rb') as file:
+        assert file.read() == data
+
+
+def test_changed_blob_restarts_download(blob, tmp_path):
+    root, data = blob
+    output = str(tmp_path / 'dataset.zip')
+    store = FlakyBlobStore(root, fail_after=9)
+    size, etag = store.properties('dataset')
+    with pytest.raises(ConnectionError):
+        RangeDownloader(store, 'dataset', KEY, workers=1, retries=0).download(output, size, etag)
+
+    data = os.urandom(len(data))
+    with BlockUploader(LocalBlobStore(root), 'dataset', KEY, chunk_size=CHUNK_SIZE) as uploader:
+        uploader.write(data)
+    store = FlakyBlobStore(root)
+    size, etag = store.properties('dataset')
+    downloader = RangeDownloader(store, 'dataset', KEY)
+    assert downloader.download(output, size, etag) == len(data)
+    assert downloader.resumed == 0
+    with open(output, 'rb') as file:
+        assert file.read() == data
+
+
+def test_cached_datasets_are_not_downloaded_again(tmp_path):
+    key_path = str(tmp_path / 'key')
+    AzureStorage.generate_key(key_path)
+    dataset = tmp_path / 'dataset' / 'facebook'
+    dataset.mkdir(parents=True)
+    (dataset / 'profile.json').write_text('{"name": "Alice"}')
+
+    store = FlakyBlobStore(str(tmp_path / 'store'))
+    storage = AzureStorage(key_path, store=store, cache_dir=str(tmp_path / 'cache'))
+    storage.upload_archive('facebook', 'alice', str(dataset))
+    first, second = str(tmp_path / 'first.zip'), str(tmp_path / 'second.zip')
+    storage.download_dataset('facebook', 'alice', first)
+    reads = store.reads
+    storage.download_dataset('facebook', 'alice', second)
+    assert store.reads == reads
+    with open(first, 'rb') as file, open(second, 'rb') as other:
+        assert file.read() == other.read()
+
+
+def test_blob_stores_must_implement_every_operation(tmp_path):
+    class PartialBlobStore(BlobStore):
+        def stage_block(self, name, block_id, data):
+            pass
+
+    with pytest.raises(TypeError, match='abstract'):
+        BlobStore()
+    with pytest.raises(TypeError, match='abstract'):
+        PartialBlobStore()
+    store = LocalBlobStore(str(tmp_path))
+    store.upload('small', b'data')
+    assert b''.join(store.download('small')) == b'data'
@@ -0,0 +1,94 @@
+import os
+
+import pytest
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet
+
+from common.blobstore import LocalBlobStore
+from common.encryption import HEADER, TAG_SIZE, ChunkEncryptor, decrypt_chunks
+from common.storage import BlockUploader
+
+KEY = Fernet.generate_key()
+CHUNK_SIZE = 64
+
+
+def encrypt(data: bytes, key: bytes = KEY) -> list:
+    """
+    Returns the header and every encrypted chunk of `data`.
+    """
+    encryptor = ChunkEncryptor(key, chunk_size=CHUNK_SIZE)
+    chunks = [data[start:start + CHUNK_SIZE] for start in range(0, len(data), CHUNK_SIZE)] or [b'']
+    return [encryptor.header] + [
+        encryptor.encrypt(index, chunk, last=index == len(chunks) - 1) for index, chunk in enumerate(chunks)
+    ]
+
+
+def decrypt(parts: list, key: bytes = KEY) -> bytes:
+    # The stream is split at arbitrary points, since the decryptor mustn't depend on how it's read.
+    data = b''.join(parts)
+    return b''.join(decrypt_chunks(key, (data[start:start + 10] for start in range(0, len(data), 10))))
+
+
+@pytest.mark.parametrize('size', [0, 1, CHUNK_SIZE - 1, CHUNK_SIZE, 5 * CHUNK_SIZE, 5 * CHUNK_SIZE + 7])
+def test_round_trip(size):
+    data = os.urandom(size)
+    parts = encrypt(data)
+    assert all(len(part) == CHUNK_SIZE + TAG_SIZE for part in parts[1:-1])
+    assert decrypt(parts) == data
+
+
+def test_truncated_streams_are_rejected():
+    parts = encrypt(os.urandom(5 * CHUNK_SIZE + 7))
+    # Dropping the last chunk leaves a stream that ends with a chunk that wasn't sealed as the last one.
+    with pytest.raises(InvalidTag):
+        decrypt(parts[:-1])
+    with pytest.raises(InvalidTag):
+        decrypt(parts[:-1] + [parts[-1][:-1]])
+
+
+def test_reordered_chunks_are_rejected():
+    parts = encrypt(os.urandom(5 * CHUNK_SIZE + 7))
+    parts[1], parts[2] = parts[2], parts[1]
+    with pytest.raises(InvalidTag):
+        decrypt(parts)
+
+
+def test_tampered_streams_are_rejected():
+    parts = encrypt(os.urandom(5 * CHUNK_SIZE + 7))
+    tampered = bytearray(parts[3])
+    tampered[0] ^= 1
+    with pytest.raises(InvalidTag):
+        decrypt(parts[:3] + [bytes(tampered)] + parts[4:])
+
+    # The header is authenticated too, so chunks can't be spliced into another stream.
+    other = encrypt(os.urandom(5 * CHUNK_SIZE + 7))
+    with pytest.raises(InvalidTag):
+        decrypt([other[0]] + parts[1:])
+
+    with pytest.raises(InvalidTag):
+        decrypt(parts, key=Fernet.generate_key())
+
+
+def test_header_is_checked():
+    with pytest.raises(ValueError):
+        decrypt([b'not a dataset' + bytes(HEADER.size)])
+
+
+@pytest.mark.parametrize('size', [0, 3 * CHUNK_SIZE, 3 * CHUNK_SIZE + 1])
+def test_block_uploads_round_trip(tmp_path, size):
+    store = LocalBlobStore(str(tmp_path))
+    data = os.urandom(size)
+    with BlockUploader(store, 'dataset', KEY, chunk_size=CHUNK_SIZE, workers=2, max_pending=1) as uploader:
+        # Writes don't line up with chunks.
+        for start in range(0, size, 50):
+            uploader.write(data[start:start + 50])
+    assert decrypt(list(store.download('dataset'))) == data
+
+
+def test_failed_block_uploads_are_not_committed(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        with BlockUploader(store, 'dataset', KEY, chunk_size=CHUNK_SIZE) as uploader:
+            uploader.write(os.urandom(3 * CHUNK_SIZE))
+            raise RuntimeError('The upload was interrupted.')
+    assert not store.exists('dataset')
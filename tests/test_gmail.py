@@ -0,0 +1,45 @@
+from examples.search.index.helpers import gmail
+from examples.search.index.helpers.gmail import EmailBody, close_maps, get_html_text
+
+
+def test_html_text():
+    assert get_html_text('<html><head><title>Subject</title></head><body><p>Hello,</p><p>world &amp; you</p>'
+                         '<script>var a = "<p>";</script></body></html>') == 'Hello, world & you'
+    assert get_html_text('  ') is None
+
+
+def test_quoted_attributes_may_hold_angle_brackets():
+    assert get_html_text('<a title="x > y" href="#">link</a>') == 'link'
+    assert get_html_text("<img alt='a > b'>after") == 'after'
+    assert get_html_text('1 < 2 <b>bold</b>') == '1 < 2 bold'
+
+
+def test_closed_maps_are_mapped_again(tmp_path):
+    path = tmp_path / 'mail.mbox'
+    messages = [b'From a\nSubject: one\n\nbody one\n', b'From b\nSubject: two\n\nbody two\n']
+    path.write_bytes(b''.join(messages))
+    first, second = EmailBody(str(path), 0, len(messages[0])), EmailBody(str(path), len(messages[0]), len(messages[1]))
+    assert first.read() == messages[0]
+    assert len(gmail._MAPS) == 1
+
+    close_maps()
+    assert not gmail._MAPS
+    assert second.read() == messages[1]
+    close_maps()
+
+
+def test_evicted_maps_are_closed(tmp_path, monkeypatch):
+    monkeypatch.setattr(gmail, 'MAP_CACHE_SIZE', 2)
+    bodies = []
+    for number in range(3):
+        path = tmp_path / f'{number}.mbox'
+        path.write_bytes(b'From a\n\nbody\n')
+        bodies.append(EmailBody(str(path), 0, 13))
+    maps = []
+    for body in bodies:
+        assert body.read() == b'From a\n\nbody\n'
+        maps.append(next(reversed(gmail._MAPS.values())))
+    assert len(gmail._MAPS) == 2
+    assert maps[0].closed and not maps[2].closed
+    close_maps()
+    assert maps[2].closed
@@ -0,0 +1,40 @@
+from datetime import datetime, timezone
+
+from examples.search.index.helpers import ical
+from examples.search.index.helpers.ical import MAX_OCCURRENCES, read_calendar
+from examples.search.models.timestamps import datetime_to_epoch
+
+UNTIL = datetime_to_epoch(datetime(2027, 1, 1, tzinfo=timezone.utc))
+
+
+def calendar(rrule: str, begin: str = '20080101T090000Z'):
+    return ['BEGIN:VCALENDAR', 'BEGIN:VEVENT', 'UID:daily@example.com', f'DTSTART:{begin}', f'RRULE:{rrule}',
+            'SUMMARY:Standup', 'END:VEVENT', 'END:VCALENDAR']
+
+
+def test_long_series_keep_their_most_recent_instances(caplog):
+    events = list(read_calendar(calendar('FREQ=DAILY'), until=UNTIL))
+    assert len(events) == MAX_OCCURRENCES
+    assert events[-1]['begin'] == datetime(2026, 12, 31, 9, tzinfo=timezone.utc)
+    assert 'too many instances' in caplog.text
+
+
+def test_series_within_the_cap_are_fully_expanded(caplog):
+    events = list(read_calendar(calendar('FREQ=WEEKLY;COUNT=10'), until=UNTIL))
+    assert [event['begin'].day for event in events[:2]] == [1, 8]
+    assert len(events) == 10
+    assert not caplog.text
+
+
+def test_window_bounds_instances():
+    since = datetime_to_epoch(datetime(2020, 1, 1, tzinfo=timezone.utc))
+    until = datetime_to_epoch(datetime(2020, 1, 11, tzinfo=timezone.utc))
+    events = list(read_calendar(calendar('FREQ=DAILY'), since=since, until=until))
+    assert [event['begin'].day for event in events] == list(range(1, 11))
+
+
+def test_runaway_rules_stop_scanning(monkeypatch, caplog):
+    monkeypatch.setattr(ical, 'MAX_SCANNED', 1000)
+    events = list(read_calendar(calendar('FREQ=MINUTELY'), until=UNTIL))
+    assert len(events) == 1000
+    assert 'too many instances' in caplog.text
@@ -0,0 +1,115 @@
+import contextlib
+import io
+import os
+
+import pytest
+
+from benchmarks.generate import FULL_NAME, generate
+from examples.search.index.helpers.gmail import EmailBody
+from examples.search.main import SearchEngine
+from lens.sources.FacebookSource import FacebookSource
+from lens.sources.GoogleSource import GoogleSource
+
+CONFIG = {'full_name': FULL_NAME, 'workers': 1}
+
+
+def preprocess(engine: SearchEngine, root: str) -> None:
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        engine.preprocess(FacebookSource(os.path.join(root, 'facebook', '')),
+                          GoogleSource(os.path.join(root, 'google', '')))
+
+
+@pytest.fixture(scope='module')
+def archives(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp('archives'))
+    generate(root, 1000)
+    return root
+
+
+def test_unchanged_rerun_retracts_nothing(archives):
+    engine = SearchEngine(CONFIG)
+    preprocess(engine, archives)
+    events = len(engine.events)
+    preprocess(engine, archives)
+    assert len(engine.events) == events
+    assert engine.events.retracted == 0
+
+
+def test_unchanged_rerun_after_load_retracts_nothing(archives, tmp_path):
+    engine = SearchEngine(CONFIG)
+    preprocess(engine, archives)
+    events = len(engine.events)
+    snapshot = str(tmp_path / 'index.lens')
+    engine.save(snapshot)
+
+    engine = SearchEngine.load(snapshot, config=CONFIG)
+    preprocess(engine, archives)
+    assert len(engine.events) == events
+    assert engine.events.retracted == 0
+
+
+def test_changed_contacts_reparse_dependent_files(tmp_path):
+    root = str(tmp_path)
+    generate(root, 1000)
+    engine = SearchEngine(CONFIG)
+    preprocess(engine, root)
+    events = len(engine.events)
+
+    vcf = os.path.join(root, 'google', 'Takeout', 'Contacts', 'All Contacts', 'All Contacts.vcf')
+    with open(vcf, 'a', newline='') as file:
+        file.write('BEGIN:VCARD\r\nVERSION:3.0\r\nFN:New Person\r\nEMAIL:new.person@example.com\r\nEND:VCARD\r\n')
+    preprocess(engine, root)
+    # A new contact can change who every email and calendar event names, so they're all re-parsed.
+    assert engine.events.retracted > 0
+    assert len(engine.events) - engine.events.retracted == events
+
+
+def test_grown_json_file_is_replaced(tmp_path):
+    root = str(tmp_path)
+    generate(root, 1000)
+    engine = SearchEngine(CONFIG)
+    preprocess(engine, root)
+    events = len(engine.events)
+
+    # The old contents are a prefix of the new ones, but the JSON parser re-parses the whole file, so the events from
+    # its previous parse have to be retracted.
+    path = os.path.join(root, 'facebook', 'comments_and_reactions', 'posts_and_comments.json')
+    with open(path, 'a') as file:
+        file.write('\n')
+    preprocess(engine, root)
+    assert engine.events.retracted > 0
+    assert len(engine.events) - engine.events.retracted == events
+
+
+def test_appended_mbox_is_resumed(tmp_path):
+    root = str(tmp_path)
+    generate(root, 1000)
+    engine = SearchEngine(CONFIG)
+    preprocess(engine, root)
+    events = len(engine.events)
+
+    mbox = os.path.join(root, 'google', 'Takeout', 'Mail', 'All mail Including Spam and Trash.mbox')
+    with open(mbox, 'a', newline='') as file:
+        file.write('From 1@xxx Mon Jan 01 10:00:00 +0000 2024\nDate: Mon, 1 Jan 2024 10:00:00 +0000\n'
+                   'Subject: Appended\nFrom: someone@example.com\nTo: jordan.avery@example.com\n\nHello\n\n')
+    preprocess(engine, root)
+    # Only the new message is parsed, and the earlier ones are kept.
+    assert engine.events.retracted == 0
+    assert len(engine.events) == events + 1
+
+
+def test_email_bodies_are_indexed_without_reparsing(archives, monkeypatch):
+    def parts(self, source=None):
+        raise AssertionError('An email body was parsed in the main process.')
+
+    monkeypatch.setattr(EmailBody, 'parts', parts)
+    engine = SearchEngine(CONFIG)
+    preprocess(engine, archives)
+    assert engine.events.unstored_text == {}
+    monkeypatch.undo()
+
+    index = next(i for i, content in engine.events.content_objects.items() if isinstance(content, EmailBody))
+    company = engine.events.companies.decode(engine.events.company_codes[index])
+    word = engine.events.content_objects.get(index).text(engine.sources[company]).split()[-1]
+    ids, _ = engine.text_index.search(word)
+    assert index in ids
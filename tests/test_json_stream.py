@@ -0,0 +1,66 @@
+import io
+import json
+
+import pytest
+
+from lens.sources.JsonStream import JsonStream
+
+DOCUMENT = {
+    'participants': [{'name': 'Alice'}, {'name': 'Bob "B" [ok]'}],
+    'messages': [
+        {'sender_name': 'Alice', 'timestamp_ms': 1500000000123, 'content': 'Brackets ] and } and \\" in a string'},
+        {'sender_name': 'Bob', 'timestamp_ms': 1500000000456, 'content': 'caf\\u00e9 ☃', 'reactions': []},
+        {'sender_name': 'Alice', 'timestamp_ms': -1.5e3, 'photos': [{'uri': 'a.jpg'}], 'is_unsent': False},
+    ],
+    'title': 'Chat',
+    'is_still_participant': True,
+    'empty': {},
+    'nothing': None,
+}
+
+# Chunk sizes from a single character (so that every token spans chunks) to the whole document.
+CHUNK_SIZES = [1, 2, 3, 7, 64, 1 << 20]
+
+
+def stream(value, chunk_size: int, indent=None) -> JsonStream:
+    return JsonStream(io.StringIO(json.dumps(value, indent=indent)), chunk_size=chunk_size)
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('indent', [None, 2])
+def test_items_are_decoded_one_at_a_time(chunk_size, indent):
+    reader = stream(DOCUMENT, chunk_size, indent)
+    assert reader.find_key('messages')
+    assert list(reader.items()) == DOCUMENT['messages']
+    # The stream is left right after the array.
+    assert reader.peek() == ','
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_find_key_skips_earlier_values(chunk_size):
+    reader = stream(DOCUMENT, chunk_size)
+    assert reader.find_key('title')
+    assert reader.decode() == 'Chat'
+    assert not stream(DOCUMENT, chunk_size).find_key('missing')
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_fields_exclude_skipped_values(chunk_size):
+    fields = stream(DOCUMENT, chunk_size, indent=1).fields({'messages', 'participants'})
+    assert fields == {key: value for key, value in DOCUMENT.items() if key not in ('messages', 'participants')}
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('value', [[], [1], [1, 22, 333], [1.25, -7, 1e100, True, None, 'x'], [[], [[]], {}]])
+def test_arrays_of_scalars_and_empty_values(chunk_size, value):
+    assert list(stream(value, chunk_size, indent=1).items()) == value
+
+
+@pytest.mark.parametrize('text', ['{"a": [1, 2', '{"a": "unterminated', '[1, 2}'])
+def test_malformed_documents_raise(text):
+    reader = JsonStream(io.StringIO(text), chunk_size=2)
+    with pytest.raises(ValueError):
+        if text.startswith('{'):
+            reader.find_key('b')
+        else:
+            list(reader.items())
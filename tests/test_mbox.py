@@ -0,0 +1,80 @@
+import mailbox
+import os
+
+import pytest
+
+from examples.search.index.helpers.mbox import SEPARATOR, parse_range, read_mbox, split_mbox
+
+
+def message(number: int) -> bytes:
+    lines = [
+        f'From sender{number}@example.com Mon Mar  4 10:00:00 2019',
+        f'From: Sender {number} <sender{number}@example.com>',
+        'To: me@example.com',
+        f'Subject: Message {number}',
+        f'Date: Mon, {number % 28 + 1} Mar 2019 10:00:00 -0700',
+        'X-Gmail-Labels: Inbox',
+        '',
+        f'Body of message {number}.',
+        # Body lines that start with "From " are escaped, and don't start a message.
+        '>From the archive: ' + 'x' * (number * 7 % 50),
+        '',
+        '',
+    ]
+    return '\n'.join(lines).encode()
+
+
+@pytest.fixture
+def mbox(tmp_path):
+    messages = [message(number) for number in range(40)]
+    path = tmp_path / 'mail.mbox'
+    path.write_bytes(b''.join(messages))
+    offsets = [sum(map(len, messages[:number])) for number in range(len(messages))]
+    return str(path), offsets
+
+
+def test_ranges_start_at_messages(mbox):
+    path, offsets = mbox
+    data = open(path, 'rb').read()
+    # Every range size makes some range boundary straddle (or land just past) a separator line.
+    for range_size in range(1, len(data) + 2, 7):
+        ranges = split_mbox(data, range_size=range_size)
+        assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+        assert all(stop == start for (_, stop), (start, _) in zip(ranges, ranges[1:]))
+        assert {start for start, _ in ranges} <= set(offsets)
+    assert data.find(SEPARATOR) + 1 == offsets[1]
+
+
+def test_escaped_from_lines_stay_in_the_body(mbox):
+    path, offsets = mbox
+    records = parse_range(path, 0, offsets[2], text=True)
+    assert [record['subject'] for record in records] == ['Message 0', 'Message 1']
+    assert records[1]['body'].read().startswith(b'From sender1@example.com')
+    assert '>From the archive' in records[1]['text']
+
+
+@pytest.mark.parametrize('range_size', [1, 100, 1000, 4096, 1 << 20])
+def test_ranges_match_a_serial_parse(mbox, range_size):
+    path, offsets = mbox
+    serial = [(box['Subject'], box['From']) for box in mailbox.mbox(path)]
+    records = list(read_mbox(path, workers=1, range_size=range_size))
+    assert [(record['subject'], record['from']) for record in records] == serial
+    assert [record['body'].offset for record in records] == offsets
+    assert records == parse_range(path, 0, os.path.getsize(path))
+
+
+def test_workers_match_a_serial_parse(mbox):
+    path, _ = mbox
+    assert list(read_mbox(path, workers=2, range_size=500)) == list(read_mbox(path, workers=1))
+
+
+@pytest.mark.parametrize('message_number', [1, 17, 39])
+def test_resuming_from_a_message(mbox, message_number):
+    path, offsets = mbox
+    records = list(read_mbox(path, workers=1, range_size=300, start=offsets[message_number]))
+    assert records == list(read_mbox(path, workers=1))[message_number:]
+
+
+def test_resuming_past_the_end(mbox):
+    path, _ = mbox
+    assert list(read_mbox(path, workers=1, start=os.path.getsize(path))) == []
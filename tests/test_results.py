@@ -0,0 +1,92 @@
+import contextlib
+import io
+import json
+import os
+
+import pytest
+
+from benchmarks.generate import FULL_NAME, generate
+from examples.search.main import SearchEngine
+from examples.search.query import Query
+from examples.search.results import Cursor, Results
+from lens.sources.FacebookSource import FacebookSource
+from lens.sources.GoogleSource import GoogleSource
+
+FIELDS = ['title', 'timestamp', 'source']
+
+
+@pytest.fixture(scope='module')
+def engine(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp('archives'))
+    generate(root, 1000)
+    engine = SearchEngine({'full_name': FULL_NAME, 'workers': 1})
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        engine.preprocess(FacebookSource(os.path.join(root, 'facebook', '')),
+                          GoogleSource(os.path.join(root, 'google', '')))
+    return engine
+
+
+def pages(engine, args, limit):
+    """
+    Pages through a query's NDJSON output, and returns the rows of each page.
+    """
+    pages, cursor = [], None
+    while True:
+        page_args = {**args, 'limit': limit, 'fields': FIELDS, **({'cursor': cursor} if cursor else {})}
+        lines = [json.loads(line) for line in engine.results(page_args).lines()]
+        cursor = lines.pop()['cursor'] if lines and 'cursor' in lines[-1] else None
+        pages.append(lines)
+        if cursor is None:
+            return pages
+
+
+def test_cursor_round_trip():
+    cursor = Cursor(fingerprint=123456789, key=1672243459.5, row=42, count=100)
+    assert Cursor.decode(cursor.encode()) == cursor
+    nan = Cursor.decode(Cursor(1, float('nan'), 7, 3).encode())
+    assert nan.key != nan.key and nan[2:] == (7, 3)
+    assert '=' not in cursor.encode()
+
+
+@pytest.mark.parametrize('value', ['', 'abc', 'not a cursor!', Cursor(1, 2.0, 3, 4).encode()[:-2], 'é'])
+def test_invalid_cursors(value):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        Cursor.decode(value)
+
+
+def test_cursors_of_other_queries_are_rejected(engine):
+    results = engine.results({'source': 'Email', 'limit': 5})
+    list(results)
+    assert results.cursor is not None
+    # The limit and fields may change from page to page, but not the filters or the order.
+    assert len(engine.query({'source': 'Email', 'limit': 10, 'fields': 'title', 'cursor': results.cursor})) == 10
+    for args in [{'source': 'Location'}, {'source': 'Email', 'order': 'asc'}, {'source': 'Email', 'q': 'the'}]:
+        with pytest.raises(ValueError, match='different query'):
+            Query({**args, 'cursor': results.cursor})
+    with pytest.raises(ValueError, match='expected a cursor'):
+        Query({'source': 'Email', 'cursor': 'garbage'})
+
+
+@pytest.mark.parametrize('args', [{}, {'order': 'asc'}, {'source': ['Email', 'Messenger']}, {'q': 'the'},
+                                  {'bbox': '-90,-180,90,180'}])
+@pytest.mark.parametrize('limit', [7, 60])
+def test_ndjson_pages_match_an_unlimited_query(engine, args, limit):
+    everything = engine.query({**args, 'limit': None, 'fields': FIELDS})
+    assert len(everything) > limit
+    result_pages = pages(engine, args, limit)
+    assert all(len(page) == limit for page in result_pages[:-1]) and len(result_pages[-1]) <= limit
+    assert [row for page in result_pages for row in page] == everything
+
+
+def test_results_stop_at_the_limit():
+    rows = ((({'row': row}), (float(-row), row)) for row in range(10))
+    results = Results(rows, limit=10, cursor=lambda key, row, count: Cursor(5, key, row, count))
+    output = io.StringIO()
+    assert results.write_ndjson(output) == 10
+    lines = output.getvalue().splitlines()
+    assert json.loads(lines[-1]) == {'cursor': results.cursor}
+    assert Cursor.decode(results.cursor) == Cursor(5, -9.0, 9, 10)
+
+    # A page that isn't full is the last one.
+    results = Results(iter([({'row': 0}, (0.0, 0))]), limit=2, cursor=lambda *position: Cursor(5, *position))
+    assert list(results) == [{'row': 0}] and results.cursor is None
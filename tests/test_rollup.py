@@ -0,0 +1,92 @@
+import contextlib
+import io
+import os
+
+import pytest
+
+from benchmarks.generate import FULL_NAME, generate
+from examples.search import main
+from examples.search.aggregate import SECONDS_PER_DAY, aggregate_events
+from examples.search.index.rollup import Rollup
+from examples.search.main import SearchEngine
+from examples.search.query import Query
+from lens.snapshot import SnapshotReader, SnapshotWriter
+from lens.sources.FacebookSource import FacebookSource
+from lens.sources.GoogleSource import GoogleSource
+
+# 2022-01-01 and 2022-07-01, in UTC.
+SINCE, UNTIL = 1640995200, 1656633600
+
+QUERIES = [
+    {'group_by': 'company'},
+    {'group_by': ['source', 'day'], 'aggregate': ['count', 'min', 'max']},
+    {'group_by': ['key', 'week'], 'order': 'desc', 'limit': 10},
+    {'group_by': 'month', 'aggregate': ['min', 'max'], 'since': SINCE, 'until': UNTIL},
+    {'group_by': ['company', 'month'], 'source': ['Email', 'Location'], 'since': SINCE},
+    {'group_by': 'day', 'company': 'Facebook', 'until': '2022-07-01T00:00:00+00:00'},
+    {'group_by': 'source', 'source': 'No such source'},
+]
+
+
+def preprocess(engine: SearchEngine, root: str) -> None:
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        engine.preprocess(FacebookSource(os.path.join(root, 'facebook', '')),
+                          GoogleSource(os.path.join(root, 'google', '')))
+
+
+@pytest.fixture(scope='module')
+def engine(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp('archives'))
+    generate(root, 1000)
+    engine = SearchEngine({'full_name': FULL_NAME, 'workers': 1})
+    preprocess(engine, root)
+    # Re-indexing a changed file retracts its previous events, which the rollup must leave out.
+    with open(os.path.join(root, 'facebook', 'comments_and_reactions', 'posts_and_comments.json'), 'a') as file:
+        file.write('\n')
+    preprocess(engine, root)
+    assert engine.events.retracted
+    return engine
+
+
+def scan(engine: SearchEngine, query: Query):
+    ids = engine.matching_ids(query, limit=None)[0]
+    return aggregate_events(engine.events, ids, query.group_by, query.aggregates, descending=query.order == 'desc',
+                            limit=query.limit)
+
+
+@pytest.mark.parametrize('args', QUERIES)
+def test_rollup_matches_a_scan(engine, args):
+    query = Query(args)
+    assert engine.rollup.covers(query)
+    groups = engine.rollup.aggregate(engine.events, query)
+    assert groups == scan(engine, query)
+    assert groups or args.get('source') == 'No such source'
+
+
+def test_covered_queries_skip_the_scan(engine, monkeypatch):
+    expected = engine.query(QUERIES[1])
+
+    def fail(*args, **kwargs):
+        raise AssertionError('Scanned the events.')
+    monkeypatch.setattr(main, 'aggregate_events', fail)
+    assert engine.query(QUERIES[1]) == expected
+    with pytest.raises(AssertionError, match='Scanned'):
+        engine.query({**QUERIES[1], 'q': 'the'})
+
+
+@pytest.mark.parametrize('args', [{'group_by': 'hour'}, {'group_by': 'name'}, {'group_by': 'day', 'since': SINCE + 1},
+                                  {'group_by': 'day', 'q': 'the'}, {'group_by': 'day', 'bbox': '-90,-180,90,180'},
+                                  {'group_by': 'day', 'person': FULL_NAME}])
+def test_queries_that_the_rollup_does_not_cover(engine, args):
+    assert SINCE % SECONDS_PER_DAY == 0
+    assert not engine.rollup.covers(Query(args))
+
+
+def test_saved_rollup_matches(engine, tmp_path):
+    with SnapshotWriter(str(tmp_path / 'rollup.lens')) as writer:
+        engine.rollup.save(writer)
+    loaded = Rollup.load(SnapshotReader(str(tmp_path / 'rollup.lens')))
+    assert len(loaded) == len(engine.rollup) < engine.events.live.values.sum()
+    for args in QUERIES:
+        query = Query(args)
+        assert loaded.aggregate(engine.events, query) == engine.rollup.aggregate(engine.events, query)
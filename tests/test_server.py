@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+from lens.server import Lane, QueryServer
+
+
+class Application:
+    """
+    An endpoint that returns `limit` numbered rows, fails on invalid arguments before returning, and fails while its
+    rows are produced if asked to.
+    """
+
+    def rows(self, args):
+        if args.get('invalid'):
+            raise ValueError('Invalid arguments.')
+
+        def rows():
+            for number in range(args['limit']):
+                if number == args.get('fail_at'):
+                    raise ValueError('The rows ran out.')
+                yield {'number': number}
+        return rows()
+
+
+def respond(method, target, body=b''):
+    server = QueryServer(load=Application, endpoints={'/rows': 'rows'}, workers=2, processes=False, max_limit=5)
+
+    async def run():
+        server.executor = server.start_executor()
+        server.lanes = {'light': Lane(2, 4), 'heavy': Lane(1, 4)}
+        try:
+            return await server.respond(method, target, body)
+        finally:
+            server.executor.shutdown()
+
+    status, response = asyncio.run(run())
+    return status, [json.loads(line) for line in response.decode('utf-8').splitlines()]
+
+
+def test_limit_is_capped_and_defaulted():
+    assert respond('GET', '/rows?limit=3') == (200, [{'number': number} for number in range(3)])
+    assert respond('POST', '/rows', b'{"limit": 100}')[1] == [{'number': number} for number in range(5)]
+    assert len(respond('GET', '/rows')[1]) == 5
+
+
+def test_invalid_arguments_are_client_errors():
+    assert respond('GET', '/rows?invalid=1') == (400, [{'error': 'Invalid arguments.'}])
+    status, body = respond('GET', '/rows?limit=many')
+    assert status == 400 and 'limit' in body[0]['error']
+    assert respond('POST', '/rows', b'[1]')[0] == 400
+
+
+def test_failures_while_producing_rows_are_server_errors():
+    status, body = respond('POST', '/rows', b'{"fail_at": 2}')
+    assert status == 500
+    assert body == [{'error': 'ValueError: The rows ran out.'}]
@@ -0,0 +1,110 @@
+import contextlib
+import io
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.generate import FULL_NAME, generate
+from examples.search.main import SearchEngine
+from lens.snapshot import ALIGNMENT, HEADER, MAGIC, SnapshotReader, SnapshotWriter
+from lens.sources.FacebookSource import FacebookSource
+from lens.sources.GoogleSource import GoogleSource
+
+CONFIG = {'full_name': FULL_NAME, 'workers': 1}
+
+QUERIES = [
+    {'limit': 50},
+    {'order': 'asc', 'source': 'Email', 'limit': 20, 'fields': ['title', 'content', 'metadata']},
+    {'q': 'the call', 'limit': 20},
+    {'bbox': '-90,-180,90,180', 'limit': None, 'fields': ['title', 'locations']},
+    {'group_by': ['source', 'month'], 'aggregate': ['count', 'min', 'max']},
+    {'group_by': 'name', 'limit': 10},
+    {'top_people': 5},
+    {'person': 'Chen Cook', 'limit': None},
+]
+
+
+def test_sections_round_trip(tmp_path):
+    path = str(tmp_path / 'state.lens')
+    arrays = {
+        'floats': np.linspace(0, 1, 1001),
+        'matrix': np.arange(24, dtype=np.int32).reshape(2, 3, 4),
+        'empty': np.zeros(0, dtype=np.uint16),
+        'strided': np.arange(100, dtype=np.int64)[::3],
+        'flags': np.array([True, False, True]),
+    }
+    with SnapshotWriter(path) as writer:
+        for name, array in arrays.items():
+            writer.add_array(name, array)
+        writer.add_bytes('bytes', b'\x00\x01payload')
+        writer.add_chunks('chunks', (bytes([number]) * number for number in range(1, 5)))
+        writer.add_object('object', {'nested': [1, 2.5, 'three', None], 'set': {4}})
+    assert not os.path.exists(path + '.tmp')
+
+    reader = SnapshotReader(path)
+    for name, array in arrays.items():
+        loaded = reader.array(name)
+        np.testing.assert_array_equal(loaded, array)
+        assert loaded.dtype == array.dtype and loaded.shape == array.shape
+        assert not loaded.flags.writeable
+        assert reader.toc[name]['offset'] % ALIGNMENT == 0
+    assert bytes(reader.bytes('bytes')) == b'\x00\x01payload'
+    assert bytes(reader.bytes('chunks')) == b'\x01\x02\x02\x03\x03\x03\x04\x04\x04\x04'
+    assert reader.object('object') == {'nested': [1, 2.5, 'three', None], 'set': {4}}
+    assert 'floats' in reader and 'missing' not in reader
+    with pytest.raises(LookupError):
+        reader.array('missing')
+    with pytest.raises(LookupError):
+        reader.array('bytes')
+
+
+def test_failed_writes_keep_the_previous_snapshot(tmp_path):
+    path = str(tmp_path / 'state.lens')
+    with SnapshotWriter(path) as writer:
+        writer.add_object('version', 1)
+    with pytest.raises(ValueError, match='already has a section'):
+        with SnapshotWriter(path) as writer:
+            writer.add_object('version', 2)
+            writer.add_object('version', 3)
+    assert SnapshotReader(path).object('version') == 1
+    assert os.listdir(tmp_path) == ['state.lens']
+
+
+@pytest.mark.parametrize('data, message', [
+    (b'\0', 'Not a Lens snapshot'),
+    (b'LENSSNAX' + bytes(HEADER.size), 'Not a Lens snapshot'),
+    (HEADER.pack(MAGIC, 99, 0, 0), 'Unsupported snapshot version 99'),
+])
+def test_invalid_snapshots(tmp_path, data, message):
+    path = tmp_path / 'invalid.lens'
+    path.write_bytes(data)
+    with pytest.raises(ValueError, match=message):
+        SnapshotReader(str(path))
+
+
+def preprocess(engine: SearchEngine, root: str) -> None:
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        engine.preprocess(FacebookSource(os.path.join(root, 'facebook', '')),
+                          GoogleSource(os.path.join(root, 'google', '')))
+
+
+def test_engine_round_trip(tmp_path):
+    root = str(tmp_path / 'archives')
+    generate(root, 1000)
+    engine = SearchEngine(CONFIG)
+    preprocess(engine, root)
+    expected = [engine.query(args) for args in QUERIES]
+    assert all(expected)
+
+    engine.save(str(tmp_path / 'first.lens'))
+    loaded = SearchEngine.load(str(tmp_path / 'first.lens'), config=CONFIG)
+    assert [loaded.query(args) for args in QUERIES] == expected
+    assert loaded.manifests.keys() == engine.manifests.keys() and loaded.states.keys() == engine.states.keys()
+
+    # A loaded engine reads its columns from the mapped snapshot, and saves them again as they were.
+    loaded.save(str(tmp_path / 'second.lens'))
+    reloaded = SearchEngine.load(str(tmp_path / 'second.lens'), config=CONFIG)
+    assert [reloaded.query(args) for args in QUERIES] == expected
+    rows = range(0, len(engine.events), 97)
+    assert [reloaded.document(index) for index in rows] == [engine.document(index) for index in rows]
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from examples.search.index.spatial import SpatialIndex, circle_bbox, distance_km, within
+from lens.snapshot import SnapshotReader, SnapshotWriter
+
+
+def coordinates(count: int, seed: int = 0):
+    random = np.random.default_rng(seed)
+    latitudes = random.uniform(-90, 90, count)
+    longitudes = random.uniform(-180, 180, count)
+    # Crowd some points around the antimeridian, the poles and the cell boundaries, and leave some unlocated.
+    longitudes[:count // 5] = random.choice([-180.0, -179.99, 179.99, 180.0, 0.05], count // 5)
+    latitudes[count // 5:count // 4] = random.choice([-90.0, 89.99, 90.0, 0.05], count // 4 - count // 5)
+    latitudes[-count // 10:] = np.nan
+    return latitudes, longitudes
+
+
+def brute_force(latitudes, longitudes, bbox=None, near=None):
+    return np.flatnonzero(within(latitudes, longitudes, bbox=bbox, near=near))
+
+
+BOXES = [
+    (-10.0, 170.0, 10.0, -170.0),  # across the antimeridian
+    (-90.0, 179.0, 90.0, -179.0),
+    (50.0, 180.0, 70.0, -180.0),
+    (-45.0, -45.0, 45.0, 45.0),
+    (80.0, -180.0, 90.0, 180.0),
+    (0.05, 0.05, 0.05, 0.05),
+]
+
+
+@pytest.mark.parametrize('bbox', BOXES)
+def test_bounding_boxes_match_a_scan(bbox):
+    latitudes, longitudes = coordinates(5000)
+    index = SpatialIndex(latitudes, longitudes)
+    np.testing.assert_array_equal(index.search(bbox=bbox), brute_force(latitudes, longitudes, bbox=bbox))
+
+
+@pytest.mark.parametrize('near', [(0.0, 179.9, 500.0), (0.0, -179.9, 50.0), (89.5, 10.0, 300.0), (-60.0, 0.0, 2000.0),
+                                  (10.0, 20.0, 25000.0)])
+def test_circles_match_a_scan(near):
+    latitudes, longitudes = coordinates(5000, seed=1)
+    index = SpatialIndex(latitudes, longitudes)
+    np.testing.assert_array_equal(index.search(near=near), brute_force(latitudes, longitudes, near=near))
+    bbox = (-30.0, 150.0, 30.0, -150.0)
+    np.testing.assert_array_equal(index.search(bbox=bbox, near=near),
+                                  brute_force(latitudes, longitudes, bbox=bbox, near=near))
+
+
+def test_circle_bbox_wraps_around_the_antimeridian():
+    south, west, north, east = circle_bbox((0.0, 179.5, 200.0))
+    assert west > east and -180 <= east <= 180 and -180 <= west <= 180
+    assert circle_bbox((89.0, 0.0, 500.0))[1:4:2] == (-180.0, 180.0)
+    # Points just across the antimeridian are close, not half a world apart.
+    assert distance_km(np.array([0.0]), np.array([-179.9]), 0.0, 179.9)[0] < 25
+
+
+def test_extending_matches_a_rebuild(tmp_path):
+    latitudes, longitudes = coordinates(3000, seed=2)
+    index = SpatialIndex(latitudes[:1000], longitudes[:1000])
+    for stop in (1700, 3000):
+        index.extend(latitudes[:stop], longitudes[:stop])
+    rebuilt = SpatialIndex(latitudes, longitudes)
+    np.testing.assert_array_equal(index.ids, rebuilt.ids)
+    np.testing.assert_array_equal(index.cells, rebuilt.cells)
+
+    with SnapshotWriter(str(tmp_path / 'spatial.lens')) as writer:
+        index.save(writer)
+    loaded = SpatialIndex.load(SnapshotReader(str(tmp_path / 'spatial.lens')))
+    for bbox in BOXES:
+        np.testing.assert_array_equal(loaded.search(bbox=bbox), index.search(bbox=bbox))
+    assert len(loaded.search()) == np.count_nonzero(~np.isnan(latitudes))
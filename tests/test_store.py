@@ -0,0 +1,105 @@
+import numpy as np
+
+from examples.search.models.event import Event
+from examples.search.models.store import EventStore, GrowableArray, MetadataArena
+
+COMPANIES = ['Facebook', 'Google']
+SOURCES = ['Messenger', 'Email', 'Location', 'Calendar']
+
+
+def event(number: int) -> Event:
+    return Event(
+        company=COMPANIES[number % 2],
+        source=SOURCES[number % 4],
+        key=f'key_{number % 3}',
+        timestamp=1600000000 + number * 3600,
+        title=f'Event {number} ✓',
+        content=[None, f'content {number}', [f'part {number}', [f'nested {number}', number]]][number % 3],
+        metadata=None if number % 5 == 0 else {'number': number, 'tags': ['a', 'b'], 'score': number / 4},
+        names={f'Person {number % 7}'} if number % 2 else None,
+        location={'latitude': number / 10, 'longitude': -number / 10} if number % 4 == 2 else None,
+    )
+
+
+def assert_same(actual: Event, expected: Event) -> None:
+    assert actual.to_json() == expected.to_json()
+
+
+def test_rows_round_trip():
+    store = EventStore()
+    events = [event(number) for number in range(3000)]
+    for number, value in enumerate(events):
+        assert store.append(value) == number
+    assert len(store) == 3000
+    for number in (0, 1, 2, 5, 1023, 1024, 2999):
+        assert_same(store[number], events[number])
+    assert_same(store[-1], events[-1])
+    # Columns are dictionary-encoded, and the NumPy columns are views over the populated prefix.
+    assert len(store.companies) == 2 and len(store.sources) == 4
+    assert store.timestamps.values.shape == (3000,)
+    np.testing.assert_array_equal(store.timestamps.values, [value.timestamp for value in events])
+    assert np.isnan(store.latitudes.values[0]) and store.latitudes.values[2] == 0.2
+    assert store.text(2) == 'Event 2 ✓ part 2 nested 2'
+    assert store.distinct_keys() == ['key_0', 'key_1', 'key_2']
+
+
+def test_threads_are_merged_into_metadata():
+    store = EventStore()
+    thread = store.add_thread({'title': 'Group chat', 'participants': ['A', 'B']})
+    store.append(event(1), thread_id=thread)
+    store.append(event(2))
+    assert store[0].metadata == {'thread_details': {'title': 'Group chat', 'participants': ['A', 'B']},
+                                 **event(1).metadata}
+    assert store[1].metadata == event(2).metadata
+
+
+def test_merge_remaps_codes():
+    first, second = EventStore(), EventStore()
+    second.add_thread({'title': 'Thread'})
+    first.add_thread({'title': 'Other thread'})
+    first.set_origin('Google/mail.mbox')
+    first.extend(event(number) for number in range(0, 10, 2))
+    second.set_origin('Facebook/messages.json')
+    for number in range(1, 10, 2):
+        second.append(event(number), thread_id=0, text=f'body {number}')
+
+    first.merge(second)
+    assert len(first) == 10
+    fields = ['company', 'source', 'key', 'title', 'timestamp', 'names', 'locations']
+    for position, number in enumerate([*range(0, 10, 2), *range(1, 10, 2)]):
+        assert first[position].to_json(fields) == event(number).to_json(fields)
+    assert first[5].metadata['thread_details'] == {'title': 'Thread'}
+    assert first.unstored_text == {5 + position: f'body {number}' for position, number in enumerate(range(1, 10, 2))}
+
+    assert first.retract(['Facebook/messages.json', 'No such file']) == 5
+    assert first.retract(['Facebook/messages.json']) == 0
+    assert first.retracted == 5
+    np.testing.assert_array_equal(first.live.values, [True] * 5 + [False] * 5)
+
+
+def test_resumed_origins_are_not_replaced():
+    store = EventStore()
+    store.set_origin('Google/mail.mbox', resumed=True)
+    store.append(event(0))
+    store.set_origin('Facebook/empty.json')
+    assert store.replaced_origins() == ['Facebook/empty.json']
+
+
+def test_read_only_columns_are_copied_on_write():
+    values = np.arange(5, dtype=np.float64)
+    values.setflags(write=False)
+    column = GrowableArray.from_array(values)
+    column.append(5.0)
+    writable = column.writable_values()
+    writable[0] = -1
+    np.testing.assert_array_equal(column.values, [-1, 1, 2, 3, 4, 5])
+    assert values[0] == 0
+
+
+def test_metadata_spills_past_its_budget(tmp_path):
+    arena = MetadataArena(memory_budget=4096, spill_dir=str(tmp_path))
+    values = [{'number': number, 'text': 'x' * (number % 50)} if number % 3 else None for number in range(2000)]
+    arena.extend(values)
+    assert len(arena._buffer) <= 4096
+    assert list(arena) == values
+    assert arena[1234] == values[1234]
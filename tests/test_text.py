@@ -0,0 +1,135 @@
+import numpy as np
+
+from examples.search.index import text
+from examples.search.index.text import SegmentedTextIndex, TextIndex
+from lens.snapshot import SnapshotReader, SnapshotWriter
+
+WORDS = ['meeting', 'budget', 'lunch', 'trip', 'report', 'call', 'party', 'draft', 'review', 'plan']
+
+
+def documents(count: int, seed: int = 0):
+    random = np.random.default_rng(seed)
+    return [' '.join(random.choice(WORDS, size=random.integers(1, 12))) for _ in range(count)]
+
+
+def live_rankings(index, live: np.ndarray, query: str):
+    ids, scores = index.search(query, limit=20, predicate=lambda docs: live[docs])
+    return ids, scores
+
+
+def test_retracted_documents_are_left_out_of_scoring(monkeypatch):
+    monkeypatch.setattr(text, 'MAX_SEGMENTS', 2)
+    docs = documents(2000)
+    live = np.ones(len(docs), dtype=bool)
+    live[np.random.default_rng(1).choice(len(docs), size=600, replace=False)] = False
+
+    index = SegmentedTextIndex()
+    for start in range(0, len(docs), 250):
+        index.add(docs[start:start + 250])
+        index.retract(np.flatnonzero(~live[:len(index)]))
+        index.compact()
+
+    live_ids = np.flatnonzero(live)
+    fresh = TextIndex.build(docs[i] for i in live_ids)
+    assert index.live_count == len(live_ids)
+    assert np.isclose(index.average_length, fresh.average_length)
+    for query in ['meeting budget', 'lunch', 'trip report review']:
+        ids, scores = live_rankings(index, live, query)
+        fresh_ids, fresh_scores = fresh.search(query, limit=20)
+        np.testing.assert_allclose(scores, fresh_scores)
+        np.testing.assert_array_equal(ids, live_ids[fresh_ids])
+
+
+def test_retracting_twice_counts_once():
+    index = TextIndex.build(documents(300))
+    assert index.retract([3, 5, 5]) == 2
+    assert index.retract([3, 7]) == 1
+    assert index.live_count == 297
+    assert index.retracted_df.sum() == sum(len(set(document.split())) for document in
+                                           (documents(300)[i] for i in (3, 5, 7)))
+
+
+def test_merged_segments_match_a_rebuild(tmp_path):
+    docs = documents(900, seed=2)
+    retracted = np.random.default_rng(3).choice(len(docs), size=200, replace=False)
+    segments = [TextIndex.build(docs[start:start + 300]) for start in range(0, len(docs), 300)]
+    # Segments loaded from a snapshot have a frozen vocabulary, which is merged the same way.
+    with SnapshotWriter(str(tmp_path / 'segment.lens')) as writer:
+        segments[0].save(writer)
+    segments[0] = TextIndex.load(SnapshotReader(str(tmp_path / 'segment.lens')))
+    for number, segment in enumerate(segments):
+        segment.retract(retracted[(retracted >= 300 * number) & (retracted < 300 * (number + 1))] - 300 * number)
+
+    merged = TextIndex.merge(segments)
+    rebuilt = TextIndex.build('' if i in retracted else document for i, document in enumerate(docs))
+    rebuilt.retract(retracted)
+    np.testing.assert_array_equal(merged.doc_lengths, rebuilt.doc_lengths)
+    assert sorted(merged.terms()) == sorted(rebuilt.terms())
+    for query in ['meeting budget', 'lunch', 'trip report review']:
+        ids, scores = merged.search(query, limit=20)
+        rebuilt_ids, rebuilt_scores = rebuilt.search(query, limit=20)
+        np.testing.assert_array_equal(ids, rebuilt_ids)
+        np.testing.assert_allclose(scores, rebuilt_scores)
+
+
+def zipf_documents(count: int, seed: int = 0):
+    # Term frequencies follow a Zipf distribution, so common terms' posting lists span many blocks and rare terms' few.
+    random = np.random.default_rng(seed)
+    vocabulary = [f'term{number}' for number in range(400)]
+    weights = 1 / np.arange(1, len(vocabulary) + 1)
+    weights /= weights.sum()
+    return [' '.join(random.choice(vocabulary, size=random.integers(1, 40), p=weights)) for _ in range(count)]
+
+
+def exhaustive_scores(docs, query: str, k1: float = 1.2, b: float = 0.75):
+    """
+    Scores every document that contains a query term by BM25, straight from the definition.
+    """
+    tokenized = [text.tokenize(document) for document in docs]
+    average_length = sum(map(len, tokenized)) / len(tokenized)
+    scores = {}
+    for term in set(text.tokenize(query)):
+        df = sum(term in tokens for tokens in tokenized)
+        idf = np.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        for doc_id, tokens in enumerate(tokenized):
+            tf = tokens.count(term)
+            if tf:
+                norm = k1 * (1 - b + b * len(tokens) / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+    return scores
+
+
+QUERIES = ['term0', 'term0 term1 term2', 'term399 term0', 'term150 term3 term1 term77', 'term5 missing', 'missing']
+
+
+def test_scores_match_the_definition():
+    docs = zipf_documents(1500)
+    index = TextIndex.build(docs)
+    for query in QUERIES:
+        expected = exhaustive_scores(docs, query)
+        ids, scores = index.search(query)
+        assert sorted(ids.tolist()) == sorted(expected)
+        np.testing.assert_allclose(scores, [expected[doc_id] for doc_id in ids.tolist()])
+        assert np.all(np.diff(scores) <= 0)
+
+
+def test_block_max_pruning_matches_exhaustive_scoring(monkeypatch):
+    docs = zipf_documents(6000, seed=1)
+    index = TextIndex.build(docs)
+    assert (index.term_blocks[1:] - index.term_blocks[:-1]).max() > 10
+    decoded = []
+    decode_blocks = index._decode_blocks
+    monkeypatch.setattr(index, '_decode_blocks', lambda blocks: decoded.append(len(blocks)) or decode_blocks(blocks))
+    index.search('term150 term3 term1 term77')
+    exhaustive, decoded[:] = sum(decoded), []
+    index.search('term150 term3 term1 term77', limit=10)
+    assert sum(decoded) < exhaustive
+
+    predicates = [None, lambda ids: ids % 3 != 0, lambda ids: ids < 200]
+    for query in QUERIES:
+        for predicate in predicates:
+            ids, scores = index.search(query, predicate=predicate)
+            for limit in (1, 10, 100, 5000):
+                pruned_ids, pruned_scores = index.search(query, limit=limit, predicate=predicate)
+                np.testing.assert_array_equal(pruned_ids, ids[:limit])
+                np.testing.assert_array_equal(pruned_scores, scores[:limit])
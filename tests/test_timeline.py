@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from examples.search.index.timeline import TimestampIndex
+from lens.snapshot import SnapshotReader, SnapshotWriter
+
+
+def timestamps(count: int, seed: int = 0) -> np.ndarray:
+    # Few distinct values, so that many rows share a timestamp, and some rows without one.
+    random = np.random.default_rng(seed)
+    values = random.integers(0, count // 10, count).astype(np.float64) * 60
+    values[random.choice(count, size=count // 50, replace=False)] = np.nan
+    return values
+
+
+def expected(values, since=None, until=None, descending=False, limit=None, predicate=None, after=None):
+    """
+    The rows a scan should return, found by sorting every row by (timestamp, row id), with missing timestamps last.
+    """
+    keys = np.nan_to_num(values, nan=np.inf)
+    ids = np.lexsort((np.arange(len(values)), keys))
+    if since is not None:
+        ids = ids[keys[ids] >= since]
+    if until is not None:
+        ids = ids[keys[ids] < until]
+    if descending:
+        ids = ids[::-1]
+    if after is not None:
+        key, row = np.inf if np.isnan(after[0]) else after[0], after[1]
+        if descending:
+            ids = ids[(keys[ids] < key) | ((keys[ids] == key) & (ids < row))]
+        else:
+            ids = ids[(keys[ids] > key) | ((keys[ids] == key) & (ids > row))]
+    if predicate is not None:
+        ids = ids[predicate(ids)]
+    return ids if limit is None else ids[:limit]
+
+
+VALUES = timestamps(20000)
+RANGES = [(None, None), (6000, None), (None, 6000), (6000, 60000), (6030, 6030), (60000, 6000), (-1e9, 1e12)]
+
+
+@pytest.mark.parametrize('since, until', RANGES)
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('limit', [None, 0, 1, 50, 5000])
+@pytest.mark.parametrize('selective', [False, True])
+def test_scans_match_a_sort(since, until, descending, limit, selective):
+    index = TimestampIndex(VALUES)
+    predicate = (lambda ids: ids % 97 == 3) if selective else (lambda ids: ids % 2 == 0)
+    for filtered in (None, predicate):
+        args = dict(since=since, until=until, descending=descending, limit=limit, predicate=filtered)
+        np.testing.assert_array_equal(index.scan(**args), expected(VALUES, **args))
+
+
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('filtered', [False, True])
+def test_pages_resume_after_the_last_row(descending, filtered):
+    index = TimestampIndex(VALUES)
+    predicate = (lambda ids: ids % 3 != 0) if filtered else None
+    everything = index.scan(since=600, descending=descending, predicate=predicate)
+    pages, after = [], None
+    while True:
+        page = index.scan(since=600, descending=descending, limit=777, predicate=predicate, after=after)
+        pages.append(page)
+        if len(page) < 777:
+            break
+        after = (VALUES[page[-1]], int(page[-1]))
+    np.testing.assert_array_equal(np.concatenate(pages), everything)
+    # A cursor's row needn't be in the index any more.
+    assert len(index.scan(after=(VALUES[100] + 0.5, 10 ** 9))) == len(expected(VALUES, after=(VALUES[100] + 0.5, 0)))
+
+
+def test_extending_matches_a_rebuild(tmp_path):
+    index = TimestampIndex(VALUES[:5000])
+    for stop in (5001, 12000, len(VALUES)):
+        index.extend(VALUES[:stop])
+    rebuilt = TimestampIndex(VALUES)
+    np.testing.assert_array_equal(index.order, rebuilt.order)
+    np.testing.assert_array_equal(index.sorted_timestamps, rebuilt.sorted_timestamps)
+
+    with SnapshotWriter(str(tmp_path / 'timeline.lens')) as writer:
+        index.save(writer)
+    loaded = TimestampIndex.load(SnapshotReader(str(tmp_path / 'timeline.lens')))
+    np.testing.assert_array_equal(loaded.scan(since=6000, until=60000, descending=True, limit=100),
+                                  expected(VALUES, since=6000, until=60000, descending=True, limit=100))
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from examples.search.models.timestamps import TimestampParser, normalize_timestamp, parse_iso8601, parse_rfc2822
+
+# 2019-03-04 17:00:00 UTC
+SECONDS = datetime(2019, 3, 4, 17, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.mark.parametrize('value', [
+    'Mon, 4 Mar 2019 10:00:00 -0700',
+    'Mon, 4 Mar 2019 10:00:00 -0700 (MST)',
+    '4 Mar 2019 10:00 MST',
+    'Mon, 04 Mar 2019 12:00:00 EST',
+    'Mon, 4 Mar 2019 17:00:00 GMT',
+    'Mon, 4 March 2019 22:30:00 +0530',
+])
+def test_rfc2822_zones(value):
+    assert TimestampParser().parse(value) == SECONDS
+
+
+def test_rfc2822_without_a_zone_is_utc():
+    assert TimestampParser().parse('Mon, 4 Mar 2019 17:00:00') == SECONDS
+    assert parse_rfc2822('Mon, 4 Mar 2019 17:00:00').tzinfo is None
+
+
+@pytest.mark.parametrize('value, year', [('4 Mar 19 17:00 +0000', 2019), ('4 Mar 49 17:00 +0000', 2049),
+                                         ('4 Mar 50 17:00 +0000', 1950), ('4 Mar 99 17:00 +0000', 1999)])
+def test_rfc2822_two_digit_years(value, year):
+    assert parse_rfc2822(value).year == year
+
+
+def test_rfc2822_falls_back_to_parsedate_tz():
+    # Unknown zone names don't match the fast path, and `parsedate_tz` takes them to be UTC.
+    parsed = parse_rfc2822('Mon, 4 Mar 2019 17:00:00 XYZ')
+    assert parsed is not None and parsed.utcoffset() in (None, timedelta(0))
+    assert TimestampParser().parse('Mon, 4 Mar 2019 17:00:00 XYZ') == SECONDS
+    assert parse_rfc2822('not a date') is None
+
+
+@pytest.mark.parametrize('value', ['2019-03-04T17:00:00', '2019-03-04T17:00:00+00:00', '2019-03-04T10:00:00-07:00',
+                                   '2019-03-04 22:30:00+05:30', '2019-03-04T17:00:00.000'])
+def test_iso8601_zones(value):
+    assert TimestampParser().parse(value) == SECONDS
+
+
+def test_iso8601_keeps_its_offset():
+    assert parse_iso8601('2019-03-04T10:00:00-07:00').utcoffset() == timedelta(hours=-7)
+    assert parse_iso8601('4 Mar 2019') is None
+
+
+@pytest.mark.parametrize('value', [SECONDS, int(SECONDS), SECONDS * 1000, int(SECONDS * 1000), str(int(SECONDS)),
+                                   str(int(SECONDS * 1000)), np.int64(SECONDS * 1000)])
+def test_epoch_milliseconds_are_detected(value):
+    assert TimestampParser().parse(value) == SECONDS
+    assert normalize_timestamp(value) == SECONDS
+
+
+def test_datetimes():
+    assert TimestampParser().parse(datetime(2019, 3, 4, 17)) == SECONDS
+    assert TimestampParser().parse(datetime(2019, 3, 4, 10, tzinfo=timezone(timedelta(hours=-7)))) == SECONDS
+    assert np.isnan(TimestampParser().parse(None))
+
+
+def test_parser_learns_the_format():
+    parser = TimestampParser()
+    parser.parse('2019-03-04T17:00:00Z')
+    assert parser.format == 'iso8601'
+    parser.parse('Mon, 4 Mar 2019 17:00:00 +0000')
+    assert parser.format == 'rfc2822'
+
+
+def test_unparseable_strings():
+    with pytest.raises(ValueError):
+        TimestampParser(fuzzy=False).parse('March the 4th')
+    with pytest.raises(ValueError):
+        TimestampParser().parse('not a date')
+    with pytest.raises(ValueError):
+        TimestampParser().parse(object())
+
+
+def test_parse_many():
+    values = ['2019-03-04T17:00:00Z', SECONDS * 1000, None, 'Mon, 4 Mar 2019 17:00:00 +0000', SECONDS]
+    seconds = TimestampParser().parse_many(values)
+    np.testing.assert_array_equal(seconds[[0, 1, 3, 4]], SECONDS)
+    assert np.isnan(seconds[2])
+    np.testing.assert_array_equal(TimestampParser().parse_many(np.array([SECONDS * 1000, SECONDS])), SECONDS)